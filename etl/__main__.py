@@ -0,0 +1,4 @@
+import sys
+from etl.cli import main
+
+sys.exit(main())
@@ -0,0 +1,330 @@
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from sqlalchemy import text, bindparam
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Hechos consultables (nombre corto en la URL -> tabla)
+API_FACTS = {
+    'internet': 'fact_internet_sales',
+    'reseller': 'fact_reseller_sales'
+}
+
+# Granularidad de fechas -> columnas de dim_date
+DATE_GRAINS = {
+    'day': ['d.date'],
+    'month': ['d.year', 'd.month'],
+    'year': ['d.year']
+}
+
+SALES_MEASURES = '''
+    SUM(f.order_quantity) AS order_quantity,
+    SUM(f.line_total) AS line_total,
+    SUM(f.net_sales_amount) AS net_sales_amount,
+    SUM(f.profit) AS profit,
+    SUM(f.reporting_line_total) AS reporting_line_total
+'''
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _param(params: dict, name: str, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def _fact_table(params: dict) -> str:
+    fact = _param(params, 'fact', 'internet')
+    if fact not in API_FACTS:
+        raise BadRequest(f"fact debe ser uno de {sorted(API_FACTS)}")
+    return API_FACTS[fact]
+
+
+def _date_filter(params: dict) -> tuple:
+    """Filtro opcional start/end (AAAA-MM-DD) sobre dim_date"""
+    conditions = []
+    bind = {}
+    for name, operator in (('start', '>='), ('end', '<=')):
+        value = _param(params, name)
+        if value is None:
+            continue
+        try:
+            bind[name] = date.fromisoformat(value)
+        except ValueError:
+            raise BadRequest(f"{name} debe tener formato AAAA-MM-DD")
+        conditions.append(f'd.date {operator} :{name}')
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ''), bind
+
+
+def _limit(params: dict) -> int:
+    try:
+        return max(1, min(int(_param(params, 'limit', 50)), 1000))
+    except ValueError:
+        raise BadRequest("limit debe ser un entero")
+
+
+def sales_by_date(params: dict) -> tuple:
+    fact_name = _fact_table(params)
+    grain = _param(params, 'grain', 'month')
+    if grain not in DATE_GRAINS:
+        raise BadRequest(f"grain debe ser uno de {sorted(DATE_GRAINS)}")
+    columns = ', '.join(DATE_GRAINS[grain])
+    where, bind = _date_filter(params)
+    return f'''
+        SELECT {columns}, {SALES_MEASURES}
+        FROM {fact_name} f
+        JOIN dim_date d ON f.date_key = d.date_key
+        {where}
+        GROUP BY {columns}
+        ORDER BY {columns}
+    ''', bind
+
+
+def sales_by_product(params: dict) -> tuple:
+    fact_name = _fact_table(params)
+    where, bind = _date_filter(params)
+    bind['limit'] = _limit(params)
+    return f'''
+        SELECT p.product_key, p.product_name, p.category_name, p.subcategory_name, {SALES_MEASURES}
+        FROM {fact_name} f
+        JOIN dim_date d ON f.date_key = d.date_key
+        JOIN dim_product p ON f.product_key = p.product_key
+        {where}
+        GROUP BY p.product_key, p.product_name, p.category_name, p.subcategory_name
+        ORDER BY line_total DESC
+        LIMIT :limit
+    ''', bind
+
+
+def sales_by_territory(params: dict) -> tuple:
+    """Territorio según la ubicación del cliente (internet) o del revendedor"""
+    fact_name = _fact_table(params)
+    where, bind = _date_filter(params)
+    if fact_name == 'fact_internet_sales':
+        join = 'JOIN dim_customer g ON f.customer_key = g.customer_key'
+    else:
+        join = 'JOIN dim_reseller g ON f.reseller_key = g.reseller_key'
+    return f'''
+        SELECT g.country_region, g.state_province, {SALES_MEASURES}
+        FROM {fact_name} f
+        JOIN dim_date d ON f.date_key = d.date_key
+        {join}
+        {where}
+        GROUP BY g.country_region, g.state_province
+        ORDER BY g.country_region, g.state_province
+    ''', bind
+
+
+def sales_by_reseller(params: dict) -> tuple:
+    where, bind = _date_filter(params)
+    bind['limit'] = _limit(params)
+    return f'''
+        SELECT r.reseller_key, r.store_name, r.country_region, {SALES_MEASURES}
+        FROM fact_reseller_sales f
+        JOIN dim_date d ON f.date_key = d.date_key
+        JOIN dim_reseller r ON f.reseller_key = r.reseller_key
+        {where}
+        GROUP BY r.reseller_key, r.store_name, r.country_region
+        ORDER BY line_total DESC
+        LIMIT :limit
+    ''', bind
+
+
+# Ruta -> constructor de la consulta parametrizada
+API_QUERIES = {
+    '/sales/by-date': sales_by_date,
+    '/sales/by-product': sales_by_product,
+    '/sales/by-territory': sales_by_territory,
+    '/sales/by-reseller': sales_by_reseller
+}
+
+
+class ResultCache:
+    """
+    Caché LRU con TTL para resultados de consultas. Se vacía completa
+    cuando cambia la generación de los hechos (ver DatamartAPI.generation).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'max_entries': self.max_entries, 'ttl': self.ttl}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class DatamartAPI:
+    """
+    Consultas de ventas sobre la bodega con caché de resultados. La
+    generación de los hechos (último log_id exitoso de catalog.FACT_PROCESSES
+    en etl_log) se revisa como mucho cada check_interval segundos; si cambió,
+    la caché se invalida.
+    """
+
+    def __init__(self, etl_conn: Engine, cache: ResultCache = None, check_interval: float = 2.0):
+        self.etl_conn = etl_conn
+        self.cache = cache or ResultCache()
+        self.check_interval = check_interval
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        if not catalog.table_exists(self.etl_conn, 'etl_log'):
+            # Sin etl_log todavía: la caché solo expira por TTL
+            return None
+        query = text('''
+            SELECT MAX(log_id) FROM etl_log
+            WHERE status = 'Exitoso' AND process_name IN :processes
+        ''').bindparams(bindparam('processes', expanding=True))
+        with self.etl_conn.connect() as conn:
+            return conn.execute(query, {'processes': catalog.FACT_PROCESSES}).scalar()
+
+    def _check_invalidation(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        generation = self.generation()
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not None:
+                    print(f"Nueva carga de hechos en etl_log (log_id {generation}): caché invalidada")
+                self._generation = generation
+                self.cache.clear()
+
+    def query(self, path: str, params: dict) -> tuple:
+        """Devuelve (filas, desde_caché); lanza KeyError/BadRequest"""
+        builder = API_QUERIES[path]
+        self._check_invalidation()
+
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        rows = self.cache.get(key)
+        if rows is not None:
+            return rows, True
+
+        sql, bind = builder(params)
+        with self.etl_conn.connect() as conn:
+            rows = [dict(row) for row in conn.execute(text(sql), bind).mappings()]
+        self.cache.put(key, rows)
+        return rows, False
+
+
+def make_handler(api: DatamartAPI):
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload, default=_json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == '/health':
+                self._send(200, {'status': 'ok', 'cache': api.cache.stats()})
+                return
+            if url.path not in API_QUERIES:
+                self._send(404, {'error': f"Ruta desconocida: {url.path}", 'routes': sorted(API_QUERIES)})
+                return
+
+            start = time.perf_counter()
+            try:
+                rows, cached = api.query(url.path, params)
+            except BadRequest as e:
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+                return
+            self._send(200, {'rows': rows, 'cached': cached,
+                             'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(etl_conn: Engine, host: str = '127.0.0.1', port: int = 8080, max_entries: int = 256,
+          ttl: float = 300, check_interval: float = 2.0):
+    """Servidor HTTP de solo lectura (un hilo por petición)"""
+    api = DatamartAPI(etl_conn, ResultCache(max_entries, ttl), check_interval)
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    print(f"✓ API de lectura en http://{host}:{port} (rutas: {', '.join(sorted(API_QUERIES))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API de lectura con caché sobre el datamart')
+    parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ttl', type=float, default=300, help='segundos de vida de cada resultado')
+    parser.add_argument('--max-entries', type=int, default=256)
+    args = parser.parse_args()
+
+    from etl import utils_etl
+
+    _, config_target, _ = utils_etl.load_config(args.config)
+    etl_conn = utils_etl.create_target_connection(config_target, pool_pre_ping=True)
+    serve(etl_conn, args.host, args.port, args.max_entries, args.ttl)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import time
+import asyncio
+from urllib.parse import unquote
+from pandas import DataFrame
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Tablas que deben estar cargadas antes de cada tabla (llaves foráneas y llaves de dimensión)
+LOAD_DEPENDENCIES = {
+    'fact_internet_sales': ['dim_customer', 'dim_product', 'dim_date', 'dim_territory', 'dim_currency'],
+    'fact_reseller_sales': ['dim_reseller', 'dim_employee', 'dim_product', 'dim_date', 'dim_territory',
+                            'dim_currency'],
+    'bridge_order_sales_reason': ['dim_sales_reason', 'fact_internet_sales', 'fact_reseller_sales'],
+    'dim_currency_rate': ['dim_currency']
+}
+
+# Conexiones simultáneas a la bodega y filas por chunk de COPY
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHUNKSIZE = 50000
+
+
+def _driver():
+    """asyncpg si está instalado, si no psycopg 3 (modo async)"""
+    try:
+        import asyncpg
+        return 'asyncpg', asyncpg
+    except ImportError:
+        pass
+    try:
+        import psycopg
+        return 'psycopg', psycopg
+    except ImportError as e:
+        raise ImportError("La carga concurrente requiere asyncpg o psycopg 3 "
+                          "(pip install asyncpg)") from e
+
+
+def connect_params(etl_conn: Engine) -> dict:
+    """Parámetros de conexión del motor de la bodega, con el search_path si la URL lo fija"""
+    url = etl_conn.url
+    params = {'host': url.host, 'port': url.port or 5432, 'user': url.username,
+              'password': url.password, 'database': url.database}
+    options = unquote(str(url.query.get('options', '')))
+    if options.startswith('-csearch_path='):
+        params['search_path'] = options[len('-csearch_path='):]
+    return params
+
+
+def _csv_chunk(table: DataFrame, start: int, end: int) -> bytes:
+    return table.iloc[start:end].to_csv(index=False, header=False, na_rep='').encode('utf-8')
+
+
+async def _csv_chunks(table: DataFrame, chunksize: int):
+    """
+    Chunks CSV del DataFrame: el siguiente se genera en un hilo mientras
+    el actual viaja por el COPY
+    """
+    starts = list(range(0, len(table), chunksize))
+    pending = asyncio.create_task(asyncio.to_thread(_csv_chunk, table, 0, chunksize)) if starts else None
+    for start in starts:
+        data = await pending
+        following = start + chunksize
+        if following < len(table):
+            pending = asyncio.create_task(asyncio.to_thread(_csv_chunk, table, following,
+                                                            following + chunksize))
+        yield data
+
+
+class AsyncLoader:
+    """
+    Orquestador asyncio de las escrituras a la bodega. Cada tabla es un
+    trabajo que espera solo a sus dependencias del mismo lote
+    (LOAD_DEPENDENCIES); las tablas independientes se escriben en paralelo
+    sobre un pool de pool_size conexiones, así el tiempo total se acerca al
+    de la tabla más grande.
+    - copy(): un solo COPY por tabla con chunks CSV en tubería, dentro de
+      una transacción (DELETE previo con replace; con watermark_column solo
+      las filas posteriores al máximo cargado).
+    - call(): una función de carga síncrona existente (merge, upsert,
+      shadow swap...) en un hilo, con su propia transacción.
+    """
+
+    def __init__(self, etl_conn: Engine, pool_size: int = DEFAULT_POOL_SIZE,
+                 chunksize: int = DEFAULT_CHUNKSIZE):
+        self.etl_conn = etl_conn
+        self.pool_size = max(1, pool_size)
+        self.chunksize = max(1, chunksize)
+        self.jobs = {}
+
+    @classmethod
+    def from_settings(cls, etl_conn: Engine, etl_settings: dict) -> 'AsyncLoader':
+        return cls(etl_conn, pool_size=etl_settings.get('load_pool_size', DEFAULT_POOL_SIZE),
+                   chunksize=etl_settings.get('load_chunksize', DEFAULT_CHUNKSIZE))
+
+    def copy(self, table_name: str, table: DataFrame, replace: bool = False, watermark_column: str = None):
+        """Encolamos la carga de un DataFrame por COPY (la tabla debe existir)"""
+        self._add(table_name, {'kind': 'copy', 'table': table, 'replace': replace,
+                               'watermark_column': watermark_column})
+
+    def call(self, table_name: str, fn, *args, **kwargs):
+        """Encolamos una función de carga síncrona que escribe table_name"""
+        self._add(table_name, {'kind': 'call', 'fn': fn, 'args': args, 'kwargs': kwargs})
+
+    def _add(self, table_name: str, job: dict):
+        if table_name in self.jobs:
+            raise ValueError(f"{table_name} ya tiene una carga en este lote")
+        self.jobs[table_name] = job
+
+    def dependencies(self, table_name: str) -> list:
+        """Dependencias de una tabla que también se cargan en este lote"""
+        return [name for name in LOAD_DEPENDENCIES.get(table_name, []) if name in self.jobs]
+
+    def run(self) -> dict:
+        """
+        Ejecutamos el lote. Devuelve {tabla: {'rows', 'seconds'}}; si alguna
+        tabla falla, sus dependientes no se cargan y se levanta el error al
+        terminar las demás.
+        """
+        if not self.jobs:
+            return {}
+        start = time.perf_counter()
+        results, errors = asyncio.run(self._run())
+        self.jobs = {}
+        catalog.invalidate_catalog(self.etl_conn)
+
+        for table_name, result in sorted(results.items(), key=lambda item: item[1]['seconds'], reverse=True):
+            print(f"  {table_name:<28} {result['rows']:>10} filas  {result['seconds']:8.2f}s")
+        print(f"Carga concurrente: {len(results)} tablas en {time.perf_counter() - start:.2f}s")
+        if errors:
+            for table_name, error in errors.items():
+                print(f"✗ Error cargando {table_name}: {error}")
+            raise RuntimeError(f"Carga concurrente con tablas fallidas: {', '.join(errors)}")
+        return results
+
+    async def _run(self) -> tuple:
+        name, driver = _driver() if any(job['kind'] == 'copy' for job in self.jobs.values()) else (None, None)
+        pool = await _Pool.open(name, driver, connect_params(self.etl_conn), self.pool_size) if name else None
+        slots = asyncio.Semaphore(self.pool_size)
+        tasks = {}
+        results, errors = {}, {}
+
+        async def run_job(table_name, job):
+            for dependency in self.dependencies(table_name):
+                await asyncio.wait([tasks[dependency]])
+                if dependency in errors:
+                    errors[table_name] = f'no se cargó porque falló {dependency}'
+                    return
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    if job['kind'] == 'copy':
+                        rows = await pool.copy(table_name, job, self.chunksize)
+                    else:
+                        rows = await asyncio.to_thread(job['fn'], *job['args'], **job['kwargs'])
+                except Exception as e:
+                    errors[table_name] = e
+                    return
+                results[table_name] = {'rows': rows if isinstance(rows, int) else _job_rows(job),
+                                       'seconds': time.perf_counter() - started}
+
+        try:
+            for table_name, job in self.jobs.items():
+                tasks[table_name] = asyncio.ensure_future(run_job(table_name, job))
+            await asyncio.gather(*tasks.values())
+        finally:
+            if pool:
+                await pool.close()
+        return results, errors
+
+
+def _job_rows(job: dict) -> int:
+    frames = [value for value in job.get('args', ()) if isinstance(value, DataFrame)]
+    return len(frames[0]) if frames else 0
+
+
+class _Pool:
+    """Pool acotado de conexiones async (asyncpg.Pool o una cola de conexiones psycopg)"""
+
+    def __init__(self, name: str, driver, connections):
+        self.name = name
+        self.driver = driver
+        self.connections = connections
+
+    @classmethod
+    async def open(cls, name: str, driver, params: dict, size: int) -> '_Pool':
+        search_path = params.pop('search_path', None)
+        if name == 'asyncpg':
+            settings = {'search_path': search_path} if search_path else None
+            return cls(name, driver, await driver.create_pool(min_size=1, max_size=size,
+                                                              server_settings=settings, **params))
+        params = {('dbname' if key == 'database' else key): value for key, value in params.items()}
+        if search_path:
+            params['options'] = f'-csearch_path={search_path}'
+        queue = asyncio.Queue()
+        for _ in range(size):
+            queue.put_nowait(await driver.AsyncConnection.connect(**params))
+        return cls(name, driver, queue)
+
+    async def copy(self, table_name: str, job: dict, chunksize: int) -> int:
+        """COPY de un DataFrame en una transacción; devuelve las filas cargadas"""
+        table = job['table']
+        columns = list(table.columns)
+        quoted = ', '.join(f'"{col}"' for col in columns)
+        copy_sql = f'COPY {table_name} ({quoted}) FROM STDIN WITH (FORMAT csv)'
+        watermark = f"SELECT MAX({job['watermark_column']}) FROM {table_name}" if job['watermark_column'] else None
+
+        if self.name == 'asyncpg':
+            async with self.connections.acquire() as conn:
+                async with conn.transaction():
+                    if job['replace']:
+                        await conn.execute(f'DELETE FROM {table_name}')
+                    if watermark:
+                        table = _after_watermark(table, job['watermark_column'], await conn.fetchval(watermark))
+                    if not table.empty:
+                        await conn.copy_to_table(table_name, source=_csv_chunks(table, chunksize),
+                                                 columns=columns, format='csv')
+            return len(table)
+
+        conn = await self.connections.get()
+        try:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    if job['replace']:
+                        await cur.execute(f'DELETE FROM {table_name}')
+                    if watermark:
+                        await cur.execute(watermark)
+                        table = _after_watermark(table, job['watermark_column'], (await cur.fetchone())[0])
+                    if not table.empty:
+                        async with cur.copy(copy_sql) as copy:
+                            async for data in _csv_chunks(table, chunksize):
+                                await copy.write(data)
+            return len(table)
+        finally:
+            self.connections.put_nowait(conn)
+
+    async def close(self):
+        if self.name == 'asyncpg':
+            await self.connections.close()
+            return
+        while not self.connections.empty():
+            await self.connections.get_nowait().close()
+
+
+def _after_watermark(table: DataFrame, column: str, loaded) -> DataFrame:
+    """Filas posteriores a la marca de agua ya cargada (carga incremental)"""
+    if loaded is None:
+        return table
+    return table[table[column] > loaded]
@@ -0,0 +1,185 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Tablas de la bodega que se reportan en el estado del ETL
+WAREHOUSE_TABLES = [
+    'dim_customer', 'dim_product', 'dim_date', 'dim_territory',
+    'dim_currency', 'dim_currency_rate', 'dim_employee', 'dim_reseller', 'dim_sales_reason',
+    'fact_internet_sales', 'fact_reseller_sales', 'bridge_order_sales_reason', 'fact_order_lifecycle'
+]
+
+# Tablas de hechos con marca de agua por sales_order_id
+FACT_TABLES = ['fact_internet_sales', 'fact_reseller_sales']
+
+# Tablas cargadas incrementalmente por sales_order_id
+WATERMARK_TABLES = FACT_TABLES + ['bridge_order_sales_reason']
+
+# Procesos de etl_log que escriben en los hechos: cli/pipeline/cola, micro-lotes, main.py,
+# carga concurrente (utils_etl.push_all) y reparaciones de reconcile
+FACT_PROCESSES = [
+    'Internet_Sales', 'Reseller_Sales', 'Hechos', 'Microlote', 'ETL_Completo', 'ETL_Concurrente',
+    'Reparacion_Internet_Sales', 'Reparacion_Reseller_Sales'
+]
+
+# Segundos que el catálogo en memoria se considera vigente
+CATALOG_TTL = 60
+
+_catalog_cache = {}
+
+
+def _catalog_key(etl_conn: Engine, schema: str) -> str:
+    return f"{etl_conn.url.render_as_string(hide_password=True)}|{schema}"
+
+
+def get_catalog(etl_conn: Engine, schema: str = None, refresh: bool = False) -> dict:
+    """
+    Leemos en una sola consulta al catálogo de PostgreSQL todas las tablas
+    del esquema con filas estimadas, tamaño y fechas de mantenimiento.
+    Sin schema se usa el esquema actual de la conexión (search_path).
+    El resultado queda en caché por motor y esquema durante CATALOG_TTL segundos.
+    """
+    key = _catalog_key(etl_conn, schema)
+    cached = _catalog_cache.get(key)
+    if cached and not refresh and time.monotonic() - cached['loaded_at'] < CATALOG_TTL:
+        return cached['tables']
+
+    query = text('''
+        SELECT
+            c.relname AS table_name,
+            c.reltuples::bigint AS reltuples,
+            s.n_live_tup AS live_rows,
+            pg_total_relation_size(c.oid) AS total_bytes,
+            pg_relation_size(c.oid) AS table_bytes,
+            GREATEST(s.last_analyze, s.last_autoanalyze) AS last_analyzed
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE n.nspname = COALESCE(:schema, current_schema())
+        AND c.relkind IN ('r', 'p')
+    ''')
+
+    tables = {}
+    with etl_conn.connect() as conn:
+        for row in conn.execute(query, {'schema': schema}).mappings():
+            # reltuples = -1 indica que la tabla nunca fue analizada
+            estimated = row['reltuples']
+            if estimated is None or estimated < 0:
+                estimated = row['live_rows'] or 0
+            tables[row['table_name']] = {
+                'estimated_rows': int(estimated),
+                'total_bytes': row['total_bytes'],
+                'table_bytes': row['table_bytes'],
+                'last_analyzed': row['last_analyzed']
+            }
+
+    _catalog_cache[key] = {'tables': tables, 'loaded_at': time.monotonic()}
+    return tables
+
+
+def invalidate_catalog(etl_conn: Engine = None):
+    """
+    Descartamos el catálogo en caché (todo, o solo el del motor indicado)
+    después de crear, eliminar o renombrar tablas
+    """
+    if etl_conn is None:
+        _catalog_cache.clear()
+        return
+    prefix = _catalog_key(etl_conn, '')
+    for key in [k for k in _catalog_cache if k.startswith(prefix)]:
+        del _catalog_cache[key]
+
+
+def table_exists(etl_conn: Engine, table_name: str, schema: str = None) -> bool:
+    """Existencia de una tabla según el catálogo en caché"""
+    return table_name in get_catalog(etl_conn, schema)
+
+
+def existing_tables(etl_conn: Engine, schema: str = None) -> list:
+    """Nombres de las tablas existentes en el esquema"""
+    return sorted(get_catalog(etl_conn, schema))
+
+
+def get_watermarks(etl_conn: Engine, schema: str = None) -> dict:
+    """
+    Obtenemos en una sola consulta el último sales_order_id cargado por cada
+    hecho y la última ejecución exitosa registrada en etl_log por proceso.
+    Los MAX leen el extremo del índice en sales_order_id (load.ensure_fact_order_indexes
+    en los hechos, la llave primaria en el puente), no la tabla completa.
+    """
+    catalog = get_catalog(etl_conn, schema)
+    parts = [
+        f"SELECT '{table}' AS name, MAX(sales_order_id)::text AS value FROM {table}"
+        for table in WATERMARK_TABLES if table in catalog
+    ]
+    if 'etl_log' in catalog:
+        parts.append('''
+            SELECT 'etl_log:' || process_name AS name, MAX(run_timestamp)::text AS value
+            FROM etl_log
+            WHERE status = 'Exitoso'
+            GROUP BY process_name
+        ''')
+
+    watermarks = {table: None for table in WATERMARK_TABLES}
+    if not parts:
+        return watermarks
+
+    with etl_conn.connect() as conn:
+        for name, value in conn.execute(text(' UNION ALL '.join(parts))):
+            if name in WATERMARK_TABLES:
+                watermarks[name] = int(value) if value is not None else None
+            else:
+                watermarks[name] = value
+    return watermarks
+
+
+def get_order_watermark(etl_conn: Engine) -> int:
+    """Mayor sales_order_id cargado entre los hechos (0 si no hay datos)"""
+    watermarks = get_watermarks(etl_conn)
+    loaded = [watermarks[table] for table in FACT_TABLES if watermarks.get(table) is not None]
+    return max(loaded) if loaded else 0
+
+
+def exact_counts(etl_conn: Engine, tables: list, max_workers: int = 4) -> dict:
+    """
+    Ejecutamos COUNT(*) exacto en paralelo, una conexión del pool por tabla
+    """
+    def count(table):
+        with etl_conn.connect() as conn:
+            return table, conn.execute(text(f'SELECT COUNT(*) FROM {table}')).scalar()
+
+    if not tables:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tables))) as pool:
+        return dict(pool.map(count, tables))
+
+
+def get_status(etl_conn: Engine, tables: list = None, exact: bool = False,
+               refresh: bool = False) -> dict:
+    """
+    Estado detallado de la bodega: existencia, filas (estimadas o exactas),
+    tamaño y marcas de agua de los hechos
+    """
+    tables = tables or WAREHOUSE_TABLES
+    catalog = get_catalog(etl_conn, refresh=refresh)
+    present = [table for table in tables if table in catalog]
+    counts = exact_counts(etl_conn, present) if exact else {}
+    watermarks = get_watermarks(etl_conn)
+
+    status = {}
+    for table in tables:
+        if table not in catalog:
+            status[table] = {'exists': False}
+            continue
+        info = catalog[table]
+        status[table] = {
+            'exists': True,
+            'rows': counts.get(table, info['estimated_rows']),
+            'exact': exact,
+            'total_bytes': info['total_bytes'],
+            'last_analyzed': info['last_analyzed'],
+            'watermark': watermarks.get(table)
+        }
+    status['etl_log'] = {k: v for k, v in watermarks.items() if k.startswith('etl_log:')}
+    return status
@@ -0,0 +1,310 @@
+"""
+Línea de comandos del ETL: python -m etl <subcomando>
+
+Solo se importan argparse y la biblioteca estándar al arrancar; pandas,
+SQLAlchemy y los módulos del ETL se importan dentro de cada subcomando
+cuando realmente se necesitan, así status y check responden rápido.
+"""
+import os
+import sys
+import time
+import argparse
+
+# Módulos que importa cada subcomando (los usa bench para medir el arranque en frío)
+SUBCOMMAND_IMPORTS = {
+    'status': ['yaml', 'etl.utils_etl', 'etl.catalog'],
+    'check': ['yaml', 'etl.utils_etl'],
+    'dims': ['yaml', 'etl.utils_etl', 'etl.extract', 'etl.transform', 'etl.load'],
+    'facts': ['yaml', 'etl.utils_etl', 'etl.extract', 'etl.transform', 'etl.load', 'etl.memory', 'etl.keys'],
+    'reconcile': ['yaml', 'etl.utils_etl', 'etl.reconcile'],
+    'export': ['yaml', 'etl.utils_etl', 'etl.parquet_export'],
+    'metrics': ['yaml', 'etl.utils_etl', 'pandas', 'etl.transform'],
+    'all': ['yaml', 'etl.utils_etl', 'etl.extract', 'etl.transform', 'etl.load', 'etl.keys', 'etl.async_load']
+}
+
+
+def _settings(args) -> tuple:
+    from etl import utils_etl
+
+    return utils_etl.load_config(args.config)
+
+
+def cmd_status(args) -> int:
+    """Estado de la bodega desde el catálogo de PostgreSQL (sin pandas ni conexión al origen)"""
+    from etl import utils_etl, catalog
+
+    _, config_target, _ = _settings(args)
+    etl_conn = utils_etl.create_target_connection(config_target)
+    # get_status ya trae las marcas de agua: una sola consulta a los hechos y a etl_log
+    details = catalog.get_status(etl_conn, exact=args.exact)
+
+    for table in catalog.WAREHOUSE_TABLES:
+        info = details[table]
+        if not info['exists']:
+            print(f"  {table:<28} Tabla no existe")
+            continue
+        watermark = info['watermark']
+        suffix = f"  (última orden {watermark})" if watermark else ''
+        print(f"  {table:<28} {info['rows']:>12,} registros{suffix}")
+    for name, value in sorted(details['etl_log'].items()):
+        print(f"  {name[len('etl_log:'):]:<28} último éxito {value}")
+    return 0
+
+
+def cmd_check(args) -> int:
+    """¿Hay datos nuevos en el origen? Código de salida 0 si hay, 1 si no"""
+    from etl import utils_etl
+
+    config_source, config_target, _ = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    return 0 if utils_etl.check_new_data(source_conn, etl_conn) else 1
+
+
+def cmd_dims(args) -> int:
+    """Carga de dimensiones"""
+    from etl import utils_etl
+
+    config_source, config_target, etl_settings = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    replace = args.replace or etl_settings.get('replace_dimensions', False)
+    try:
+        utils_etl.push_dimensions(source_conn, etl_conn, replace=replace)
+    except Exception:
+        utils_etl.log_etl_run(etl_conn, 'Dimensiones', 'Fallido')
+        return 1
+    utils_etl.log_etl_run(etl_conn, 'Dimensiones', 'Exitoso')
+    return 0
+
+
+def cmd_all(args) -> int:
+    """Dimensiones y hechos con todas las escrituras en un lote asyncio concurrente"""
+    from etl import utils_etl, async_load
+
+    config_source, config_target, etl_settings = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    loader = async_load.AsyncLoader.from_settings(etl_conn, etl_settings)
+    replace = args.replace or etl_settings.get('replace_dimensions', False)
+    try:
+        utils_etl.push_all(source_conn, etl_conn, loader, replace=replace, incremental=not args.full)
+    except Exception as e:
+        print(f"✗ Error en la carga concurrente: {e}")
+        return 1
+    return 0
+
+
+def cmd_facts(args) -> int:
+    """Carga de hechos: por lotes si hay memory_budget_mb, si no en una pasada"""
+    from etl import utils_etl, keys
+    from etl.memory import MemoryGovernor
+
+    config_source, config_target, etl_settings = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    start_date = etl_settings.get('start_date', '2011-01-01')
+    governor = MemoryGovernor.from_settings(etl_settings)
+
+    if governor is None or args.full:
+        try:
+            utils_etl.push_facts(source_conn, etl_conn, incremental=not args.full)
+        except Exception:
+            utils_etl.log_etl_run(etl_conn, 'Hechos', 'Fallido')
+            return 1
+        utils_etl.log_etl_run(etl_conn, 'Hechos', 'Exitoso')
+        return 0
+
+    allocator = keys.KeyAllocator.from_settings(etl_conn, etl_settings)
+    dimensions = allocator.dimensions(etl_settings.get('reporting_currency'))
+    for fact_name, process_name in (('fact_internet_sales', 'Internet_Sales'),
+                                    ('fact_reseller_sales', 'Reseller_Sales')):
+        try:
+            records = utils_etl.push_fact_batches(source_conn, etl_conn, fact_name, dimensions,
+                                                  governor, start_date=start_date)
+        except Exception as e:
+            print(f"✗ Error procesando {fact_name}: {e}")
+            utils_etl.log_etl_run(etl_conn, process_name, 'Fallido')
+            return 1
+        utils_etl.log_etl_run(etl_conn, process_name, 'Exitoso', records)
+        print(f"✓ {fact_name}: {records} registros")
+    return 0
+
+
+def cmd_reconcile(args) -> int:
+    """Reconciliación por particiones; código de salida 1 si quedan diferencias"""
+    from etl import utils_etl, reconcile
+
+    config_source, config_target, etl_settings = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    reports = reconcile.reconcile_all(
+        source_conn, etl_conn,
+        granularity=args.granularity or etl_settings.get('reconcile_granularity', 'month'),
+        start_date=etl_settings.get('start_date', '2011-01-01'),
+        repair=args.repair,
+        reporting_currency=etl_settings.get('reporting_currency')
+    )
+    mismatched = sum(int((~report['match']).sum()) for report in reports.values() if not report.empty)
+    return 1 if mismatched and not args.repair else 0
+
+
+def cmd_export(args) -> int:
+    """Exportación Parquet del datamart (incremental desde --after-order-id o con --verify)"""
+    from etl import utils_etl, parquet_export
+
+    _, config_target, etl_settings = _settings(args)
+    etl_conn = utils_etl.create_target_connection(config_target)
+    parquet_export.export_datamart(
+        etl_conn,
+        output_dir=args.output or etl_settings.get('parquet_dir', 'datamart_parquet'),
+        after_order_id=args.after_order_id,
+        compression=etl_settings.get('parquet_compression', 'zstd'),
+        verify=args.verify
+    )
+    return 0
+
+
+def cmd_metrics(args) -> int:
+    """Métricas de ventas por grano sobre el histórico completo (agregación por streaming)"""
+    from etl import utils_etl
+
+    _, config_target, _ = _settings(args)
+    etl_conn = utils_etl.create_target_connection(config_target)
+    grain = [column.strip() for column in args.grain.split(',')] if args.grain else None
+    metrics = utils_etl.aggregate_sales_metrics(etl_conn, grain=grain, fact_names=args.fact,
+                                                chunksize=args.chunksize)
+    if args.output:
+        metrics.to_csv(args.output, index=False)
+        print(f"✓ {len(metrics)} filas de métricas en {args.output}")
+    else:
+        print(metrics.to_string(index=False, max_rows=50))
+    return 0
+
+
+def cmd_serve(args) -> int:
+    """API HTTP de lectura con caché (ver etl.api)"""
+    from etl import utils_etl, api
+
+    _, config_target, etl_settings = _settings(args)
+    etl_conn = utils_etl.create_target_connection(config_target, pool_pre_ping=True)
+    api.serve(etl_conn, args.host, args.port,
+              max_entries=etl_settings.get('api_cache_entries', 256),
+              ttl=etl_settings.get('api_cache_ttl', 300))
+    return 0
+
+
+def cmd_daemon(args) -> int:
+    """Modo demonio de micro-lotes (ver etl.daemon)"""
+    from etl import utils_etl, daemon
+
+    config_source, config_target, etl_settings = _settings(args)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target,
+                                                         **daemon.ENGINE_OPTIONS)
+    worker = daemon.from_settings(source_conn, etl_conn, etl_settings)
+    stats = worker.run(max_cycles=1 if args.once else None)
+    return 1 if stats['errors'] else 0
+
+
+def _time_command(command: list, runs: int) -> list:
+    import subprocess
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def cmd_bench(args) -> int:
+    """
+    Arranque en frío medido en procesos nuevos: intérprete vacío, --help y
+    las importaciones de cada subcomando (mínimo y mediana de runs corridas).
+    """
+    import statistics
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = {
+        'python (vacío)': [sys.executable, '-c', 'pass'],
+        'etl --help': [sys.executable, '-m', 'etl', '--help']
+    }
+    for name, modules in SUBCOMMAND_IMPORTS.items():
+        commands[f'imports {name}'] = [sys.executable, '-c', f"import {', '.join(modules)}"]
+    if args.live:
+        commands['etl status'] = [sys.executable, '-m', 'etl', '--config', args.config, 'status']
+        commands['etl check'] = [sys.executable, '-m', 'etl', '--config', args.config, 'check']
+
+    cwd = os.getcwd()
+    os.chdir(package_dir)
+    try:
+        print(f"{'comando':<22} {'mínimo':>9} {'mediana':>9}")
+        for name, command in commands.items():
+            timings = _time_command(command, args.runs)
+            print(f"{name:<22} {min(timings) * 1000:>7.0f}ms {statistics.median(timings) * 1000:>7.0f}ms")
+    finally:
+        os.chdir(cwd)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='etl', description='ETL AdventureWorks')
+    parser.add_argument('--config', default='config.yml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    status = subparsers.add_parser('status', help='estado de la bodega')
+    status.add_argument('--exact', action='store_true', help='COUNT(*) exacto en lugar de filas estimadas')
+    status.set_defaults(func=cmd_status)
+
+    check = subparsers.add_parser('check', help='¿hay datos nuevos en el origen? (0 = sí, 1 = no)')
+    check.set_defaults(func=cmd_check)
+
+    dims = subparsers.add_parser('dims', help='cargar dimensiones')
+    dims.add_argument('--replace', action='store_true')
+    dims.set_defaults(func=cmd_dims)
+
+    facts = subparsers.add_parser('facts', help='cargar hechos')
+    facts.add_argument('--full', action='store_true', help='recarga completa (shadow swap)')
+    facts.set_defaults(func=cmd_facts)
+
+    all_tables = subparsers.add_parser('all', help='dimensiones y hechos con carga concurrente (asyncio)')
+    all_tables.add_argument('--replace', action='store_true', help='recargar dimensiones')
+    all_tables.add_argument('--full', action='store_true', help='recarga completa de hechos (shadow swap)')
+    all_tables.set_defaults(func=cmd_all)
+
+    reconcile = subparsers.add_parser('reconcile', help='reconciliar hechos contra el origen')
+    reconcile.add_argument('--repair', action='store_true')
+    reconcile.add_argument('--granularity', choices=['month', 'order'])
+    reconcile.set_defaults(func=cmd_reconcile)
+
+    export = subparsers.add_parser('export', help='exportar el datamart a Parquet particionado')
+    export.add_argument('--output', help='directorio del dataset (parquet_dir)')
+    export.add_argument('--after-order-id', type=int,
+                        help='solo particiones con órdenes posteriores (sin esto, exportación completa)')
+    export.add_argument('--verify', action='store_true',
+                        help='comparar la huella de todas las particiones con el manifiesto y reescribir las que cambiaron')
+    export.set_defaults(func=cmd_export)
+
+    metrics = subparsers.add_parser('metrics', help='métricas de ventas por grano (streaming)')
+    metrics.add_argument('--grain', help='columnas del grano separadas por coma (por defecto date_key,product_key)')
+    metrics.add_argument('--fact', action='append', choices=['fact_internet_sales', 'fact_reseller_sales'],
+                         help='hecho a agregar (repetible; por defecto ambos)')
+    metrics.add_argument('--chunksize', type=int, default=200000)
+    metrics.add_argument('--output', help='archivo CSV de salida')
+    metrics.set_defaults(func=cmd_metrics)
+
+    serve = subparsers.add_parser('serve', help='API HTTP de lectura con caché')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.set_defaults(func=cmd_serve)
+
+    daemon = subparsers.add_parser('daemon', help='micro-lotes casi en tiempo real')
+    daemon.add_argument('--once', action='store_true')
+    daemon.set_defaults(func=cmd_daemon)
+
+    bench = subparsers.add_parser('bench', help='medir el arranque en frío de cada subcomando')
+    bench.add_argument('--runs', type=int, default=5)
+    bench.add_argument('--live', action='store_true', help='incluir status y check contra las bases')
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,250 @@
+import time
+import signal
+import argparse
+import threading
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Hechos que procesa el demonio: (extracción, transformación, llaves de dimensión)
+DAEMON_FACTS = {
+    'fact_internet_sales': ('extract_internet_sales', 'transform_internet_sales',
+                            ['customer_key', 'product_key', 'date_key']),
+    'fact_reseller_sales': ('extract_reseller_sales', 'transform_reseller_sales',
+                            ['reseller_key', 'product_key', 'date_key'])
+}
+
+# Opciones de los motores para un proceso de larga duración
+ENGINE_OPTIONS = {'pool_pre_ping': True, 'pool_recycle': 1800, 'pool_size': 2, 'max_overflow': 2}
+
+# Segundos mínimos entre relecturas de dimensiones por llaves faltantes
+DIMENSION_RETRY_SECONDS = 60
+
+
+class MicroBatchDaemon:
+    """
+    Demonio de micro-lotes: mantiene en memoria los motores, las dimensiones
+    de la bodega y las marcas de agua, consulta el origen cada interval
+    segundos con una sonda barata (MAX(SalesOrderID) sobre la llave primaria)
+    y carga las órdenes nuevas en lotes de a lo sumo max_orders órdenes.
+    """
+
+    def __init__(self, source_conn: Engine, etl_conn: Engine, start_date: str = '2011-01-01',
+                 interval: float = 5.0, max_orders: int = 500, dimension_ttl: float = 900,
+                 reporting_currency: str = None):
+        self.source_conn = source_conn
+        self.etl_conn = etl_conn
+        self.start_date = start_date
+        self.interval = interval
+        self.max_orders = max_orders
+        self.dimension_ttl = dimension_ttl
+        self.reporting_currency = reporting_currency
+        self.dimensions = None
+        self.dimensions_loaded_at = 0.0
+        self.dimensions_run = None
+        self.watermarks = {}
+        self.seen_order_id = 0
+        self.stats = {'cycles': 0, 'batches': 0, 'rows': 0, 'errors': 0}
+        self._stop = threading.Event()
+
+    def warm(self):
+        """Cargamos catálogo, dimensiones y marcas de agua antes del primer ciclo"""
+        catalog.get_catalog(self.etl_conn, refresh=True)
+        self.refresh_dimensions()
+        watermarks = catalog.get_watermarks(self.etl_conn)
+        self.watermarks = {fact_name: watermarks.get(fact_name) or 0 for fact_name in DAEMON_FACTS}
+        self.watermarks['bridge_order_sales_reason'] = watermarks.get('bridge_order_sales_reason') or 0
+        self.seen_order_id = min(self.watermarks[fact_name] for fact_name in DAEMON_FACTS)
+        print(f"✓ Demonio listo: marcas de agua {self.watermarks}")
+
+    def refresh_dimensions(self):
+        """Releemos las dimensiones de la bodega (una vez, no en cada lote)"""
+        from etl import extract
+
+        self.dimensions = extract.extract_dimensions_from_dw(self.etl_conn, self.reporting_currency)
+        self.dimensions_loaded_at = time.monotonic()
+        self.dimensions_run = self._last_dimensions_run()
+
+    def _last_dimensions_run(self):
+        """Última carga exitosa de dimensiones según etl_log"""
+        if not catalog.table_exists(self.etl_conn, 'etl_log'):
+            return None
+        with self.etl_conn.connect() as conn:
+            return conn.execute(text('''
+                SELECT MAX(run_timestamp) FROM etl_log
+                WHERE process_name = 'Dimensiones' AND status = 'Exitoso'
+            ''')).scalar()
+
+    def _dimensions_stale(self) -> bool:
+        """Las dimensiones se releen si vence el TTL o hubo una carga de dimensiones"""
+        if time.monotonic() - self.dimensions_loaded_at >= self.dimension_ttl:
+            return True
+        return self._last_dimensions_run() != self.dimensions_run
+
+    def probe(self) -> int:
+        """Sonda de cambios: mayor SalesOrderID en el origen (búsqueda en el índice clustered)"""
+        with self.source_conn.connect() as conn:
+            return conn.execute(text('SELECT MAX(SalesOrderID) FROM Sales.SalesOrderHeader')).scalar() or 0
+
+    def process_fact(self, fact_name: str, until_order_id: int) -> int:
+        """
+        Cargamos las órdenes de (marca de agua, until_order_id] en micro-lotes.
+        Cada lote borra su rango y carga en una transacción, así un reintento
+        tras un error no duplica filas.
+        """
+        from etl import extract, transform, integrity
+
+        extract_name, transform_name, key_columns = DAEMON_FACTS[fact_name]
+        extract_fn = getattr(extract, extract_name)
+        transform_fn = getattr(transform, transform_name)
+        total = 0
+
+        while self.watermarks[fact_name] < until_order_id and not self._stop.is_set():
+            after_order_id = self.watermarks[fact_name]
+            batch = extract_fn(self.source_conn, start_date=self.start_date, after_order_id=after_order_id,
+                               max_orders=self.max_orders, until_order_id=until_order_id)
+            if batch.empty:
+                self.watermarks[fact_name] = until_order_id
+                break
+            batch_until = int(batch['SalesOrderID'].max())
+
+            fact = transform_fn(batch, self.dimensions)
+            missing = fact[key_columns].isna().any(axis=1)
+            if missing.any():
+                print(f"Advertencia: {int(missing.sum())} filas de {fact_name} sin llave de dimensión")
+                # Miembros nuevos de dimensión: se releen (con límite de frecuencia) y se re-transforma
+                if time.monotonic() - self.dimensions_loaded_at >= DIMENSION_RETRY_SECONDS:
+                    self.refresh_dimensions()
+                    fact = transform_fn(batch, self.dimensions)
+            # Las que siguen huérfanas van a cuarentena sin frenar el micro-lote
+            fact = integrity.precheck(fact, fact_name, self.dimensions, self.etl_conn)
+            if not transform.validate_transformations(fact, fact_name):
+                raise ValueError(f"Validación fallida para {fact_name} (órdenes {after_order_id}+)")
+
+            with self.etl_conn.begin() as conn:
+                conn.execute(text(f'''
+                    DELETE FROM {fact_name}
+                    WHERE sales_order_id > :after_order_id AND sales_order_id <= :until_order_id
+                '''), {'after_order_id': after_order_id, 'until_order_id': batch_until})
+                fact.to_sql(fact_name, conn, if_exists='append', index=False, chunksize=10000)
+
+            self.watermarks[fact_name] = batch_until
+            self.stats['batches'] += 1
+            total += len(fact)
+            print(f"✓ {fact_name}: órdenes ({after_order_id}, {batch_until}] -> {len(fact)} registros")
+
+        return total
+
+    def process_bridge(self, until_order_id: int) -> int:
+        """Pares orden-razón de las órdenes nuevas"""
+        from etl import extract, transform, load
+
+        after_order_id = self.watermarks['bridge_order_sales_reason']
+        order_reasons = extract.extract_order_sales_reason(self.source_conn, after_order_id=after_order_id)
+        order_reasons = order_reasons[order_reasons['SalesOrderID'] <= until_order_id]
+        bridge = transform.transform_order_sales_reason(order_reasons)
+        inserted = load.load_bridge_order_sales_reason(bridge, self.etl_conn) if not bridge.empty else 0
+        self.watermarks['bridge_order_sales_reason'] = until_order_id
+        return inserted
+
+    def run_once(self) -> int:
+        """Un ciclo: sonda y, si hay órdenes nuevas, micro-lotes hasta alcanzarlas"""
+        from etl import utils_etl
+
+        self.stats['cycles'] += 1
+        source_max = self.probe()
+        if source_max <= self.seen_order_id:
+            return 0
+
+        if self._dimensions_stale():
+            self.refresh_dimensions()
+
+        started = time.perf_counter()
+        rows = 0
+        for fact_name in DAEMON_FACTS:
+            rows += self.process_fact(fact_name, source_max)
+        if self._stop.is_set():
+            return rows
+        try:
+            self.process_bridge(source_max)
+        except Exception as e:
+            print(f"Advertencia: Error cargando razones de venta: {e}")
+
+        self.seen_order_id = source_max
+        self.stats['rows'] += rows
+        utils_etl.log_etl_run(self.etl_conn, 'Microlote', 'Exitoso', rows)
+        print(f"✓ Micro-lote hasta la orden {source_max}: {rows} registros en "
+              f"{time.perf_counter() - started:.2f} s")
+        return rows
+
+    def run(self, max_cycles: int = None):
+        """
+        Bucle principal hasta recibir SIGINT/SIGTERM (o max_cycles ciclos).
+        Un error en un ciclo se registra y se reintenta en el siguiente con
+        las marcas de agua releídas de la bodega.
+        """
+        from etl import utils_etl
+
+        self.warm()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"✗ Error en el micro-lote: {e}")
+                utils_etl.log_etl_run(self.etl_conn, 'Microlote', 'Fallido')
+                try:
+                    self.warm()
+                except Exception as warm_error:
+                    print(f"✗ Error releyendo el estado de la bodega: {warm_error}")
+            if max_cycles is not None and self.stats['cycles'] >= max_cycles:
+                break
+            self._stop.wait(self.interval)
+        print(f"Demonio detenido: {self.stats}")
+        return self.stats
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+def from_settings(source_conn: Engine, etl_conn: Engine, etl_settings: dict) -> MicroBatchDaemon:
+    """
+    Creamos el demonio desde ETL_SETTINGS (daemon_interval, daemon_max_orders,
+    daemon_dimension_ttl, start_date, reporting_currency)
+    """
+    return MicroBatchDaemon(
+        source_conn, etl_conn,
+        start_date=etl_settings.get('start_date', '2011-01-01'),
+        interval=etl_settings.get('daemon_interval', 5.0),
+        max_orders=etl_settings.get('daemon_max_orders', 500),
+        dimension_ttl=etl_settings.get('daemon_dimension_ttl', 900),
+        reporting_currency=etl_settings.get('reporting_currency')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ETL en micro-lotes casi en tiempo real')
+    parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--interval', type=float, help='segundos entre sondas al origen')
+    parser.add_argument('--max-orders', type=int, help='órdenes por micro-lote')
+    parser.add_argument('--once', action='store_true', help='un solo ciclo y salir')
+    args = parser.parse_args()
+
+    from etl import utils_etl
+
+    config_source, config_target, etl_settings = utils_etl.load_config(args.config)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target, **ENGINE_OPTIONS)
+
+    daemon = from_settings(source_conn, etl_conn, etl_settings)
+    if args.interval is not None:
+        daemon.interval = args.interval
+    if args.max_orders is not None:
+        daemon.max_orders = args.max_orders
+
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    daemon.run(max_cycles=1 if args.once else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,11 +11,107 @@ def extract(tables: list, connection: Engine) -> list[pd.DataFrame]:
     return dataframes
 
 
-def extract_internet_sales(connection: Engine, start_date: str = '2011-01-01'):
+# Modo muestra (desarrollo/CI): None = extracción completa; si no {'percent': ..., 'seed': ...}
+SAMPLE = None
+
+# Granularidad del hash de órdenes de la muestra (porcentajes con dos decimales)
+SAMPLE_BUCKETS = 10000
+
+
+def set_sample(percent: float = None, seed: int = 0):
+    """
+    Activamos (o con percent=None desactivamos) el modo muestra: las
+    extracciones de ventas toman un porcentaje determinístico de órdenes y
+    las de dimensiones solo los miembros que esas órdenes referencian
+    """
+    global SAMPLE
+    SAMPLE = None if percent is None else {'percent': float(percent), 'seed': int(seed)}
+
+
+def _sample_orders(column: str) -> str:
+    """
+    Predicado de órdenes de la muestra: hash multiplicativo de SalesOrderID
+    según la semilla (misma muestra en cada corrida y en cualquier motor)
+    """
+    if SAMPLE is None:
+        return '1 = 1'
+    threshold = int(round(SAMPLE['percent'] * SAMPLE_BUCKETS / 100))
+    # La semilla cambia el multiplicador (otra permutación módulo el primo), no solo desplaza el hash
+    multiplier = 2654435761 + 40503 * SAMPLE['seed']
+    return f"(CAST({column} AS BIGINT) * {multiplier} % 1000003) % {SAMPLE_BUCKETS} < {threshold}"
+
+
+def _sample_members(column: str, referenced: str, order_column: str, source: str) -> str:
+    """
+    Predicado de dimensión en modo muestra: solo los miembros (column) que
+    referencian las órdenes de la muestra, así la muestra queda cerrada
+    referencialmente. Sin muestra no filtra.
+    """
+    if SAMPLE is None:
+        return '1 = 1'
+    return f'{column} IN (SELECT {referenced} FROM {source} WHERE {_sample_orders(order_column)})'
+
+
+def _sales_order_filter(online_flag: int, start_date: str = None, after_order_id: int = None,
+                        max_orders: int = None, end_date: str = None,
+                        until_order_id: int = None, order_ids: list = None) -> tuple:
+    """
+    Construimos el filtro de órdenes para las extracciones de ventas.
+    Con max_orders se extrae un lote de órdenes completas (todas sus líneas)
+    a partir de after_order_id, en orden de SalesOrderID.
+    end_date (exclusivo) y until_order_id (inclusivo) acotan el rango.
+    order_ids limita a esas órdenes (lista IN con literales enteros: SQL
+    Server admite a lo sumo 2100 parámetros por consulta).
+    """
+    conditions = ['soh.OnlineOrderFlag = ?', _sample_orders('soh.SalesOrderID')]
+    params = [online_flag]
+    
+    if start_date is not None:
+        conditions.append('soh.OrderDate >= ?')
+        params.append(start_date)
+    
+    if end_date is not None:
+        conditions.append('soh.OrderDate < ?')
+        params.append(end_date)
+    
+    if after_order_id is not None:
+        conditions.append('soh.SalesOrderID > ?')
+        params.append(int(after_order_id))
+    
+    if until_order_id is not None:
+        conditions.append('soh.SalesOrderID <= ?')
+        params.append(int(until_order_id))
+    
+    if order_ids is not None:
+        listed = ', '.join(str(int(order_id)) for order_id in order_ids) or 'NULL'
+        conditions.append(f'soh.SalesOrderID IN ({listed})')
+    
+    if max_orders is not None:
+        conditions.append(f'''soh.SalesOrderID IN (
+            SELECT TOP (?) b.SalesOrderID
+            FROM Sales.SalesOrderHeader b
+            WHERE b.OnlineOrderFlag = ? AND b.OrderDate >= ? AND b.SalesOrderID > ?
+            AND {_sample_orders('b.SalesOrderID')}
+            ORDER BY b.SalesOrderID
+        )''')
+        params.extend([int(max_orders), online_flag, start_date or '1900-01-01', int(after_order_id or 0)])
+    
+    where = '\n    AND '.join(conditions)
+    order_by = 'ORDER BY soh.SalesOrderID, sod.SalesOrderDetailID' if max_orders is not None else ''
+    # Tupla: con SQLAlchemy 2 una lista de escalares se toma como executemany
+    return f'WHERE {where}\n    {order_by}', tuple(params)
+
+
+def extract_internet_sales(connection: Engine, start_date: str = '2011-01-01',
+                           after_order_id: int = None, max_orders: int = None,
+                           end_date: str = None, until_order_id: int = None,
+                           order_ids: list = None):
     """
     Extraemos datos de ventas por internet de AdventureWorks
     """
-    query = """
+    where, params = _sales_order_filter(1, start_date, after_order_id, max_orders,
+                                        end_date, until_order_id, order_ids)
+    query = f"""
     SELECT 
         soh.SalesOrderID,
         soh.OrderDate,
@@ -35,21 +131,29 @@ def extract_internet_sales(connection: Engine, start_date: str = '2011-01-01'):
         sod.UnitPriceDiscount,
         sod.LineTotal,
         c.PersonID as CustomerPersonID,
-        soh.OnlineOrderFlag
+        soh.OnlineOrderFlag,
+        p.StandardCost,
+        COALESCE(cr.ToCurrencyCode, 'USD') as CurrencyCode
     FROM Sales.SalesOrderHeader soh
     JOIN Sales.SalesOrderDetail sod ON soh.SalesOrderID = sod.SalesOrderID
     JOIN Sales.Customer c ON soh.CustomerID = c.CustomerID
-    WHERE soh.OnlineOrderFlag = 1
-    AND soh.OrderDate >= ?
+    JOIN Production.Product p ON sod.ProductID = p.ProductID
+    LEFT JOIN Sales.CurrencyRate cr ON soh.CurrencyRateID = cr.CurrencyRateID
+    {where}
     """
-    return pd.read_sql_query(query, connection, params=[start_date])
+    return pd.read_sql_query(query, connection, params=params)
 
 
-def extract_reseller_sales(connection: Engine, start_date: str = '2011-01-01'):
+def extract_reseller_sales(connection: Engine, start_date: str = '2011-01-01',
+                           after_order_id: int = None, max_orders: int = None,
+                           end_date: str = None, until_order_id: int = None,
+                           order_ids: list = None):
     """
     Extraemos datos de ventas por revendedores de AdventureWorks
     """
-    query = """
+    where, params = _sales_order_filter(0, start_date, after_order_id, max_orders,
+                                        end_date, until_order_id, order_ids)
+    query = f"""
     SELECT 
         soh.SalesOrderID,
         soh.OrderDate,
@@ -70,22 +174,135 @@ def extract_reseller_sales(connection: Engine, start_date: str = '2011-01-01'):
         sod.LineTotal,
         s.BusinessEntityID as StoreID,
         s.Name as StoreName,
-        soh.OnlineOrderFlag
+        soh.OnlineOrderFlag,
+        p.StandardCost,
+        COALESCE(cr.ToCurrencyCode, 'USD') as CurrencyCode
     FROM Sales.SalesOrderHeader soh
     JOIN Sales.SalesOrderDetail sod ON soh.SalesOrderID = sod.SalesOrderID
     JOIN Sales.Customer c ON soh.CustomerID = c.CustomerID
     JOIN Sales.Store s ON c.StoreID = s.BusinessEntityID
-    WHERE soh.OnlineOrderFlag = 0
-    AND soh.OrderDate >= ?
+    JOIN Production.Product p ON sod.ProductID = p.ProductID
+    LEFT JOIN Sales.CurrencyRate cr ON soh.CurrencyRateID = cr.CurrencyRateID
+    {where}
     """
-    return pd.read_sql_query(query, connection, params=[start_date])
+    return pd.read_sql_query(query, connection, params=params)
 
 
-def extract_customers(connection: Engine):
+
+def extract_order_lifecycle(connection: Engine, modified_since=None, start_date: str = '2011-01-01',
+                            chunksize: int = None):
     """
-    Extraemos datos de clientes
+    Hitos de cada línea de orden (pedido, vencimiento, despacho y estado)
+    para el snapshot acumulativo. Solo líneas cuya cabecera o detalle se
+    modificó desde modified_since (inclusive: lo que comparta el instante
+    de la marca de agua se vuelve a comparar, no se pierde). En orden de
+    modificación, así una corrida interrumpida no adelanta la marca de agua
+    más allá de lo ya cargado. Con chunksize devuelve un iterador de DataFrames.
     """
-    query = """
+    query = f"""
+    SELECT 
+        soh.SalesOrderID,
+        sod.SalesOrderDetailID,
+        soh.OnlineOrderFlag,
+        soh.Status,
+        sod.ProductID,
+        soh.OrderDate,
+        soh.DueDate,
+        soh.ShipDate,
+        CASE WHEN sod.ModifiedDate > soh.ModifiedDate THEN sod.ModifiedDate ELSE soh.ModifiedDate END
+            as SourceModified
+    FROM Sales.SalesOrderHeader soh
+    JOIN Sales.SalesOrderDetail sod ON soh.SalesOrderID = sod.SalesOrderID
+    WHERE soh.OrderDate >= ?
+    AND (soh.ModifiedDate >= ? OR sod.ModifiedDate >= ?)
+    AND {_sample_orders('soh.SalesOrderID')}
+    ORDER BY SourceModified, soh.SalesOrderID
+    """
+    since = modified_since if modified_since is not None else '1900-01-01'
+    return pd.read_sql_query(query, connection, params=(start_date or '1900-01-01', since, since),
+                             chunksize=chunksize)
+
+# Reglas de preferencia para elegir un único email/teléfono/dirección por entidad.
+# Los tipos se prefieren en el orden listado; el desempate es el registro más reciente.
+CUSTOMER_PREFERENCES = {
+    'phone_types': ['Cell', 'Home', 'Work'],
+    'address_types': ['Home', 'Primary', 'Billing', 'Shipping']
+}
+
+STORE_PREFERENCES = {
+    'address_types': ['Main Office', 'Primary', 'Billing', 'Shipping']
+}
+
+
+def _preference_order(column: str, preferred: list) -> tuple:
+    """
+    Construimos un CASE parametrizado que ordena por la lista de preferencias
+    """
+    if not preferred:
+        return '0', []
+    whens = ' '.join('WHEN ? THEN %d' % i for i in range(len(preferred)))
+    return f'CASE {column} {whens} ELSE {len(preferred)} END', list(preferred)
+
+
+def _key_range_filter(column: str, key_ranges: list = None) -> str:
+    """
+    Predicado para extraer solo rangos de llaves [desde, hasta] (los que
+    cambiaron según la sonda de la dimensión); sin rangos no filtra
+    """
+    if not key_ranges:
+        return '1 = 1'
+    return '(' + ' OR '.join(f'{column} BETWEEN {int(low)} AND {int(high)}' for low, high in key_ranges) + ')'
+
+
+def _report_collapsed(df: pd.DataFrame, entity: str) -> pd.DataFrame:
+    """
+    Informamos cuántas filas del join original se colapsaron en el servidor
+    """
+    collapsed = int(df['CollapsedRows'].sum()) if not df.empty else 0
+    print(f"{entity}: {len(df)} filas extraídas, {collapsed} filas duplicadas colapsadas en origen")
+    return df.drop(columns='CollapsedRows')
+
+
+def extract_customers(connection: Engine, preferences: dict = None, key_ranges: list = None):
+    """
+    Extraemos datos de clientes (una fila por cliente).
+    Email, teléfono y dirección se eligen en el servidor con ROW_NUMBER
+    según las reglas de preferencia. Con key_ranges solo esos CustomerID.
+    """
+    preferences = {**CUSTOMER_PREFERENCES, **(preferences or {})}
+    phone_order, phone_params = _preference_order('pnt.Name', preferences['phone_types'])
+    address_order, address_params = _preference_order('at.Name', preferences['address_types'])
+    
+    query = f"""
+    WITH email AS (
+        SELECT 
+            be.BusinessEntityID,
+            be.EmailAddress,
+            ROW_NUMBER() OVER (PARTITION BY be.BusinessEntityID 
+                               ORDER BY be.ModifiedDate DESC, be.EmailAddressID) AS rn,
+            COUNT(*) OVER (PARTITION BY be.BusinessEntityID) AS candidates
+        FROM Person.EmailAddress be
+    ),
+    phone AS (
+        SELECT 
+            pp.BusinessEntityID,
+            pp.PhoneNumber,
+            ROW_NUMBER() OVER (PARTITION BY pp.BusinessEntityID 
+                               ORDER BY {phone_order}, pp.ModifiedDate DESC, pp.PhoneNumber) AS rn,
+            COUNT(*) OVER (PARTITION BY pp.BusinessEntityID) AS candidates
+        FROM Person.PersonPhone pp
+        JOIN Person.PhoneNumberType pnt ON pp.PhoneNumberTypeID = pnt.PhoneNumberTypeID
+    ),
+    address AS (
+        SELECT 
+            bea.BusinessEntityID,
+            bea.AddressID,
+            ROW_NUMBER() OVER (PARTITION BY bea.BusinessEntityID 
+                               ORDER BY {address_order}, bea.ModifiedDate DESC, bea.AddressID) AS rn,
+            COUNT(*) OVER (PARTITION BY bea.BusinessEntityID) AS candidates
+        FROM Person.BusinessEntityAddress bea
+        JOIN Person.AddressType at ON bea.AddressTypeID = at.AddressTypeID
+    )
     SELECT 
         c.CustomerID,
         c.PersonID,
@@ -99,24 +316,29 @@ def extract_customers(connection: Engine):
         a.City,
         a.PostalCode,
         sp.Name as StateProvince,
-        cr.Name as CountryRegion
+        cr.Name as CountryRegion,
+        COALESCE(be.candidates, 1) * COALESCE(pp.candidates, 1) * COALESCE(bea.candidates, 1) - 1 as CollapsedRows
     FROM Sales.Customer c
     LEFT JOIN Person.Person p ON c.PersonID = p.BusinessEntityID
-    LEFT JOIN Person.EmailAddress be ON p.BusinessEntityID = be.BusinessEntityID
-    LEFT JOIN Person.PersonPhone pp ON p.BusinessEntityID = pp.BusinessEntityID
-    LEFT JOIN Person.BusinessEntityAddress bea ON p.BusinessEntityID = bea.BusinessEntityID
+    LEFT JOIN email be ON p.BusinessEntityID = be.BusinessEntityID AND be.rn = 1
+    LEFT JOIN phone pp ON p.BusinessEntityID = pp.BusinessEntityID AND pp.rn = 1
+    LEFT JOIN address bea ON p.BusinessEntityID = bea.BusinessEntityID AND bea.rn = 1
     LEFT JOIN Person.Address a ON bea.AddressID = a.AddressID
     LEFT JOIN Person.StateProvince sp ON a.StateProvinceID = sp.StateProvinceID
     LEFT JOIN Person.CountryRegion cr ON sp.CountryRegionCode = cr.CountryRegionCode
+    WHERE {_key_range_filter('c.CustomerID', key_ranges)}
+    AND {_sample_members('c.CustomerID', 'so.CustomerID', 'so.SalesOrderID', 'Sales.SalesOrderHeader so')}
+    ORDER BY c.CustomerID
     """
-    return pd.read_sql_query(query, connection)
+    df = pd.read_sql_query(query, connection, params=tuple(phone_params + address_params))
+    return _report_collapsed(df, 'Clientes')
 
 
-def extract_products(connection: Engine):
+def extract_products(connection: Engine, key_ranges: list = None):
     """
-    Extraemos datos de productos
+    Extraemos datos de productos (con key_ranges solo esos ProductID)
     """
-    query = """
+    query = f"""
     SELECT 
         p.ProductID,
         p.Name as ProductName,
@@ -136,6 +358,8 @@ def extract_products(connection: Engine):
     LEFT JOIN Production.ProductSubcategory psc ON p.ProductSubcategoryID = psc.ProductSubcategoryID
     LEFT JOIN Production.ProductCategory pc ON psc.ProductCategoryID = pc.ProductCategoryID
     LEFT JOIN Production.ProductModel pm ON p.ProductModelID = pm.ProductModelID
+    WHERE {_key_range_filter('p.ProductID', key_ranges)}
+    AND {_sample_members('p.ProductID', 'sd.ProductID', 'sd.SalesOrderID', 'Sales.SalesOrderDetail sd')}
     """
     return pd.read_sql_query(query, connection)
 
@@ -154,11 +378,27 @@ def extract_currency(connection: Engine):
     return pd.read_sql_table('Currency', connection, schema='Sales')
 
 
-def extract_employees(connection: Engine):
+def extract_currency_rate(connection: Engine):
     """
-    Extraemos datos de empleados/vendedores
+    Extraemos las tasas de cambio diarias (USD -> moneda de la orden)
     """
     query = """
+    SELECT 
+        cr.CurrencyRateDate,
+        cr.FromCurrencyCode,
+        cr.ToCurrencyCode,
+        cr.AverageRate,
+        cr.EndOfDayRate
+    FROM Sales.CurrencyRate cr
+    """
+    return pd.read_sql_query(query, connection)
+
+
+def extract_employees(connection: Engine, key_ranges: list = None):
+    """
+    Extraemos datos de empleados/vendedores (con key_ranges solo esos BusinessEntityID)
+    """
+    query = f"""
     SELECT 
         e.BusinessEntityID,
         p.FirstName,
@@ -172,15 +412,33 @@ def extract_employees(connection: Engine):
     JOIN HumanResources.EmployeeDepartmentHistory edh ON e.BusinessEntityID = edh.BusinessEntityID
     JOIN HumanResources.Department d ON edh.DepartmentID = d.DepartmentID
     WHERE edh.EndDate IS NULL  -- Departamento actual
+        AND {_key_range_filter('e.BusinessEntityID', key_ranges)}
+        AND {_sample_members('e.BusinessEntityID', 'so.SalesPersonID', 'so.SalesOrderID',
+                             'Sales.SalesOrderHeader so')}
     """
     return pd.read_sql_query(query, connection)
 
 
-def extract_stores(connection: Engine):
+def extract_stores(connection: Engine, preferences: dict = None, key_ranges: list = None):
     """
-    Extraemos datos de tiendas/revendedores
+    Extraemos datos de tiendas/revendedores (una fila por tienda,
+    eligiendo la dirección según las reglas de preferencia; con key_ranges
+    solo esos BusinessEntityID)
     """
-    query = """
+    preferences = {**STORE_PREFERENCES, **(preferences or {})}
+    address_order, address_params = _preference_order('at.Name', preferences['address_types'])
+    
+    query = f"""
+    WITH address AS (
+        SELECT 
+            bea.BusinessEntityID,
+            bea.AddressID,
+            ROW_NUMBER() OVER (PARTITION BY bea.BusinessEntityID 
+                               ORDER BY {address_order}, bea.ModifiedDate DESC, bea.AddressID) AS rn,
+            COUNT(*) OVER (PARTITION BY bea.BusinessEntityID) AS candidates
+        FROM Person.BusinessEntityAddress bea
+        JOIN Person.AddressType at ON bea.AddressTypeID = at.AddressTypeID
+    )
     SELECT 
         s.BusinessEntityID as StoreID,
         s.Name as StoreName,
@@ -189,14 +447,20 @@ def extract_stores(connection: Engine):
         a.City,
         a.PostalCode,
         sp.Name as StateProvince,
-        cr.Name as CountryRegion
+        cr.Name as CountryRegion,
+        bea.candidates - 1 as CollapsedRows
     FROM Sales.Store s
-    JOIN Person.BusinessEntityAddress bea ON s.BusinessEntityID = bea.BusinessEntityID
+    JOIN address bea ON s.BusinessEntityID = bea.BusinessEntityID AND bea.rn = 1
     JOIN Person.Address a ON bea.AddressID = a.AddressID
     JOIN Person.StateProvince sp ON a.StateProvinceID = sp.StateProvinceID
     JOIN Person.CountryRegion cr ON sp.CountryRegionCode = cr.CountryRegionCode
+    WHERE {_key_range_filter('s.BusinessEntityID', key_ranges)}
+    AND {_sample_members('s.BusinessEntityID', 'sc.StoreID', 'so.SalesOrderID',
+                         'Sales.Customer sc JOIN Sales.SalesOrderHeader so ON so.CustomerID = sc.CustomerID')}
+    ORDER BY s.BusinessEntityID
     """
-    return pd.read_sql_query(query, connection)
+    df = pd.read_sql_query(query, connection, params=tuple(address_params))
+    return _report_collapsed(df, 'Tiendas')
 
 
 def extract_sales_person(connection: Engine):
@@ -246,7 +510,7 @@ def extract_hecho_reseller_sales(etl_connection: Engine):
     return [df_trans, dim_reseller, dim_product, dim_date, dim_territory, dim_employee]
 
 
-def extract_dimensions_from_dw(etl_connection: Engine):
+def extract_dimensions_from_dw(etl_connection: Engine, reporting_currency: str = None):
     """
     Extraemos todas las dimensiones de la bodega de datos
     (Para transformaciones que necesitan referencias)
@@ -259,6 +523,13 @@ def extract_dimensions_from_dw(etl_connection: Engine):
     dim_employee = pd.read_sql_table('dim_employee', etl_connection)
     dim_reseller = pd.read_sql_table('dim_reseller', etl_connection)
     
+    # Tasas de cambio para la conversión a moneda de reporte (si ya existen en la bodega)
+    from etl import catalog
+    if catalog.table_exists(etl_connection, 'dim_currency_rate'):
+        currency_rates = pd.read_sql_table('dim_currency_rate', etl_connection)
+    else:
+        currency_rates = None
+    
     return {
         'dim_customer': dim_customer,
         'dim_product': dim_product,
@@ -266,22 +537,38 @@ def extract_dimensions_from_dw(etl_connection: Engine):
         'dim_territory': dim_territory,
         'dim_currency': dim_currency,
         'dim_employee': dim_employee,
-        'dim_reseller': dim_reseller
+        'dim_reseller': dim_reseller,
+        'currency_rates': currency_rates,
+        'reporting_currency': reporting_currency
     }
 
 
 def extract_sales_reason(connection: Engine):
     """
-    Extraemos razones de venta
+    Extraemos el catálogo de razones de venta (una fila por razón)
     """
-    query = """
+    query = f"""
     SELECT 
         sr.SalesReasonID,
         sr.Name as ReasonName,
-        sr.ReasonType,
-        soh.SalesOrderID
+        sr.ReasonType
     FROM Sales.SalesReason sr
-    JOIN Sales.SalesOrderHeaderSalesReason sohsr ON sr.SalesReasonID = sohsr.SalesReasonID
-    JOIN Sales.SalesOrderHeader soh ON sohsr.SalesOrderID = soh.SalesOrderID
+    WHERE {_sample_members('sr.SalesReasonID', 'sohsr.SalesReasonID', 'sohsr.SalesOrderID',
+                           'Sales.SalesOrderHeaderSalesReason sohsr')}
+    """
+    return pd.read_sql_query(query, connection)
+
+
+def extract_order_sales_reason(connection: Engine, after_order_id: int = None):
+    """
+    Extraemos los pares orden-razón de venta (solo órdenes posteriores a after_order_id)
+    """
+    query = f"""
+    SELECT 
+        sohsr.SalesOrderID,
+        sohsr.SalesReasonID
+    FROM Sales.SalesOrderHeaderSalesReason sohsr
+    WHERE sohsr.SalesOrderID > ?
+    AND {_sample_orders('sohsr.SalesOrderID')}
     """
-    return pd.read_sql_query(query, connection)
\ No newline at end of file
+    return pd.read_sql_query(query, connection, params=(int(after_order_id or 0),))
@@ -0,0 +1,28 @@
+import functools
+import inspect
+
+
+def wrap_module_functions(module, make_wrapper, prefixes: tuple = None):
+    """
+    Reemplazamos las funciones públicas de un módulo por envoltorios creados
+    con make_wrapper(nombre, función), sin cambiar las llamadas existentes
+    (módulo.función se resuelve al momento de llamar).
+    Devuelve una función que restaura las originales.
+    """
+    module_label = module.__name__.rsplit('.', 1)[-1]
+    originals = {}
+
+    for name, fn in list(vars(module).items()):
+        if name.startswith('_') or not inspect.isfunction(fn) or fn.__module__ != module.__name__:
+            continue
+        if prefixes and not name.startswith(tuple(prefixes)):
+            continue
+        wrapper = functools.wraps(fn)(make_wrapper(f'{module_label}.{name}', fn))
+        originals[name] = fn
+        setattr(module, name, wrapper)
+
+    def restore():
+        for name, fn in originals.items():
+            setattr(module, name, fn)
+
+    return restore
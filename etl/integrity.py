@@ -0,0 +1,232 @@
+import json
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Llaves foráneas de cada hecho: columna -> (dimensión, llave de la dimensión)
+FACT_FOREIGN_KEYS = {
+    'fact_internet_sales': {
+        'customer_key': ('dim_customer', 'customer_key'),
+        'product_key': ('dim_product', 'product_key'),
+        'date_key': ('dim_date', 'date_key')
+    },
+    'fact_reseller_sales': {
+        'reseller_key': ('dim_reseller', 'reseller_key'),
+        'product_key': ('dim_product', 'product_key'),
+        'employee_key': ('dim_employee', 'employee_key'),
+        'date_key': ('dim_date', 'date_key')
+    }
+}
+
+# Llaves densas (SERIAL) hasta este máximo se verifican con un bitmap; más allá, arreglo ordenado
+BITMAP_MAX_KEY = 50_000_000
+
+# Órdenes por consulta al re-extraer la cuarentena (literales en la lista IN)
+RELEASE_BATCH_ORDERS = 1000
+
+QUARANTINE_DDL = '''
+    CREATE TABLE IF NOT EXISTS etl_quarantine (
+        quarantine_id SERIAL PRIMARY KEY,
+        fact_name VARCHAR(64) NOT NULL,
+        sales_order_id INTEGER,
+        sales_order_detail_id INTEGER NOT NULL,
+        reasons TEXT NOT NULL,
+        payload JSONB,
+        quarantined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        UNIQUE (fact_name, sales_order_detail_id)
+    )
+'''
+
+
+def _key_set(values) -> dict:
+    """Conjunto de llaves de una dimensión como bitmap o arreglo ordenado"""
+    keys = pd.Series(values).dropna().to_numpy(dtype='int64')
+    if len(keys) and 0 <= keys.min() and keys.max() <= BITMAP_MAX_KEY:
+        bitmap = np.zeros(int(keys.max()) + 1, dtype=bool)
+        bitmap[keys] = True
+        return {'bitmap': bitmap}
+    return {'sorted': np.unique(keys)}
+
+
+def _contains(key_set: dict, keys: np.ndarray) -> np.ndarray:
+    """Pertenencia vectorizada de llaves enteras al conjunto"""
+    if 'bitmap' in key_set:
+        bitmap = key_set['bitmap']
+        inside = (keys >= 0) & (keys < len(bitmap))
+        found = np.zeros(len(keys), dtype=bool)
+        found[inside] = bitmap[keys[inside]]
+        return found
+    sorted_keys = key_set['sorted']
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    position = np.clip(np.searchsorted(sorted_keys, keys), 0, len(sorted_keys) - 1)
+    return sorted_keys[position] == keys
+
+
+def dimension_key_sets(dimensions: dict) -> dict:
+    """
+    Conjuntos de llaves por dimensión, preparados una vez y guardados en el
+    diccionario de dimensiones para reutilizarlos en todos los lotes
+    """
+    key_sets = dimensions.get('_key_sets')
+    if key_sets is None:
+        key_sets = {}
+        for foreign_keys in FACT_FOREIGN_KEYS.values():
+            for dimension, key_column in foreign_keys.values():
+                if dimension not in key_sets and dimensions.get(dimension) is not None:
+                    key_sets[dimension] = _key_set(dimensions[dimension][key_column])
+        dimensions['_key_sets'] = key_sets
+    return key_sets
+
+
+def split_orphans(fact: DataFrame, fact_name: str, dimensions: dict) -> tuple:
+    """
+    Verificamos todas las llaves foráneas del lote contra las dimensiones.
+    Devuelve (filas limpias, huérfanas con la columna quarantine_reason).
+    """
+    key_sets = dimension_key_sets(dimensions)
+    bad = np.zeros(len(fact), dtype=bool)
+    reasons = np.full(len(fact), '', dtype=object)
+
+    for column, (dimension, _) in FACT_FOREIGN_KEYS[fact_name].items():
+        values = fact[column]
+        missing = values.isna().to_numpy()
+        orphan = np.zeros(len(fact), dtype=bool)
+        if dimension in key_sets:
+            present = ~missing
+            orphan[present] = ~_contains(key_sets[dimension], values[present].to_numpy(dtype='int64'))
+        if missing.any():
+            reasons[missing] += f'{column} nulo; '
+        if orphan.any():
+            reasons[orphan] += f'{column} sin fila en {dimension}; '
+        bad |= missing | orphan
+
+    clean = fact[~bad]
+    orphans = fact[bad].copy()
+    orphans['quarantine_reason'] = [reason.rstrip('; ') for reason in reasons[bad]]
+    return clean, orphans
+
+
+def ensure_quarantine_table(etl_conn):
+    with etl_conn.begin() as conn:
+        conn.execute(text(QUARANTINE_DDL))
+    catalog.invalidate_catalog(etl_conn)
+
+
+def quarantine_rows(orphans: DataFrame, fact_name: str, etl_conn) -> int:
+    """
+    Guardamos las filas huérfanas con sus motivos. Una fila ya en cuarentena
+    (mismo detalle de orden) se actualiza y suma un intento.
+    """
+    if orphans.empty:
+        return 0
+    if not catalog.table_exists(etl_conn, 'etl_quarantine'):
+        ensure_quarantine_table(etl_conn)
+
+    payload = json.loads(orphans.drop(columns=['quarantine_reason']).to_json(orient='records',
+                                                                             date_format='iso'))
+    rows = [
+        {
+            'fact_name': fact_name,
+            'sales_order_id': int(order_id),
+            'sales_order_detail_id': int(detail_id),
+            'reasons': reason,
+            'payload': json.dumps(record)
+        }
+        for order_id, detail_id, reason, record in zip(orphans['sales_order_id'],
+                                                       orphans['sales_order_detail_id'],
+                                                       orphans['quarantine_reason'], payload)
+    ]
+    upsert = text('''
+        INSERT INTO etl_quarantine (fact_name, sales_order_id, sales_order_detail_id, reasons, payload)
+        VALUES (:fact_name, :sales_order_id, :sales_order_detail_id, :reasons, CAST(:payload AS JSONB))
+        ON CONFLICT (fact_name, sales_order_detail_id) DO UPDATE SET
+            reasons = EXCLUDED.reasons,
+            payload = EXCLUDED.payload,
+            quarantined_at = CURRENT_TIMESTAMP,
+            attempts = etl_quarantine.attempts + 1
+    ''')
+    with etl_conn.begin() as conn:
+        conn.execute(upsert, rows)
+    return len(rows)
+
+
+def precheck(fact: DataFrame, fact_name: str, dimensions: dict, etl_conn) -> DataFrame:
+    """
+    Etapa de integridad previa a la carga: las huérfanas van a cuarentena
+    y se devuelven las filas limpias para cargarlas de inmediato
+    """
+    clean, orphans = split_orphans(fact, fact_name, dimensions)
+    if not orphans.empty:
+        quarantine_rows(orphans, fact_name, etl_conn)
+        summary = orphans['quarantine_reason'].value_counts().head(3).to_dict()
+        print(f"Advertencia: {len(orphans)} filas de {fact_name} en cuarentena ({summary}); "
+              f"se cargan {len(clean)} filas limpias")
+    return clean
+
+
+def _order_batches(order_ids) -> list:
+    """Órdenes distintas, ordenadas y en lotes de a lo sumo RELEASE_BATCH_ORDERS"""
+    ordered = sorted(set(int(order_id) for order_id in order_ids))
+    return [ordered[start:start + RELEASE_BATCH_ORDERS] for start in range(0, len(ordered), RELEASE_BATCH_ORDERS)]
+
+
+def release_quarantine(source_conn: Engine, etl_conn: Engine, fact_name: str, dimensions: dict,
+                       start_date: str = None, touched: set = None) -> int:
+    """
+    Reintentamos las filas en cuarentena (p.ej. clientes que llegaron tarde):
+    se re-extraen sus órdenes del origen, se vuelven a transformar con las
+    dimensiones actuales y las que ya pasan la verificación se cargan y
+    salen de la cuarentena. En touched se agregan los date_key liberados.
+    """
+    from etl import extract, transform
+    from etl.utils_etl import FACT_STAGES
+
+    if not catalog.table_exists(etl_conn, 'etl_quarantine'):
+        return 0
+    with etl_conn.connect() as conn:
+        quarantined = conn.execute(text('''
+            SELECT sales_order_id, sales_order_detail_id FROM etl_quarantine
+            WHERE fact_name = :fact_name
+        '''), {'fact_name': fact_name}).all()
+    if not quarantined:
+        return 0
+
+    extract_name, transform_name, _ = FACT_STAGES[fact_name]
+    detail_ids = {int(detail_id) for _, detail_id in quarantined}
+    # Una consulta por lote de órdenes (lista IN acotada), no una por rango de órdenes consecutivas
+    batches = [
+        getattr(extract, extract_name)(source_conn, start_date=start_date, order_ids=order_ids)
+        for order_ids in _order_batches(order_id for order_id, _ in quarantined)
+    ]
+    source_rows = pd.concat(batches, ignore_index=True)
+    source_rows = source_rows[source_rows['SalesOrderDetailID'].isin(detail_ids)]
+    if source_rows.empty:
+        return 0
+
+    fact = getattr(transform, transform_name)(source_rows, dimensions)
+    clean, orphans = split_orphans(fact, fact_name, dimensions)
+    released = [int(detail_id) for detail_id in clean['sales_order_detail_id']]
+
+    with etl_conn.begin() as conn:
+        if not clean.empty:
+            # Por si un reintento anterior alcanzó a cargarlas
+            conn.execute(text(f'''
+                DELETE FROM {fact_name} WHERE sales_order_detail_id = ANY(:detail_ids)
+            '''), {'detail_ids': released})
+            clean.to_sql(fact_name, conn, if_exists='append', index=False, chunksize=10000)
+            conn.execute(text('''
+                DELETE FROM etl_quarantine
+                WHERE fact_name = :fact_name AND sales_order_detail_id = ANY(:detail_ids)
+            '''), {'fact_name': fact_name, 'detail_ids': released})
+    if touched is not None:
+        touched.update(clean['date_key'].drop_duplicates())
+    if not orphans.empty:
+        quarantine_rows(orphans, fact_name, etl_conn)
+
+    print(f"Cuarentena de {fact_name}: {len(released)} filas liberadas, {len(orphans)} siguen pendientes")
+    return len(released)
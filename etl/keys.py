@@ -0,0 +1,154 @@
+import threading
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Dimensiones con llave sustituta asignada en el proceso: tabla -> (llave sustituta, llave natural)
+SURROGATE_KEYS = {
+    'dim_customer': ('customer_key', 'customer_id'),
+    'dim_product': ('product_key', 'product_id'),
+    'dim_date': ('date_key', 'date'),
+    'dim_employee': ('employee_key', 'business_entity_id'),
+    'dim_reseller': ('reseller_key', 'store_id')
+}
+
+# Llaves que se reservan de la secuencia en cada viaje a PostgreSQL
+DEFAULT_BLOCK_SIZE = 1000
+
+
+def _natural_values(values, natural_column: str):
+    """Llave natural comparable entre el DataFrame transformado y la bodega (fechas como datetime64)"""
+    if natural_column == 'date':
+        return pd.to_datetime(pd.Series(values)).to_numpy()
+    return pd.Series(values).to_numpy()
+
+
+class KeyAllocator:
+    """
+    Asignación de llaves sustitutas en pandas. Cada dimensión reserva
+    bloques de block_size valores de su secuencia de PostgreSQL (la del
+    SERIAL o una propia si la tabla no la tiene) y mantiene en memoria el
+    mapa llave natural -> llave sustituta, sembrado una vez con dos columnas
+    de la bodega. Los hechos se enlazan contra ese mapa sin releer las
+    dimensiones, incluso con miembros nuevos del mismo lote.
+    Las llaves reservadas y no usadas al terminar quedan como huecos.
+    """
+
+    def __init__(self, etl_conn: Engine, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.etl_conn = etl_conn
+        self.block_size = max(1, block_size)
+        self.maps = {}
+        self.pools = {}
+        self.sequences = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, etl_conn: Engine, etl_settings: dict) -> 'KeyAllocator':
+        return cls(etl_conn, block_size=etl_settings.get('key_block_size', DEFAULT_BLOCK_SIZE))
+
+    def _key_map(self, table: str) -> pd.Series:
+        """Mapa llave natural -> llave sustituta (se lee de la bodega la primera vez)"""
+        if table not in self.maps:
+            key_column, natural_column = SURROGATE_KEYS[table]
+            if catalog.table_exists(self.etl_conn, table):
+                with self.etl_conn.connect() as conn:
+                    rows = conn.execute(text(f'''
+                        SELECT {key_column}, {natural_column} FROM {table}
+                        WHERE {key_column} IS NOT NULL
+                    ''')).all()
+            else:
+                rows = []
+            keys = np.array([row[0] for row in rows], dtype='int64')
+            naturals = _natural_values([row[1] for row in rows], natural_column)
+            key_map = pd.Series(keys, index=pd.Index(naturals), dtype='int64').sort_values()
+            # Cargas anteriores pudieron duplicar miembros: vale la llave más antigua
+            self.maps[table] = key_map[~key_map.index.duplicated(keep='first')]
+            self.pools[table] = np.empty(0, dtype='int64')
+        return self.maps[table]
+
+    def _sequence(self, table: str) -> str:
+        """Secuencia del SERIAL de la tabla; si no tiene, una propia que arranca tras la mayor llave"""
+        if table not in self.sequences:
+            key_column, _ = SURROGATE_KEYS[table]
+            sequence = None
+            with self.etl_conn.begin() as conn:
+                if catalog.table_exists(self.etl_conn, table):
+                    sequence = conn.execute(text('SELECT pg_get_serial_sequence(:table, :column)'),
+                                            {'table': table, 'column': key_column}).scalar()
+                if sequence is None:
+                    sequence = f'{table}_{key_column}_seq'
+                    conn.execute(text(f'CREATE SEQUENCE IF NOT EXISTS {sequence}'))
+                    current = self._key_map(table)
+                    if len(current):
+                        # Solo se adelanta: otro proceso pudo reservar llaves que aún no están en la tabla
+                        conn.execute(text(f'''
+                            SELECT setval(CAST(:sequence AS regclass), :value) FROM {sequence}
+                            WHERE NOT is_called OR last_value < :value
+                        '''), {'sequence': sequence, 'value': int(current.max())})
+            self.sequences[table] = sequence
+        return self.sequences[table]
+
+    def _take(self, table: str, count: int) -> np.ndarray:
+        """count llaves nuevas del bloque reservado; se reserva otro bloque si no alcanzan"""
+        pool = self.pools[table]
+        if len(pool) < count:
+            needed = count - len(pool)
+            reserve = -(-needed // self.block_size) * self.block_size
+            with self.etl_conn.begin() as conn:
+                reserved = conn.execute(text('''
+                    SELECT nextval(CAST(:sequence AS regclass)) FROM generate_series(1, :count)
+                '''), {'sequence': self._sequence(table), 'count': reserve}).scalars().all()
+            pool = np.concatenate([pool, np.array(reserved, dtype='int64')])
+        self.pools[table] = pool[count:]
+        return pool[:count]
+
+    def assign(self, df: DataFrame, table: str, only_new: bool = False) -> DataFrame:
+        """
+        Agregamos la llave sustituta como primera columna: los miembros ya
+        conocidos conservan su llave y los nuevos toman llaves del bloque.
+        Con only_new se devuelven solo los miembros nuevos.
+        """
+        key_column, natural_column = SURROGATE_KEYS[table]
+        with self._lock:
+            key_map = self._key_map(table)
+            naturals = _natural_values(df[natural_column], natural_column)
+            new = ~pd.Index(naturals).isin(key_map.index)
+            new_naturals = pd.unique(naturals[new])
+            if len(new_naturals):
+                added = pd.Series(self._take(table, len(new_naturals)), index=pd.Index(new_naturals),
+                                  dtype='int64')
+                key_map = self.maps[table] = pd.concat([key_map, added]) if len(key_map) else added
+            keys = key_map.reindex(naturals).to_numpy(dtype='int64')
+
+        df = df.drop(columns=[key_column], errors='ignore')
+        df.insert(0, key_column, keys)
+        if only_new:
+            df = df[new].reset_index(drop=True)
+        if len(new_naturals):
+            print(f"{table}: {len(new_naturals)} llaves nuevas asignadas")
+        return df
+
+    def key_frame(self, table: str) -> DataFrame:
+        """Mapa de una dimensión con las columnas que usan las transformaciones de hechos"""
+        key_column, natural_column = SURROGATE_KEYS[table]
+        with self._lock:
+            key_map = self._key_map(table)
+        return pd.DataFrame({key_column: key_map.to_numpy(), natural_column: key_map.index.to_numpy()})
+
+    def dimensions(self, reporting_currency: str = None) -> dict:
+        """
+        Diccionario de dimensiones para transformar hechos (mismas claves que
+        extract_dimensions_from_dw) armado con los mapas en memoria; de la
+        bodega solo se leen las tasas de cambio
+        """
+        dimensions = {table: self.key_frame(table) for table in SURROGATE_KEYS}
+        if catalog.table_exists(self.etl_conn, 'dim_currency_rate'):
+            dimensions['currency_rates'] = pd.read_sql_query(text('SELECT * FROM dim_currency_rate'),
+                                                             self.etl_conn)
+        else:
+            dimensions['currency_rates'] = None
+        dimensions['reporting_currency'] = reporting_currency
+        return dimensions
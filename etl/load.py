@@ -1,9 +1,13 @@
+import io
+import re
+import time
 import pandas as pd
 from pandas import DataFrame
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
 import yaml
 from sqlalchemy.dialects.postgresql import insert
+from etl import catalog
 
 
 def load_dim_customer(dim_customer: DataFrame, etl_conn: Engine):
@@ -61,12 +65,141 @@ def load_trans_reseller_sales(trans_reseller_sales: DataFrame, etl_conn: Engine)
     trans_reseller_sales.to_sql('trans_reseller_sales', etl_conn, if_exists='append', index_label='trans_reseller_key')
 
 
+def _insert_on_conflict_do_nothing(pd_table, conn, keys, data_iter):
+    """Método para to_sql: INSERT ... ON CONFLICT DO NOTHING"""
+    rows = [dict(zip(keys, row)) for row in data_iter]
+    stmt = insert(pd_table.table).values(rows).on_conflict_do_nothing()
+    result = conn.execute(stmt)
+    return result.rowcount
+
+
 def load_sales_reason(sales_reason: DataFrame, etl_conn: Engine):
-    """Carga dimensión razón de venta"""
-    sales_reason.to_sql('dim_sales_reason', etl_conn, if_exists='append', index_label='sales_reason_key')
+    """Carga dimensión razón de venta (UPSERT por sales_reason_id)"""
+    if sales_reason.empty:
+        return
+    
+    upsert = text('''
+        INSERT INTO dim_sales_reason (sales_reason_id, reason_name, reason_type, saved_date)
+        VALUES (:sales_reason_id, :reason_name, :reason_type, :saved_date)
+        ON CONFLICT (sales_reason_id) DO UPDATE SET
+            reason_name = EXCLUDED.reason_name,
+            reason_type = EXCLUDED.reason_type,
+            saved_date = EXCLUDED.saved_date
+        WHERE (dim_sales_reason.reason_name, dim_sales_reason.reason_type)
+            IS DISTINCT FROM (EXCLUDED.reason_name, EXCLUDED.reason_type)
+    ''')
+    with etl_conn.begin() as conn:
+        conn.execute(upsert, sales_reason.to_dict('records'))
+    print(f"Razones de venta actualizadas en dim_sales_reason: {len(sales_reason)} registros")
+
+
+# Columnas de conversión de moneda agregadas a los hechos
+CURRENCY_FACT_COLUMNS = {
+    'currency_code': 'CHAR(3)',
+    'exchange_rate': 'DECIMAL(18,8)',
+    'reporting_unit_price': 'DECIMAL(10,2)',
+    'reporting_line_total': 'DECIMAL(10,2)',
+    'reporting_tax_amount': 'DECIMAL(10,2)',
+    'reporting_freight_amount': 'DECIMAL(10,2)'
+}
+
+
+def ensure_currency_schema(etl_conn: Engine):
+    """
+    Bodegas creadas antes de la conversión de moneda: crea dim_currency_rate
+    y agrega las columnas de moneda de reporte a los hechos existentes
+    """
+    with open('sqlscripts.yml', 'r') as f:
+        ddl = yaml.safe_load(f)['dim_currency_rate']
+    
+    with etl_conn.begin() as conn:
+        if not catalog.table_exists(etl_conn, 'dim_currency_rate'):
+            conn.execute(text(ddl))
+        for fact_name in catalog.FACT_TABLES:
+            if not catalog.table_exists(etl_conn, fact_name):
+                continue
+            columns = ', '.join(f'ADD COLUMN IF NOT EXISTS {column} {column_type}'
+                                for column, column_type in CURRENCY_FACT_COLUMNS.items())
+            conn.execute(text(f'ALTER TABLE {fact_name} {columns}'))
+    catalog.invalidate_catalog(etl_conn)
+
+
+# Llaves primarias de las tablas de razones de venta (sqlscripts.yml)
+SALES_REASON_KEYS = {
+    'dim_sales_reason': ['sales_reason_id'],
+    'bridge_order_sales_reason': ['sales_order_id', 'sales_reason_id']
+}
+
+
+def _has_constraint(conn, table_name: str, constraint_type: str) -> bool:
+    """Si la tabla tiene una restricción del tipo dado ('p' llave primaria, 'f' foránea)"""
+    return conn.execute(text('''
+        SELECT EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = to_regclass(:table_name) AND contype = :constraint_type
+        )
+    '''), {'table_name': table_name, 'constraint_type': constraint_type}).scalar()
+
+
+def ensure_sales_reason_schema(etl_conn: Engine):
+    """
+    Bodegas creadas antes de las llaves de razones de venta: crea
+    dim_sales_reason y bridge_order_sales_reason desde sqlscripts.yml, o
+    les agrega la llave primaria (y al puente su llave foránea) si to_sql
+    las creó sin ellas. Antes se eliminan las filas con llave nula y los
+    duplicados (se conserva la última fila física).
+    """
+    with open('sqlscripts.yml', 'r') as f:
+        ddl = yaml.safe_load(f)
+
+    with etl_conn.begin() as conn:
+        for table_name, key_columns in SALES_REASON_KEYS.items():
+            if not catalog.table_exists(etl_conn, table_name):
+                conn.execute(text(ddl[table_name]))
+                continue
+            if _has_constraint(conn, table_name, 'p'):
+                continue
+            keys = ', '.join(key_columns)
+            null_keys = ' OR '.join(f'{col} IS NULL' for col in key_columns)
+            same_keys = ' AND '.join(f't.{col} = d.{col}' for col in key_columns)
+            conn.execute(text(f'DELETE FROM {table_name} WHERE {null_keys}'))
+            conn.execute(text(f'DELETE FROM {table_name} t USING {table_name} d WHERE {same_keys} AND t.ctid < d.ctid'))
+            conn.execute(text(f'ALTER TABLE {table_name} ADD PRIMARY KEY ({keys})'))
+            print(f"✓ Llave primaria agregada a {table_name} ({keys})")
+
+        if not _has_constraint(conn, 'bridge_order_sales_reason', 'f'):
+            # NOT VALID: se exige para las filas nuevas sin revisar las ya cargadas
+            conn.execute(text('''
+                ALTER TABLE bridge_order_sales_reason
+                ADD FOREIGN KEY (sales_reason_id) REFERENCES dim_sales_reason (sales_reason_id) NOT VALID
+            '''))
+    catalog.invalidate_catalog(etl_conn)
+
+
+def load_currency_rate(currency_rate: DataFrame, etl_conn: Engine, chunksize: int = 10000):
+    """Carga incremental de tasas de cambio (una tasa publicada no cambia)"""
+    if currency_rate.empty:
+        return 0
+    
+    inserted = currency_rate.to_sql('dim_currency_rate', etl_conn, if_exists='append', index=False,
+                                    chunksize=chunksize, method=_insert_on_conflict_do_nothing)
+    print(f"Cargadas {inserted} nuevas tasas en dim_currency_rate")
+    return inserted
 
 
-def load_incremental_fact_internet_sales(fact_data: DataFrame, etl_conn: Engine):
+def load_bridge_order_sales_reason(bridge: DataFrame, etl_conn: Engine, chunksize: int = 10000):
+    """Carga incremental de la tabla puente orden-razón (ignora pares ya cargados)"""
+    if bridge.empty:
+        print("No hay nuevos datos para bridge_order_sales_reason")
+        return 0
+    
+    inserted = bridge.to_sql('bridge_order_sales_reason', etl_conn, if_exists='append', index=False,
+                             chunksize=chunksize, method=_insert_on_conflict_do_nothing)
+    print(f"Cargadas {inserted} nuevas filas en bridge_order_sales_reason")
+    return inserted
+
+
+def load_incremental_fact_internet_sales(fact_data: DataFrame, etl_conn: Engine, chunksize: int = None):
     """
     Carga incremental para fact_internet_sales usando UPSERT
     """
@@ -83,13 +216,13 @@ def load_incremental_fact_internet_sales(fact_data: DataFrame, etl_conn: Engine)
         pass
     
     if len(fact_data) > 0:
-        fact_data.to_sql('fact_internet_sales', etl_conn, if_exists='append', index=False)
+        fact_data.to_sql('fact_internet_sales', etl_conn, if_exists='append', index=False, chunksize=chunksize)
         print(f"Cargadas {len(fact_data)} nuevas filas en fact_internet_sales")
     else:
         print("No hay nuevos datos para fact_internet_sales")
 
 
-def load_incremental_fact_reseller_sales(fact_data: DataFrame, etl_conn: Engine):
+def load_incremental_fact_reseller_sales(fact_data: DataFrame, etl_conn: Engine, chunksize: int = None):
     """
     Carga incremental para fact_reseller_sales usando UPSERT
     """
@@ -106,7 +239,7 @@ def load_incremental_fact_reseller_sales(fact_data: DataFrame, etl_conn: Engine)
         pass
     
     if len(fact_data) > 0:
-        fact_data.to_sql('fact_reseller_sales', etl_conn, if_exists='append', index=False)
+        fact_data.to_sql('fact_reseller_sales', etl_conn, if_exists='append', index=False, chunksize=chunksize)
         print(f"Cargadas {len(fact_data)} nuevas filas en fact_reseller_sales")
     else:
         print("No hay nuevos datos para fact_reseller_sales")
@@ -137,11 +270,324 @@ def load_with_upsert(table: DataFrame, etl_conn: Engine, table_name: str, confli
     print(f"Datos cargados en {table_name} con UPSERT")
 
 
-def load(table: DataFrame, etl_conn: Engine, table_name: str, replace: bool = False):
+def merge_dimension(table: DataFrame, etl_conn: Engine, table_name: str, key_column: str) -> tuple:
+    """
+    Aplicamos a una dimensión las filas cambiadas por su llave natural:
+    UPDATE de las existentes e INSERT de las nuevas desde una tabla de
+    paso, conservando las llaves sustitutas que ya usan los hechos
+    """
+    if table.empty:
+        return 0, 0
+    
+    staging = f'_stage_{table_name}'
+    columns = [f'"{col}"' for col in table.columns]
+    assignments = ', '.join(f'{col} = s.{col}' for col in columns if col != f'"{key_column}"')
+    
+    with etl_conn.begin() as conn:
+        # Tabla de paso de la sesión con los tipos de la dimensión: dos corridas no chocan
+        # y se elimina al confirmar o revertir
+        conn.execute(text(f'''
+            CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+            SELECT {', '.join(columns)} FROM {table_name} WITH NO DATA
+        '''))
+        copy_dataframe(table, conn.connection.cursor(), staging)
+        updated = conn.execute(text(f'''
+            UPDATE {table_name} SET {assignments}
+            FROM {staging} s
+            WHERE {table_name}."{key_column}" = s."{key_column}"
+        ''')).rowcount
+        inserted = conn.execute(text(f'''
+            INSERT INTO {table_name} ({', '.join(columns)})
+            SELECT {', '.join(f's.{col}' for col in columns)} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE t."{key_column}" = s."{key_column}")
+        ''')).rowcount
+    
+    print(f"{table_name}: {updated} filas actualizadas, {inserted} nuevas")
+    return updated, inserted
+
+
+# Índices de los hechos en sales_order_id (sqlscripts.yml): marcas de agua y reemplazo por rango de órdenes
+FACT_ORDER_INDEXES = {f'{fact_name}_order_idx': fact_name for fact_name in catalog.FACT_TABLES}
+
+
+def ensure_fact_order_indexes(etl_conn: Engine):
+    """
+    Hechos de bodegas anteriores al índice, o creados por to_sql o por el
+    shadow swap (que no copia índices): crea el índice en sales_order_id
+    que usan MAX(sales_order_id) de las marcas de agua y los DELETE por rango
+    """
+    with etl_conn.begin() as conn:
+        for index_name, fact_name in FACT_ORDER_INDEXES.items():
+            missing = conn.execute(text('''
+                SELECT to_regclass(:fact_name) IS NOT NULL AND to_regclass(:index_name) IS NULL
+            '''), {'fact_name': fact_name, 'index_name': index_name}).scalar()
+            if missing:
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {fact_name} (sales_order_id)'))
+
+
+def ensure_order_lifecycle_table(etl_conn: Engine):
+    """Bodegas creadas antes del snapshot acumulativo: crea fact_order_lifecycle"""
+    if catalog.table_exists(etl_conn, 'fact_order_lifecycle'):
+        return
+    with open('sqlscripts.yml', 'r') as f:
+        ddl = yaml.safe_load(f)['fact_order_lifecycle']
+    with etl_conn.begin() as conn:
+        conn.execute(text(ddl))
+    catalog.invalidate_catalog(etl_conn)
+
+
+def order_lifecycle_watermark(etl_conn: Engine):
+    """Última modificación del origen ya reflejada en el snapshot (índice en source_modified)"""
+    if not catalog.table_exists(etl_conn, 'fact_order_lifecycle'):
+        return None
+    with etl_conn.connect() as conn:
+        return conn.execute(text('SELECT MAX(source_modified) FROM fact_order_lifecycle')).scalar()
+
+
+def merge_order_lifecycle(lifecycle: DataFrame, etl_conn: Engine, tracked: list) -> int:
+    """
+    Aplicamos un lote del snapshot acumulativo: COPY a una tabla temporal
+    y un solo INSERT ... ON CONFLICT que inserta líneas nuevas y actualiza
+    solo las que cambiaron alguna columna de tracked o source_modified. Sin
+    esta última, una línea modificada en el origen sin cambios en tracked
+    dejaría atrás la marca de agua y se re-extraería en cada corrida.
+    Devuelve las filas insertadas o actualizadas.
+    """
+    if lifecycle.empty:
+        return 0
+
+    columns = list(lifecycle.columns)
+    staging = '_stage_order_lifecycle'
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in columns if col != 'sales_order_detail_id')
+    guarded = list(tracked) + ['source_modified']
+    current = ', '.join(f'f.{col}' for col in guarded)
+    incoming = ', '.join(f'EXCLUDED.{col}' for col in guarded)
+
+    with etl_conn.begin() as conn:
+        conn.execute(text(f'''
+            CREATE TEMP TABLE {staging} (LIKE fact_order_lifecycle INCLUDING DEFAULTS) ON COMMIT DROP
+        '''))
+        copy_dataframe(lifecycle, conn.connection.cursor(), staging)
+        changed = conn.execute(text(f'''
+            INSERT INTO fact_order_lifecycle AS f ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM {staging}
+            ON CONFLICT (sales_order_detail_id) DO UPDATE SET {updates}
+            WHERE ({current}) IS DISTINCT FROM ({incoming})
+        ''')).rowcount
+    return changed
+
+
+# Observadores de cada COPY (p.ej. query_stats.QueryRecorder): el cursor de psycopg2 no
+# pasa por los eventos de SQLAlchemy. Se llaman como
+# observer(statement, client_seconds, server_seconds, rows, bytes)
+COPY_OBSERVERS = []
+
+
+def copy_dataframe(table: DataFrame, cursor, table_name: str, chunksize: int = 100000):
+    """
+    Carga masiva con COPY ... FROM STDIN (CSV) usando un cursor de psycopg2.
+    Por chunk se mide el armado del CSV (cliente) y copy_expert (servidor)
+    y se informa a COPY_OBSERVERS.
+    """
+    columns = ', '.join(f'"{col}"' for col in table.columns)
+    copy_sql = f'COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)'
+    
+    for start in range(0, len(table), chunksize):
+        started = time.perf_counter()
+        chunk = table.iloc[start:start + chunksize]
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, index=False, header=False, na_rep='')
+        size = buffer.tell()
+        buffer.seek(0)
+        serialized = time.perf_counter()
+        cursor.copy_expert(copy_sql, buffer)
+        finished = time.perf_counter()
+        for observer in COPY_OBSERVERS:
+            observer(copy_sql, serialized - started, finished - serialized, len(chunk), size)
+
+
+def _grant_statements(conn, relation: str) -> list:
+    """
+    Privilegios de tabla y de columna de relation como sentencias GRANT con
+    {target} en lugar del nombre, para repetirlos sobre otra relación.
+    """
+    rows = conn.execute(text('''
+        SELECT NULL AS column_name, a.privilege_type, a.grantee, a.is_grantable
+        FROM pg_class c, aclexplode(c.relacl) a
+        WHERE c.oid = to_regclass(:relation)
+        UNION ALL
+        SELECT quote_ident(att.attname), a.privilege_type, a.grantee, a.is_grantable
+        FROM pg_attribute att, aclexplode(att.attacl) a
+        WHERE att.attrelid = to_regclass(:relation) AND att.attnum > 0 AND NOT att.attisdropped
+    '''), {'relation': relation}).all()
+    statements = []
+    for column, privilege, grantee, grantable in rows:
+        grantee_name = 'PUBLIC' if grantee == 0 else conn.execute(
+            text('SELECT quote_ident(pg_get_userbyid(:oid))'), {'oid': grantee}).scalar()
+        columns = f' ({column})' if column else ''
+        option = ' WITH GRANT OPTION' if grantable else ''
+        statements.append(f'GRANT {privilege}{columns} ON {{target}} TO {grantee_name}{option}')
+    return statements
+
+
+def _dependent_views(conn, table_name: str) -> list:
+    """
+    Vistas que dependen (directa o transitivamente) de table_name, en orden de
+    creación: cada vista aparece después de las vistas que usa. La definición
+    se captura con el nombre actual de la tabla.
+    """
+    return conn.execute(text('''
+        WITH RECURSIVE deps (oid, depth) AS (
+            SELECT r.ev_class, 1
+            FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass AND d.refclassid = 'pg_class'::regclass
+            AND d.refobjid = to_regclass(:table_name) AND r.ev_class <> d.refobjid
+            UNION
+            SELECT r.ev_class, deps.depth + 1
+            FROM deps
+            JOIN pg_depend d ON d.refobjid = deps.oid
+                AND d.refclassid = 'pg_class'::regclass AND d.classid = 'pg_rewrite'::regclass
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE r.ev_class <> deps.oid
+        )
+        SELECT c.oid::regclass::text AS name, c.relkind, pg_get_viewdef(c.oid) AS definition,
+               array_to_string(c.reloptions, ', ') AS options,
+               quote_ident(pg_get_userbyid(c.relowner)) AS owner,
+               obj_description(c.oid, 'pg_class') AS comment
+        FROM deps JOIN pg_class c ON c.oid = deps.oid
+        GROUP BY c.oid
+        ORDER BY MAX(deps.depth), c.oid
+    '''), {'table_name': table_name}).all()
+
+
+def load_swap(table: DataFrame, etl_conn: Engine, table_name: str):
+    """
+    Recarga completa azul/verde: se construye {tabla}__shadow (COPY, índices,
+    restricciones y ANALYZE) y se intercambia con la tabla actual mediante
+    RENAME dentro de la misma transacción. Los lectores ven la versión
+    anterior completa hasta el COMMIT. Los privilegios y el dueño pasan a la
+    tabla nueva; las vistas que dependen de ella se recrean con su
+    definición, dueño y privilegios.
+    """
+    shadow = f'{table_name}__shadow'
+    old = f'{table_name}__old'
+    
+    if not catalog.table_exists(etl_conn, table_name):
+        # No hay versión anterior que intercambiar
+        load(table, etl_conn, table_name, replace=False)
+        return
+    
+    with etl_conn.begin() as conn:
+        params = {'table_name': table_name}
+        
+        # Si otras tablas referencian a esta (dimensiones), sus FK seguirían a la tabla vieja
+        referenced_by = conn.execute(text('''
+            SELECT COUNT(*) FROM pg_constraint
+            WHERE contype = 'f'
+            AND confrelid = to_regclass(:table_name)
+            AND conrelid <> confrelid
+        '''), params).scalar()
+        views = _dependent_views(conn, table_name)
+        materialized = [view.name for view in views if view.relkind == 'm']
+        if referenced_by:
+            print(f"Advertencia: {table_name} es referenciada por {referenced_by} FK, se usa DELETE + append")
+            swap_possible = False
+        elif materialized:
+            # Recrearlas implicaría volver a calcularlas dentro del intercambio
+            print(f"Advertencia: {table_name} es usada por vistas materializadas "
+                  f"({', '.join(materialized)}), se usa DELETE + append")
+            swap_possible = False
+        else:
+            swap_possible = True
+            constraints = conn.execute(text('''
+                SELECT conname, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE conrelid = to_regclass(:table_name)
+                AND contype IN ('p', 'u', 'f', 'x')
+                ORDER BY contype DESC
+            '''), params).all()
+            indexes = conn.execute(text('''
+                SELECT i.relname, pg_get_indexdef(i.oid)
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = to_regclass(:table_name)
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+            '''), params).all()
+            sequences = conn.execute(text('''
+                SELECT a.attname, pg_get_serial_sequence(:table_name, a.attname)
+                FROM pg_attribute a
+                WHERE a.attrelid = to_regclass(:table_name)
+                AND a.attnum > 0 AND NOT a.attisdropped
+                AND pg_get_serial_sequence(:table_name, a.attname) IS NOT NULL
+            '''), params).all()
+            grants = _grant_statements(conn, table_name)
+            owner = conn.execute(text('''
+                SELECT quote_ident(pg_get_userbyid(relowner)) FROM pg_class WHERE oid = to_regclass(:table_name)
+            '''), params).scalar()
+            view_grants = {view.name: _grant_statements(conn, view.name) for view in views}
+            
+            # 1. Tabla sombra sin índices para la carga masiva
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS {shadow}')
+            conn.exec_driver_sql(
+                f'CREATE TABLE {shadow} (LIKE {table_name} '
+                f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)'
+            )
+            copy_dataframe(table, conn.connection.cursor(), shadow)
+            
+            # 2. Restricciones e índices con nombres temporales, luego estadísticas
+            for name, definition in constraints:
+                conn.exec_driver_sql(f'ALTER TABLE {shadow} ADD CONSTRAINT {name}__shadow {definition}')
+            for name, definition in indexes:
+                definition = re.sub(rf'INDEX {name} ON (\S+\.)?{table_name} ',
+                                    rf'INDEX {name}__shadow ON \g<1>{shadow} ', definition, count=1)
+                conn.exec_driver_sql(definition)
+            conn.exec_driver_sql(f'ANALYZE {shadow}')
+            conn.exec_driver_sql(f'ALTER TABLE {shadow} OWNER TO {owner}')
+            for grant in grants:
+                conn.exec_driver_sql(grant.replace('{target}', shadow))
+            
+            # 3. Intercambio atómico y limpieza de la versión anterior; las vistas
+            #    siguen a la tabla vieja, así que se eliminan y se recrean
+            for view in reversed(views):
+                conn.exec_driver_sql(f'DROP VIEW {view.name}')
+            conn.exec_driver_sql(f'ALTER TABLE {table_name} RENAME TO {old}')
+            conn.exec_driver_sql(f'ALTER TABLE {shadow} RENAME TO {table_name}')
+            for column, sequence in sequences:
+                conn.exec_driver_sql(f'ALTER SEQUENCE {sequence} OWNED BY {table_name}.{column}')
+            conn.exec_driver_sql(f'DROP TABLE {old}')
+            for view in views:
+                options = f' WITH ({view.options})' if view.options else ''
+                # exec_driver_sql pasa por el formato de parámetros de psycopg2 (p.ej. LIKE '%x')
+                definition = view.definition.replace('%', '%%')
+                conn.exec_driver_sql(f'CREATE VIEW {view.name}{options} AS {definition}')
+                conn.exec_driver_sql(f'ALTER VIEW {view.name} OWNER TO {view.owner}')
+                for grant in view_grants[view.name]:
+                    conn.exec_driver_sql(grant.replace('{target}', view.name))
+                if view.comment is not None:
+                    conn.execute(text(f'COMMENT ON VIEW {view.name} IS :comment'), {'comment': view.comment})
+            for name, _ in constraints:
+                conn.exec_driver_sql(f'ALTER TABLE {table_name} RENAME CONSTRAINT {name}__shadow TO {name}')
+            for name, _ in indexes:
+                conn.exec_driver_sql(f'ALTER INDEX {name}__shadow RENAME TO {name}')
+    
+    if not swap_possible:
+        load(table, etl_conn, table_name, replace=True)
+        return
+    
+    catalog.invalidate_catalog(etl_conn)
+    recreated = f", {len(views)} vistas recreadas" if views else ''
+    print(f"Tabla {table_name} reemplazada (shadow swap) con {len(table)} registros{recreated}")
+
+
+def load(table: DataFrame, etl_conn: Engine, table_name: str, replace: bool = False, swap: bool = False):
   
     if table.empty:
         print(f"DataFrame vacío para {table_name}, omitiendo carga")
         return
+    
+    if replace and swap:
+        load_swap(table, etl_conn, table_name)
+        return
         
     if replace:
         with etl_conn.connect() as conn:
@@ -152,6 +598,9 @@ def load(table: DataFrame, etl_conn: Engine, table_name: str, replace: bool = Fa
     else:
         table.to_sql(table_name, etl_conn, if_exists='append', index=False)
         print(f"Datos cargados en {table_name}: {len(table)} registros")
+    
+    # to_sql puede haber creado la tabla: el catálogo en caché ya no es válido
+    catalog.invalidate_catalog(etl_conn)
 
 
 def load_all_dimensions(dimensions_dict: dict, etl_conn: Engine, replace: bool = False):
@@ -0,0 +1,139 @@
+import os
+from pandas import DataFrame
+
+# Multiplicadores iniciales del pico de memoria de cada etapa respecto al
+# tamaño en memoria de sus DataFrames (configurables con stage_factors)
+STAGE_FACTORS = {
+    'extract': 1.5,    # DataFrame + buffers del driver durante el fetch
+    'transform': 1.5,  # columnas nuevas de medidas y llaves (la entrada no se copia)
+    'load': 2.0        # conversión a parámetros/CSV por chunk
+}
+
+
+def current_rss() -> int:
+    """
+    Memoria residente actual del proceso en bytes
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        # Último recurso: pico de RSS (KB en Linux)
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def frame_bytes(df: DataFrame) -> int:
+    """Tamaño en memoria de un DataFrame (incluye strings)"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class MemoryGovernor:
+    """
+    Ajusta el tamaño de los lotes de extracción, transformación y carga para
+    mantener el RSS del proceso bajo un presupuesto.
+
+    Aprende los bytes por fila de cada etapa a partir de los DataFrames
+    observados (promedio móvil exponencial) y corrige con el RSS medido:
+    si se supera el presupuesto el siguiente lote se reduce a la mitad,
+    si sobra memoria el lote crece hasta el doble.
+    """
+
+    def __init__(self, budget_mb: float, min_rows: int = 1000, max_rows: int = 2_000_000,
+                 initial_rows: int = 50_000, safety: float = 0.8, smoothing: float = 0.5,
+                 stage_factors: dict = None, verbose: bool = True):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.safety = safety
+        self.smoothing = smoothing
+        self.factors = {**STAGE_FACTORS, **(stage_factors or {})}
+        self.verbose = verbose
+        self.bytes_per_row = {}
+        self.rows_per_order = None
+        self.last_rows = {stage: initial_rows for stage in self.factors}
+        self.batch = 0
+
+    @classmethod
+    def from_settings(cls, etl_settings: dict):
+        """
+        Creamos el gobernador desde ETL_SETTINGS (None si no hay presupuesto configurado)
+        """
+        budget_mb = etl_settings.get('memory_budget_mb')
+        if not budget_mb:
+            return None
+        return cls(
+            budget_mb,
+            min_rows=etl_settings.get('memory_min_rows', 1000),
+            max_rows=etl_settings.get('memory_max_rows', 2_000_000),
+            initial_rows=etl_settings.get('memory_initial_rows', 50_000)
+        )
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def observe(self, stage: str, df: DataFrame, orders: int = None, extra_bytes: int = 0):
+        """
+        Registramos el tamaño observado de un DataFrame de la etapa.
+        extra_bytes permite sumar otros objetos vivos (p.ej. la entrada de la transformación).
+        """
+        rows = len(df)
+        if rows == 0:
+            return
+        per_row = (frame_bytes(df) + extra_bytes) / rows
+        self.bytes_per_row[stage] = self._smooth(self.bytes_per_row.get(stage), per_row)
+        if orders:
+            self.rows_per_order = self._smooth(self.rows_per_order, rows / orders)
+
+    def available_bytes(self) -> int:
+        """Memoria disponible bajo el presupuesto (con margen de seguridad)"""
+        return int(self.budget * self.safety) - current_rss()
+
+    def chunk_size(self, stage: str) -> int:
+        """
+        Filas por chunk para la etapa según el presupuesto restante
+        """
+        previous = self.last_rows[stage]
+        per_row = self.bytes_per_row.get(stage)
+        available = self.available_bytes()
+
+        if per_row is None:
+            # Sin observaciones todavía: se usa el tamaño inicial
+            rows = previous
+        elif available <= 0:
+            rows = previous // 2
+        else:
+            rows = int(available / (per_row * self.factors[stage]))
+            rows = min(rows, previous * 2)
+
+        rows = max(self.min_rows, min(self.max_rows, rows))
+        self.last_rows[stage] = rows
+        return rows
+
+    def batch_orders(self) -> int:
+        """
+        Órdenes por lote de extracción (las filas se traducen a órdenes con
+        el promedio observado de líneas por orden)
+        """
+        self.batch += 1
+        rows = self.chunk_size('extract')
+        orders = max(1, int(rows / (self.rows_per_order or 1)))
+        self.log(f"lote {self.batch}: extracción de {orders} órdenes (~{rows} filas)")
+        return orders
+
+    def log(self, message: str):
+        if self.verbose:
+            rss_mb = current_rss() / 1024 / 1024
+            budget_mb = self.budget / 1024 / 1024
+            print(f"[memoria] {message} | RSS {rss_mb:.0f} MB / presupuesto {budget_mb:.0f} MB")
@@ -0,0 +1,264 @@
+import os
+import json
+import shutil
+from datetime import datetime
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Dimensiones exportadas completas (un archivo por tabla)
+EXPORT_DIMENSIONS = [
+    'dim_customer', 'dim_product', 'dim_date', 'dim_territory', 'dim_currency',
+    'dim_currency_rate', 'dim_employee', 'dim_reseller', 'dim_sales_reason'
+]
+
+# Partición de los hechos sin fecha (date_key nulo), como en Hive
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+MANIFEST_FILE = '_manifest.json'
+
+
+def _require_pyarrow():
+    """pyarrow es opcional: solo lo necesita la exportación a Parquet"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _read_manifest(table_dir: str) -> dict:
+    path = os.path.join(table_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'partitions': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(table_dir: str, manifest: dict):
+    path = os.path.join(table_dir, MANIFEST_FILE)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def write_parquet(df: DataFrame, path: str, compression: str = 'zstd', row_group_size: int = 256000):
+    """
+    Escribimos un archivo Parquet comprimido con estadísticas por columna y
+    codificación de diccionario. Se escribe a un temporal y se renombra,
+    así un lector nunca ve un archivo a medias.
+    """
+    pa, pq = _require_pyarrow()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table, tmp_path, compression=compression, use_dictionary=True,
+                   write_statistics=True, row_group_size=row_group_size)
+    os.replace(tmp_path, path)
+
+
+def _partition_dir(table_dir: str, partition_key: int) -> str:
+    if not partition_key:
+        return os.path.join(table_dir, f'year={NULL_PARTITION}', f'month={NULL_PARTITION}')
+    year, month = divmod(int(partition_key), 100)
+    return os.path.join(table_dir, f'year={year}', f'month={month:02d}')
+
+
+def fact_partitions(etl_conn: Engine, fact_name: str, after_order_id: int = None) -> list:
+    """
+    Particiones año/mes (año*100+mes, 0 sin fecha) de un hecho; con
+    after_order_id solo las que tocaron las órdenes cargadas después
+    """
+    order_filter = 'WHERE f.sales_order_id > :after_order_id' if after_order_id is not None else ''
+    query = text(f'''
+        SELECT DISTINCT COALESCE(d.year * 100 + d.month, 0) AS partition_key
+        FROM {fact_name} f
+        LEFT JOIN dim_date d ON f.date_key = d.date_key
+        {order_filter}
+    ''')
+    with etl_conn.connect() as conn:
+        rows = conn.execute(query, {'after_order_id': after_order_id}).scalars().all()
+    return sorted(int(partition_key) for partition_key in rows)
+
+
+def read_fact_partition(etl_conn: Engine, fact_name: str, partition_key: int) -> DataFrame:
+    """Filas de una partición año/mes del hecho, ordenadas para mejores estadísticas"""
+    if partition_key:
+        year, month = divmod(int(partition_key), 100)
+        query = text(f'''
+            SELECT f.*
+            FROM {fact_name} f
+            JOIN dim_date d ON f.date_key = d.date_key
+            WHERE d.year = :year AND d.month = :month
+            ORDER BY f.date_key, f.sales_order_id, f.sales_order_detail_id
+        ''')
+        params = {'year': year, 'month': month}
+    else:
+        query = text(f'''
+            SELECT f.*
+            FROM {fact_name} f
+            LEFT JOIN dim_date d ON f.date_key = d.date_key
+            WHERE d.date_key IS NULL
+            ORDER BY f.sales_order_id, f.sales_order_detail_id
+        ''')
+        params = {}
+    return pd.read_sql_query(query, etl_conn, params=params)
+
+
+def date_partitions(etl_conn: Engine, date_keys) -> list:
+    """
+    Particiones año/mes de un conjunto de date_key según dim_date; las
+    llaves nulas o sin fila en dim_date caen en la partición 0, como en
+    read_fact_partition
+    """
+    keys = {int(date_key) for date_key in date_keys if pd.notna(date_key)}
+    partitions = set()
+    if keys:
+        with etl_conn.connect() as conn:
+            rows = conn.execute(text('''
+                SELECT date_key, year * 100 + month FROM dim_date WHERE date_key = ANY(:date_keys)
+            '''), {'date_keys': sorted(keys)}).all()
+        partitions = {int(partition_key) for _, partition_key in rows}
+        if len(rows) < len(keys):
+            partitions.add(0)
+    if any(pd.isna(date_key) for date_key in date_keys):
+        partitions.add(0)
+    return sorted(partitions)
+
+
+def _fingerprint(row_count, order_quantity, line_total, key_hash) -> str:
+    """Huella de una partición en texto, igual desde PostgreSQL o desde el DataFrame exportado"""
+    return f'{int(row_count)}|{int(order_quantity or 0)}|{float(line_total or 0):.2f}|{int(key_hash or 0)}'
+
+
+def frame_fingerprint(df: DataFrame) -> str:
+    """Huella de las filas de una partición ya leídas (filas, cantidades, importe y hash de llaves)"""
+    from etl import reconcile
+
+    detail_ids = df['sales_order_detail_id'].to_numpy(dtype='int64')
+    key_hash = (detail_ids * reconcile.KEY_HASH_MULTIPLIER % reconcile.KEY_HASH_MODULUS).sum()
+    return _fingerprint(len(df), df['order_quantity'].sum(), pd.to_numeric(df['line_total']).sum(), key_hash)
+
+
+def partition_fingerprints(etl_conn: Engine, fact_name: str) -> dict:
+    """
+    Huella de todas las particiones año/mes del hecho en la bodega (la misma
+    de la reconciliación). Recorre el hecho completo: solo la usa la
+    exportación con verify.
+    """
+    from etl import reconcile
+
+    fingerprints = reconcile.warehouse_fingerprints(etl_conn, fact_name)
+    partition_keys = pd.to_numeric(fingerprints['partition_key']).fillna(0).astype('int64')
+    return {
+        str(partition_key): _fingerprint(*(row[col] for col in reconcile.FINGERPRINT_COLUMNS))
+        for partition_key, (_, row) in zip(partition_keys, fingerprints.iterrows())
+    }
+
+
+def export_fact(etl_conn: Engine, fact_name: str, output_dir: str, after_order_id: int = None,
+                compression: str = 'zstd', partitions: list = None, verify: bool = False) -> dict:
+    """
+    Exportamos un hecho particionado por year=/month=. Con un manifiesto
+    previo la exportación es incremental y solo se reescriben:
+    - partitions: las particiones que tocó la corrida (órdenes nuevas,
+      reparaciones y liberaciones de cuarentena; las pasa el pipeline)
+    - after_order_id: las que tocaron las órdenes posteriores
+    - verify: las que cambiaron su huella desde la última exportación, con
+      una pasada completa de huellas sobre el hecho
+    Sin manifiesto o sin ninguno de los tres se reescriben todas. Las
+    particiones que quedan sin filas se eliminan.
+    """
+    table_dir = os.path.join(output_dir, fact_name)
+    manifest = _read_manifest(table_dir)
+    incremental = bool(manifest['partitions']) and (partitions is not None or after_order_id is not None or verify)
+    if incremental:
+        targets = set(partitions or ())
+        if after_order_id is not None:
+            targets |= set(fact_partitions(etl_conn, fact_name, after_order_id))
+        if verify:
+            fingerprints = partition_fingerprints(etl_conn, fact_name)
+            targets |= {int(partition_key) for partition_key, fingerprint in fingerprints.items()
+                        if manifest['partitions'].get(partition_key, {}).get('fingerprint') != fingerprint}
+            # Particiones exportadas antes que ya no tienen filas en la bodega
+            targets |= {int(partition_key) for partition_key in set(manifest['partitions']) - set(fingerprints)}
+    else:
+        targets = set(fact_partitions(etl_conn, fact_name)) | {int(key) for key in manifest['partitions']}
+
+    written, rows = 0, 0
+    for partition_key in sorted(targets):
+        df = read_fact_partition(etl_conn, fact_name, partition_key)
+        partition_dir = _partition_dir(table_dir, partition_key)
+        if df.empty:
+            shutil.rmtree(partition_dir, ignore_errors=True)
+            manifest['partitions'].pop(str(partition_key), None)
+            continue
+        write_parquet(df, os.path.join(partition_dir, 'part-0.parquet'), compression)
+        manifest['partitions'][str(partition_key)] = {
+            'rows': len(df),
+            'max_sales_order_id': int(df['sales_order_id'].max()),
+            'fingerprint': frame_fingerprint(df),
+            'exported_at': datetime.now().isoformat(timespec='seconds')
+        }
+        written += 1
+        rows += len(df)
+
+    manifest['after_order_id'] = after_order_id
+    _write_manifest(table_dir, manifest)
+    mode = 'incremental' if incremental else 'completa'
+    if verify:
+        mode += ', verificada'
+    print(f"✓ {fact_name} exportado a Parquet ({mode}): {written} particiones, {rows} registros")
+    return {'partitions': written, 'rows': rows}
+
+
+def export_dimension(etl_conn: Engine, table_name: str, output_dir: str, compression: str = 'zstd') -> bool:
+    """
+    Exportamos una dimensión a un único archivo; si su contenido no cambió
+    desde la exportación anterior (hash de filas) no se reescribe
+    """
+    table_dir = os.path.join(output_dir, table_name)
+    manifest = _read_manifest(table_dir)
+    df = pd.read_sql_table(table_name, etl_conn)
+    content_hash = str(int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+    path = os.path.join(table_dir, 'part-0.parquet')
+    if manifest.get('content_hash') == content_hash and os.path.exists(path):
+        return False
+
+    write_parquet(df, path, compression)
+    manifest.update({'content_hash': content_hash, 'rows': len(df),
+                     'exported_at': datetime.now().isoformat(timespec='seconds')})
+    _write_manifest(table_dir, manifest)
+    return True
+
+
+def export_datamart(etl_conn: Engine, output_dir: str = 'datamart_parquet', after_order_id: int = None,
+                    compression: str = 'zstd', partitions: dict = None, verify: bool = False) -> dict:
+    """
+    Exportación del datamart para BI: dimensiones que cambiaron y
+    particiones año/mes de los hechos tocadas por la corrida (partitions:
+    hecho -> particiones; ver export_fact)
+    """
+    _require_pyarrow()
+    summary = {}
+
+    changed = []
+    for table_name in EXPORT_DIMENSIONS:
+        if catalog.table_exists(etl_conn, table_name) and export_dimension(etl_conn, table_name,
+                                                                           output_dir, compression):
+            changed.append(table_name)
+    summary['dimensions'] = changed
+    print(f"✓ Dimensiones exportadas a Parquet: {len(changed)} con cambios")
+
+    for fact_name in catalog.FACT_TABLES:
+        if catalog.table_exists(etl_conn, fact_name):
+            touched = None if partitions is None else partitions.get(fact_name, [])
+            summary[fact_name] = export_fact(etl_conn, fact_name, output_dir, after_order_id, compression,
+                                             touched, verify)
+    return summary
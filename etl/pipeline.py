@@ -0,0 +1,572 @@
+import json
+import time
+import hashlib
+import sys
+import inspect
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+TASK_STATE_DDL = '''
+    CREATE TABLE IF NOT EXISTS etl_task_state (
+        task_name VARCHAR(100) PRIMARY KEY,
+        fingerprint CHAR(64) NOT NULL,
+        finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_seconds DOUBLE PRECISION
+    )
+'''
+
+# Dimensiones del DAG: (extracción, transformación, tablas del origen que leen)
+DIMENSION_TASKS = {
+    'dim_customer': ('extract_customers', 'transform_customer', [
+        'Sales.Customer', 'Person.Person', 'Person.EmailAddress', 'Person.PersonPhone',
+        'Person.BusinessEntityAddress', 'Person.Address', 'Person.StateProvince', 'Person.CountryRegion'
+    ]),
+    'dim_product': ('extract_products', 'transform_product', [
+        'Production.Product', 'Production.ProductSubcategory', 'Production.ProductCategory',
+        'Production.ProductModel'
+    ]),
+    'dim_date': (None, 'transform_date', []),
+    'dim_territory': ('extract_sales_territory', 'transform_territory', ['Sales.SalesTerritory']),
+    'dim_currency': ('extract_currency', 'transform_currency', ['Sales.Currency']),
+    'dim_currency_rate': ('extract_currency_rate', 'transform_currency_rate', ['Sales.CurrencyRate']),
+    'dim_employee': ('extract_employees', 'transform_employee', [
+        'HumanResources.Employee', 'Person.Person', 'HumanResources.EmployeeDepartmentHistory',
+        'HumanResources.Department'
+    ]),
+    'dim_reseller': ('extract_stores', 'transform_reseller', [
+        'Sales.Store', 'Person.BusinessEntityAddress', 'Person.Address', 'Person.StateProvince',
+        'Person.CountryRegion'
+    ]),
+    'dim_sales_reason': ('extract_sales_reason', 'transform_sales_reason', ['Sales.SalesReason'])
+}
+
+# Hechos del DAG: (extracción, transformación, carga incremental, proceso en etl_log)
+FACT_TASKS = {
+    'fact_internet_sales': ('extract_internet_sales', 'transform_internet_sales',
+                            'load_incremental_fact_internet_sales', 'Internet_Sales'),
+    'fact_reseller_sales': ('extract_reseller_sales', 'transform_reseller_sales',
+                            'load_incremental_fact_reseller_sales', 'Reseller_Sales')
+}
+FACT_SOURCES = ['Sales.SalesOrderHeader', 'Sales.SalesOrderDetail', 'Production.Product', 'Sales.CurrencyRate']
+FACT_CONFIG = ['start_date', 'incremental_load', 'swap_reload', 'reporting_currency', 'memory_budget_mb']
+
+BRIDGE_SOURCES = ['Sales.SalesOrderHeaderSalesReason']
+
+# Pasos de esquema para bodegas existentes y la carga de dimensión que los espera
+SCHEMA_TASKS = {
+    'schema:currency': 'dim_currency_rate',
+    'schema:sales_reason': 'dim_sales_reason'
+}
+
+# Tablas que lee el snapshot acumulativo de órdenes
+LIFECYCLE_SOURCES = ['Sales.SalesOrderHeader', 'Sales.SalesOrderDetail']
+
+
+class Task:
+    """
+    Tarea del DAG. run(pipeline, inputs, **params) recibe en inputs las
+    salidas de sus dependencias. La huella de la tarea combina las marcas
+    de cambio de sus tablas de origen, el código de sus funciones, las
+    claves de configuración que usa, si su tabla destino existe y las
+    huellas de sus dependencias.
+    materialized indica que su resultado queda en la bodega: una tarea que
+    corre no obliga a correr a sus dependencias materializadas.
+    blocking indica si su falla bloquea a las tareas que dependen de ella;
+    si no, solo las ordena y la tarea se reintenta en la siguiente corrida.
+    """
+
+    def __init__(self, name: str, run, deps: list = (), sources: list = (), code: list = (),
+                 config: list = (), params: dict = None, target: str = None, materialized: bool = True,
+                 process_name: str = None, blocking: bool = True):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.sources = list(sources)
+        self.code = list(code)
+        self.config = list(config)
+        self.params = params or {}
+        self.target = target
+        self.materialized = materialized
+        self.process_name = process_name
+        self.blocking = blocking
+
+
+# Versión del código del ETL: subirla fuerza a correr todas las tareas (p. ej. por un cambio
+# en un módulo que no aparece en el código declarado de ninguna tarea)
+CODE_VERSION = 1
+
+
+@functools.lru_cache(maxsize=None)
+def _module_digest(module_name: str) -> str:
+    """SHA-256 del código de un módulo; bytecode de sus funciones si no hay fuente"""
+    module = sys.modules[module_name]
+    try:
+        source = inspect.getsource(module)
+    except (OSError, TypeError):
+        source = ''.join(value.__code__.co_code.hex() for value in vars(module).values()
+                         if inspect.isfunction(value))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _code_digest(fn) -> tuple:
+    """
+    (módulo, huella) del módulo que define la función (sin los envoltorios
+    de perfilado/progreso): así la huella cubre también los helpers del
+    módulo que la función llama
+    """
+    module = inspect.getmodule(inspect.unwrap(fn))
+    return module.__name__, _module_digest(module.__name__)
+
+
+def _function_digest(path: str) -> tuple:
+    """(módulo, huella) de 'módulo.función' del paquete etl"""
+    module_name, function_name = path.rsplit('.', 1)
+    module = importlib.import_module(f'etl.{module_name}')
+    return _code_digest(getattr(module, function_name))
+
+
+def source_tokens(source_conn: Engine, tables: list) -> dict:
+    """
+    Marca de cambio por tabla del origen (filas y último ModifiedDate),
+    todas en una sola consulta
+    """
+    if not tables:
+        return {}
+    parts = [
+        f"SELECT '{table}' AS name, COUNT_BIG(*) AS row_count, MAX(ModifiedDate) AS modified FROM {table}"
+        for table in sorted(tables)
+    ]
+    with source_conn.connect() as conn:
+        return {name: f'{row_count}|{modified}' for name, row_count, modified
+                in conn.execute(text(' UNION ALL '.join(parts)))}
+
+
+class Pipeline:
+    """
+    Ejecutor del DAG: calcula las huellas, omite las tareas cuya huella
+    coincide con la de su última ejecución exitosa (etl_task_state) y corre
+    las demás en cuanto sus dependencias terminan, con las ramas
+    independientes en paralelo (workers hilos).
+    """
+
+    def __init__(self, tasks: list, source_conn: Engine, etl_conn: Engine, etl_settings: dict,
+                 workers: int = 4, force: bool = False, skip: set = None):
+        self.tasks = {task.name: task for task in tasks}
+        self.source_conn = source_conn
+        self.etl_conn = etl_conn
+        self.settings = etl_settings
+        self.workers = max(1, workers)
+        self.force = force
+        self.skip = set(skip or ())
+        self.context = {}
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Ciclo en el DAG del pipeline en la tarea {name}")
+            if name not in self.tasks:
+                raise ValueError(f"Dependencia desconocida en el DAG: {name}")
+            visiting.add(name)
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    def fingerprints(self) -> dict:
+        tables = {table for task in self.tasks.values() for table in task.sources}
+        tokens = source_tokens(self.source_conn, tables)
+        fingerprints = {}
+        for name in self.order:
+            task = self.tasks[name]
+            payload = {
+                'sources': {table: tokens.get(table) for table in task.sources},
+                'code': dict([_function_digest(path) for path in task.code] + [_code_digest(task.run)]),
+                'code_version': CODE_VERSION,
+                'config': {key: self.settings.get(key) for key in task.config},
+                'params': task.params,
+                'target': catalog.table_exists(self.etl_conn, task.target) if task.target else None,
+                'probe': self.context.get('probe_signatures', {}).get(task.target),
+                'deps': {dep: fingerprints[dep] for dep in task.deps}
+            }
+            encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+            fingerprints[name] = hashlib.sha256(encoded).hexdigest()
+        return fingerprints
+
+    def _stored_fingerprints(self) -> dict:
+        if not catalog.table_exists(self.etl_conn, 'etl_task_state'):
+            with self.etl_conn.begin() as conn:
+                conn.execute(text(TASK_STATE_DDL))
+            catalog.invalidate_catalog(self.etl_conn)
+            return {}
+        with self.etl_conn.connect() as conn:
+            return dict(conn.execute(text('SELECT task_name, fingerprint FROM etl_task_state')).all())
+
+    def _save_fingerprint(self, name: str, fingerprint: str, seconds: float):
+        with self.etl_conn.begin() as conn:
+            conn.execute(text('''
+                INSERT INTO etl_task_state (task_name, fingerprint, finished_at, duration_seconds)
+                VALUES (:task_name, :fingerprint, CURRENT_TIMESTAMP, :seconds)
+                ON CONFLICT (task_name) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint,
+                    finished_at = EXCLUDED.finished_at,
+                    duration_seconds = EXCLUDED.duration_seconds
+            '''), {'task_name': name, 'fingerprint': fingerprint, 'seconds': seconds})
+
+    def plan(self, fingerprints: dict, stored: dict) -> set:
+        """Tareas a correr: las de huella nueva y las dependencias en memoria que necesitan"""
+        to_run = {
+            name for name in self.order
+            if name not in self.skip and (self.force or stored.get(name) != fingerprints[name])
+        }
+        stack = list(to_run)
+        while stack:
+            for dep in self.tasks[stack.pop()].deps:
+                if not self.tasks[dep].materialized and dep not in to_run:
+                    to_run.add(dep)
+                    stack.append(dep)
+        return to_run
+
+    def _execute(self, task: Task, inputs: dict):
+        start = time.perf_counter()
+        result = task.run(self, inputs, **task.params)
+        return result, time.perf_counter() - start
+
+    def run(self) -> dict:
+        from etl import utils_etl
+
+        fingerprints = self.fingerprints()
+        to_run = self.plan(fingerprints, self._stored_fingerprints())
+        status = {name: 'omitida' for name in self.order if name not in to_run}
+        for name in self.order:
+            if name in status:
+                print(f"  = {name}: sin cambios, se omite")
+        results = {}
+        pending = [name for name in self.order if name in to_run]
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='etl-task') as pool:
+            running = {}
+            while pending or running:
+                for name in list(pending):
+                    deps = [(status.get(dep), self.tasks[dep].blocking) for dep in self.tasks[name].deps]
+                    if any(state in ('fallida', 'bloqueada') and blocking for state, blocking in deps):
+                        status[name] = 'bloqueada'
+                        pending.remove(name)
+                        print(f"  ✗ {name}: bloqueada por una dependencia fallida")
+                    elif all(state in ('exitosa', 'omitida', 'fallida', 'bloqueada') for state, _ in deps):
+                        inputs = {dep: results.get(dep) for dep in self.tasks[name].deps}
+                        running[pool.submit(self._execute, self.tasks[name], inputs)] = name
+                        pending.remove(name)
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    task = self.tasks[name]
+                    try:
+                        results[name], seconds = future.result()
+                    except Exception as e:
+                        status[name] = 'fallida'
+                        print(f"  ✗ {name}: {e}")
+                        if not task.blocking:
+                            print(f"  Advertencia: las tareas que dependen de {name} continúan")
+                        if task.process_name:
+                            utils_etl.log_etl_run(self.etl_conn, task.process_name, 'Fallido')
+                        continue
+                    status[name] = 'exitosa'
+                    self._save_fingerprint(name, fingerprints[name], seconds)
+                    print(f"  ✓ {name} ({seconds:.2f} s)")
+                    if task.process_name:
+                        records = results[name] if isinstance(results[name], int) else 0
+                        utils_etl.log_etl_run(self.etl_conn, task.process_name, 'Exitoso', records)
+
+        summary = {
+            'executed': [name for name in self.order if status.get(name) == 'exitosa'],
+            'skipped': [name for name in self.order if status.get(name) == 'omitida'],
+            'failed': [name for name in self.order if status.get(name) in ('fallida', 'bloqueada')],
+            'status': status,
+            'results': results
+        }
+        print(f"Pipeline: {len(summary['executed'])} tareas ejecutadas, {len(summary['skipped'])} omitidas, "
+              f"{len(summary['failed'])} fallidas en {time.perf_counter() - started:.2f} s")
+        return summary
+
+
+# Tareas del ETL de AdventureWorks
+
+def _extract_dimension(pipeline: Pipeline, inputs: dict, extract_name: str, table_name: str = None):
+    from etl import extract, source_probe
+
+    # Si la sonda acotó los cambios a rangos de llaves, solo se extraen esos
+    ranges = None
+    if not (pipeline.force or pipeline.settings.get('replace_dimensions', False)):
+        ranges = source_probe.key_ranges(pipeline.context.get('dimension_plans', {}), table_name)
+    if ranges:
+        return getattr(extract, extract_name)(pipeline.source_conn, key_ranges=ranges)
+    return getattr(extract, extract_name)(pipeline.source_conn)
+
+
+def _transform_dimension(pipeline: Pipeline, inputs: dict, table_name: str, transform_name: str,
+                         extract_task: str = None):
+    from etl import transform, keys, source_probe
+
+    transform_fn = getattr(transform, transform_name)
+    df = transform_fn(inputs[extract_task]) if extract_task else transform_fn()
+    if table_name in keys.SURROGATE_KEYS:
+        # Las dimensiones sin merge por llave natural (dim_date) solo cargan sus miembros nuevos
+        only_new = (table_name not in source_probe.DIMENSION_PROBES
+                    and not pipeline.settings.get('replace_dimensions', False))
+        df = pipeline.context['keys'].assign(df, table_name, only_new=only_new)
+    transform.validate_transformations(df, table_name, pipeline.etl_conn)
+    return df
+
+
+def _load_dimension(pipeline: Pipeline, inputs: dict, table_name: str, transform_task: str):
+    from etl import load, source_probe
+
+    df = inputs[transform_task]
+    if table_name == 'dim_sales_reason':
+        load.load_sales_reason(df, pipeline.etl_conn)
+    elif table_name == 'dim_currency_rate':
+        load.load_currency_rate(df, pipeline.etl_conn)
+    elif table_name in source_probe.DIMENSION_PROBES:
+        source_probe.apply_changes(df, pipeline.etl_conn, table_name,
+                                   pipeline.settings.get('replace_dimensions', False))
+        if 'source_probe' in pipeline.context:
+            source_probe.save_probe(pipeline.etl_conn, pipeline.context['source_probe'], table_name)
+    else:
+        load.load(df, pipeline.etl_conn, table_name, pipeline.settings.get('replace_dimensions', False))
+    return len(df)
+
+
+def _currency_schema(pipeline: Pipeline, inputs: dict):
+    from etl import load
+
+    load.ensure_currency_schema(pipeline.etl_conn)
+
+
+def _sales_reason_schema(pipeline: Pipeline, inputs: dict):
+    from etl import load
+
+    load.ensure_sales_reason_schema(pipeline.etl_conn)
+
+
+def _dimensions_done(pipeline: Pipeline, inputs: dict):
+    """Barrera: todas las dimensiones cargadas (se registra como 'Dimensiones' en etl_log)"""
+    print("✓ Todas las dimensiones cargadas exitosamente")
+
+
+def _warehouse_dimensions(pipeline: Pipeline, inputs: dict):
+    """Dimensiones para los hechos desde los mapas de llaves en memoria (sin releer la bodega)"""
+    return pipeline.context['keys'].dimensions(reporting_currency=pipeline.settings.get('reporting_currency'))
+
+
+def _touched_date_keys(pipeline: Pipeline, fact_name: str) -> set:
+    """date_key de las filas que la corrida cargó, liberó o reparó en un hecho (exportación incremental)"""
+    return pipeline.context.setdefault('touched_date_keys', {}).setdefault(fact_name, set())
+
+
+def _release_quarantine(pipeline: Pipeline, inputs: dict):
+    from etl import integrity
+
+    dimensions = inputs['dimensions:warehouse']
+    released = 0
+    for fact_name in integrity.FACT_FOREIGN_KEYS:
+        released += integrity.release_quarantine(pipeline.source_conn, pipeline.etl_conn, fact_name, dimensions,
+                                                 start_date=pipeline.settings.get('start_date', '2011-01-01'),
+                                                 touched=_touched_date_keys(pipeline, fact_name))
+    return released
+
+
+def _load_fact(pipeline: Pipeline, inputs: dict, fact_name: str):
+    """Carga de un hecho: por lotes con memory_budget_mb, si no en una pasada"""
+    from etl import extract, transform, load, integrity, utils_etl
+    from etl.memory import MemoryGovernor
+
+    settings = pipeline.settings
+    dimensions = inputs['dimensions:warehouse']
+    start_date = settings.get('start_date', '2011-01-01')
+    incremental = settings.get('incremental_load', True)
+    extract_name, transform_name, load_name, _ = FACT_TASKS[fact_name]
+
+    governor = MemoryGovernor.from_settings(settings)
+    if governor is not None and incremental:
+        return utils_etl.push_fact_batches(pipeline.source_conn, pipeline.etl_conn, fact_name, dimensions,
+                                           governor, start_date=start_date,
+                                           touched=_touched_date_keys(pipeline, fact_name))
+
+    source_rows = getattr(extract, extract_name)(pipeline.source_conn, start_date=start_date)
+    fact = getattr(transform, transform_name)(source_rows, dimensions)
+    fact = integrity.precheck(fact, fact_name, dimensions, pipeline.etl_conn)
+    if not transform.validate_transformations(fact, fact_name, pipeline.etl_conn):
+        raise ValueError(f"Validación fallida para {fact_name}")
+    if incremental:
+        getattr(load, load_name)(fact, pipeline.etl_conn)
+        _touched_date_keys(pipeline, fact_name).update(fact['date_key'].drop_duplicates())
+    else:
+        load.load(fact, pipeline.etl_conn, fact_name, replace=True, swap=settings.get('swap_reload', True))
+    load.ensure_fact_order_indexes(pipeline.etl_conn)
+    return len(fact)
+
+
+def _load_bridge(pipeline: Pipeline, inputs: dict):
+    """Pares orden-razón posteriores a la marca de agua de la tabla puente"""
+    from etl import extract, transform, load
+
+    after_order_id = catalog.get_watermarks(pipeline.etl_conn).get('bridge_order_sales_reason') or 0
+    order_reasons = extract.extract_order_sales_reason(pipeline.source_conn, after_order_id=after_order_id)
+    bridge = transform.transform_order_sales_reason(order_reasons)
+    rows = load.load_bridge_order_sales_reason(bridge, pipeline.etl_conn) if not bridge.empty else 0
+    print(f"✓ Razones de venta cargadas: {rows} nuevos pares orden-razón")
+    return rows
+
+
+def _load_order_lifecycle(pipeline: Pipeline, inputs: dict):
+    from etl import utils_etl
+
+    return utils_etl.push_order_lifecycle(pipeline.source_conn, pipeline.etl_conn, inputs['dimensions:warehouse'],
+                                          start_date=pipeline.settings.get('start_date', '2011-01-01'))
+
+
+def _reconcile(pipeline: Pipeline, inputs: dict):
+    from etl import reconcile
+
+    settings = pipeline.settings
+    reconcile.reconcile_all(
+        pipeline.source_conn, pipeline.etl_conn,
+        granularity=settings.get('reconcile_granularity', 'month'),
+        start_date=settings.get('start_date', '2011-01-01'),
+        repair=settings.get('reconcile') == 'repair',
+        reporting_currency=settings.get('reporting_currency'),
+        touched={fact_name: _touched_date_keys(pipeline, fact_name) for fact_name in reconcile.RECONCILE_FACTS}
+    )
+
+
+def _parquet_export(pipeline: Pipeline, inputs: dict):
+    from etl import parquet_export
+
+    settings = pipeline.settings
+    # Solo las particiones que tocó la corrida; con recarga completa de los hechos
+    # (incremental_load: false) se exporta todo
+    partitions = None
+    if settings.get('incremental_load', True):
+        partitions = {fact_name: parquet_export.date_partitions(pipeline.etl_conn, date_keys)
+                      for fact_name, date_keys in pipeline.context.get('touched_date_keys', {}).items()}
+    parquet_export.export_datamart(
+        pipeline.etl_conn,
+        output_dir=settings.get('parquet_dir', 'datamart_parquet'),
+        compression=settings.get('parquet_compression', 'zstd'),
+        partitions=partitions,
+        verify=settings.get('parquet_verify', False)
+    )
+
+
+def etl_tasks(etl_settings: dict) -> list:
+    """DAG del ETL: extracción/transformación/carga por dimensión, hechos, puente y pasos finales"""
+    tasks = [
+        Task('schema:currency', _currency_schema, code=['load.ensure_currency_schema']),
+        Task('schema:sales_reason', _sales_reason_schema, code=['load.ensure_sales_reason_schema'])
+    ]
+
+    for table_name, (extract_name, transform_name, sources) in DIMENSION_TASKS.items():
+        extract_task = f'extract:{table_name}' if extract_name else None
+        if extract_name:
+            tasks.append(Task(extract_task, _extract_dimension, sources=sources,
+                              code=[f'extract.{extract_name}'], materialized=False,
+                              params={'extract_name': extract_name, 'table_name': table_name}))
+        tasks.append(Task(f'transform:{table_name}', _transform_dimension, deps=[extract_task] if extract_task else [],
+                          code=[f'transform.{transform_name}'], materialized=False,
+                          params={'table_name': table_name, 'transform_name': transform_name,
+                                  'extract_task': extract_task}))
+        load_deps = [f'transform:{table_name}'] + [schema for schema, table in SCHEMA_TASKS.items()
+                                                   if table == table_name]
+        tasks.append(Task(f'load:{table_name}', _load_dimension, deps=load_deps, target=table_name,
+                          config=['replace_dimensions'], code=['load.load', 'load.merge_dimension'],
+                          params={'table_name': table_name, 'transform_task': f'transform:{table_name}'}))
+
+    tasks += [
+        Task('dimensions', _dimensions_done, deps=[f'load:{table_name}' for table_name in DIMENSION_TASKS],
+             process_name='Dimensiones'),
+        Task('dimensions:warehouse', _warehouse_dimensions, deps=['dimensions', 'schema:currency'],
+             config=['reporting_currency'], materialized=False),
+        # Una liberación fallida no detiene la carga de los hechos (se reintenta en la siguiente corrida)
+        Task('quarantine:release', _release_quarantine, deps=['dimensions:warehouse'],
+             code=['integrity.release_quarantine'], config=['start_date'], blocking=False)
+    ]
+
+    for fact_name, (extract_name, transform_name, load_name, process_name) in FACT_TASKS.items():
+        tasks.append(Task(f'fact:{fact_name}', _load_fact, deps=['dimensions:warehouse', 'quarantine:release'],
+                          sources=FACT_SOURCES, config=FACT_CONFIG, target=fact_name,
+                          code=[f'extract.{extract_name}', f'transform.{transform_name}', f'load.{load_name}',
+                                'integrity.precheck', 'utils_etl.push_fact_batches'],
+                          params={'fact_name': fact_name}, process_name=process_name))
+
+    tasks.append(Task('bridge:order_sales_reason', _load_bridge,
+                      deps=['load:dim_sales_reason', 'schema:sales_reason'],
+                      sources=BRIDGE_SOURCES, target='bridge_order_sales_reason',
+                      code=['extract.extract_order_sales_reason', 'transform.transform_order_sales_reason',
+                            'load.load_bridge_order_sales_reason']))
+    tasks.append(Task('fact:order_lifecycle', _load_order_lifecycle, deps=['dimensions:warehouse'],
+                      sources=LIFECYCLE_SOURCES, config=['start_date'], target='fact_order_lifecycle',
+                      code=['extract.extract_order_lifecycle', 'transform.transform_order_lifecycle',
+                            'load.merge_order_lifecycle', 'utils_etl.push_order_lifecycle'],
+                      process_name='Order_Lifecycle'))
+
+    fact_tasks = [f'fact:{fact_name}' for fact_name in FACT_TASKS]
+    export_deps = fact_tasks + ['bridge:order_sales_reason', 'dimensions']
+    if etl_settings.get('reconcile', False):
+        tasks.append(Task('reconcile', _reconcile, deps=fact_tasks, code=['reconcile.reconcile_all'],
+                          config=['reconcile', 'reconcile_granularity', 'start_date', 'reporting_currency']))
+        # La exportación ve las particiones que repare la reconciliación
+        export_deps.append('reconcile')
+    if etl_settings.get('parquet_export', False):
+        tasks.append(Task('export:parquet', _parquet_export, deps=export_deps,
+                          code=['parquet_export.export_datamart'],
+                          config=['parquet_dir', 'parquet_compression', 'parquet_verify', 'incremental_load']))
+    return tasks
+
+
+def build_etl_pipeline(source_conn: Engine, etl_conn: Engine, etl_settings: dict, force: bool = False) -> Pipeline:
+    """
+    Pipeline del ETL desde ETL_SETTINGS (pipeline_workers). Con
+    load_dimensions: false y la bodega ya poblada se omite todo el trabajo
+    de dimensiones.
+    """
+    tasks = etl_tasks(etl_settings)
+    skip = set()
+    if not etl_settings.get('load_dimensions', True) and catalog.table_exists(etl_conn, 'dim_customer'):
+        skip = {task.name for task in tasks
+                if task.name.split(':', 1)[-1] in DIMENSION_TASKS or task.name == 'dimensions'}
+
+    pipeline = Pipeline(tasks, source_conn, etl_conn, etl_settings,
+                        workers=etl_settings.get('pipeline_workers', 4), force=force, skip=skip)
+    # Sondas de checksum de las dimensiones (probe_dimensions): su resumen entra en la huella
+    # de la carga y los cambios acotados a rangos de llaves se extraen solo en esos rangos
+    if etl_settings.get('probe_dimensions', True) and not skip:
+        from etl import source_probe
+
+        probes, plans = source_probe.plan_dimensions(source_conn, etl_conn)
+        pipeline.context['source_probe'] = probes
+        pipeline.context['dimension_plans'] = plans
+        pipeline.context['probe_signatures'] = {dimension: source_probe.probe_signature(probes, dimension)
+                                                for dimension in plans}
+    # Llaves sustitutas asignadas en el proceso (key_block_size por reserva a la secuencia)
+    from etl import keys
+
+    pipeline.context['keys'] = keys.KeyAllocator.from_settings(etl_conn, etl_settings)
+    return pipeline
@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import time
+import atexit
+import cProfile
+import pstats
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from etl.hooks import wrap_module_functions
+
+# Funciones de pandas que se reportan como puntos calientes
+HOTSPOT_FUNCTIONS = {
+    'merge', 'apply', 'to_sql', 'read_sql', 'read_sql_query', 'read_sql_table',
+    'groupby', 'agg', 'replace', 'rename', 'copy', 'concat', 'astype', 'to_csv',
+    'drop_duplicates', 'fillna', 'cut', 'to_datetime'
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f'{code.co_name} ({module})'
+
+
+def _is_pandas_frame(frame) -> bool:
+    return f'{os.sep}pandas{os.sep}' in frame.f_code.co_filename
+
+
+class _Sampler(threading.Thread):
+    """
+    Muestreador de pilas: cada interval segundos toma la pila del hilo
+    perfilado y la acumula en formato colapsado (raíz;...;hoja)
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.hotspots = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            hotspot = None
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                # El punto caliente es la llamada de pandas más externa de la pila
+                if _is_pandas_frame(frame) and frame.f_code.co_name in HOTSPOT_FUNCTIONS:
+                    hotspot = frame.f_code.co_name
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            if hotspot:
+                self.hotspots[hotspot] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class StageProfiler:
+    """
+    Perfilador por etapa del ETL. Cada etapa de primer nivel escribe:
+    - NN_etapa.collapsed: pilas muestreadas para flamegraph.pl / speedscope
+    - NN_etapa.prof: volcado de cProfile (solo en modo 'cprofile')
+    y al final summary.txt con tiempos y puntos calientes de pandas.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', mode: str = 'sampling', interval: float = 0.005):
+        if mode not in ('sampling', 'cprofile'):
+            raise ValueError(f"Modo de perfilado no soportado: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.output_dir = os.path.join(output_dir, datetime.now().strftime('%Y%m%d_%H%M%S'))
+        self.results = []
+        self._local = threading.local()
+        self._cprofile_active = False
+        self._restore = []
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        atexit.register(self.write_summary)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Perfilamos un bloque. Las etapas anidadas (p.ej. load.load dentro de
+        una función de carga) quedan dentro del perfil de la etapa externa.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            if depth:
+                yield
+            else:
+                with self._profiled(name):
+                    yield
+        finally:
+            self._local.depth = depth
+
+    @contextmanager
+    def _profiled(self, name: str):
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        profile = None
+        with self._lock:
+            # cProfile admite un solo perfil activo a la vez
+            if self.mode == 'cprofile' and not self._cprofile_active:
+                self._cprofile_active = True
+                profile = cProfile.Profile()
+        sampler.start()
+        if profile:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile:
+                profile.disable()
+                self._cprofile_active = False
+            sampler.stop()
+            self._save_stage(name, elapsed, sampler, profile)
+
+    def _save_stage(self, name: str, elapsed: float, sampler: _Sampler, profile):
+        with self._lock:
+            index = len(self.results) + 1
+            self.results.append(None)
+        base = os.path.join(self.output_dir, f"{index:02d}_{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}")
+
+        with open(base + '.collapsed', 'w') as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        hotspots = {fn: count / sampler.samples for fn, count in sampler.hotspots.items()} if sampler.samples else {}
+        if profile:
+            profile.dump_stats(base + '.prof')
+            # En modo determinista el tiempo acumulado de cProfile es más preciso
+            stats = pstats.Stats(profile).stats
+            cumulative = Counter()
+            for (filename, _, funcname), (_, _, _, ct, _) in stats.items():
+                if f'{os.sep}pandas{os.sep}' in filename and funcname in HOTSPOT_FUNCTIONS:
+                    cumulative[funcname] = max(cumulative[funcname], ct)
+            hotspots = {fn: ct / elapsed for fn, ct in cumulative.items()} if elapsed else {}
+
+        self.results[index - 1] = {'stage': name, 'seconds': elapsed, 'samples': sampler.samples,
+                                   'hotspots': hotspots}
+
+    def instrument(self, *modules):
+        """Envolvemos las funciones públicas de los módulos como etapas"""
+        def make_wrapper(name, fn):
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+
+        for module in modules:
+            self._restore.append(wrap_module_functions(module, make_wrapper))
+
+    def uninstrument(self):
+        for restore in self._restore:
+            restore()
+        self._restore = []
+
+    def write_summary(self):
+        """Resumen por etapa: tiempo, muestras y puntos calientes de pandas"""
+        results = [result for result in self.results if result]
+        if not results:
+            return
+        lines = [f"Perfil ETL ({self.mode}) - {len(results)} etapas", '']
+        for result in sorted(results, key=lambda r: r['seconds'], reverse=True):
+            lines.append(f"{result['stage']:<50} {result['seconds']:>9.3f} s  {result['samples']:>6} muestras")
+            for fn, share in sorted(result['hotspots'].items(), key=lambda item: item[1], reverse=True)[:5]:
+                lines.append(f"    pandas.{fn:<20} {share * 100:5.1f}%")
+        with open(os.path.join(self.output_dir, 'summary.txt'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print(f"✓ Perfiles por etapa escritos en {self.output_dir}")
+
+
+class NullProfiler:
+    """Perfilador desactivado: no envuelve nada y stage() no hace nada"""
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def instrument(self, *modules):
+        pass
+
+    def uninstrument(self):
+        pass
+
+    def write_summary(self):
+        pass
+
+
+def from_settings(etl_settings: dict, enabled: bool = None):
+    """
+    Creamos el perfilador desde ETL_SETTINGS (profile, profile_mode,
+    profile_dir, profile_interval). Sin profile devuelve NullProfiler.
+    """
+    if enabled is None:
+        enabled = bool(etl_settings.get('profile', False))
+    if not enabled:
+        return NullProfiler()
+    return StageProfiler(
+        output_dir=etl_settings.get('profile_dir', 'profiles'),
+        mode=etl_settings.get('profile_mode', 'sampling'),
+        interval=etl_settings.get('profile_interval', 0.005)
+    )
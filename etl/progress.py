@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import atexit
+import threading
+from collections import defaultdict
+from pandas import DataFrame
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import Insert
+from etl.hooks import wrap_module_functions
+
+# Tabla de la bodega asociada a cada función de extracción/transformación
+FUNCTION_TABLES = {
+    'extract_internet_sales': 'fact_internet_sales',
+    'extract_reseller_sales': 'fact_reseller_sales',
+    'extract_customers': 'dim_customer',
+    'extract_products': 'dim_product',
+    'extract_sales_territory': 'dim_territory',
+    'extract_currency': 'dim_currency',
+    'extract_currency_rate': 'dim_currency_rate',
+    'extract_employees': 'dim_employee',
+    'extract_stores': 'dim_reseller',
+    'extract_sales_reason': 'dim_sales_reason',
+    'extract_order_sales_reason': 'bridge_order_sales_reason',
+    'transform_internet_sales': 'fact_internet_sales',
+    'transform_reseller_sales': 'fact_reseller_sales',
+    'transform_customer': 'dim_customer',
+    'transform_product': 'dim_product',
+    'transform_date': 'dim_date',
+    'transform_territory': 'dim_territory',
+    'transform_currency': 'dim_currency',
+    'transform_currency_rate': 'dim_currency_rate',
+    'transform_employee': 'dim_employee',
+    'transform_reseller': 'dim_reseller',
+    'transform_sales_reason': 'dim_sales_reason',
+    'transform_order_sales_reason': 'bridge_order_sales_reason'
+}
+
+# Límites (segundos) del histograma de duración por etapa
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+
+
+def _label_value(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ProgressTracker:
+    """
+    Seguimiento en vivo de filas extraídas/transformadas/cargadas por tabla,
+    con línea de progreso limitada a una cada interval segundos (filas/s y
+    ETA) y archivo de texto en formato Prometheus para el textfile collector
+    de node_exporter.
+    """
+
+    def __init__(self, textfile: str = None, interval: float = 5.0, stream=None):
+        self.textfile = textfile
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.rows = defaultdict(int)            # (tabla, etapa) -> filas
+        self.expected = {}                      # (tabla, etapa) -> filas esperadas
+        self.started = {}                       # (tabla, etapa) -> primer avance
+        self.durations = defaultdict(list)      # etapa -> duraciones de llamadas
+        self._last_print = defaultdict(float)
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        self._restore = []
+        atexit.register(self.close)
+
+    def expect(self, table: str, stage: str, total: int):
+        """Filas esperadas para calcular porcentaje y ETA"""
+        with self._lock:
+            self.expected[(table, stage)] = int(total)
+
+    def begin(self, table: str, stage: str):
+        """Marcamos el inicio de la etapa para medir throughput desde ahí"""
+        with self._lock:
+            self.started.setdefault((table, stage), time.monotonic())
+
+    def advance(self, table: str, stage: str, rows: int):
+        """Registramos filas procesadas y mostramos el progreso (limitado)"""
+        now = time.monotonic()
+        key = (table, stage)
+        with self._lock:
+            self.started.setdefault(key, now)
+            self.rows[key] += int(rows)
+            # Lo extraído es lo que queda por transformar y cargar
+            if stage == 'extract':
+                for downstream in ('transform', 'load'):
+                    self.expected[(table, downstream)] = self.rows[key]
+            due = now - self._last_print[key] >= self.interval
+            if due:
+                self._last_print[key] = now
+        if due:
+            self.stream.write(self.format_line(table, stage) + '\n')
+            self.stream.flush()
+        self._maybe_write()
+
+    def observe_duration(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def rate(self, table: str, stage: str) -> float:
+        key = (table, stage)
+        elapsed = time.monotonic() - self.started.get(key, time.monotonic())
+        return self.rows[key] / elapsed if elapsed > 0 else 0.0
+
+    def format_line(self, table: str, stage: str) -> str:
+        key = (table, stage)
+        done = self.rows[key]
+        rate = self.rate(table, stage)
+        line = f"[progreso] {table} {stage}: {done:,} filas"
+        expected = self.expected.get(key)
+        if expected:
+            line += f"/{expected:,} ({min(done / expected, 1) * 100:.1f}%)"
+        line += f" | {rate:,.0f} filas/s"
+        if expected and rate > 0 and done < expected:
+            line += f" | ETA {(expected - done) / rate:.0f}s"
+        return line
+
+    def _maybe_write(self, force: bool = False):
+        if not self.textfile:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        self.write_textfile()
+
+    def render_metrics(self) -> str:
+        """Métricas en formato de exposición de Prometheus/OpenMetrics"""
+        with self._lock:
+            rows = dict(self.rows)
+            expected = dict(self.expected)
+            durations = {stage: list(values) for stage, values in self.durations.items()}
+
+        lines = [
+            '# HELP etl_rows_total Filas procesadas por tabla y etapa.',
+            '# TYPE etl_rows_total counter'
+        ]
+        for (table, stage), value in sorted(rows.items()):
+            lines.append(f'etl_rows_total{{table="{_label_value(table)}",stage="{stage}"}} {value}')
+
+        lines += ['# HELP etl_expected_rows Filas esperadas por tabla y etapa.',
+                  '# TYPE etl_expected_rows gauge']
+        for (table, stage), value in sorted(expected.items()):
+            lines.append(f'etl_expected_rows{{table="{_label_value(table)}",stage="{stage}"}} {value}')
+
+        lines += ['# HELP etl_rows_per_second Throughput promedio por tabla y etapa.',
+                  '# TYPE etl_rows_per_second gauge']
+        for table, stage in sorted(rows):
+            lines.append(f'etl_rows_per_second{{table="{_label_value(table)}",stage="{stage}"}} '
+                         f'{self.rate(table, stage):.3f}')
+
+        lines += ['# HELP etl_stage_duration_seconds Duración de cada llamada por etapa.',
+                  '# TYPE etl_stage_duration_seconds histogram']
+        for stage, values in sorted(durations.items()):
+            for bound in DURATION_BUCKETS:
+                count = sum(1 for value in values if value <= bound)
+                lines.append(f'etl_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'etl_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {len(values)}')
+            lines.append(f'etl_stage_duration_seconds_sum{{stage="{stage}"}} {sum(values):.6f}')
+            lines.append(f'etl_stage_duration_seconds_count{{stage="{stage}"}} {len(values)}')
+
+        lines += ['# HELP etl_progress_last_update_seconds Momento de la última actualización (epoch).',
+                  '# TYPE etl_progress_last_update_seconds gauge',
+                  f'etl_progress_last_update_seconds {time.time():.3f}']
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        """Escritura atómica (archivo temporal + rename) para node_exporter"""
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.textfile}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render_metrics())
+        os.replace(tmp_path, self.textfile)
+
+    def instrument(self, extract_module=None, transform_module=None, load_module=None):
+        """
+        Enganchamos el seguimiento a las funciones de extracción,
+        transformación y carga sin cambiar sus llamadas (el avance por chunk
+        de las cargas sale de attach)
+        """
+        def make_wrapper(stage):
+            def factory(name, fn):
+                function_name = name.split('.', 1)[1]
+
+                def wrapper(*args, **kwargs):
+                    table = self._table_for(stage, function_name, args, kwargs)
+                    if stage == 'load' and args and isinstance(args[0], DataFrame):
+                        before = self.rows[(table, 'load')]
+                        self.expect(table, 'load', max(self.expected.get((table, 'load'), 0), len(args[0])))
+                    self.begin(table, stage)
+                    start = time.perf_counter()
+                    result = fn(*args, **kwargs)
+                    self.observe_duration(stage, time.perf_counter() - start)
+                    if stage in ('extract', 'transform') and isinstance(result, DataFrame):
+                        self.advance(table, stage, len(result))
+                    elif stage == 'load' and args and isinstance(args[0], DataFrame):
+                        # Cargas sin INSERT compilado (p.ej. COPY o SQL de texto): se cuentan al terminar
+                        if self.rows[(table, 'load')] == before:
+                            self.advance(table, 'load', len(args[0]))
+                    return result
+                return wrapper
+            return factory
+
+        for module, stage in ((extract_module, 'extract'), (transform_module, 'transform'),
+                              (load_module, 'load')):
+            if module is not None:
+                self._restore.append(wrap_module_functions(module, make_wrapper(stage)))
+
+    def _table_for(self, stage: str, function_name: str, args: tuple, kwargs: dict) -> str:
+        if stage != 'load':
+            return FUNCTION_TABLES.get(function_name, function_name.split('_', 1)[-1])
+        table_name = kwargs.get('table_name')
+        if table_name is None and len(args) > 2 and isinstance(args[2], str):
+            table_name = args[2]
+        if table_name is None:
+            table_name = function_name.replace('load_incremental_', '').replace('load_', '')
+        return table_name
+
+    def attach(self, engine: Engine):
+        """
+        Contamos las filas de cada INSERT compilado hacia la bodega (to_sql,
+        inserts de SQLAlchemy) con el evento after_cursor_execute del motor,
+        para reportar avance por chunk durante cargas largas. Solo escucha
+        este motor: no reemplaza DataFrame.to_sql en todo el proceso.
+        """
+        def after(conn, cursor, statement, parameters, context, executemany):
+            compiled = getattr(context, 'compiled', None)
+            insert = getattr(compiled, 'statement', None)
+            if not isinstance(insert, Insert):
+                return
+            # Con insertmanyvalues cada lote de VALUES es una ejecución: rowcount trae sus filas,
+            # mientras que parameters puede ser la lista completa (SQLAlchemy 2.0)
+            rows = cursor.rowcount
+            if (rows is None or rows < 0) and executemany and isinstance(parameters, (list, tuple)):
+                rows = len(parameters)
+            if rows and rows > 0:
+                self.advance(insert.table.name, 'load', rows)
+
+        event.listen(engine, 'after_cursor_execute', after)
+        self._restore.append(lambda: event.remove(engine, 'after_cursor_execute', after))
+
+    def uninstrument(self):
+        for restore in reversed(self._restore):
+            restore()
+        self._restore = []
+
+    def close(self):
+        """Última escritura del archivo de métricas"""
+        self._maybe_write(force=True)
+
+
+def from_settings(etl_settings: dict):
+    """
+    Creamos el seguimiento desde ETL_SETTINGS (progress, progress_textfile,
+    progress_interval). Devuelve None si está desactivado.
+    """
+    if not etl_settings.get('progress', False) and not etl_settings.get('progress_textfile'):
+        return None
+    return ProgressTracker(
+        textfile=etl_settings.get('progress_textfile'),
+        interval=etl_settings.get('progress_interval', 5.0)
+    )
@@ -0,0 +1,386 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Reglas de calidad por tabla:
+# - not_null: columnas obligatorias
+# - unique: llaves (simples o compuestas) que no se pueden repetir
+# - range: columna -> (mínimo, máximo) inclusivos; None deja el lado abierto
+# - allowed: columna -> valores permitidos
+# - row_delta: variación relativa máxima de filas respecto a la corrida anterior (solo advierte)
+QUALITY_RULES = {
+    'fact_internet_sales': {
+        'not_null': ['sales_order_id', 'sales_order_detail_id', 'customer_key', 'product_key', 'date_key'],
+        'unique': [['sales_order_detail_id']],
+        'range': {'order_quantity': (1, None), 'unit_price': (0, None), 'line_total': (0, None),
+                  'exchange_rate': (0, None)}
+    },
+    'fact_reseller_sales': {
+        'not_null': ['sales_order_id', 'sales_order_detail_id', 'reseller_key', 'product_key',
+                     'employee_key', 'date_key'],
+        'unique': [['sales_order_detail_id']],
+        'range': {'order_quantity': (1, None), 'unit_price': (0, None), 'line_total': (0, None),
+                  'exchange_rate': (0, None)}
+    },
+    'dim_customer': {
+        'not_null': ['customer_id'],
+        'unique': [['customer_id']],
+        'allowed': {'customer_type': ['Business', 'Individual'],
+                    'email_promotion_category': ['Alta', 'Media', 'Baja']},
+        'row_delta': 0.2
+    },
+    'dim_product': {
+        'not_null': ['product_id'],
+        'unique': [['product_id']],
+        'range': {'list_price': (0, None), 'standard_cost': (0, None)},
+        'row_delta': 0.2
+    },
+    'dim_territory': {
+        'not_null': ['territory_id'],
+        'unique': [['territory_id']]
+    },
+    'dim_date': {
+        'not_null': ['date'],
+        'unique': [['date']],
+        'range': {'month': (1, 12), 'day': (1, 31), 'quarter': (1, 4)}
+    },
+    'dim_employee': {
+        'not_null': ['business_entity_id'],
+        'unique': [['business_entity_id']]
+    },
+    'dim_reseller': {
+        'not_null': ['store_id'],
+        'unique': [['store_id']]
+    },
+    'dim_currency_rate': {
+        'not_null': ['currency_code', 'rate_date', 'average_rate'],
+        'unique': [['currency_code', 'rate_date']],
+        'range': {'average_rate': (0, None), 'end_of_day_rate': (0, None)}
+    },
+    'dim_sales_reason': {
+        'not_null': ['sales_reason_id'],
+        'unique': [['sales_reason_id']]
+    },
+    'bridge_order_sales_reason': {
+        'not_null': ['sales_order_id', 'sales_reason_id'],
+        'unique': [['sales_order_id', 'sales_reason_id']]
+    }
+}
+
+# Ejemplos de valores inválidos que se guardan por regla
+SAMPLE_SIZE = 5
+
+QUALITY_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS etl_quality_report (
+        report_id SERIAL PRIMARY KEY,
+        run_at TIMESTAMP NOT NULL,
+        table_name VARCHAR(64) NOT NULL,
+        rule VARCHAR(32) NOT NULL,
+        column_name VARCHAR(200),
+        severity VARCHAR(16) NOT NULL,
+        rows_checked BIGINT,
+        violations BIGINT,
+        passed BOOLEAN,
+        sample TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS etl_quality_profile (
+        profile_id SERIAL PRIMARY KEY,
+        run_at TIMESTAMP NOT NULL,
+        table_name VARCHAR(64) NOT NULL,
+        column_name VARCHAR(200) NOT NULL,
+        dtype VARCHAR(32),
+        rows BIGINT,
+        nulls BIGINT,
+        null_pct DOUBLE PRECISION,
+        min_value TEXT,
+        max_value TEXT,
+        mean DOUBLE PRECISION
+    )
+    '''
+]
+
+
+def _default_rules(columns) -> dict:
+    """Tablas sin reglas declaradas: solo las llaves sustitutas (*_key) son obligatorias"""
+    return {'not_null': [column for column in columns if column.endswith('_key')]}
+
+
+def _key_values(df: DataFrame, columns: list) -> np.ndarray:
+    """Llave de unicidad como enteros: el valor si es una columna entera, si no un hash por fila"""
+    if (len(columns) == 1 and pd.api.types.is_integer_dtype(df[columns[0]])
+            and not df[columns[0]].isna().any()):
+        return df[columns[0]].to_numpy(dtype='int64')
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _sample(values) -> list:
+    return [str(value) for value in pd.unique(values)[:SAMPLE_SIZE]]
+
+
+class SortedKeys:
+    """
+    Llaves vistas para la unicidad como arreglos ordenados, sin repetidos y
+    disjuntos, de tamaños decrecientes. Cada chunk se busca en ellos con
+    searchsorted y solo se fusionan arreglos de tamaño parecido (como un
+    contador binario), así cada llave se re-ordena O(log n) veces en total
+    en lugar de re-ordenar todas las llaves vistas en cada chunk.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            position = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[position] == keys
+        return found
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """Agregamos llaves; máscara de las repetidas (ya vistas o antes en el mismo arreglo)"""
+        unique, first = np.unique(keys, return_index=True)
+        repeated = np.ones(len(keys), dtype=bool)
+        repeated[first] = False
+        seen = self.contains(unique)
+        repeated[first[seen]] = True
+
+        new = unique[~seen]
+        if len(new):
+            self.runs.append(new)
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            last = self.runs.pop()
+            self.runs[-1] = np.sort(np.concatenate([self.runs[-1], last]))
+        return repeated
+
+
+class QualityState:
+    """
+    Estado acumulable de calidad de una tabla: conteo de filas, violaciones
+    por regla, llaves vistas para la unicidad y perfil por columna. Se
+    alimenta por chunks con update() y dos estados se combinan con merge(),
+    así la verificación de un hecho cargado por lotes cubre la corrida
+    completa sin tener todas las filas en memoria.
+    """
+
+    def __init__(self, table_name: str, rules: dict = None):
+        self.table_name = table_name
+        self.rules = rules if rules is not None else QUALITY_RULES.get(table_name)
+        self.rows = 0
+        self.violations = {}
+        self.samples = {}
+        self.keys = {}
+        self.duplicates = {}
+        self.profile = {}
+
+    def _count(self, rule: tuple, mask: np.ndarray, values=None):
+        violations = int(mask.sum())
+        self.violations[rule] = self.violations.get(rule, 0) + violations
+        if violations and values is not None and len(self.samples.get(rule, [])) < SAMPLE_SIZE:
+            self.samples[rule] = (self.samples.get(rule, []) + _sample(values[mask]))[:SAMPLE_SIZE]
+
+    def update(self, df: DataFrame) -> 'QualityState':
+        """Evaluamos todas las reglas y el perfil sobre un chunk en una pasada vectorizada"""
+        rules = self.rules if self.rules is not None else _default_rules(df.columns)
+        self.rows += len(df)
+        nulls = df.isna().sum()
+
+        for column in rules.get('not_null', []):
+            rule = ('not_null', column)
+            if column not in df.columns:
+                self._count(rule, np.ones(len(df), dtype=bool))
+            else:
+                self.violations[rule] = self.violations.get(rule, 0) + int(nulls[column])
+
+        for columns in rules.get('unique', []):
+            rule = ('unique', ', '.join(columns))
+            if not set(columns) <= set(df.columns):
+                continue
+            repeated = self.keys.setdefault(rule, SortedKeys()).add(_key_values(df, columns))
+            duplicates = int(repeated.sum())
+            self.duplicates[rule] = self.duplicates.get(rule, 0) + duplicates
+            if duplicates and len(self.samples.get(rule, [])) < SAMPLE_SIZE:
+                self.samples[rule] = _sample(df[columns[0]].to_numpy()[repeated])
+
+        for column, (low, high) in rules.get('range', {}).items():
+            if column not in df.columns:
+                continue
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64')
+            mask = np.zeros(len(df), dtype=bool)
+            if low is not None:
+                mask |= values < low
+            if high is not None:
+                mask |= values > high
+            self._count(('range', column), mask, values)
+
+        for column, allowed in rules.get('allowed', {}).items():
+            if column not in df.columns:
+                continue
+            values = df[column]
+            mask = (values.notna() & ~values.isin(allowed)).to_numpy()
+            self._count(('allowed', column), mask, values.to_numpy())
+
+        self._update_profile(df, nulls)
+        return self
+
+    def _update_profile(self, df: DataFrame, nulls):
+        numeric = df.select_dtypes(include=['number', 'datetime'])
+        minimum, maximum = numeric.min(), numeric.max()
+        sums = df.select_dtypes(include='number').sum()
+        for column in df.columns:
+            stats = self.profile.setdefault(column, {'dtype': str(df[column].dtype), 'rows': 0, 'nulls': 0,
+                                                     'min': None, 'max': None, 'sum': 0.0, 'count': 0})
+            stats['rows'] += len(df)
+            stats['nulls'] += int(nulls[column])
+            if column in numeric.columns:
+                low, high = minimum[column], maximum[column]
+                if pd.notna(low):
+                    stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+                    stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+            if column in sums.index:
+                stats['sum'] += float(sums[column])
+                stats['count'] += len(df) - int(nulls[column])
+
+    def merge(self, other: 'QualityState') -> 'QualityState':
+        """Combinamos el estado de otro chunk (o de otro worker) de la misma tabla"""
+        self.rows += other.rows
+        for rule, violations in other.violations.items():
+            self.violations[rule] = self.violations.get(rule, 0) + violations
+        for rule, sample in other.samples.items():
+            self.samples[rule] = (self.samples.get(rule, []) + sample)[:SAMPLE_SIZE]
+        for rule, keys in other.keys.items():
+            seen = self.keys.setdefault(rule, SortedKeys())
+            repeated = sum(int(seen.add(run).sum()) for run in keys.runs)
+            self.duplicates[rule] = self.duplicates.get(rule, 0) + other.duplicates.get(rule, 0) + repeated
+        for column, theirs in other.profile.items():
+            stats = self.profile.setdefault(column, dict(theirs, rows=0, nulls=0, min=None, max=None,
+                                                         sum=0.0, count=0))
+            stats['rows'] += theirs['rows']
+            stats['nulls'] += theirs['nulls']
+            stats['sum'] += theirs['sum']
+            stats['count'] += theirs['count']
+            for key, pick in (('min', min), ('max', max)):
+                if theirs[key] is not None:
+                    stats[key] = theirs[key] if stats[key] is None else pick(stats[key], theirs[key])
+        return self
+
+    def report(self, previous_rows: int = None) -> DataFrame:
+        """Una fila por regla: violaciones, severidad y si pasó"""
+        records = []
+        for (rule, column), violations in self.violations.items():
+            records.append({'rule': rule, 'column_name': column, 'severity': 'error',
+                            'violations': violations, 'sample': self.samples.get((rule, column))})
+        for (rule, column), duplicates in self.duplicates.items():
+            records.append({'rule': rule, 'column_name': column, 'severity': 'error',
+                            'violations': duplicates, 'sample': self.samples.get((rule, column))})
+
+        max_delta = (self.rules or {}).get('row_delta')
+        delta = None
+        if previous_rows:
+            delta = abs(self.rows - previous_rows) / previous_rows
+        records.append({'rule': 'row_count', 'column_name': None, 'severity': 'warning',
+                        'violations': int(max_delta is not None and delta is not None and delta > max_delta),
+                        'sample': [f'anterior {previous_rows}, actual {self.rows}'] if previous_rows else None})
+
+        report = pd.DataFrame(records, columns=['rule', 'column_name', 'severity', 'violations', 'sample'])
+        report.insert(0, 'table_name', self.table_name)
+        report['rows_checked'] = self.rows
+        report['passed'] = report['violations'] == 0
+        return report
+
+    def column_profile(self) -> DataFrame:
+        """Perfil por columna: tipo, nulos, mínimo, máximo y media"""
+        records = []
+        for column, stats in self.profile.items():
+            records.append({
+                'column_name': column,
+                'dtype': stats['dtype'],
+                'rows': stats['rows'],
+                'nulls': stats['nulls'],
+                'null_pct': round(stats['nulls'] / stats['rows'] * 100, 2) if stats['rows'] else 0.0,
+                'min_value': None if stats['min'] is None else str(stats['min']),
+                'max_value': None if stats['max'] is None else str(stats['max']),
+                'mean': stats['sum'] / stats['count'] if stats['count'] else None
+            })
+        profile = pd.DataFrame(records)
+        profile.insert(0, 'table_name', self.table_name)
+        return profile
+
+    @property
+    def passed(self) -> bool:
+        """Solo las reglas de severidad error hacen fallar la validación"""
+        return not any(self.violations.values()) and not any(self.duplicates.values())
+
+    def print_issues(self):
+        report = self.report()
+        failed = report[~report['passed'] & (report['severity'] == 'error')]
+        for row in failed.itertuples():
+            sample = f" (p.ej. {', '.join(row.sample)})" if row.sample else ''
+            print(f"Advertencia: {row.violations} violaciones de {row.rule} en {row.column_name} "
+                  f"para {self.table_name}{sample}")
+
+
+def evaluate(df: DataFrame, table_name: str, chunk_rows: int = None) -> QualityState:
+    """
+    Evaluamos las reglas de la tabla; con chunk_rows el DataFrame se
+    recorre por tramos y los estados parciales se combinan
+    """
+    state = QualityState(table_name)
+    if not chunk_rows or len(df) <= chunk_rows:
+        return state.update(df)
+    for start in range(0, len(df), chunk_rows):
+        state.merge(QualityState(table_name).update(df.iloc[start:start + chunk_rows]))
+    return state
+
+
+def ensure_quality_tables(etl_conn: Engine):
+    with etl_conn.begin() as conn:
+        for ddl in QUALITY_DDL:
+            conn.execute(text(ddl))
+    catalog.invalidate_catalog(etl_conn)
+
+
+def previous_row_count(etl_conn: Engine, table_name: str):
+    """Filas verificadas en la última corrida registrada de la tabla"""
+    if not catalog.table_exists(etl_conn, 'etl_quality_report'):
+        return None
+    with etl_conn.connect() as conn:
+        return conn.execute(text('''
+            SELECT rows_checked FROM etl_quality_report
+            WHERE table_name = :table_name AND rule = 'row_count'
+            ORDER BY run_at DESC LIMIT 1
+        '''), {'table_name': table_name}).scalar()
+
+
+def persist(etl_conn: Engine, state: QualityState, run_at: datetime = None) -> DataFrame:
+    """
+    Guardamos el reporte de calidad y el perfil de columnas de la corrida
+    (etl_quality_report / etl_quality_profile) y devolvemos el reporte
+    """
+    if not catalog.table_exists(etl_conn, 'etl_quality_report'):
+        ensure_quality_tables(etl_conn)
+    run_at = run_at or datetime.now()
+
+    report = state.report(previous_row_count(etl_conn, state.table_name))
+    report['sample'] = report['sample'].map(lambda sample: '; '.join(sample) if sample else None)
+    report.insert(0, 'run_at', run_at)
+    profile = state.column_profile()
+    profile.insert(0, 'run_at', run_at)
+
+    with etl_conn.begin() as conn:
+        report.to_sql('etl_quality_report', conn, if_exists='append', index=False)
+        profile.to_sql('etl_quality_profile', conn, if_exists='append', index=False)
+
+    warnings = report[~report['passed'] & (report['severity'] == 'warning')]
+    for row in warnings.itertuples():
+        print(f"Advertencia: {state.table_name} cambió más de lo esperado en filas ({row.sample})")
+    return report
@@ -0,0 +1,362 @@
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+from datetime import datetime
+from pandas import DataFrame
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from etl import catalog
+from etl.hooks import wrap_module_functions
+
+QUERY_STATS_DDL = '''
+    CREATE TABLE IF NOT EXISTS etl_query_stats (
+        run_id VARCHAR(32) NOT NULL,
+        statement_id CHAR(16) NOT NULL,
+        function_name VARCHAR(100) NOT NULL,
+        engine VARCHAR(20) NOT NULL,
+        statement TEXT,
+        server_seconds DOUBLE PRECISION,
+        client_seconds DOUBLE PRECISION,
+        row_count BIGINT,
+        bytes BIGINT,
+        baseline_seconds DOUBLE PRECISION,
+        slow BOOLEAN DEFAULT FALSE,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+QUERY_PLANS_DDL = '''
+    CREATE TABLE IF NOT EXISTS etl_query_plans (
+        run_id VARCHAR(32) NOT NULL,
+        statement_id CHAR(16) NOT NULL,
+        function_name VARCHAR(100) NOT NULL,
+        engine VARCHAR(20) NOT NULL,
+        plan_format VARCHAR(20),
+        plan TEXT,
+        captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Corridas anteriores que forman la línea base de cada sentencia
+BASELINE_RUNS = 20
+
+# Mínimo de ejecuciones históricas para comparar contra la línea base
+BASELINE_MIN_SAMPLES = 3
+
+# Una sentencia es lenta si supera factor x mediana histórica y el mínimo absoluto
+DEFAULT_SLOW_FACTOR = 3.0
+DEFAULT_SLOW_MIN_SECONDS = 0.5
+
+# Sentencias a las que se les captura el plan (las demás son DDL, SET, COPY...)
+PLANNED_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+# Largo máximo del texto de la sentencia que se guarda
+STATEMENT_PREVIEW = 1000
+
+
+def statement_id(statement: str) -> str:
+    """Identificador estable de una sentencia: texto sin espacios extra ni literales numéricos"""
+    normalized = re.sub(r'\s+', ' ', statement).strip()
+    normalized = re.sub(r'\b\d+(\.\d+)?\b', '?', normalized)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def _first_keyword(statement: str) -> str:
+    match = re.match(r'\s*(?:--[^\n]*\n\s*)*(\w+)', statement)
+    return match.group(1).upper() if match else ''
+
+
+class QueryRecorder:
+    """
+    Costo de cada sentencia SQL emitida por las funciones instrumentadas
+    (extract, load, utils_etl):
+    - server_seconds: tiempo dentro de cursor.execute (ejecución en el
+      servidor hasta la primera respuesta; psycopg2 ya trae todas las filas);
+    - client_seconds: desde que vuelve execute hasta la siguiente sentencia
+      del hilo o el fin de la función (fetch y conversión a DataFrame);
+    - row_count y bytes: rowcount del cursor o, si la función devuelve un
+      DataFrame, sus filas y memoria.
+    Con capture_plans guarda una vez por corrida el plan de cada sentencia:
+    EXPLAIN (ANALYZE, BUFFERS) en PostgreSQL (dentro de un SAVEPOINT que se
+    revierte), SHOWPLAN_XML (plan estimado) en SQL Server y EXPLAIN QUERY
+    PLAN en SQLite. Las cargas por COPY usan el cursor de psycopg2 directo:
+    se registran desde load.COPY_OBSERVERS, con el armado del CSV como
+    tiempo de cliente (sin plan).
+    """
+
+    def __init__(self, capture_plans: bool = False, slow_factor: float = DEFAULT_SLOW_FACTOR,
+                 slow_min_seconds: float = DEFAULT_SLOW_MIN_SECONDS):
+        self.capture_plans = capture_plans
+        self.slow_factor = slow_factor
+        self.slow_min_seconds = slow_min_seconds
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.records = []
+        self.plans = {}
+        self.etl_conn = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._restore = []
+        self._flushed = False
+        atexit.register(self.close)
+
+    # --- Funciones instrumentadas ---
+
+    def instrument(self, *modules):
+        """Envolvemos las funciones públicas: sus sentencias se atribuyen a la función más interna"""
+        def make_wrapper(name, fn):
+            def wrapper(*args, **kwargs):
+                stack = self._stack()
+                stack.append(name)
+                try:
+                    result = fn(*args, **kwargs)
+                finally:
+                    stack.pop()
+                    pending = self._close_pending()
+                if pending is not None and isinstance(result, DataFrame):
+                    with self._lock:
+                        if pending['row_count'] is None:
+                            pending['row_count'] = len(result)
+                        pending['bytes'] = int(result.memory_usage(deep=True).sum())
+                return result
+            return wrapper
+
+        for module in modules:
+            self._restore.append(wrap_module_functions(module, make_wrapper))
+            observers = getattr(module, 'COPY_OBSERVERS', None)
+            if observers is not None:
+                observers.append(self.record_copy)
+                self._restore.append(lambda observers=observers: observers.remove(self.record_copy))
+
+    def uninstrument(self):
+        for restore in reversed(self._restore):
+            restore()
+        self._restore = []
+        for engine, name, listener in self._listeners:
+            event.remove(engine, name, listener)
+        self._listeners = []
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _close_pending(self, now: float = None):
+        """Cerramos el tiempo de cliente de la última sentencia del hilo"""
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending['client_seconds'] = (now or time.perf_counter()) - self._local.returned_at
+            self._local.pending = None
+        return pending
+
+    def record_copy(self, statement: str, client_seconds: float, server_seconds: float, rows: int, size: int):
+        """Un chunk de COPY ... FROM STDIN hacia la bodega (ver load.copy_dataframe)"""
+        if not self._stack() or getattr(self._local, 'muted', False):
+            return
+        # El tiempo de cliente de la sentencia anterior termina donde empezó este chunk
+        self._close_pending(time.perf_counter() - client_seconds - server_seconds)
+        record = {
+            'statement_id': statement_id(statement),
+            'function_name': self._stack()[-1],
+            'engine': 'warehouse',
+            'statement': statement.strip()[:STATEMENT_PREVIEW],
+            'server_seconds': server_seconds,
+            'client_seconds': client_seconds,
+            'row_count': rows,
+            'bytes': size
+        }
+        with self._lock:
+            self.records.append(record)
+
+    # --- Eventos de SQLAlchemy ---
+
+    def attach(self, engine: Engine, label: str):
+        """Escuchamos las sentencias de un motor ('source' o 'warehouse')"""
+        def before(conn, cursor, statement, parameters, context, executemany):
+            if not self._stack() or getattr(self._local, 'muted', False):
+                return
+            self._close_pending()
+            if self.capture_plans and not executemany:
+                self._capture_plan(conn.dialect.name, cursor, statement, parameters, label)
+            self._local.started_at = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            if not self._stack() or getattr(self._local, 'muted', False):
+                return
+            now = time.perf_counter()
+            rowcount = getattr(cursor, 'rowcount', -1)
+            record = {
+                'statement_id': statement_id(statement),
+                'function_name': self._stack()[-1],
+                'engine': label,
+                'statement': statement.strip()[:STATEMENT_PREVIEW],
+                'server_seconds': now - self._local.started_at,
+                'client_seconds': 0.0,
+                'row_count': rowcount if rowcount is not None and rowcount >= 0 else None,
+                'bytes': None
+            }
+            with self._lock:
+                self.records.append(record)
+            self._local.pending = record
+            self._local.returned_at = now
+
+        for name, listener in (('before_cursor_execute', before), ('after_cursor_execute', after)):
+            event.listen(engine, name, listener)
+            self._listeners.append((engine, name, listener))
+
+    def _capture_plan(self, dialect: str, cursor, statement: str, parameters, label: str):
+        """Plan de la sentencia (una vez por corrida) en un cursor aparte de la misma conexión"""
+        key = statement_id(statement)
+        if key in self.plans or _first_keyword(statement) not in PLANNED_STATEMENTS:
+            return
+        if dialect == 'mssql' and _first_keyword(statement) not in ('SELECT', 'WITH'):
+            return
+        with self._lock:
+            if key in self.plans:
+                return
+            self.plans[key] = None
+
+        plan_cursor = cursor.connection.cursor()
+        try:
+            if dialect == 'postgresql':
+                # ANALYZE ejecuta la sentencia: el SAVEPOINT revierte sus efectos
+                plan_cursor.execute('SAVEPOINT etl_query_plan')
+                try:
+                    plan_cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}', parameters)
+                    plan, plan_format = json.dumps(plan_cursor.fetchone()[0]), 'json'
+                finally:
+                    plan_cursor.execute('ROLLBACK TO SAVEPOINT etl_query_plan')
+                    plan_cursor.execute('RELEASE SAVEPOINT etl_query_plan')
+            elif dialect == 'mssql':
+                plan_cursor.execute('SET SHOWPLAN_XML ON')
+                try:
+                    plan_cursor.execute(statement, parameters)
+                    plan, plan_format = ''.join(row[0] for row in plan_cursor.fetchall()), 'showplan_xml'
+                finally:
+                    plan_cursor.execute('SET SHOWPLAN_XML OFF')
+            elif dialect == 'sqlite':
+                plan_cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+                plan, plan_format = '\n'.join(str(row[-1]) for row in plan_cursor.fetchall()), 'text'
+            else:
+                return
+        except Exception as e:
+            print(f"Advertencia: no se pudo capturar el plan de {self._stack()[-1]}: {e}")
+            return
+        finally:
+            plan_cursor.close()
+
+        with self._lock:
+            self.plans[key] = {'statement_id': key, 'function_name': self._stack()[-1], 'engine': label,
+                               'plan_format': plan_format, 'plan': plan}
+
+    # --- Línea base y persistencia ---
+
+    def baseline(self, etl_conn: Engine) -> dict:
+        """Mediana de server_seconds por sentencia en las últimas BASELINE_RUNS corridas"""
+        if not catalog.table_exists(etl_conn, 'etl_query_stats'):
+            return {}
+        history = DataFrame(self._query(etl_conn, f'''
+            SELECT statement_id, server_seconds FROM etl_query_stats
+            WHERE run_id IN (
+                SELECT run_id FROM etl_query_stats GROUP BY run_id ORDER BY run_id DESC LIMIT {BASELINE_RUNS}
+            )
+        '''), columns=['statement_id', 'server_seconds'])
+        grouped = history.groupby('statement_id')['server_seconds']
+        medians = grouped.median()[grouped.count() >= BASELINE_MIN_SAMPLES]
+        return medians.to_dict()
+
+    def _query(self, etl_conn: Engine, sql: str) -> list:
+        self._local.muted = True
+        try:
+            with etl_conn.connect() as conn:
+                return conn.execute(text(sql)).all()
+        finally:
+            self._local.muted = False
+
+    def flag_slow(self, baseline: dict) -> list:
+        """Marcamos las sentencias que superan su línea base; devuelve las lentas"""
+        slow = []
+        with self._lock:
+            for record in self.records:
+                median = baseline.get(record['statement_id'])
+                record['baseline_seconds'] = median
+                record['slow'] = bool(median is not None
+                                      and record['server_seconds'] >= self.slow_min_seconds
+                                      and record['server_seconds'] > self.slow_factor * median)
+                if record['slow']:
+                    slow.append(record)
+        return slow
+
+    def summary(self) -> DataFrame:
+        """Totales por función: sentencias, tiempo de servidor y de cliente, filas y bytes"""
+        with self._lock:
+            stats = DataFrame(self.records, columns=['function_name', 'engine', 'server_seconds',
+                                                     'client_seconds', 'row_count', 'bytes'])
+        return (stats.groupby(['function_name', 'engine'])
+                .agg(statements=('server_seconds', 'size'), server_seconds=('server_seconds', 'sum'),
+                     client_seconds=('client_seconds', 'sum'), row_count=('row_count', 'sum'), bytes=('bytes', 'sum'))
+                .sort_values('server_seconds', ascending=False)
+                .reset_index())
+
+    def flush(self, etl_conn: Engine = None):
+        """Guardamos estadísticas y planes de la corrida y reportamos las sentencias lentas"""
+        etl_conn = etl_conn or self.etl_conn
+        if etl_conn is None or self._flushed or not self.records:
+            return
+        self._flushed = True
+        self._local.muted = True
+        try:
+            slow = self.flag_slow(self.baseline(etl_conn))
+            for ddl, table in ((QUERY_STATS_DDL, 'etl_query_stats'), (QUERY_PLANS_DDL, 'etl_query_plans')):
+                if not catalog.table_exists(etl_conn, table):
+                    with etl_conn.begin() as conn:
+                        conn.execute(text(ddl))
+                    catalog.invalidate_catalog(etl_conn)
+
+            with self._lock:
+                stats = DataFrame(self.records).assign(run_id=self.run_id)
+                plans = DataFrame([plan for plan in self.plans.values() if plan])
+            with etl_conn.begin() as conn:
+                stats.to_sql('etl_query_stats', conn, if_exists='append', index=False)
+                if not plans.empty:
+                    plans.assign(run_id=self.run_id).to_sql('etl_query_plans', conn, if_exists='append',
+                                                            index=False)
+        finally:
+            self._local.muted = False
+
+        summary = self.summary()
+        print(f"✓ Costo de {len(stats)} sentencias SQL registrado (corrida {self.run_id}, "
+              f"{len(plans)} planes)")
+        for row in summary.head(10).itertuples():
+            print(f"  {row.function_name:<45} {row.engine:<10} {row.statements:>5} sentencias  "
+                  f"servidor {row.server_seconds:8.3f}s  cliente {row.client_seconds:8.3f}s")
+        for record in slow:
+            print(f"Advertencia: sentencia lenta en {record['function_name']} ({record['statement_id']}): "
+                  f"{record['server_seconds']:.3f}s vs. línea base {record['baseline_seconds']:.3f}s")
+
+    def close(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"✗ Error guardando el costo de las sentencias SQL: {e}")
+
+
+def from_settings(etl_settings: dict, enabled: bool = None, capture_plans: bool = None):
+    """
+    Creamos el registro desde ETL_SETTINGS (query_stats, query_plans,
+    query_slow_factor, query_slow_min_seconds). Devuelve None si está desactivado.
+    """
+    if enabled is None:
+        enabled = bool(etl_settings.get('query_stats', False))
+    if capture_plans is None:
+        capture_plans = bool(etl_settings.get('query_plans', False))
+    if not enabled and not capture_plans:
+        return None
+    return QueryRecorder(
+        capture_plans=capture_plans,
+        slow_factor=etl_settings.get('query_slow_factor', DEFAULT_SLOW_FACTOR),
+        slow_min_seconds=etl_settings.get('query_slow_min_seconds', DEFAULT_SLOW_MIN_SECONDS)
+    )
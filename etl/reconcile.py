@@ -0,0 +1,299 @@
+from datetime import date
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import extract, transform, catalog, integrity
+
+# Multiplicador para el hash aditivo de llaves (hash de Knuth módulo 2^32).
+# Se calcula igual en SQL Server y PostgreSQL con aritmética BIGINT.
+KEY_HASH_MULTIPLIER = 2654435761
+KEY_HASH_MODULUS = 4294967296
+
+# Definición de cada hecho en origen y en la bodega
+RECONCILE_FACTS = {
+    'fact_internet_sales': {
+        'online_flag': 1,
+        'source_from': '''Sales.SalesOrderHeader soh
+    JOIN Sales.SalesOrderDetail sod ON soh.SalesOrderID = sod.SalesOrderID
+    JOIN Sales.Customer c ON soh.CustomerID = c.CustomerID''',
+        'extract': 'extract_internet_sales',
+        'transform': 'transform_internet_sales',
+        'repair_process': 'Reparacion_Internet_Sales'
+    },
+    'fact_reseller_sales': {
+        'online_flag': 0,
+        'source_from': '''Sales.SalesOrderHeader soh
+    JOIN Sales.SalesOrderDetail sod ON soh.SalesOrderID = sod.SalesOrderID
+    JOIN Sales.Customer c ON soh.CustomerID = c.CustomerID
+    JOIN Sales.Store s ON c.StoreID = s.BusinessEntityID''',
+        'extract': 'extract_reseller_sales',
+        'transform': 'transform_reseller_sales',
+        'repair_process': 'Reparacion_Reseller_Sales'
+    }
+}
+
+FINGERPRINT_COLUMNS = ['row_count', 'order_quantity', 'line_total', 'key_hash']
+
+
+def source_fingerprints(source_conn: Engine, fact_name: str, granularity: str = 'month',
+                        bucket_size: int = 1000, start_date: str = None) -> DataFrame:
+    """
+    Huellas por partición calculadas en SQL Server: filas, SUM(OrderQty),
+    SUM(LineTotal redondeado a 2 decimales) y hash aditivo de SalesOrderDetailID
+    """
+    spec = RECONCILE_FACTS[fact_name]
+    if granularity == 'month':
+        partition = 'YEAR(soh.OrderDate) * 100 + MONTH(soh.OrderDate)'
+    else:
+        # Literal entero: SQL Server exige la misma expresión en SELECT y GROUP BY
+        partition = f'soh.SalesOrderID / {int(bucket_size)}'
+    where, params = extract._sales_order_filter(spec['online_flag'], start_date)
+
+    query = f"""
+    SELECT
+        {partition} AS partition_key,
+        COUNT(*) AS row_count,
+        SUM(CAST(sod.OrderQty AS BIGINT)) AS order_quantity,
+        SUM(ROUND(sod.LineTotal, 2)) AS line_total,
+        SUM(CAST(sod.SalesOrderDetailID AS BIGINT) * {KEY_HASH_MULTIPLIER} % {KEY_HASH_MODULUS}) AS key_hash
+    FROM {spec['source_from']}
+    {where}
+    GROUP BY {partition}
+    """
+    return pd.read_sql_query(query, source_conn, params=params)
+
+
+def warehouse_fingerprints(etl_conn: Engine, fact_name: str, granularity: str = 'month',
+                           bucket_size: int = 1000, start_date: str = None) -> DataFrame:
+    """
+    Huellas por partición calculadas en PostgreSQL sobre la tabla de hechos
+    """
+    if granularity == 'month':
+        partition = 'd.year * 100 + d.month'
+    else:
+        partition = 'f.sales_order_id / :bucket_size'
+    date_filter = 'WHERE d.date >= :start_date' if start_date else ''
+
+    query = text(f'''
+        SELECT
+            {partition} AS partition_key,
+            COUNT(*) AS row_count,
+            SUM(f.order_quantity::bigint) AS order_quantity,
+            SUM(f.line_total) AS line_total,
+            SUM(f.sales_order_detail_id::bigint * {KEY_HASH_MULTIPLIER} % {KEY_HASH_MODULUS}) AS key_hash
+        FROM {fact_name} f
+        LEFT JOIN dim_date d ON f.date_key = d.date_key
+        {date_filter}
+        GROUP BY 1
+    ''')
+    params = {'bucket_size': int(bucket_size), 'start_date': start_date}
+    with etl_conn.connect() as conn:
+        return pd.DataFrame(conn.execute(query, params).mappings().all(),
+                            columns=['partition_key'] + FINGERPRINT_COLUMNS)
+
+
+def quarantine_fingerprints(etl_conn: Engine, fact_name: str, granularity: str = 'month',
+                            bucket_size: int = 1000, start_date: str = None) -> DataFrame:
+    """
+    Huellas por partición de las filas del hecho retenidas en etl_quarantine
+    (desde su payload). Sin sumarlas, una partición con filas en cuarentena
+    nunca coincide con el origen. Las filas sin date_key no tienen mes.
+    """
+    if not catalog.table_exists(etl_conn, 'etl_quarantine'):
+        return DataFrame(columns=['partition_key'] + FINGERPRINT_COLUMNS)
+    if granularity == 'month':
+        partition = 'd.year * 100 + d.month'
+    else:
+        partition = 'q.sales_order_id / :bucket_size'
+    date_filter = 'AND d.date >= :start_date' if start_date else ''
+
+    query = text(f'''
+        SELECT
+            {partition} AS partition_key,
+            COUNT(*) AS row_count,
+            SUM((q.payload->>'order_quantity')::numeric::bigint) AS order_quantity,
+            SUM(ROUND((q.payload->>'line_total')::numeric, 2)) AS line_total,
+            SUM(q.sales_order_detail_id::bigint * {KEY_HASH_MULTIPLIER} % {KEY_HASH_MODULUS}) AS key_hash
+        FROM etl_quarantine q
+        LEFT JOIN dim_date d ON (q.payload->>'date_key')::numeric::int = d.date_key
+        WHERE q.fact_name = :fact_name {date_filter}
+        GROUP BY 1
+    ''')
+    params = {'fact_name': fact_name, 'bucket_size': int(bucket_size), 'start_date': start_date}
+    with etl_conn.connect() as conn:
+        return pd.DataFrame(conn.execute(query, params).mappings().all(),
+                            columns=['partition_key'] + FINGERPRINT_COLUMNS)
+
+
+def net_of_quarantine(warehouse: DataFrame, quarantine: DataFrame) -> DataFrame:
+    """Huellas de la bodega más las de la cuarentena, partición por partición"""
+    if quarantine.empty:
+        return warehouse
+    combined = pd.concat([warehouse, quarantine], ignore_index=True)
+    for col in ['partition_key'] + FINGERPRINT_COLUMNS:
+        combined[col] = pd.to_numeric(combined[col])
+    # El hash aditivo también se suma: es la misma suma sobre el conjunto unido de detalles
+    return combined.groupby('partition_key', as_index=False)[FINGERPRINT_COLUMNS].sum()
+
+
+def compare_fingerprints(source: DataFrame, warehouse: DataFrame, tolerance: float = 0.01) -> DataFrame:
+    """
+    Comparamos las huellas por partición; las particiones ausentes en un lado
+    cuentan como diferencia
+    """
+    merged = source.merge(warehouse, on='partition_key', how='outer', suffixes=('_source', '_dw'))
+    merged = merged[merged['partition_key'].notna()]
+
+    for col in ['row_count', 'order_quantity', 'key_hash']:
+        merged[f'{col}_source'] = pd.to_numeric(merged[f'{col}_source']).fillna(0).astype('int64')
+        merged[f'{col}_dw'] = pd.to_numeric(merged[f'{col}_dw']).fillna(0).astype('int64')
+    merged['line_total_source'] = pd.to_numeric(merged['line_total_source']).fillna(0).astype(float)
+    merged['line_total_dw'] = pd.to_numeric(merged['line_total_dw']).fillna(0).astype(float)
+
+    merged['match'] = (
+        (merged['row_count_source'] == merged['row_count_dw'])
+        & (merged['order_quantity_source'] == merged['order_quantity_dw'])
+        & (merged['key_hash_source'] == merged['key_hash_dw'])
+        & ((merged['line_total_source'] - merged['line_total_dw']).abs() <= tolerance)
+    )
+    merged['partition_key'] = merged['partition_key'].astype('int64')
+    return merged.sort_values('partition_key').reset_index(drop=True)
+
+
+def _partition_bounds(partition_key: int, granularity: str, bucket_size: int) -> dict:
+    """Rango de extracción y de borrado correspondiente a una partición"""
+    if granularity == 'month':
+        year, month = divmod(int(partition_key), 100)
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return {
+            'start_date': date(year, month, 1).isoformat(),
+            'end_date': date(next_year, next_month, 1).isoformat(),
+            'year': year,
+            'month': month
+        }
+    low = int(partition_key) * bucket_size
+    return {'after_order_id': low - 1, 'until_order_id': low + bucket_size - 1}
+
+
+def repair_partition(source_conn: Engine, etl_conn: Engine, fact_name: str, partition_key: int,
+                     dimensions: dict, granularity: str = 'month', bucket_size: int = 1000,
+                     touched: set = None) -> int:
+    """
+    Re-sincronizamos una partición: se re-extrae del origen y se reemplazan
+    sus filas en la bodega dentro de una sola transacción. Cada reparación
+    (exitosa o fallida) queda en etl_log con su partición en details.
+    En touched se agregan los date_key de las filas borradas y cargadas.
+    """
+    from etl import utils_etl
+
+    spec = RECONCILE_FACTS[fact_name]
+    details = f'{fact_name} partición {partition_key} ({granularity})'
+    try:
+        deleted, inserted = _replace_partition(source_conn, etl_conn, fact_name, partition_key, dimensions,
+                                               granularity, bucket_size, touched)
+    except Exception:
+        utils_etl.log_etl_run(etl_conn, spec['repair_process'], 'Fallido', details=details)
+        raise
+    utils_etl.log_etl_run(etl_conn, spec['repair_process'], 'Exitoso', inserted,
+                          details=f'{details}: {deleted} filas borradas')
+    print(f"Partición {partition_key} de {fact_name} re-sincronizada: {deleted} filas borradas, {inserted} cargadas")
+    return inserted
+
+
+def _replace_partition(source_conn: Engine, etl_conn: Engine, fact_name: str, partition_key: int,
+                       dimensions: dict, granularity: str, bucket_size: int, touched: set = None) -> tuple:
+    """Re-extracción y reemplazo de la partición; devuelve (filas borradas, filas cargadas)"""
+    spec = RECONCILE_FACTS[fact_name]
+    bounds = _partition_bounds(partition_key, granularity, bucket_size)
+
+    extract_fn = getattr(extract, spec['extract'])
+    transform_fn = getattr(transform, spec['transform'])
+    if granularity == 'month':
+        source_rows = extract_fn(source_conn, start_date=bounds['start_date'], end_date=bounds['end_date'])
+        delete = text(f'''
+            DELETE FROM {fact_name} f
+            USING dim_date d
+            WHERE f.date_key = d.date_key AND d.year = :year AND d.month = :month
+            RETURNING f.date_key
+        ''')
+    else:
+        source_rows = extract_fn(source_conn, start_date=None, after_order_id=bounds['after_order_id'],
+                                 until_order_id=bounds['until_order_id'])
+        delete = text(f'''
+            DELETE FROM {fact_name}
+            WHERE sales_order_id > :after_order_id AND sales_order_id <= :until_order_id
+            RETURNING date_key
+        ''')
+
+    fact = None
+    if not source_rows.empty:
+        fact = transform_fn(source_rows, dimensions)
+        # Como en los micro-lotes: las huérfanas van a cuarentena y se valida lo que se carga
+        fact = integrity.precheck(fact, fact_name, dimensions, etl_conn)
+        if not transform.validate_transformations(fact, fact_name):
+            raise ValueError(f"Validación fallida para {fact_name} en la partición {partition_key}")
+
+    with etl_conn.begin() as conn:
+        deleted_keys = conn.execute(delete, bounds).scalars().all()
+        if fact is not None and not fact.empty:
+            fact.to_sql(fact_name, conn, if_exists='append', index=False, chunksize=10000)
+            # Las filas que estaban en cuarentena y ahora cargaron limpias salen de ella
+            if catalog.table_exists(etl_conn, 'etl_quarantine'):
+                conn.execute(text('''
+                    DELETE FROM etl_quarantine
+                    WHERE fact_name = :fact_name AND sales_order_detail_id = ANY(:detail_ids)
+                '''), {'fact_name': fact_name,
+                      'detail_ids': [int(detail_id) for detail_id in fact['sales_order_detail_id']]})
+
+    if touched is not None:
+        touched.update(deleted_keys)
+        if fact is not None:
+            touched.update(fact['date_key'].drop_duplicates())
+    return len(deleted_keys), 0 if fact is None else len(fact)
+
+
+def reconcile_fact(source_conn: Engine, etl_conn: Engine, fact_name: str, granularity: str = 'month',
+                   bucket_size: int = 1000, start_date: str = None, repair: bool = False,
+                   dimensions: dict = None, touched: set = None) -> DataFrame:
+    """
+    Verificación por particiones entre SQL Server y la bodega (contando las
+    filas en cuarentena); con repair=True se re-sincronizan solo las
+    particiones con diferencias (sus date_key se agregan en touched)
+    """
+    if not catalog.table_exists(etl_conn, fact_name):
+        print(f"✗ {fact_name} no existe en la bodega, no se puede reconciliar")
+        return DataFrame()
+
+    source = source_fingerprints(source_conn, fact_name, granularity, bucket_size, start_date)
+    warehouse = warehouse_fingerprints(etl_conn, fact_name, granularity, bucket_size, start_date)
+    quarantine = quarantine_fingerprints(etl_conn, fact_name, granularity, bucket_size, start_date)
+    report = compare_fingerprints(source, net_of_quarantine(warehouse, quarantine))
+
+    mismatched = report.loc[~report['match'], 'partition_key'].tolist()
+    print(f"Reconciliación {fact_name}: {len(report)} particiones, {len(mismatched)} con diferencias")
+
+    if repair and mismatched:
+        if dimensions is None:
+            dimensions = extract.extract_dimensions_from_dw(etl_conn)
+        for partition_key in mismatched:
+            repair_partition(source_conn, etl_conn, fact_name, partition_key, dimensions,
+                             granularity, bucket_size, touched)
+        catalog.invalidate_catalog(etl_conn)
+
+    return report
+
+
+def reconcile_all(source_conn: Engine, etl_conn: Engine, granularity: str = 'month',
+                  bucket_size: int = 1000, start_date: str = None, repair: bool = False,
+                  reporting_currency: str = None, touched: dict = None) -> dict:
+    """
+    Reconciliación de ambos hechos compartiendo las dimensiones leídas
+    (touched: hecho -> set de date_key reparados)
+    """
+    dimensions = extract.extract_dimensions_from_dw(etl_conn, reporting_currency) if repair else None
+    return {
+        fact_name: reconcile_fact(source_conn, etl_conn, fact_name, granularity, bucket_size,
+                                  start_date, repair, dimensions, (touched or {}).get(fact_name))
+        for fact_name in RECONCILE_FACTS
+    }
@@ -0,0 +1,307 @@
+import hashlib
+from datetime import datetime
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text, event
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Sonda por dimensión del origen:
+# - table/key/columns: tabla raíz, llave entera por la que se agrupa en buckets
+#   (None = sin acotar por rangos) y columnas del BINARY_CHECKSUM
+# - related: tablas que la extracción une; se sondean con filas y MAX(ModifiedDate)
+#   y si cambian la dimensión se extrae completa
+# - natural_key: llave natural en la bodega para aplicar los cambios
+DIMENSION_PROBES = {
+    'dim_customer': {
+        'table': 'Sales.Customer', 'key': 'CustomerID', 'natural_key': 'customer_id',
+        'columns': ['CustomerID', 'PersonID', 'StoreID', 'TerritoryID', 'ModifiedDate'],
+        'related': ['Person.Person', 'Person.EmailAddress', 'Person.PersonPhone',
+                    'Person.BusinessEntityAddress', 'Person.Address', 'Person.StateProvince',
+                    'Person.CountryRegion']
+    },
+    'dim_product': {
+        'table': 'Production.Product', 'key': 'ProductID', 'natural_key': 'product_id',
+        'columns': ['ProductID', 'Name', 'ProductNumber', 'Color', 'StandardCost', 'ListPrice', 'Size',
+                    'Weight', 'ProductLine', 'Class', 'Style', 'ProductSubcategoryID', 'ProductModelID',
+                    'ModifiedDate'],
+        'related': ['Production.ProductSubcategory', 'Production.ProductCategory', 'Production.ProductModel']
+    },
+    'dim_reseller': {
+        'table': 'Sales.Store', 'key': 'BusinessEntityID', 'natural_key': 'store_id',
+        'columns': ['BusinessEntityID', 'Name', 'SalesPersonID', 'ModifiedDate'],
+        'related': ['Person.BusinessEntityAddress', 'Person.Address', 'Person.StateProvince',
+                    'Person.CountryRegion']
+    },
+    'dim_employee': {
+        'table': 'HumanResources.Employee', 'key': 'BusinessEntityID', 'natural_key': 'business_entity_id',
+        'columns': ['BusinessEntityID', 'JobTitle', 'BirthDate', 'HireDate', 'ModifiedDate'],
+        'related': ['Person.Person', 'HumanResources.EmployeeDepartmentHistory', 'HumanResources.Department']
+    },
+    'dim_territory': {
+        'table': 'Sales.SalesTerritory', 'key': None, 'natural_key': 'territory_id',
+        'columns': ['TerritoryID', 'Name', 'CountryRegionCode', '[Group]', 'SalesYTD', 'SalesLastYear',
+                    'CostYTD', 'CostLastYear', 'ModifiedDate'],
+        'related': []
+    },
+    'dim_currency': {
+        'table': 'Sales.Currency', 'key': None, 'natural_key': 'currency_code',
+        'columns': ['CurrencyCode', 'Name', 'ModifiedDate'],
+        'related': []
+    }
+}
+
+# Llaves por bucket de la sonda: un cambio obliga a re-extraer a lo sumo este rango
+PROBE_BUCKET_SIZE = 1000
+
+# Fracción de buckets cambiados a partir de la cual conviene extraer completo
+FULL_EXTRACT_RATIO = 0.5
+
+# Bucket de las filas de tablas relacionadas y de tablas sin llave de rangos
+WHOLE_TABLE = -1
+
+PROBE_DDL = '''
+    CREATE TABLE IF NOT EXISTS etl_source_probe (
+        dimension VARCHAR(64) NOT NULL,
+        source_table VARCHAR(128) NOT NULL,
+        bucket BIGINT NOT NULL,
+        row_count BIGINT,
+        modified VARCHAR(40),
+        checksum BIGINT,
+        probed_at TIMESTAMP,
+        PRIMARY KEY (dimension, source_table, bucket)
+    )
+'''
+
+PROBE_COLUMNS = ['dimension', 'source_table', 'bucket', 'row_count', 'modified', 'checksum']
+
+
+def probe_query(dimensions: list = None) -> str:
+    """
+    Una sola consulta para todas las sondas: por bucket de llave de la
+    tabla raíz CHECKSUM_AGG(BINARY_CHECKSUM(...)), COUNT_BIG y
+    MAX(ModifiedDate); por tabla relacionada solo filas y MAX(ModifiedDate)
+    """
+    parts = []
+    for dimension in dimensions or DIMENSION_PROBES:
+        spec = DIMENSION_PROBES[dimension]
+        bucket = f"{spec['key']} / {PROBE_BUCKET_SIZE}" if spec['key'] else str(WHOLE_TABLE)
+        parts.append(f'''
+            SELECT '{dimension}' AS dimension, '{spec['table']}' AS source_table, {bucket} AS bucket,
+                   COUNT_BIG(*) AS row_count, MAX(ModifiedDate) AS modified,
+                   CHECKSUM_AGG(BINARY_CHECKSUM({', '.join(spec['columns'])})) AS checksum
+            FROM {spec['table']}
+            GROUP BY {bucket}
+        ''' if spec['key'] else f'''
+            SELECT '{dimension}' AS dimension, '{spec['table']}' AS source_table, {bucket} AS bucket,
+                   COUNT_BIG(*) AS row_count, MAX(ModifiedDate) AS modified,
+                   CHECKSUM_AGG(BINARY_CHECKSUM({', '.join(spec['columns'])})) AS checksum
+            FROM {spec['table']}
+        ''')
+        for related in spec['related']:
+            parts.append(f'''
+                SELECT '{dimension}' AS dimension, '{related}' AS source_table, {WHOLE_TABLE} AS bucket,
+                       COUNT_BIG(*) AS row_count, MAX(ModifiedDate) AS modified, NULL AS checksum
+                FROM {related}
+            ''')
+    return ' UNION ALL '.join(parts)
+
+
+def probe_sources(source_conn: Engine, dimensions: list = None) -> DataFrame:
+    """Ejecutamos las sondas en el origen (el agregado corre en SQL Server, viaja un resumen)"""
+    with source_conn.connect() as conn:
+        rows = conn.execute(text(probe_query(dimensions))).all()
+    probe = pd.DataFrame(rows, columns=PROBE_COLUMNS)
+    probe['modified'] = [None if row[4] is None else str(row[4]) for row in rows]
+    return _normalize(probe)
+
+
+def _normalize(probe: DataFrame) -> DataFrame:
+    """Tipos estables para comparar la sonda del origen con la guardada"""
+    probe['bucket'] = probe['bucket'].astype('int64')
+    # En el origen emulado (SQLite) un agregado sin filas da NULL en lugar de 0
+    probe['row_count'] = probe['row_count'].fillna(0).astype('int64')
+    probe['checksum'] = probe['checksum'].astype('Int64')
+    probe['modified'] = probe['modified'].astype(object).where(probe['modified'].notna(), None)
+    return probe
+
+
+def previous_probes(etl_conn: Engine) -> DataFrame:
+    if not catalog.table_exists(etl_conn, 'etl_source_probe'):
+        return pd.DataFrame(columns=PROBE_COLUMNS)
+    query = text(f"SELECT {', '.join(PROBE_COLUMNS)} FROM etl_source_probe")
+    return _normalize(pd.read_sql_query(query, etl_conn))
+
+
+def _bucket_ranges(buckets: list) -> list:
+    """Buckets cambiados -> rangos de llaves [desde, hasta] contiguos"""
+    ranges = []
+    for bucket in sorted(buckets):
+        low, high = bucket * PROBE_BUCKET_SIZE, (bucket + 1) * PROBE_BUCKET_SIZE - 1
+        if ranges and low == ranges[-1][1] + 1:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    return [tuple(key_range) for key_range in ranges]
+
+
+def detect_changes(current: DataFrame, previous: DataFrame, dimension: str) -> dict:
+    """
+    Comparamos la sonda actual con la guardada. Devuelve {'mode': ...}:
+    - 'unchanged': no hay que extraer la dimensión
+    - 'ranges': solo cambiaron buckets de la tabla raíz (con 'ranges')
+    - 'full': primera sonda, cambió una tabla relacionada o demasiados buckets
+    """
+    spec = DIMENSION_PROBES[dimension]
+    now = current[current['dimension'] == dimension].set_index(['source_table', 'bucket'])
+    before = previous[previous['dimension'] == dimension].set_index(['source_table', 'bucket'])
+    if before.empty:
+        return {'mode': 'full', 'reason': 'sin sonda anterior'}
+
+    fields = ['row_count', 'modified', 'checksum']
+    joined = now[fields].astype(object).join(before[fields].astype(object), how='outer', rsuffix='_before')
+    changed = pd.Series(False, index=joined.index)
+    for field in fields:
+        a, b = joined[field], joined[f'{field}_before']
+        changed |= ~((a == b) | (a.isna() & b.isna()))
+    changed_keys = list(joined.index[changed])
+    if not changed_keys:
+        return {'mode': 'unchanged'}
+
+    if any(table != spec['table'] for table, _ in changed_keys):
+        return {'mode': 'full', 'reason': 'cambió una tabla relacionada'}
+    buckets = [bucket for _, bucket in changed_keys]
+    root_buckets = len(joined.loc[spec['table']])
+    if not spec['key'] or len(buckets) > FULL_EXTRACT_RATIO * root_buckets:
+        return {'mode': 'full', 'reason': f'{len(buckets)} de {root_buckets} buckets cambiados'}
+    return {'mode': 'ranges', 'ranges': _bucket_ranges(buckets)}
+
+
+def save_probe(etl_conn: Engine, current: DataFrame, dimension: str):
+    """Guardamos la sonda de una dimensión una vez aplicados sus cambios en la bodega"""
+    if not catalog.table_exists(etl_conn, 'etl_source_probe'):
+        with etl_conn.begin() as conn:
+            conn.execute(text(PROBE_DDL))
+        catalog.invalidate_catalog(etl_conn)
+
+    rows = current[current['dimension'] == dimension].copy()
+    rows['probed_at'] = datetime.now()
+    with etl_conn.begin() as conn:
+        conn.execute(text('DELETE FROM etl_source_probe WHERE dimension = :dimension'), {'dimension': dimension})
+        rows.to_sql('etl_source_probe', conn, if_exists='append', index=False)
+
+
+def probe_signature(current: DataFrame, dimension: str) -> str:
+    """Resumen de la sonda de una dimensión (marca de cambio para las huellas del pipeline)"""
+    rows = current[current['dimension'] == dimension].sort_values(['source_table', 'bucket'])
+    encoded = rows[PROBE_COLUMNS].to_csv(index=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def plan_dimensions(source_conn: Engine, etl_conn: Engine, dimensions: list = None) -> tuple:
+    """
+    Sondeamos el origen y decidimos qué hacer con cada dimensión. Si la
+    tabla de la bodega no existe o está vacía la extracción es completa.
+    Devuelve (sonda actual, {dimensión: cambios}).
+    """
+    dimensions = dimensions or list(DIMENSION_PROBES)
+    current = probe_sources(source_conn, dimensions)
+    previous = previous_probes(etl_conn)
+    status = catalog.get_status(etl_conn)
+
+    plans = {}
+    for dimension in dimensions:
+        info = status.get(dimension, {})
+        if not info.get('exists'):
+            plans[dimension] = {'mode': 'full', 'reason': 'tabla no existe en la bodega'}
+        else:
+            plans[dimension] = detect_changes(current, previous, dimension)
+        reason = plans[dimension].get('reason') or plans[dimension].get('ranges', '')
+        print(f"  Sonda {dimension}: {plans[dimension]['mode']} {reason}")
+    return current, plans
+
+
+def key_ranges(plans: dict, dimension: str):
+    """Rangos de llaves a extraer; None = extracción completa"""
+    plan = plans.get(dimension, {})
+    return plan['ranges'] if plan.get('mode') == 'ranges' else None
+
+
+def apply_changes(df: DataFrame, etl_conn: Engine, dimension: str, replace: bool = False):
+    """
+    Cargamos una dimensión sondeada: con la tabla ya poblada (y sin
+    replace) las filas se aplican por llave natural, conservando las
+    llaves sustitutas; si no, carga normal
+    """
+    from etl import load
+
+    if not replace and catalog.table_exists(etl_conn, dimension):
+        load.merge_dimension(df, etl_conn, dimension, DIMENSION_PROBES[dimension]['natural_key'])
+    else:
+        load.load(df, etl_conn, dimension, replace)
+
+
+# Emulación de las funciones de checksum de SQL Server para un origen local de prueba (SQLite)
+
+def _binary_checksum(*values) -> int:
+    """
+    BINARY_CHECKSUM emulado: entero de 32 bits con signo a partir de un
+    hash de la fila (no CRC32: es lineal y el XOR de CHECKSUM_AGG
+    anularía rangos completos de llaves)
+    """
+    encoded = '\x1f'.join('' if value is None else repr(value) for value in values).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=4).digest(), 'big', signed=True)
+
+
+class _ChecksumAgg:
+    """CHECKSUM_AGG emulado: XOR de los checksums (independiente del orden, como en SQL Server)"""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, checksum):
+        if checksum is not None:
+            self.value ^= int(checksum)
+
+    def finalize(self):
+        return self.value
+
+
+class _CountBig:
+    """COUNT_BIG emulado (COUNT_BIG(*) llega sin argumentos)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def step(self, *values):
+        self.count += 1
+
+    def finalize(self):
+        return self.count
+
+
+def emulate_checksums(dbapi_connection, schemas: list = ()):
+    """
+    Registramos BINARY_CHECKSUM, CHECKSUM_AGG y COUNT_BIG en una conexión
+    sqlite3 y adjuntamos una base en memoria por esquema (Sales, Person...)
+    para que las consultas de las sondas corran sin cambios
+    """
+    dbapi_connection.create_function('BINARY_CHECKSUM', -1, _binary_checksum, deterministic=True)
+    dbapi_connection.create_aggregate('CHECKSUM_AGG', 1, _ChecksumAgg)
+    dbapi_connection.create_aggregate('COUNT_BIG', -1, _CountBig)
+    for schema in schemas:
+        dbapi_connection.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+
+
+def standin_engine(schemas: list = ('Sales', 'Person', 'Production', 'HumanResources')) -> Engine:
+    """Motor SQLite en memoria que hace de origen local con las funciones de checksum emuladas"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, _):
+        emulate_checksums(dbapi_connection, schemas)
+
+    return engine
@@ -5,13 +5,35 @@ import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
+# Las transformaciones no hacen copias defensivas: cuentan con Copy-on-Write, que es
+# el único modo desde pandas 3 y en pandas 2.x hay que activarlo (opción del proceso)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def deduplicate_entities(df: DataFrame, keys: list, table_name: str) -> DataFrame:
+    """
+    Red de seguridad: dejamos una fila por entidad (la primera según el orden
+    de extracción) e informamos cuántas filas se colapsaron
+    """
+    duplicated = df.duplicated(subset=keys, keep='first')
+    collapsed = int(duplicated.sum())
+    if collapsed:
+        print(f"Advertencia: {collapsed} filas duplicadas por {keys} colapsadas en {table_name}")
+        df = df[~duplicated]
+    return df
+
 
 def transform_customer(customer_data: DataFrame) -> DataFrame:
    
-    df = customer_data.copy()
+    # Solo las columnas que se usan; sin copias defensivas (Copy-on-Write)
+    df = deduplicate_entities(customer_data, ['CustomerID'], 'dim_customer')[[
+        'CustomerID', 'PersonID', 'StoreID', 'FirstName', 'LastName', 'EmailAddress',
+        'PhoneNumber', 'EmailPromotion', 'City', 'StateProvince', 'CountryRegion'
+    ]]
     
     # Limpieza de datos
-    df.replace({'': 'No especificado', np.nan: 'No especificado'}, inplace=True)
+    df = df.replace({'': 'No especificado', np.nan: 'No especificado'})
     
     # Crear nombre completo
     df['customer_name'] = df['FirstName'] + ' ' + df['LastName']
@@ -53,14 +75,11 @@ def transform_customer(customer_data: DataFrame) -> DataFrame:
 
 def transform_product(product_data: DataFrame) -> DataFrame:
    
-    df = product_data.copy()
-    
-    # Limpieza de datos
-    df.replace({'': 'No especificado', np.nan: 'No especificado'}, inplace=True)
+    # Limpieza de datos (devuelve un DataFrame nuevo; la entrada no se copia antes)
+    df = product_data.replace({'': 'No especificado', np.nan: 'No especificado'})
     
     # Calcular margen de ganancia
-    df['profit_margin'] = ((df['ListPrice'] - df['StandardCost']) / df['ListPrice'] * 100).round(2)
-    df['profit_margin'].fillna(0, inplace=True)
+    df['profit_margin'] = ((df['ListPrice'] - df['StandardCost']) / df['ListPrice'] * 100).round(2).fillna(0)
     
     # Categorizar productos por precio
     df['price_category'] = pd.cut(
@@ -136,9 +155,7 @@ def transform_date() -> DataFrame:
 
 def transform_territory(territory_data: DataFrame) -> DataFrame:
     
-    df = territory_data.copy()
-    
-    df.rename(columns={
+    df = territory_data.rename(columns={
         'TerritoryID': 'territory_id',
         'Name': 'territory_name',
         'CountryRegionCode': 'country_region_code',
@@ -147,7 +164,7 @@ def transform_territory(territory_data: DataFrame) -> DataFrame:
         'SalesLastYear': 'sales_last_year',
         'CostYTD': 'cost_ytd',
         'CostLastYear': 'cost_last_year'
-    }, inplace=True)
+    })
     
     # Calcular métricas de performance
     df['ytd_profit'] = df['sales_ytd'] - df['cost_ytd']
@@ -159,29 +176,54 @@ def transform_territory(territory_data: DataFrame) -> DataFrame:
     return df
 
 
+def label_by_substring(values: pd.Series, rules: list, default: str):
+    """
+    Etiqueta de la primera regla (subcadena, etiqueta) presente en cada
+    valor, o default. Vectorizado: sin apply ni un objeto Python por fila.
+    """
+    # Las etiquetas en el dtype de la columna (objetos, o strings de Arrow con pandas 3):
+    # take solo copia referencias, sin convertir un arreglo de objetos Python por fila
+    labels = pd.array([default] + [label for _, label in rules], dtype=values.dtype)
+    conditions = [values.str.contains(pattern, regex=False, na=False).to_numpy(dtype=bool)
+                  for pattern, _ in rules]
+    return labels.take(np.select(conditions, np.arange(1, len(rules) + 1, dtype='int8'), 0))
+
+
+def whole_years_since(values: pd.Series, today: date) -> np.ndarray:
+    """Años cumplidos (días // 365) desde cada fecha hasta today; NaN si la fecha es nula"""
+    dates = pd.to_datetime(values).to_numpy(dtype='datetime64[D]')
+    missing = np.isnat(dates)
+    days = (np.datetime64(today, 'D') - dates).view('int64')
+    years = np.floor_divide(days, 365, out=days)
+    return np.where(missing, np.nan, years) if missing.any() else years
+
+
 def transform_employee(employee_data: DataFrame) -> DataFrame:
    
-    df = employee_data.copy()
+    # Solo las columnas de la salida; agregar columnas no copia la entrada (Copy-on-Write)
+    df = employee_data[['BusinessEntityID', 'FirstName', 'LastName', 'JobTitle', 'BirthDate', 'HireDate',
+                        'DepartmentName']]
     
     # Crear nombre completo
     df['employee_name'] = df['FirstName'] + ' ' + df['LastName']
     
     # Calcular edad y antigüedad
-    df['age'] = (date.today() - df['BirthDate'].dt.date).dt.days // 365
-    df['years_of_service'] = (date.today() - df['HireDate'].dt.date).dt.days // 365
+    today = date.today()
+    df['age'] = whole_years_since(df['BirthDate'], today)
+    df['years_of_service'] = whole_years_since(df['HireDate'], today)
     
     # Categorizar por departamento
-    df['department_category'] = df['DepartmentName'].apply(
-        lambda x: 'Ventas' if 'Sales' in str(x) else 'Administrativo' if 'Executive' in str(x) else 'Operaciones'
-    )
+    df['department_category'] = label_by_substring(df['DepartmentName'], [
+        ('Sales', 'Ventas'), ('Executive', 'Administrativo')
+    ], 'Operaciones')
     
-    df.rename(columns={
+    df = df.rename(columns={
         'BusinessEntityID': 'business_entity_id',
         'JobTitle': 'job_title',
         'BirthDate': 'birth_date',
         'HireDate': 'hire_date',
         'DepartmentName': 'department_name'
-    }, inplace=True)
+    })
     
     df["saved_date"] = date.today()
     
@@ -194,20 +236,18 @@ def transform_employee(employee_data: DataFrame) -> DataFrame:
 
 def transform_reseller(store_data: DataFrame) -> DataFrame:
     
-    df = store_data.copy()
-    
-    df.rename(columns={
+    df = deduplicate_entities(store_data, ['StoreID'], 'dim_reseller').rename(columns={
         'StoreID': 'store_id',
         'StoreName': 'store_name',
         'City': 'city',
         'StateProvince': 'state_province',
         'CountryRegion': 'country_region'
-    }, inplace=True)
+    })
     
     # Categorizar por ubicación
-    df['region'] = df['state_province'].apply(
-        lambda x: 'Norte' if 'North' in str(x) else 'Sur' if 'South' in str(x) else 'Este' if 'East' in str(x) else 'Oeste' if 'West' in str(x) else 'Central'
-    )
+    df['region'] = label_by_substring(df['state_province'], [
+        ('North', 'Norte'), ('South', 'Sur'), ('East', 'Este'), ('West', 'Oeste')
+    ], 'Central')
     
     df["saved_date"] = date.today()
     
@@ -216,169 +256,440 @@ def transform_reseller(store_data: DataFrame) -> DataFrame:
 
 def transform_currency(currency_data: DataFrame) -> DataFrame:
    
-    df = currency_data.copy()
-    
-    df.rename(columns={
+    df = currency_data.rename(columns={
         'CurrencyCode': 'currency_code',
         'Name': 'currency_name'
-    }, inplace=True)
+    })
     
     df["saved_date"] = date.today()
     
     return df
 
 
-def transform_internet_sales(sales_data: DataFrame, dimensions: dict) -> DataFrame:
-    
-    df = sales_data.copy()
-    
-    # Unir con dimensiones
-    df = df.merge(
-        dimensions['dim_customer'][['customer_key', 'customer_id']], 
-        left_on='CustomerID', right_on='customer_id', how='left'
-    )
+# Moneda en la que están expresadas las tasas y moneda de reporte por defecto
+BASE_CURRENCY = 'USD'
+REPORTING_CURRENCY = 'USD'
+
+# Montos de los hechos que se convierten y su columna en moneda de reporte
+CURRENCY_AMOUNTS = {
+    'UnitPrice': 'reporting_unit_price',
+    'LineTotal': 'reporting_line_total',
+    'TaxAmt': 'reporting_tax_amount',
+    'Freight': 'reporting_freight_amount'
+}
+
+# Desplazamiento para codificar (moneda, día) en un solo entero ordenable
+_DAY_OFFSET = 1 << 31
+
+
+def transform_currency_rate(rate_data: DataFrame) -> DataFrame:
+    """
+    Tasas diarias USD -> moneda, una fila por (moneda, fecha)
+    """
+    df = rate_data[rate_data['FromCurrencyCode'] == BASE_CURRENCY].rename(columns={
+        'ToCurrencyCode': 'currency_code',
+        'CurrencyRateDate': 'rate_date',
+        'AverageRate': 'average_rate',
+        'EndOfDayRate': 'end_of_day_rate'
+    })
     
-    df = df.merge(
-        dimensions['dim_product'][['product_key', 'product_id']], 
-        left_on='ProductID', right_on='product_id', how='left'
-    )
+    df['rate_date'] = pd.to_datetime(df['rate_date']).dt.normalize()
+    df = df.drop_duplicates(['currency_code', 'rate_date'], keep='last')
+    df = df[['currency_code', 'rate_date', 'average_rate', 'end_of_day_rate']]
+    df["saved_date"] = date.today()
     
-    # Convertir fechas y unir con dim_date
-    df['OrderDate'] = pd.to_datetime(df['OrderDate'])
-    df = df.merge(
-        dimensions['dim_date'][['date_key', 'date']], 
-        left_on='OrderDate', right_on='date', how='left'
-    )
+    return df
+
+
+def prepare_currency_rates(rates: DataFrame, rate_column: str = 'average_rate') -> dict:
+    """
+    Tabla de tasas lista para búsquedas as-of vectorizadas: llaves
+    (moneda, día) codificadas como int64 y ordenadas, con sus tasas
+    """
+    if rates is None or rates.empty:
+        return {'codes': {}, 'keys': np.empty(0, dtype='int64'), 'rates': np.empty(0)}
+    
+    codes = {code: index for index, code in enumerate(sorted(rates['currency_code'].unique()))}
+    code_index = rates['currency_code'].map(codes).to_numpy(dtype='int64')
+    days = pd.to_datetime(rates['rate_date']).to_numpy(dtype='datetime64[D]').astype('int64')
+    keys = (code_index << 32) | (days + _DAY_OFFSET)
+    
+    order = np.argsort(keys, kind='stable')
+    return {
+        'codes': codes,
+        'keys': keys[order],
+        'rates': rates[rate_column].to_numpy(dtype='float64')[order]
+    }
+
+
+def _currency_rate_table(dimensions: dict) -> dict:
+    """
+    Tabla preparada una sola vez y guardada en el diccionario de dimensiones,
+    que se reutiliza en todos los chunks/lotes de la misma corrida
+    """
+    table = dimensions.get('_currency_rate_table')
+    if table is None:
+        table = prepare_currency_rates(dimensions.get('currency_rates'))
+        dimensions['_currency_rate_table'] = table
+    return table
+
+
+def _rate_codes(table: dict, currency_codes) -> np.ndarray:
+    """
+    Índice de moneda por fila en la tabla de tasas: -1 si la moneda no tiene
+    tasas y -2 para la moneda base (o sin moneda). Se resuelve sobre los
+    valores únicos, no fila por fila.
+    """
+    if not isinstance(currency_codes, (pd.Series, np.ndarray)):
+        currency_codes = np.asarray(currency_codes, dtype=object)
+    # Sobre la columna tal cual: con strings de Arrow no se crea un objeto Python por fila
+    labels, uniques = pd.factorize(currency_codes)
+    mapping = [-2 if code == BASE_CURRENCY else table['codes'].get(code, -1) for code in uniques]
+    # El último elemento atiende la etiqueta -1 de factorize (valores nulos)
+    return np.array(mapping + [-2], dtype='int64')[labels]
+
+
+def lookup_rates(table: dict, code_index: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """
+    Búsqueda as-of vectorizada: la última tasa de la moneda con fecha <= el
+    día dado (o la primera disponible si el día es anterior a todas). La
+    moneda base vale 1; monedas sin tasas quedan en NaN.
+    """
+    result = np.full(len(code_index), np.nan)
+    result[code_index == -2] = 1.0
+    known = code_index >= 0
+    if known.any() and len(table['keys']):
+        codes = code_index[known]
+        queries = (codes << 32) | (days[known] + _DAY_OFFSET)
+        position = np.searchsorted(table['keys'], queries, side='right') - 1
+        # Sin tasa previa (o la previa es de otra moneda): primera tasa de la moneda
+        first = np.searchsorted(table['keys'], codes << 32, side='left')
+        previous_code = table['keys'][np.clip(position, 0, None)] >> 32
+        position = np.where((position >= 0) & (previous_code == codes), position, first)
+        position = np.clip(position, 0, len(table['keys']) - 1)
+        found = (table['keys'][position] >> 32) == codes
+        result[np.flatnonzero(known)[found]] = table['rates'][position[found]]
+    return result
+
+
+def reporting_currency_columns(df: DataFrame, dimensions: dict, date_column: str = 'OrderDate') -> dict:
+    """
+    Columnas de moneda de reporte para las filas de df, sin modificarlo:
+    reporte = monto / tasa(moneda orden) * tasa(moneda reporte), ambas as-of la fecha de la orden
+    """
+    reporting_currency = dimensions.get('reporting_currency') or REPORTING_CURRENCY
+    table = _currency_rate_table(dimensions)
+    
+    if 'CurrencyCode' in df.columns:
+        currency_codes = df['CurrencyCode']
+    else:
+        currency_codes = np.full(len(df), BASE_CURRENCY, dtype=object)
+    days = pd.to_datetime(df[date_column]).to_numpy(dtype='datetime64[D]').astype('int64')
+    
+    order_codes = _rate_codes(table, currency_codes)
+    reporting_codes = np.full(len(df), _rate_codes(table, [reporting_currency])[0], dtype='int64')
+    exchange_rate = lookup_rates(table, reporting_codes, days) / lookup_rates(table, order_codes, days)
+    
+    missing = np.isnan(exchange_rate)
+    if missing.any():
+        print(f"Advertencia: {int(missing.sum())} filas sin tasa de cambio hacia {reporting_currency}")
+    
+    columns = {
+        'currency_code': (currency_codes.where(order_codes != -2, BASE_CURRENCY)
+                          if isinstance(currency_codes, pd.Series) else currency_codes),
+        'exchange_rate': exchange_rate
+    }
+    for source_column, reporting_column in CURRENCY_AMOUNTS.items():
+        columns[reporting_column] = (df[source_column].to_numpy(dtype='float64') * exchange_rate).round(2)
+    return columns
+
+
+def convert_to_reporting_currency(df: DataFrame, dimensions: dict, date_column: str = 'OrderDate') -> DataFrame:
+    """
+    Convertimos los montos de la moneda de la orden a la moneda de reporte
+    pasando por la moneda base de las tasas (USD)
+    """
+    return df.assign(**reporting_currency_columns(df, dimensions, date_column))
+
+
+def _key_lookup(dimensions: dict, dimension: str, key_column: str, natural_column: str) -> tuple:
+    """
+    Índice de la llave natural y arreglo de llaves sustitutas de una
+    dimensión, armados una vez y guardados en el diccionario de dimensiones
+    para reutilizarlos en todos los lotes (una fila por llave natural)
+    """
+    lookups = dimensions.setdefault('_key_lookups', {})
+    if dimension not in lookups:
+        dim = dimensions[dimension]
+        naturals = dim[natural_column]
+        if natural_column == 'date':
+            naturals = pd.to_datetime(naturals)
+        unique = ~naturals.duplicated(keep='first').to_numpy()
+        lookups[dimension] = (pd.Index(naturals.to_numpy()[unique]),
+                              dim[key_column].to_numpy(dtype='int64')[unique])
+    return lookups[dimension]
+
+
+def lookup_keys(values, dimensions: dict, dimension: str, key_column: str, natural_column: str,
+                index: pd.Index = None) -> pd.Series:
+    """
+    Llave sustituta de cada valor natural por búsqueda en el índice de la
+    dimensión (equivale al merge left, sin copiar el lote); nula si no está.
+    index es el índice de la Serie resultante (el del lote, para alinear).
+    """
+    lookup, keys = _key_lookup(dimensions, dimension, key_column, natural_column)
+    position = lookup.get_indexer(values)
+    missing = position < 0
+    return pd.Series(pd.arrays.IntegerArray(keys[np.where(missing, 0, position)] if len(keys)
+                                            else np.zeros(len(position), dtype='int64'), missing),
+                     index=index)
+
+
+def _sales_fact(sales_data: DataFrame, dimensions: dict, keys: dict) -> DataFrame:
+    """
+    Hecho de ventas sin copias del lote: las llaves salen de búsquedas en
+    los índices de las dimensiones, las medidas se calculan sobre columnas
+    y el resultado referencia las columnas de la entrada (Copy-on-Write)
+    """
+    order_date = pd.to_datetime(sales_data['OrderDate'])
+    quantity = sales_data['OrderQty'].to_numpy()
+    unit_price = sales_data['UnitPrice'].to_numpy()
+    line_total = sales_data['LineTotal'].to_numpy()
     
     # Calcular métricas adicionales
-    df['discount_amount'] = df['UnitPriceDiscount'] * df['OrderQty'] * df['UnitPrice']
-    df['net_sales_amount'] = df['LineTotal'] - df['discount_amount']
-    df['profit'] = df['net_sales_amount'] - (df['StandardCost'] * df['OrderQty'])
-    
-    # Crear fact table
-    fact_internet_sales = df[[
-        'SalesOrderID', 'SalesOrderDetailID', 'customer_key', 'product_key', 
-        'date_key', 'OrderQty', 'UnitPrice', 'LineTotal', 'discount_amount',
-        'net_sales_amount', 'profit', 'TaxAmt', 'Freight'
-    ]].rename(columns={
-        'SalesOrderID': 'sales_order_id',
-        'SalesOrderDetailID': 'sales_order_detail_id',
-        'OrderQty': 'order_quantity',
-        'UnitPrice': 'unit_price',
-        'LineTotal': 'line_total',
-        'TaxAmt': 'tax_amount',
-        'Freight': 'freight_amount'
+    discount_amount = sales_data['UnitPriceDiscount'].to_numpy() * quantity * unit_price
+    net_sales_amount = line_total - discount_amount
+    profit = net_sales_amount - sales_data['StandardCost'].to_numpy() * quantity
+    
+    columns = {
+        'sales_order_id': sales_data['SalesOrderID'],
+        'sales_order_detail_id': sales_data['SalesOrderDetailID']
+    }
+    for key_column, (dimension, natural_column, source_column) in keys.items():
+        values = order_date if source_column == 'OrderDate' else sales_data[source_column]
+        columns[key_column] = lookup_keys(values, dimensions, dimension, key_column, natural_column,
+                                          index=sales_data.index)
+    columns.update({
+        'order_quantity': sales_data['OrderQty'],
+        'unit_price': sales_data['UnitPrice'],
+        'line_total': sales_data['LineTotal'],
+        'discount_amount': discount_amount,
+        'net_sales_amount': net_sales_amount,
+        'profit': profit,
+        'tax_amount': sales_data['TaxAmt'],
+        'freight_amount': sales_data['Freight']
     })
     
-    fact_internet_sales["saved_date"] = date.today()
+    # Montos en moneda de reporte (as-of join vectorizado con las tasas en caché)
+    columns.update(reporting_currency_columns(sales_data, dimensions))
     
-    return fact_internet_sales
+    # Mismo índice que el lote: las Series de la entrada se alinean sin copiarse y los
+    # arreglos posicionales calzan aunque el lote sea un slice o un filtro
+    fact = pd.DataFrame(columns, index=sales_data.index, copy=False)
+    fact['saved_date'] = date.today()
+    return fact
 
 
-def transform_reseller_sales(sales_data: DataFrame, dimensions: dict) -> DataFrame:
-    
-    df = sales_data.copy()
-    
-    # Unir con dimensiones
-    df = df.merge(
-        dimensions['dim_reseller'][['reseller_key', 'store_id']], 
-        left_on='StoreID', right_on='store_id', how='left'
-    )
-    
-    df = df.merge(
-        dimensions['dim_product'][['product_key', 'product_id']], 
-        left_on='ProductID', right_on='product_id', how='left'
-    )
-    
-    df = df.merge(
-        dimensions['dim_employee'][['employee_key', 'business_entity_id']], 
-        left_on='SalesPersonID', right_on='business_entity_id', how='left'
-    )
-    
-    # Convertir fechas y unir con dim_date
-    df['OrderDate'] = pd.to_datetime(df['OrderDate'])
-    df = df.merge(
-        dimensions['dim_date'][['date_key', 'date']], 
-        left_on='OrderDate', right_on='date', how='left'
-    )
-    
-    # Calcular métricas adicionales
-    df['discount_amount'] = df['UnitPriceDiscount'] * df['OrderQty'] * df['UnitPrice']
-    df['net_sales_amount'] = df['LineTotal'] - df['discount_amount']
-    df['profit'] = df['net_sales_amount'] - (df['StandardCost'] * df['OrderQty'])
-    
-    # Crear fact table
-    fact_reseller_sales = df[[
-        'SalesOrderID', 'SalesOrderDetailID', 'reseller_key', 'product_key', 
-        'employee_key', 'date_key', 'OrderQty', 'UnitPrice', 'LineTotal', 
-        'discount_amount', 'net_sales_amount', 'profit', 'TaxAmt', 'Freight'
-    ]].rename(columns={
-        'SalesOrderID': 'sales_order_id',
-        'SalesOrderDetailID': 'sales_order_detail_id',
-        'OrderQty': 'order_quantity',
-        'UnitPrice': 'unit_price',
-        'LineTotal': 'line_total',
-        'TaxAmt': 'tax_amount',
-        'Freight': 'freight_amount'
-    })
+# Llaves de cada hecho: columna -> (dimensión, llave natural, columna del origen)
+INTERNET_SALES_KEYS = {
+    'customer_key': ('dim_customer', 'customer_id', 'CustomerID'),
+    'product_key': ('dim_product', 'product_id', 'ProductID'),
+    'date_key': ('dim_date', 'date', 'OrderDate')
+}
+RESELLER_SALES_KEYS = {
+    'reseller_key': ('dim_reseller', 'store_id', 'StoreID'),
+    'product_key': ('dim_product', 'product_id', 'ProductID'),
+    'employee_key': ('dim_employee', 'business_entity_id', 'SalesPersonID'),
+    'date_key': ('dim_date', 'date', 'OrderDate')
+}
+
+
+def transform_internet_sales(sales_data: DataFrame, dimensions: dict) -> DataFrame:
     
-    fact_reseller_sales["saved_date"] = date.today()
+    return _sales_fact(sales_data, dimensions, INTERNET_SALES_KEYS)
+
+
+def transform_reseller_sales(sales_data: DataFrame, dimensions: dict) -> DataFrame:
     
-    return fact_reseller_sales
+    return _sales_fact(sales_data, dimensions, RESELLER_SALES_KEYS)
 
 
 def transform_sales_reason(sales_reason_data: DataFrame) -> DataFrame:
     
-    df = sales_reason_data.copy()
-    
-    df.rename(columns={
+    df = sales_reason_data.rename(columns={
         'SalesReasonID': 'sales_reason_id',
         'ReasonName': 'reason_name',
-        'ReasonType': 'reason_type',
-        'SalesOrderID': 'sales_order_id'
-    }, inplace=True)
+        'ReasonType': 'reason_type'
+    })
     
     df["saved_date"] = date.today()
     
-    return df
+    return df[['sales_reason_id', 'reason_name', 'reason_type', 'saved_date']]
 
 
-def calculate_sales_metrics(fact_table: DataFrame) -> DataFrame:
+def transform_order_sales_reason(order_reason_data: DataFrame) -> DataFrame:
     
-    metrics = fact_table.groupby(['date_key', 'product_key']).agg({
-        'order_quantity': 'sum',
-        'line_total': 'sum',
-        'discount_amount': 'sum',
-        'net_sales_amount': 'sum',
-        'profit': 'sum'
-    }).reset_index()
+    # Tabla puente: solo pares de enteros, sin repetir nombres ni tipos de razón
+    bridge = pd.DataFrame({
+        'sales_order_id': order_reason_data['SalesOrderID'].astype('int32'),
+        'sales_reason_id': order_reason_data['SalesReasonID'].astype('int16')
+    })
     
-    metrics['avg_sale_amount'] = metrics['line_total'] / metrics['order_quantity']
-    metrics['discount_rate'] = (metrics['discount_amount'] / metrics['line_total'] * 100).round(2)
-    metrics['profit_margin'] = (metrics['profit'] / metrics['net_sales_amount'] * 100).round(2)
+    return bridge.drop_duplicates()
+
+
+
+# Columnas del snapshot acumulativo cuyo cambio obliga a actualizar la fila
+ORDER_LIFECYCLE_TRACKED = [
+    'status', 'product_key', 'order_date_key', 'due_date_key', 'ship_date_key',
+    'order_to_ship_days', 'order_to_due_days', 'ship_delay_days', 'is_shipped', 'is_late'
+]
+
+# Estado de SalesOrderHeader para una orden despachada
+SHIPPED_STATUS = 5
+
+
+def _date_keys(values, dim_date: DataFrame) -> pd.Series:
+    """date_key de cada fecha (nulo si la fecha no está o no existe en dim_date)"""
+    lookup = pd.Series(dim_date['date_key'].to_numpy(), index=pd.to_datetime(dim_date['date']).dt.normalize())
+    lookup = lookup[~lookup.index.duplicated(keep='first')]
+    days = pd.to_datetime(pd.Series(values)).dt.normalize()
+    return pd.Series(lookup.reindex(days).to_numpy(), index=days.index).astype('Int64')
+
+
+def transform_order_lifecycle(lifecycle_data: DataFrame, dimensions: dict) -> DataFrame:
+    """
+    Snapshot acumulativo por línea de orden: llaves de las fechas de pedido,
+    vencimiento y despacho y los desfases entre ellas (en días). Las fechas
+    aún no alcanzadas quedan nulas hasta que una corrida posterior las llene.
+    """
+    df = lifecycle_data.reset_index(drop=True)
+    order_date = pd.to_datetime(df['OrderDate']).dt.normalize()
+    due_date = pd.to_datetime(df['DueDate']).dt.normalize()
+    ship_date = pd.to_datetime(df['ShipDate']).dt.normalize()
+    dim_date = dimensions['dim_date']
+    
+    products = dimensions['dim_product']
+    product_keys = pd.Series(products['product_key'].to_numpy(), index=products['product_id'].to_numpy())
+    product_keys = product_keys[~product_keys.index.duplicated(keep='first')]
+    
+    ship_delay = (ship_date - due_date).dt.days.astype('Int64')
+    fact = pd.DataFrame({
+        'sales_order_id': df['SalesOrderID'].astype('int64'),
+        'sales_order_detail_id': df['SalesOrderDetailID'].astype('int64'),
+        'channel': np.where(df['OnlineOrderFlag'].astype(bool), 'internet', 'reseller'),
+        'status': df['Status'].astype('int16'),
+        'product_key': pd.Series(product_keys.reindex(df['ProductID']).to_numpy()).astype('Int64'),
+        'order_date_key': _date_keys(order_date, dim_date),
+        'due_date_key': _date_keys(due_date, dim_date),
+        'ship_date_key': _date_keys(ship_date, dim_date),
+        'order_to_ship_days': (ship_date - order_date).dt.days.astype('Int64'),
+        'order_to_due_days': (due_date - order_date).dt.days.astype('Int64'),
+        'ship_delay_days': ship_delay,
+        'is_shipped': (df['Status'] == SHIPPED_STATUS) & ship_date.notna(),
+        'is_late': (ship_delay > 0).fillna(False).astype(bool),
+        'source_modified': pd.to_datetime(df['SourceModified'])
+    })
+    fact['saved_date'] = date.today()
     
-    return metrics
+    return fact
 
+# Medidas aditivas de los hechos que se acumulan por grano en las métricas de ventas
+SALES_METRIC_MEASURES = ['order_quantity', 'line_total', 'discount_amount', 'net_sales_amount', 'profit']
+SALES_METRIC_GRAIN = ['date_key', 'product_key']
 
-def validate_transformations(df: DataFrame, table_name: str) -> bool:
-   
-    try:
-        # Verificar que no hay valores nulos en campos críticos
-        critical_columns = [col for col in df.columns if 'key' in col or 'id' in col]
-        for col in critical_columns:
-            if df[col].isnull().any():
-                print(f"Advertencia: Valores nulos en {col} para {table_name}")
-                return False
+
+class SalesMetricsAggregator:
+    """
+    Agregación de métricas de ventas por streaming: cada chunk aporta sumas
+    parciales por grano, las parciales se combinan (la suma es asociativa,
+    así que el orden de chunks o workers no importa) y los cocientes solo
+    se calculan en finalize(). La memoria depende de la cantidad de grupos,
+    no de filas: las parciales se compactan al superar compact_rows filas y
+    el doble de lo que quedó en la compactación anterior, así con muchos
+    grupos no se recombina todo en cada chunk.
+    """
+
+    def __init__(self, grain: list = None, measures: list = None, compact_rows: int = 500000):
+        self.grain = list(grain or SALES_METRIC_GRAIN)
+        self.measures = list(measures or SALES_METRIC_MEASURES)
+        self.compact_rows = compact_rows
+        self.rows = 0
+        self._partials = []
+        self._pending = 0
+        self._compacted = 0
+
+    def _compact(self):
+        if len(self._partials) > 1:
+            combined = pd.concat(self._partials)
+            self._partials = [combined.groupby(level=self.grain, sort=False, dropna=False).sum()]
+        self._pending = sum(len(partial) for partial in self._partials)
+        self._compacted = self._pending
+
+    def _should_compact(self) -> bool:
+        return self._pending > max(self.compact_rows, 2 * self._compacted)
+
+    def update(self, chunk: DataFrame) -> 'SalesMetricsAggregator':
+        partial = chunk.groupby(self.grain, sort=False, dropna=False)[self.measures].sum()
+        self._partials.append(partial)
+        self.rows += len(chunk)
+        self._pending += len(partial)
+        if self._should_compact():
+            self._compact()
+        return self
+
+    def merge(self, other: 'SalesMetricsAggregator') -> 'SalesMetricsAggregator':
+        self._partials.extend(other._partials)
+        self.rows += other.rows
+        self._pending += other._pending
+        if self._should_compact():
+            self._compact()
+        return self
+
+    def finalize(self) -> DataFrame:
+        self._compact()
+        if not self._partials:
+            return pd.DataFrame(columns=self.grain + self.measures)
+        metrics = self._partials[0].sort_index().reset_index()
         
-        # Verificar que no hay duplicados en claves primarias
-        if 'customer_key' in df.columns:
-            if df['customer_key'].duplicated().any():
-                print(f"Advertencia: Duplicados en customer_key para {table_name}")
-                return False
+        if {'line_total', 'order_quantity'} <= set(self.measures):
+            metrics['avg_sale_amount'] = metrics['line_total'] / metrics['order_quantity']
+        if {'discount_amount', 'line_total'} <= set(self.measures):
+            metrics['discount_rate'] = (metrics['discount_amount'] / metrics['line_total'] * 100).round(2)
+        if {'profit', 'net_sales_amount'} <= set(self.measures):
+            metrics['profit_margin'] = (metrics['profit'] / metrics['net_sales_amount'] * 100).round(2)
+        
+        return metrics
+
+
+def calculate_sales_metrics(fact_table: DataFrame, grain: list = None, chunk_rows: int = 1000000) -> DataFrame:
+    
+    aggregator = SalesMetricsAggregator(grain)
+    for start in range(0, len(fact_table), chunk_rows):
+        aggregator.update(fact_table.iloc[start:start + chunk_rows])
+    
+    return aggregator.finalize()
+
+
+def validate_transformations(df: DataFrame, table_name: str, etl_conn=None) -> bool:
+    """
+    Validamos el DataFrame con las reglas declarativas de etl.quality
+    (nulos, unicidad, rangos y valores permitidos) y reportamos todas las
+    violaciones. Con etl_conn también se guardan el reporte y el perfil.
+    """
+    from etl import quality
+    
+    try:
+        state = quality.evaluate(df, table_name)
+        state.print_issues()
+        if etl_conn is not None:
+            quality.persist(etl_conn, state)
         
+        if not state.passed:
+            return False
         print(f"✓ Transformación validada para {table_name}")
         return True
         
     except Exception as e:
         print(f"✗ Error validando {table_name}: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -1,6 +1,75 @@
-from sqlalchemy import Engine, text
+from sqlalchemy import Engine, create_engine, text
 from datetime import date
-import pandas as pd
+
+def load_config(path: str = 'config.yml') -> tuple:
+    """
+    Leemos config.yml y devolvemos (SOURCE_DB, TARGET_DB, ETL_SETTINGS)
+    """
+    import yaml
+    
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    return config['SOURCE_DB'], config['TARGET_DB'], config['ETL_SETTINGS']
+
+
+def create_source_connection(config_source: dict, **engine_options) -> Engine:
+    """
+    Motor de SQL Server (fuente - AdventureWorks)
+    """
+    source_conn_string = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={config_source['host']},{config_source['port']};"
+        f"DATABASE={config_source['dbname']};"
+        f"UID={config_source['user']};"
+        f"PWD={config_source['password']}"
+    )
+    return create_engine(f"mssql+pyodbc:///?odbc_connect={source_conn_string}", **engine_options)
+
+
+def create_target_connection(config_target: dict, schema: str = None, **engine_options) -> Engine:
+    """
+    Motor de PostgreSQL (destino - Data Warehouse). Con schema las tablas sin
+    calificar se crean y leen en ese esquema (search_path), p.ej. la bodega
+    de prueba del modo muestra
+    """
+    target_url = (
+        f"{config_target['drivername']}://{config_target['user']}:{config_target['password']}"
+        f"@{config_target['host']}:{config_target['port']}/{config_target['dbname']}"
+    )
+    if schema:
+        # En la URL (y no en connect_args) para que el catálogo en caché distinga el esquema
+        target_url += f"?options=-csearch_path%3D{schema}"
+    return create_engine(target_url, **engine_options)
+
+
+def reset_sample_schema(config_target: dict, schema: str):
+    """
+    Recreamos vacío el esquema de prueba de la bodega para el modo muestra
+    (cada corrida de muestra parte de cero, sin marcas de agua ni huellas previas)
+    """
+    if schema in ('public', 'pg_catalog', 'information_schema'):
+        raise ValueError(f"El esquema de muestra no puede ser '{schema}'")
+    engine = create_target_connection(config_target)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {schema} CASCADE'))
+            conn.execute(text(f'CREATE SCHEMA {schema}'))
+    finally:
+        engine.dispose()
+
+
+def create_connections(config_source: dict, config_target: dict, schema: str = None,
+                       **engine_options) -> tuple:
+    """
+    Creamos los motores de SQL Server (fuente) y PostgreSQL (bodega).
+    schema apunta la bodega a otro esquema (modo muestra).
+    engine_options se pasa a create_engine (p.ej. pool_pre_ping para procesos largos)
+    """
+    source_conn = create_source_connection(config_source, **engine_options)
+    target_conn = create_target_connection(config_target, schema=schema, **engine_options)
+    
+    return source_conn, target_conn
+
 
 def check_new_data(source_conn: Engine, etl_conn: Engine) -> bool:
     
@@ -53,85 +122,140 @@ def check_new_data(source_conn: Engine, etl_conn: Engine) -> bool:
 
 def check_table_exists(etl_conn: Engine, table_name: str) -> bool:
     
+    # Se responde desde el catálogo en caché en lugar de abrir una conexión por tabla
+    from etl import catalog
+    
     try:
-        query = text('''
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = :table_name
-            )
-        ''')
-        with etl_conn.connect() as conn:
-            result = conn.execute(query, {'table_name': table_name})
-            exists = result.scalar()
-            return exists
+        return catalog.table_exists(etl_conn, table_name)
     except Exception as e:
         print(f'[Error] Verificando tabla {table_name}: {e}')
         return False
 
-def push_dimensions(source_conn: Engine, etl_conn: Engine, replace: bool = False):
-   
+def push_dimensions(source_conn: Engine, etl_conn: Engine, replace: bool = False, probe: bool = True,
+                    allocator=None, loader=None):
+    """
+    Carga de dimensiones con llaves sustitutas asignadas en el proceso;
+    devuelve el KeyAllocator para enlazar los hechos sin releer la bodega.
+    Con loader (async_load.AsyncLoader) las escrituras solo se encolan.
+    """
     # Importar módulos (evitar circular imports)
-    from src import extract, transform, load
+    from etl import extract, transform, load, source_probe, keys, catalog
     
+    allocator = allocator or keys.KeyAllocator(etl_conn)
     print("Iniciando carga de dimensiones...")
     
     try:
+        # Sondas de checksum en el origen: las dimensiones sin cambios no se extraen
+        # y las que cambiaron en pocos rangos de llaves se extraen solo en esos rangos
+        plans = {}
+        if probe:
+            print("Sondeando dimensiones en el origen...")
+            probes, plans = source_probe.plan_dimensions(source_conn, etl_conn)
+        if replace:
+            plans = {dimension: {'mode': 'full'} for dimension in plans}
+        
+        def wanted(dimension):
+            return plans.get(dimension, {}).get('mode') != 'unchanged'
+        
+        def ranges(dimension):
+            return source_probe.key_ranges(plans, dimension)
+        
         # Extraer datos de dimensiones desde SQL Server
         print("Extrayendo datos de dimensiones...")
-        dim_customer = extract.extract_customers(source_conn)
-        dim_product = extract.extract_products(source_conn)
-        dim_territory = extract.extract_sales_territory(source_conn)
-        dim_currency = extract.extract_currency(source_conn)
-        dim_employee = extract.extract_employees(source_conn)
-        dim_reseller = extract.extract_stores(source_conn)
+        probed = {}
+        if wanted('dim_customer'):
+            probed['dim_customer'] = transform.transform_customer(
+                extract.extract_customers(source_conn, key_ranges=ranges('dim_customer')))
+        if wanted('dim_product'):
+            probed['dim_product'] = transform.transform_product(
+                extract.extract_products(source_conn, key_ranges=ranges('dim_product')))
+        if wanted('dim_territory'):
+            probed['dim_territory'] = transform.transform_territory(extract.extract_sales_territory(source_conn))
+        if wanted('dim_currency'):
+            probed['dim_currency'] = transform.transform_currency(extract.extract_currency(source_conn))
+        if wanted('dim_employee'):
+            probed['dim_employee'] = transform.transform_employee(
+                extract.extract_employees(source_conn, key_ranges=ranges('dim_employee')))
+        if wanted('dim_reseller'):
+            probed['dim_reseller'] = transform.transform_reseller(
+                extract.extract_stores(source_conn, key_ranges=ranges('dim_reseller')))
+        currency_rate = extract.extract_currency_rate(source_conn)
         sales_reason = extract.extract_sales_reason(source_conn)
         
         # Transformar dimensiones
         print("Transformando dimensiones...")
-        dim_customer_transformed = transform.transform_customer(dim_customer)
-        dim_product_transformed = transform.transform_product(dim_product)
         dim_date_transformed = transform.transform_date()  # Dimensión de tiempo generada
-        dim_territory_transformed = transform.transform_territory(dim_territory)
-        dim_currency_transformed = transform.transform_currency(dim_currency)
-        dim_employee_transformed = transform.transform_employee(dim_employee)
-        dim_reseller_transformed = transform.transform_reseller(dim_reseller)
+        currency_rate_transformed = transform.transform_currency_rate(currency_rate)
         sales_reason_transformed = transform.transform_sales_reason(sales_reason)
         
+        # Llaves sustitutas en pandas (los miembros existentes conservan la suya)
+        for table_name in probed:
+            if table_name in keys.SURROGATE_KEYS:
+                probed[table_name] = allocator.assign(probed[table_name], table_name)
+        dim_date_transformed = allocator.assign(dim_date_transformed, 'dim_date', only_new=not replace)
+        
         # Validar transformaciones
         print("Validando transformaciones...")
-        transform.validate_transformations(dim_customer_transformed, 'dim_customer')
-        transform.validate_transformations(dim_product_transformed, 'dim_product')
-        transform.validate_transformations(dim_territory_transformed, 'dim_territory')
+        for table_name, df in probed.items():
+            if table_name != 'dim_currency':
+                transform.validate_transformations(df, table_name, etl_conn)
+        transform.validate_transformations(dim_date_transformed, 'dim_date', etl_conn)
+        transform.validate_transformations(currency_rate_transformed, 'dim_currency_rate', etl_conn)
         
         # Cargar dimensiones a PostgreSQL
+        def load_probed(table_name, df):
+            source_probe.apply_changes(df, etl_conn, table_name, replace)
+            if probe:
+                source_probe.save_probe(etl_conn, probes, table_name)
+        
+        def load_currency_rate(df):
+            load.ensure_currency_schema(etl_conn)
+            load.load_currency_rate(df, etl_conn)
+        
+        def load_sales_reason(df):
+            load.ensure_sales_reason_schema(etl_conn)
+            load.load_sales_reason(df, etl_conn)
+        
+        if loader is not None:
+            for table_name, df in probed.items():
+                loader.call(table_name, load_probed, table_name, df)
+            if catalog.table_exists(etl_conn, 'dim_date') and not dim_date_transformed.empty:
+                loader.copy('dim_date', dim_date_transformed, replace)
+            else:
+                loader.call('dim_date', load.load, dim_date_transformed, etl_conn, 'dim_date', replace)
+            loader.call('dim_sales_reason', load_sales_reason, sales_reason_transformed)
+            loader.call('dim_currency_rate', load_currency_rate, currency_rate_transformed)
+            print("Dimensiones encoladas para la carga concurrente")
+            return allocator
+        
         print("Cargando dimensiones a la bodega...")
-        load.load(dim_customer_transformed, etl_conn, 'dim_customer', replace)
-        load.load(dim_product_transformed, etl_conn, 'dim_product', replace)
+        for table_name, df in probed.items():
+            load_probed(table_name, df)
         load.load(dim_date_transformed, etl_conn, 'dim_date', replace)
-        load.load(dim_territory_transformed, etl_conn, 'dim_territory', replace)
-        load.load(dim_currency_transformed, etl_conn, 'dim_currency', replace)
-        load.load(dim_employee_transformed, etl_conn, 'dim_employee', replace)
-        load.load(dim_reseller_transformed, etl_conn, 'dim_reseller', replace)
-        load.load(sales_reason_transformed, etl_conn, 'dim_sales_reason', replace)
+        load_sales_reason(sales_reason_transformed)
+        load_currency_rate(currency_rate_transformed)
         
         print("✓ Todas las dimensiones cargadas exitosamente")
+        return allocator
         
     except Exception as e:
         print(f"✗ Error cargando dimensiones: {e}")
         raise
 
-def push_facts(source_conn: Engine, etl_conn: Engine, incremental: bool = True):
-    
+def push_facts(source_conn: Engine, etl_conn: Engine, incremental: bool = True, allocator=None, loader=None):
+    """
+    Carga de hechos (incremental por sales_order_id o completa con shadow
+    swap). Con loader las escrituras solo se encolan.
+    """
     # Importar módulos
-    from src import extract, transform, load
+    from etl import extract, transform, load, keys, catalog
     
     print("Iniciando carga de hechos...")
     
     try:
-        # Extraer dimensiones existentes para las transformaciones
-        print("Extrayendo dimensiones para transformaciones...")
-        dimensions = extract.extract_dimensions_from_dw(etl_conn)
+        # Mapas de llaves en memoria (los de push_dimensions si se pasa su allocator)
+        print("Preparando llaves de dimensiones para transformaciones...")
+        dimensions = (allocator or keys.KeyAllocator(etl_conn)).dimensions()
         
         # Extraer datos de hechos desde SQL Server
         print("Extrayendo datos de ventas...")
@@ -144,6 +268,19 @@ def push_facts(source_conn: Engine, etl_conn: Engine, incremental: bool = True):
         fact_reseller_sales = transform.transform_reseller_sales(reseller_sales, dimensions)
         
         # Cargar hechos a PostgreSQL
+        if loader is not None:
+            for fact_name, fact_data in (('fact_internet_sales', fact_internet_sales),
+                                         ('fact_reseller_sales', fact_reseller_sales)):
+                if incremental and catalog.table_exists(etl_conn, fact_name):
+                    # COPY de las órdenes posteriores a la marca de agua, leída en la misma transacción
+                    loader.copy(fact_name, fact_data, watermark_column='sales_order_id')
+                elif incremental:
+                    loader.call(fact_name, load.load, fact_data, etl_conn, fact_name)
+                else:
+                    loader.call(fact_name, load.load, fact_data, etl_conn, fact_name, replace=True, swap=True)
+            print("Hechos encolados para la carga concurrente")
+            return
+        
         print("Cargando hechos a la bodega...")
         
         if incremental:
@@ -152,8 +289,9 @@ def push_facts(source_conn: Engine, etl_conn: Engine, incremental: bool = True):
             load.load_incremental_fact_reseller_sales(fact_reseller_sales, etl_conn)
         else:
             # Carga completa
-            load.load(fact_internet_sales, etl_conn, 'fact_internet_sales', replace=True)
-            load.load(fact_reseller_sales, etl_conn, 'fact_reseller_sales', replace=True)
+            load.load(fact_internet_sales, etl_conn, 'fact_internet_sales', replace=True, swap=True)
+            load.load(fact_reseller_sales, etl_conn, 'fact_reseller_sales', replace=True, swap=True)
+        load.ensure_fact_order_indexes(etl_conn)
         
         print("✓ Todos los hechos cargados exitosamente")
         
@@ -161,26 +299,221 @@ def push_facts(source_conn: Engine, etl_conn: Engine, incremental: bool = True):
         print(f"✗ Error cargando hechos: {e}")
         raise
 
-def get_etl_status(etl_conn: Engine) -> dict:
+def push_all(source_conn: Engine, etl_conn: Engine, loader, replace: bool = False, incremental: bool = True,
+             process_name: str = 'ETL_Concurrente'):
+    """
+    Dimensiones y hechos extraídos y transformados primero (las llaves
+    sustitutas salen del KeyAllocator, no de la bodega) y todas las
+    escrituras en un solo lote concurrente de loader; etl_log se escribe
+    cuando el lote completo quedó confirmado
+    """
+    from etl import load
+
+    allocator = push_dimensions(source_conn, etl_conn, replace=replace, loader=loader)
+    push_facts(source_conn, etl_conn, incremental=incremental, allocator=allocator, loader=loader)
+    # El puente espera a dim_sales_reason y a los hechos del mismo lote (LOAD_DEPENDENCIES)
+    bridge = order_sales_reason_pairs(source_conn, etl_conn, after_order_id=None if incremental else 0)
+    loader.call('bridge_order_sales_reason', load.load_bridge_order_sales_reason, bridge, etl_conn)
+    print("Cargando dimensiones, hechos y puente a la bodega (concurrente)...")
+    try:
+        results = loader.run()
+    except Exception:
+        log_etl_run(etl_conn, process_name, 'Fallido')
+        raise
+    load.ensure_fact_order_indexes(etl_conn)
+    log_etl_run(etl_conn, process_name, 'Exitoso', sum(result['rows'] for result in results.values()))
+    return results
+
+
+def order_sales_reason_pairs(source_conn: Engine, etl_conn: Engine, after_order_id: int = None):
+    """
+    Pares orden-razón transformados posteriores a after_order_id, o a la
+    marca de agua de bridge_order_sales_reason si va más atrasada (None:
+    solo la marca de agua del puente)
+    """
+    from etl import extract, transform, catalog
+    
+    # Si la tabla puente va atrasada respecto a los hechos, se continúa desde ella
+    bridge_watermark = catalog.get_watermarks(etl_conn).get('bridge_order_sales_reason') or 0
+    after_order_id = bridge_watermark if after_order_id is None else min(after_order_id, bridge_watermark)
+    
+    order_reasons = extract.extract_order_sales_reason(source_conn, after_order_id=after_order_id)
+    return transform.transform_order_sales_reason(order_reasons)
+
+
+def push_sales_reasons(source_conn: Engine, etl_conn: Engine, after_order_id: int = 0) -> int:
+    """
+    Actualiza dim_sales_reason y carga en bridge_order_sales_reason solo los
+    pares de órdenes posteriores a la marca de agua de los hechos
+    """
+    from etl import extract, transform, load
+    
+    sales_reason = transform.transform_sales_reason(extract.extract_sales_reason(source_conn))
+    load.ensure_sales_reason_schema(etl_conn)
+    load.load_sales_reason(sales_reason, etl_conn)
+    
+    bridge = order_sales_reason_pairs(source_conn, etl_conn, after_order_id or 0)
+    return load.load_bridge_order_sales_reason(bridge, etl_conn)
+
+
+def push_order_lifecycle(source_conn: Engine, etl_conn: Engine, dimensions: dict,
+                         start_date: str = '2011-01-01', chunksize: int = 200000) -> int:
+    """
+    Mantenimiento incremental de fact_order_lifecycle: se re-extraen solo
+    las líneas modificadas desde la marca de agua (MAX(source_modified)) y
+    se aplican por lotes con un merge que no toca las filas sin cambios.
+    La primera corrida recorre el histórico completo en chunks.
+    """
+    from etl import extract, transform, load
+
+    load.ensure_order_lifecycle_table(etl_conn)
+    since = load.order_lifecycle_watermark(etl_conn)
+    print(f"Snapshot de órdenes: cambios desde {since or 'el inicio'}")
+
+    extracted = changed = 0
+    for chunk in extract.extract_order_lifecycle(source_conn, modified_since=since, start_date=start_date,
+                                                 chunksize=chunksize):
+        lifecycle = transform.transform_order_lifecycle(chunk, dimensions)
+        changed += load.merge_order_lifecycle(lifecycle, etl_conn, transform.ORDER_LIFECYCLE_TRACKED)
+        extracted += len(chunk)
+
+    print(f"✓ fact_order_lifecycle: {extracted} líneas revisadas, {changed} insertadas o actualizadas")
+    return changed
+
+
+# Funciones de extracción, transformación y carga incremental por hecho
+FACT_STAGES = {
+    'fact_internet_sales': ('extract_internet_sales', 'transform_internet_sales',
+                            'load_incremental_fact_internet_sales'),
+    'fact_reseller_sales': ('extract_reseller_sales', 'transform_reseller_sales',
+                            'load_incremental_fact_reseller_sales')
+}
+
+
+def _order_aligned_slices(order_ids, rows: int) -> list:
+    """
+    Partimos un lote ordenado por SalesOrderID en tramos de ~rows filas
+    sin cortar una orden entre dos tramos
+    """
+    import numpy as np
+    
+    order_ids = np.asarray(order_ids)
+    slices = []
+    start = 0
+    while start < len(order_ids):
+        end = min(start + rows, len(order_ids))
+        if end < len(order_ids):
+            # Extender hasta la última línea de la orden en el borde
+            end = int(np.searchsorted(order_ids, order_ids[end - 1], side='right'))
+        slices.append((start, end))
+        start = end
+    return slices
+
+
+def push_fact_batches(source_conn: Engine, etl_conn: Engine, fact_name: str, dimensions: dict,
+                      governor, start_date: str = '2011-01-01', touched: set = None) -> int:
+    """
+    Carga incremental de un hecho por lotes de órdenes cuyo tamaño decide
+    el gobernador de memoria (extracción, transformación y carga).
+    En touched se agregan los date_key de las filas cargadas.
+    """
+    from etl import extract, transform, load, catalog, integrity, quality
+    from etl.memory import frame_bytes
+    
+    extract_name, transform_name, load_name = FACT_STAGES[fact_name]
+    extract_fn = getattr(extract, extract_name)
+    transform_fn = getattr(transform, transform_name)
+    load_fn = getattr(load, load_name)
+    
+    # Se continúa desde la marca de agua del hecho
+    after_order_id = catalog.get_watermarks(etl_conn).get(fact_name) or 0
+    total = 0
+    # Estado de calidad de toda la corrida (los chunks se combinan)
+    run_quality = quality.QualityState(fact_name)
+    
+    while True:
+        batch = extract_fn(source_conn, start_date=start_date,
+                           after_order_id=after_order_id, max_orders=governor.batch_orders())
+        if batch.empty:
+            break
+        governor.observe('extract', batch, orders=batch['SalesOrderID'].nunique())
+        
+        transform_rows = governor.chunk_size('transform')
+        for start, end in _order_aligned_slices(batch['SalesOrderID'], transform_rows):
+            chunk = batch.iloc[start:end]
+            fact = transform_fn(chunk, dimensions)
+            governor.observe('transform', fact, extra_bytes=frame_bytes(chunk))
+            
+            # Las huérfanas van a cuarentena; el resto del lote se carga igual
+            fact = integrity.precheck(fact, fact_name, dimensions, etl_conn)
+            chunk_quality = quality.evaluate(fact, fact_name)
+            if not chunk_quality.passed:
+                chunk_quality.print_issues()
+                raise ValueError(f"Validación fallida para {fact_name} (órdenes {after_order_id}+)")
+            run_quality.merge(chunk_quality)
+            # Llaves repetidas entre chunks de la corrida: este chunk ya no se carga
+            if not run_quality.passed:
+                run_quality.print_issues()
+                quality.persist(etl_conn, run_quality)
+                raise ValueError(f"Validación fallida para {fact_name}: llaves repetidas entre lotes "
+                                 f"(órdenes {after_order_id}+)")
+            
+            load_rows = governor.chunk_size('load')
+            governor.observe('load', fact)
+            governor.log(f"{fact_name}: transformación de {end - start} filas, carga en chunks de {load_rows}")
+            load_fn(fact, etl_conn, chunksize=load_rows)
+            if touched is not None:
+                touched.update(fact['date_key'].drop_duplicates())
+            total += len(fact)
+            del fact, chunk
+        
+        after_order_id = int(batch['SalesOrderID'].max())
+        del batch
+    
+    quality.persist(etl_conn, run_quality)
+    load.ensure_fact_order_indexes(etl_conn)
+    return total
+
+
+def aggregate_sales_metrics(etl_conn: Engine, grain: list = None, fact_names: list = None,
+                            chunksize: int = 200000):
+    """
+    Métricas de ventas sobre el histórico completo de los hechos leyendo por
+    chunks con un cursor del lado del servidor: en memoria solo quedan las
+    sumas parciales por grano, nunca la tabla completa
+    """
+    import pandas as pd
+    from etl import transform, catalog
+    
+    aggregator = transform.SalesMetricsAggregator(grain)
+    columns = ', '.join(aggregator.grain + aggregator.measures)
+    
+    for fact_name in fact_names or catalog.FACT_TABLES:
+        if not catalog.table_exists(etl_conn, fact_name):
+            continue
+        with etl_conn.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql_query(text(f'SELECT {columns} FROM {fact_name}'), conn, chunksize=chunksize):
+                aggregator.update(chunk)
+        print(f"✓ {fact_name} agregado ({aggregator.rows} filas acumuladas)")
+    
+    return aggregator.finalize()
+
+
+def get_etl_status(etl_conn: Engine, exact: bool = False) -> dict:
+    
+    # Importar módulos
+    from etl import catalog
     
     status = {}
     
     try:
-        tables = [
-            'dim_customer', 'dim_product', 'dim_date', 'dim_territory',
-            'dim_currency', 'dim_employee', 'dim_reseller', 'dim_sales_reason',
-            'fact_internet_sales', 'fact_reseller_sales'
-        ]
-        
-        with etl_conn.connect() as conn:
-            for table in tables:
-                if check_table_exists(etl_conn, table):
-                    query = text(f'SELECT COUNT(*) as count FROM {table}')
-                    result = conn.execute(query)
-                    count = result.scalar()
-                    status[table] = count
-                else:
-                    status[table] = 'Tabla no existe'
+        # Una consulta al catálogo (filas estimadas); con exact=True los COUNT(*) corren en paralelo
+        details = catalog.get_status(etl_conn, exact=exact, refresh=True)
+        for table in catalog.WAREHOUSE_TABLES:
+            if details[table]['exists']:
+                status[table] = details[table]['rows']
+            else:
+                status[table] = 'Tabla no existe'
         
         return status
         
@@ -188,7 +521,10 @@ def get_etl_status(etl_conn: Engine) -> dict:
         print(f'[Error] Obteniendo estado ETL: {e}')
         return {}
 
-def log_etl_run(etl_conn: Engine, process_name: str, status: str, records_processed: int = 0):
+def log_etl_run(etl_conn: Engine, process_name: str, status: str, records_processed: int = 0,
+                details: str = None):
+    
+    from etl import catalog
     
     try:
         # Crear tabla de logs si no existe
@@ -204,8 +540,8 @@ def log_etl_run(etl_conn: Engine, process_name: str, status: str, records_proces
         ''')
         
         insert_log = text('''
-            INSERT INTO etl_log (process_name, status, records_processed)
-            VALUES (:process_name, :status, :records_processed)
+            INSERT INTO etl_log (process_name, status, records_processed, details)
+            VALUES (:process_name, :status, :records_processed, :details)
         ''')
         
         with etl_conn.connect() as conn:
@@ -213,9 +549,12 @@ def log_etl_run(etl_conn: Engine, process_name: str, status: str, records_proces
             conn.execute(insert_log, {
                 'process_name': process_name,
                 'status': status,
-                'records_processed': records_processed
+                'records_processed': records_processed,
+                'details': details
             })
             conn.commit()
+        
+        catalog.invalidate_catalog(etl_conn)
             
         print(f"✓ Log registrado: {process_name} - {status}")
         
@@ -0,0 +1,413 @@
+import os
+import socket
+import time
+import uuid
+import argparse
+import multiprocessing
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl import catalog
+
+# Funciones de extracción y transformación por hecho
+QUEUE_FACTS = {
+    'fact_internet_sales': {
+        'online_flag': 1,
+        'extract': 'extract_internet_sales',
+        'transform': 'transform_internet_sales',
+        'process_name': 'Internet_Sales'
+    },
+    'fact_reseller_sales': {
+        'online_flag': 0,
+        'extract': 'extract_reseller_sales',
+        'transform': 'transform_reseller_sales',
+        'process_name': 'Reseller_Sales'
+    }
+}
+
+QUEUE_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS etl_work_queue (
+        unit_id SERIAL PRIMARY KEY,
+        run_id VARCHAR(64) NOT NULL,
+        fact_name VARCHAR(64) NOT NULL,
+        after_order_id INTEGER NOT NULL,
+        until_order_id INTEGER NOT NULL,
+        start_date DATE,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        leased_by VARCHAR(100),
+        lease_expires_at TIMESTAMP,
+        rows_loaded INTEGER,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS etl_work_queue_claim_idx ON etl_work_queue (status, unit_id)'
+]
+
+
+def default_worker_id() -> str:
+    """Identificador del worker: host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_queue_table(etl_conn: Engine):
+    """
+    Creamos la cola de trabajo si no existe. Solo se ejecuta el DDL de los
+    objetos que faltan: CREATE INDEX IF NOT EXISTS toma el lock aunque el
+    índice exista y, con workers cargando a la vez, provoca deadlocks.
+    """
+    order_indexes = {f'{fact_name}_order_idx': fact_name for fact_name in QUEUE_FACTS
+                     if catalog.table_exists(etl_conn, fact_name)}
+    with etl_conn.begin() as conn:
+        missing = [name for name in ['etl_work_queue', *order_indexes]
+                   if conn.execute(text('SELECT to_regclass(:name) IS NULL'), {'name': name}).scalar()]
+        if not missing:
+            return
+        # Workers que arrancan a la vez: serializamos la creación
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('etl_work_queue'))"))
+        for ddl in QUEUE_DDL:
+            conn.execute(text(ddl))
+        # Los workers reemplazan su rango de órdenes: índice para el DELETE idempotente
+        for index_name, fact_name in order_indexes.items():
+            if index_name in missing:
+                conn.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS {index_name} ON {fact_name} (sales_order_id)'
+                ))
+    catalog.invalidate_catalog(etl_conn)
+
+
+def plan_work_units(source_conn: Engine, fact_name: str, after_order_id: int = 0,
+                    start_date: str = '2011-01-01', orders_per_unit: int = 2000) -> list:
+    """
+    Partimos las órdenes pendientes del hecho en rangos contiguos de
+    SalesOrderID con ~orders_per_unit órdenes cada uno (calculado en SQL Server)
+    """
+    query = text('''
+        SELECT MAX(SalesOrderID) AS until_order_id
+        FROM (
+            SELECT
+                SalesOrderID,
+                (ROW_NUMBER() OVER (ORDER BY SalesOrderID) - 1) / :orders_per_unit AS bucket
+            FROM Sales.SalesOrderHeader
+            WHERE OnlineOrderFlag = :online_flag
+            AND OrderDate >= :start_date
+            AND SalesOrderID > :after_order_id
+        ) t
+        GROUP BY bucket
+        ORDER BY bucket
+    ''')
+    params = {
+        'orders_per_unit': int(orders_per_unit),
+        'online_flag': QUEUE_FACTS[fact_name]['online_flag'],
+        'start_date': start_date,
+        'after_order_id': int(after_order_id)
+    }
+    with source_conn.connect() as conn:
+        bounds = [row[0] for row in conn.execute(query, params)]
+
+    units = []
+    lower = int(after_order_id)
+    for upper in bounds:
+        units.append({'fact_name': fact_name, 'after_order_id': lower,
+                      'until_order_id': int(upper), 'start_date': start_date})
+        lower = int(upper)
+    return units
+
+
+def publish_units(etl_conn: Engine, units: list, run_id: str, max_attempts: int = 3) -> int:
+    """Publicamos las unidades de trabajo en la cola"""
+    if not units:
+        return 0
+    insert = text('''
+        INSERT INTO etl_work_queue (run_id, fact_name, after_order_id, until_order_id, start_date, max_attempts)
+        VALUES (:run_id, :fact_name, :after_order_id, :until_order_id, :start_date, :max_attempts)
+    ''')
+    with etl_conn.begin() as conn:
+        conn.execute(insert, [{**unit, 'run_id': run_id, 'max_attempts': max_attempts} for unit in units])
+    return len(units)
+
+
+def requeue_failed(etl_conn: Engine, run_id: str) -> int:
+    """
+    Devolvemos a la cola, con los intentos en cero y dentro de la corrida
+    nueva, las unidades fallidas de corridas anteriores. Sus rangos pueden
+    quedar debajo de la marca de agua (MAX(sales_order_id)) de unidades que
+    sí terminaron, así que planificar desde la marca de agua no los cubre.
+    """
+    reap_expired(etl_conn)
+    with etl_conn.begin() as conn:
+        result = conn.execute(text('''
+            UPDATE etl_work_queue
+            SET status = 'pending', attempts = 0, run_id = :run_id,
+                leased_by = NULL, lease_expires_at = NULL
+            WHERE status = 'failed'
+        '''), {'run_id': run_id})
+    return result.rowcount
+
+
+def run_coordinator(source_conn: Engine, etl_conn: Engine, start_date: str = '2011-01-01',
+                    orders_per_unit: int = 2000, max_attempts: int = 3, run_id: str = None) -> str:
+    """
+    Coordinador: vuelve a encolar las unidades fallidas y planifica las
+    órdenes nuevas de cada hecho (desde su marca de agua y las unidades ya
+    publicadas) para publicarlas en la cola
+    """
+    ensure_queue_table(etl_conn)
+    run_id = run_id or uuid.uuid4().hex[:12]
+    requeued = requeue_failed(etl_conn, run_id)
+    if requeued:
+        print(f"Coordinador: {requeued} unidades fallidas vuelven a la cola")
+    watermarks = catalog.get_watermarks(etl_conn)
+
+    # No volver a publicar rangos que otra corrida todavía tiene en la cola
+    with etl_conn.connect() as conn:
+        queued = dict(conn.execute(text('''
+            SELECT fact_name, MAX(until_order_id)
+            FROM etl_work_queue
+            WHERE status IN ('pending', 'running')
+            GROUP BY fact_name
+        ''')).all())
+
+    total = 0
+    for fact_name in QUEUE_FACTS:
+        after_order_id = max(watermarks.get(fact_name) or 0, queued.get(fact_name) or 0)
+        units = plan_work_units(source_conn, fact_name, after_order_id, start_date, orders_per_unit)
+        total += publish_units(etl_conn, units, run_id, max_attempts)
+        print(f"Coordinador: {len(units)} unidades publicadas para {fact_name} (desde orden {after_order_id})")
+
+    print(f"✓ Corrida {run_id}: {total + requeued} unidades de trabajo en cola")
+    return run_id
+
+
+def claim_unit(etl_conn: Engine, worker_id: str, lease_seconds: int = 600):
+    """
+    Reclamamos la siguiente unidad libre (o con lease vencido) usando
+    FOR UPDATE SKIP LOCKED, sin bloquear a los demás workers
+    """
+    query = text('''
+        UPDATE etl_work_queue q
+        SET status = 'running',
+            attempts = q.attempts + 1,
+            leased_by = :worker_id,
+            lease_expires_at = now() + make_interval(secs => :lease_seconds)
+        WHERE q.unit_id = (
+            SELECT unit_id FROM etl_work_queue
+            WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < now()))
+            AND attempts < max_attempts
+            ORDER BY unit_id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING q.unit_id, q.run_id, q.fact_name, q.after_order_id, q.until_order_id,
+                  q.start_date, q.attempts
+    ''')
+    with etl_conn.begin() as conn:
+        row = conn.execute(query, {'worker_id': worker_id, 'lease_seconds': lease_seconds}).mappings().first()
+    return dict(row) if row else None
+
+
+def renew_lease(etl_conn: Engine, unit_id: int, worker_id: str, lease_seconds: int = 600) -> bool:
+    """Extendemos el lease; False si otro worker ya tomó la unidad"""
+    with etl_conn.begin() as conn:
+        result = conn.execute(text('''
+            UPDATE etl_work_queue
+            SET lease_expires_at = now() + make_interval(secs => :lease_seconds)
+            WHERE unit_id = :unit_id AND leased_by = :worker_id AND status = 'running'
+        '''), {'unit_id': unit_id, 'worker_id': worker_id, 'lease_seconds': lease_seconds})
+    return result.rowcount == 1
+
+
+def fail_unit(etl_conn: Engine, unit_id: int, worker_id: str, error: str):
+    """Devolvemos la unidad a la cola, o la marcamos fallida si agotó los intentos"""
+    with etl_conn.begin() as conn:
+        conn.execute(text('''
+            UPDATE etl_work_queue
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                leased_by = NULL,
+                lease_expires_at = NULL,
+                last_error = :error
+            WHERE unit_id = :unit_id AND leased_by = :worker_id
+        '''), {'unit_id': unit_id, 'worker_id': worker_id, 'error': error[:2000]})
+
+
+def reap_expired(etl_conn: Engine) -> int:
+    """Marcamos como fallidas las unidades con lease vencido y sin intentos restantes"""
+    with etl_conn.begin() as conn:
+        result = conn.execute(text('''
+            UPDATE etl_work_queue
+            SET status = 'failed', last_error = COALESCE(last_error, 'lease vencido')
+            WHERE status = 'running' AND lease_expires_at < now() AND attempts >= max_attempts
+        '''))
+    return result.rowcount
+
+
+def process_unit(source_conn: Engine, etl_conn: Engine, unit: dict, worker_id: str,
+                 dimensions: dict, lease_seconds: int = 600) -> int:
+    """
+    Extrae, transforma y carga el rango de órdenes de la unidad. El borrado
+    del rango, la carga y el cierre de la unidad van en una sola transacción
+    que solo confirma si el lease sigue siendo de este worker.
+    """
+    from etl import extract, transform, integrity
+
+    spec = QUEUE_FACTS[unit['fact_name']]
+    fact_name = unit['fact_name']
+    start_date = unit['start_date'].isoformat() if unit['start_date'] else None
+
+    source_rows = getattr(extract, spec['extract'])(
+        source_conn, start_date=start_date,
+        after_order_id=unit['after_order_id'], until_order_id=unit['until_order_id']
+    )
+    fact = getattr(transform, spec['transform'])(source_rows, dimensions)
+    fact = integrity.precheck(fact, fact_name, dimensions, etl_conn)
+    if not transform.validate_transformations(fact, fact_name):
+        raise ValueError(f"Validación fallida para {fact_name} en la unidad {unit['unit_id']}")
+
+    if not renew_lease(etl_conn, unit['unit_id'], worker_id, lease_seconds):
+        raise RuntimeError(f"Lease perdido para la unidad {unit['unit_id']}")
+
+    with etl_conn.begin() as conn:
+        conn.execute(text(f'''
+            DELETE FROM {fact_name}
+            WHERE sales_order_id > :after_order_id AND sales_order_id <= :until_order_id
+        '''), unit)
+        if not fact.empty:
+            fact.to_sql(fact_name, conn, if_exists='append', index=False, chunksize=10000)
+        done = conn.execute(text('''
+            UPDATE etl_work_queue
+            SET status = 'done', rows_loaded = :rows_loaded, finished_at = now(), lease_expires_at = NULL
+            WHERE unit_id = :unit_id AND leased_by = :worker_id AND status = 'running'
+        '''), {'unit_id': unit['unit_id'], 'worker_id': worker_id, 'rows_loaded': len(fact)})
+        if done.rowcount != 1:
+            # Otro worker tomó la unidad: se descarta esta carga (rollback)
+            raise RuntimeError(f"Lease perdido para la unidad {unit['unit_id']}")
+
+    return len(fact)
+
+
+def pending_units(etl_conn: Engine) -> int:
+    """Unidades que todavía pueden procesarse (pendientes o en curso)"""
+    with etl_conn.connect() as conn:
+        return conn.execute(text('''
+            SELECT COUNT(*) FROM etl_work_queue
+            WHERE status IN ('pending', 'running')
+        ''')).scalar()
+
+
+def run_worker(source_conn: Engine, etl_conn: Engine, worker_id: str = None, lease_seconds: int = 600,
+               poll_interval: float = 5.0, exit_when_idle: bool = True, reporting_currency: str = None) -> dict:
+    """
+    Worker: reclama unidades hasta vaciar la cola (o indefinidamente con
+    exit_when_idle=False). Los errores devuelven la unidad para reintento.
+    """
+    from etl import extract
+
+    worker_id = worker_id or default_worker_id()
+    ensure_queue_table(etl_conn)
+    dimensions = extract.extract_dimensions_from_dw(etl_conn, reporting_currency)
+    stats = {'units': 0, 'rows': 0, 'failed': 0}
+
+    while True:
+        unit = claim_unit(etl_conn, worker_id, lease_seconds)
+        if unit is None:
+            reap_expired(etl_conn)
+            if exit_when_idle and pending_units(etl_conn) == 0:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        label = f"{unit['fact_name']} ({unit['after_order_id']}, {unit['until_order_id']}]"
+        try:
+            rows = process_unit(source_conn, etl_conn, unit, worker_id, dimensions, lease_seconds)
+            stats['units'] += 1
+            stats['rows'] += rows
+            print(f"✓ [{worker_id}] Unidad {unit['unit_id']} {label}: {rows} registros")
+        except Exception as e:
+            stats['failed'] += 1
+            print(f"✗ [{worker_id}] Unidad {unit['unit_id']} {label} (intento {unit['attempts']}): {e}")
+            fail_unit(etl_conn, unit['unit_id'], worker_id, str(e))
+
+    print(f"[{worker_id}] Worker terminado: {stats}")
+    return stats
+
+
+def queue_summary(etl_conn: Engine, run_id: str) -> dict:
+    """Unidades por estado y registros cargados por hecho de una corrida"""
+    with etl_conn.connect() as conn:
+        rows = conn.execute(text('''
+            SELECT fact_name, status, COUNT(*) AS units, COALESCE(SUM(rows_loaded), 0) AS rows_loaded
+            FROM etl_work_queue
+            WHERE run_id = :run_id
+            GROUP BY fact_name, status
+        '''), {'run_id': run_id}).mappings().all()
+
+    summary = {}
+    for row in rows:
+        fact = summary.setdefault(row['fact_name'], {'rows_loaded': 0})
+        fact[row['status']] = row['units']
+        fact['rows_loaded'] += row['rows_loaded']
+    return summary
+
+
+def _worker_process(config_path: str, index: int, lease_seconds: int):
+    """Punto de entrada de cada proceso worker local"""
+    from etl import utils_etl
+
+    config_source, config_target, etl_settings = utils_etl.load_config(config_path)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+    run_worker(source_conn, etl_conn, worker_id=f"{default_worker_id()}-{index}",
+               lease_seconds=lease_seconds, reporting_currency=etl_settings.get('reporting_currency'))
+
+
+def run_local_workers(config_path: str, workers: int = 4, lease_seconds: int = 600) -> int:
+    """
+    Lanzamos varios procesos worker locales y esperamos a que vacíen la cola.
+    Devuelve la cantidad de procesos que terminaron con error.
+    """
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(config_path, index, lease_seconds))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return sum(1 for process in processes if process.exitcode != 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ejecución distribuida del ETL con cola de trabajo')
+    parser.add_argument('role', choices=['coordinator', 'worker', 'local'])
+    parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--workers', type=int, default=4, help='procesos locales (role=local)')
+    parser.add_argument('--orders-per-unit', type=int, default=2000)
+    parser.add_argument('--lease-seconds', type=int, default=600)
+    args = parser.parse_args()
+
+    from etl import utils_etl
+
+    config_source, config_target, etl_settings = utils_etl.load_config(args.config)
+    source_conn, etl_conn = utils_etl.create_connections(config_source, config_target)
+
+    if args.role in ('coordinator', 'local'):
+        run_id = run_coordinator(source_conn, etl_conn,
+                                 start_date=etl_settings.get('start_date', '2011-01-01'),
+                                 orders_per_unit=args.orders_per_unit)
+    if args.role == 'worker':
+        run_worker(source_conn, etl_conn, lease_seconds=args.lease_seconds,
+                   reporting_currency=etl_settings.get('reporting_currency'))
+    elif args.role == 'local':
+        failed = run_local_workers(args.config, args.workers, args.lease_seconds)
+        summary = queue_summary(etl_conn, run_id)
+        print(f"Resumen de la corrida {run_id}: {summary} ({failed} procesos con error)")
+        for fact_name, spec in QUEUE_FACTS.items():
+            fact = summary.get(fact_name, {'rows_loaded': 0})
+            status = 'Fallido' if fact.get('failed') or fact.get('pending') else 'Exitoso'
+            utils_etl.log_etl_run(etl_conn, spec['process_name'], status, fact['rows_loaded'])
+
+
+if __name__ == '__main__':
+    main()
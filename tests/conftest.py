@@ -0,0 +1,163 @@
+import gc
+import os
+import uuid
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from etl import catalog
+
+# PostgreSQL para las pruebas de la bodega, p.ej. postgresql+psycopg2://postgres@localhost/etl_test
+TEST_DATABASE_URL = os.environ.get('ETL_TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def pg_url():
+    """URL de un esquema nuevo y vacío (search_path) en la base de prueba; se elimina al terminar"""
+    if not TEST_DATABASE_URL:
+        pytest.skip('ETL_TEST_DATABASE_URL no está definida')
+    schema = f'etl_test_{uuid.uuid4().hex[:8]}'
+    admin = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {schema}'))
+    url = admin.url.update_query_dict({'options': f'-csearch_path={schema}'})
+    try:
+        yield url
+    finally:
+        catalog.invalidate_catalog()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        admin.dispose()
+
+
+@pytest.fixture
+def pg_engine(pg_url):
+    engine = create_engine(pg_url)
+    yield engine
+    engine.dispose()
+
+
+def synthetic_transform_inputs(rows: int, seed: int = 0) -> dict:
+    """
+    Entradas sintéticas con las columnas y tipos de las extracciones, para
+    medir las transformaciones sin conexión: {función: (args...)}
+    """
+    rng = np.random.default_rng(seed)
+    entities = max(rows // 10, 10)
+    dates = pd.date_range('2011-01-01', '2014-12-31', freq='D')
+    order_dates = dates[rng.integers(0, len(dates), rows)]
+    names = np.array(['Ana', 'Luis', 'Marta', 'José', ''], dtype=object)
+    places = np.array(['North Austin', 'South Bend', 'East Ridge', 'Lyon', None], dtype=object)
+
+    def sales(online: bool) -> pd.DataFrame:
+        quantity = rng.integers(1, 10, rows)
+        price = rng.uniform(1, 3000, rows).round(2)
+        df = pd.DataFrame({
+            'SalesOrderID': np.sort(rng.integers(43659, 43659 + rows // 4 + 1, rows)),
+            'OrderDate': order_dates,
+            'DueDate': order_dates + pd.Timedelta(days=12),
+            'ShipDate': order_dates + pd.Timedelta(days=7),
+            'CustomerID': rng.integers(1, entities, rows),
+            'SalesPersonID': rng.integers(274, 290, rows),
+            'TerritoryID': rng.integers(1, 11, rows),
+            'SubTotal': rng.uniform(1, 10000, rows),
+            'TaxAmt': rng.uniform(1, 800, rows),
+            'Freight': rng.uniform(1, 250, rows),
+            'TotalDue': rng.uniform(1, 11000, rows),
+            'SalesOrderDetailID': np.arange(1, rows + 1),
+            'ProductID': rng.integers(1, 505, rows),
+            'OrderQty': quantity,
+            'UnitPrice': price,
+            'UnitPriceDiscount': rng.choice([0.0, 0.02, 0.05], rows),
+            'LineTotal': (quantity * price).round(2),
+            'OnlineOrderFlag': online,
+            'StandardCost': (price * 0.6).round(2),
+            'CurrencyCode': rng.choice(np.array(['USD', 'EUR', 'GBP'], dtype=object), rows)
+        })
+        if not online:
+            df['StoreID'] = rng.integers(1, entities, rows)
+            df['StoreName'] = rng.choice(names, rows)
+        else:
+            df['CustomerPersonID'] = df['CustomerID']
+        return df
+
+    dimensions = {
+        'dim_customer': pd.DataFrame({'customer_key': np.arange(1, entities + 1),
+                                      'customer_id': np.arange(1, entities + 1)}),
+        'dim_product': pd.DataFrame({'product_key': np.arange(1, 506), 'product_id': np.arange(1, 506)}),
+        'dim_date': pd.DataFrame({'date_key': np.arange(1, len(dates) + 1), 'date': dates}),
+        'dim_employee': pd.DataFrame({'employee_key': np.arange(1, 20),
+                                      'business_entity_id': np.arange(274, 293)}),
+        'dim_reseller': pd.DataFrame({'reseller_key': np.arange(1, entities + 1),
+                                      'store_id': np.arange(1, entities + 1)}),
+        'currency_rates': pd.DataFrame({
+            'currency_code': np.repeat(['EUR', 'GBP'], len(dates)),
+            'rate_date': np.tile(dates, 2),
+            'average_rate': rng.uniform(0.6, 0.9, 2 * len(dates))
+        }),
+        'reporting_currency': 'USD'
+    }
+    customers = pd.DataFrame({
+        'CustomerID': np.arange(1, rows + 1),
+        'PersonID': rng.integers(1, rows, rows).astype('float64'),
+        'StoreID': np.where(rng.random(rows) < 0.1, rng.integers(1, 700, rows), np.nan),
+        'FirstName': rng.choice(names, rows),
+        'LastName': rng.choice(names, rows),
+        'EmailAddress': rng.choice(names, rows),
+        'PhoneNumber': rng.choice(names, rows),
+        'EmailPromotion': rng.integers(0, 3, rows),
+        'City': rng.choice(places, rows),
+        'StateProvince': rng.choice(places, rows),
+        'CountryRegion': rng.choice(places, rows)
+    })
+    products = pd.DataFrame({
+        'ProductID': np.arange(1, rows + 1),
+        'ProductName': rng.choice(names, rows),
+        'ProductNumber': rng.choice(names, rows),
+        'Color': rng.choice(names, rows),
+        'Size': rng.choice(names, rows),
+        'Weight': rng.uniform(1, 20, rows),
+        'StandardCost': rng.uniform(1, 1000, rows),
+        'ListPrice': rng.choice([0.0, 50.0, 700.0, 2500.0], rows),
+        'CategoryName': rng.choice(names[:4], rows),
+        'SubcategoryName': rng.choice(names[:4], rows),
+        'ProductModelName': rng.choice(names, rows)
+    })
+    employees = pd.DataFrame({
+        'BusinessEntityID': np.arange(1, rows + 1),
+        'FirstName': rng.choice(names, rows),
+        'LastName': rng.choice(names, rows),
+        'JobTitle': rng.choice(names, rows),
+        'BirthDate': order_dates - pd.Timedelta(days=12000),
+        'HireDate': order_dates,
+        'DepartmentName': rng.choice(np.array(['Sales', 'Executive', 'Production'], dtype=object), rows)
+    })
+    stores = pd.DataFrame({
+        'StoreID': np.arange(1, rows + 1),
+        'StoreName': rng.choice(names, rows),
+        'City': rng.choice(places, rows),
+        'StateProvince': rng.choice(places, rows),
+        'CountryRegion': rng.choice(places, rows)
+    })
+    return {
+        'transform_internet_sales': (sales(True), dimensions),
+        'transform_reseller_sales': (sales(False), dimensions),
+        'transform_customer': (customers,),
+        'transform_product': (products,),
+        'transform_employee': (employees,),
+        'transform_reseller': (stores,)
+    }
+
+
+def transform_peak(fn, *args) -> int:
+    """Pico de memoria asignada (tracemalloc, incluye numpy) durante una llamada, en bytes"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
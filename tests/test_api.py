@@ -0,0 +1,171 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import pytest
+from etl import api, utils_etl
+
+
+def _sales(**columns) -> pd.DataFrame:
+    rows = len(columns['date_key'])
+    measures = {'order_quantity': [1] * rows, 'line_total': [10.0 * (i + 1) for i in range(rows)],
+                'net_sales_amount': [9.0] * rows, 'profit': [4.0] * rows, 'reporting_line_total': [10.0] * rows}
+    return pd.DataFrame({**columns, **measures})
+
+
+@pytest.fixture
+def warehouse(pg_engine):
+    """Dos meses de ventas por internet y una venta de revendedor"""
+    tables = {
+        'dim_date': pd.DataFrame({'date_key': [1, 2, 3],
+                                  'date': pd.to_datetime(['2012-03-01', '2012-03-15', '2012-04-01']).date,
+                                  'year': [2012] * 3, 'month': [3, 3, 4]}),
+        'dim_product': pd.DataFrame({'product_key': [1, 2], 'product_name': ['Bike', 'Helmet'],
+                                     'category_name': ['Bikes', 'Accessories'],
+                                     'subcategory_name': ['Road', 'Helmets']}),
+        'dim_customer': pd.DataFrame({'customer_key': [1], 'country_region': ['United States'],
+                                      'state_province': ['Washington']}),
+        'dim_reseller': pd.DataFrame({'reseller_key': [1], 'store_name': ['Store 1001'],
+                                      'country_region': ['France'], 'state_province': ['Yveline']}),
+        'fact_internet_sales': _sales(date_key=[1, 2, 3], product_key=[1, 2, 2], customer_key=[1, 1, 1]),
+        'fact_reseller_sales': _sales(date_key=[1], product_key=[1], reseller_key=[1])
+    }
+    for table, df in tables.items():
+        df.to_sql(table, pg_engine, index=False)
+    return pg_engine
+
+
+def _add_sale(engine):
+    _sales(date_key=[3], product_key=[1], customer_key=[1]).to_sql('fact_internet_sales', engine, index=False,
+                                                                   if_exists='append')
+
+
+def test_sales_by_date_grains_and_filters(warehouse):
+    datamart = api.DatamartAPI(warehouse)
+    rows, _ = datamart.query('/sales/by-date', {'grain': ['month']})
+    assert [(row['month'], row['order_quantity'], float(row['line_total'])) for row in rows] == [
+        (3, 2, 30.0), (4, 1, 30.0)]
+
+    rows, _ = datamart.query('/sales/by-date', {'grain': ['day'], 'start': ['2012-03-10'], 'end': ['2012-03-31']})
+    assert [str(row['date']) for row in rows] == ['2012-03-15']
+
+
+def test_product_territory_and_reseller_queries(warehouse):
+    datamart = api.DatamartAPI(warehouse)
+    products, _ = datamart.query('/sales/by-product', {'limit': ['1']})
+    assert [row['product_name'] for row in products] == ['Helmet']
+
+    territories, _ = datamart.query('/sales/by-territory', {'fact': ['reseller']})
+    assert [(row['country_region'], row['state_province']) for row in territories] == [('France', 'Yveline')]
+
+    resellers, _ = datamart.query('/sales/by-reseller', {})
+    assert [(row['store_name'], float(row['line_total'])) for row in resellers] == [('Store 1001', 10.0)]
+
+
+@pytest.mark.parametrize('path, params', [
+    ('/sales/by-date', {'fact': ['wholesale']}),
+    ('/sales/by-date', {'grain': ['week']}),
+    ('/sales/by-date', {'start': ['01/03/2012']}),
+    ('/sales/by-product', {'limit': ['muchos']})
+])
+def test_bad_parameters(warehouse, path, params):
+    with pytest.raises(api.BadRequest):
+        api.DatamartAPI(warehouse).query(path, params)
+
+
+def test_repeated_query_is_served_from_the_cache(warehouse):
+    datamart = api.DatamartAPI(warehouse)
+    first, cached = datamart.query('/sales/by-date', {'grain': ['year']})
+    assert not cached
+    # El orden de los parámetros no cambia la llave
+    second, cached = datamart.query('/sales/by-date', {'grain': ['year'], 'fact': ['internet']})
+    assert not cached
+    third, cached = datamart.query('/sales/by-date', {'fact': ['internet'], 'grain': ['year']})
+    assert cached and third == second == first
+    assert datamart.cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('process_name', ['Internet_Sales', 'Microlote', 'ETL_Concurrente',
+                                          'Reparacion_Internet_Sales'])
+def test_fact_load_invalidates_the_cache(warehouse, process_name):
+    utils_etl.log_etl_run(warehouse, 'Internet_Sales', 'Exitoso')
+    datamart = api.DatamartAPI(warehouse, check_interval=0)
+    before, _ = datamart.query('/sales/by-date', {'grain': ['year']})
+    _add_sale(warehouse)
+
+    # Sin registro nuevo en etl_log la caché sigue vigente
+    rows, cached = datamart.query('/sales/by-date', {'grain': ['year']})
+    assert cached and rows == before
+
+    utils_etl.log_etl_run(warehouse, process_name, 'Exitoso')
+    rows, cached = datamart.query('/sales/by-date', {'grain': ['year']})
+    assert not cached and rows[0]['order_quantity'] == 4
+
+
+def test_other_processes_keep_the_cache(warehouse):
+    utils_etl.log_etl_run(warehouse, 'Internet_Sales', 'Exitoso')
+    datamart = api.DatamartAPI(warehouse, check_interval=0)
+    datamart.query('/sales/by-date', {})
+    utils_etl.log_etl_run(warehouse, 'Dimensiones', 'Exitoso')
+    utils_etl.log_etl_run(warehouse, 'Internet_Sales', 'Fallido')
+    assert datamart.query('/sales/by-date', {})[1]
+
+
+def test_generation_is_checked_at_most_every_interval(warehouse):
+    utils_etl.log_etl_run(warehouse, 'Internet_Sales', 'Exitoso')
+    datamart = api.DatamartAPI(warehouse, check_interval=3600)
+    datamart.query('/sales/by-date', {})
+    utils_etl.log_etl_run(warehouse, 'Internet_Sales', 'Exitoso')
+    # Dentro del intervalo no se consulta etl_log: la caché expira después
+    assert datamart.query('/sales/by-date', {})[1]
+
+
+def test_cache_lru_and_ttl(monkeypatch):
+    now = {'t': 0.0}
+    monkeypatch.setattr(api.time, 'monotonic', lambda: now['t'])
+    cache = api.ResultCache(max_entries=2, ttl=10)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    # 'b' es la menos usada
+    assert cache.get('b') is None and cache.get('a') == 1
+
+    now['t'] = 11
+    assert cache.get('a') is None
+    assert cache.stats() == {'entries': 1, 'hits': 2, 'misses': 2, 'max_entries': 2, 'ttl': 10}
+
+
+@pytest.fixture
+def server(warehouse):
+    datamart = api.DatamartAPI(warehouse)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), api.make_handler(datamart))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(url: str) -> tuple:
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_http_routes(server):
+    status, payload = _get(f'{server}/sales/by-date?grain=month')
+    assert status == 200 and not payload['cached']
+    assert payload['rows'][0] == {'year': 2012, 'month': 3, 'order_quantity': 2, 'line_total': 30.0,
+                                  'net_sales_amount': 18.0, 'profit': 8.0, 'reporting_line_total': 20.0}
+    assert _get(f'{server}/sales/by-date?grain=month')[1]['cached']
+
+    assert _get(f'{server}/sales/by-date?grain=week')[0] == 400
+    status, payload = _get(f'{server}/sales/by-customer')
+    assert status == 404 and '/sales/by-date' in payload['routes']
+    status, payload = _get(f'{server}/health')
+    assert status == 200 and payload['cache']['hits'] == 1
@@ -0,0 +1,148 @@
+import asyncio
+import importlib.util
+import re
+import threading
+import pandas as pd
+import pytest
+import yaml
+from sqlalchemy import text
+from etl import async_load
+
+requires_driver = pytest.mark.skipif(
+    not (importlib.util.find_spec('asyncpg') or importlib.util.find_spec('psycopg')),
+    reason='la carga por COPY requiere asyncpg o psycopg 3')
+
+
+def test_dependencies_cover_the_foreign_keys():
+    with open('sqlscripts.yml') as f:
+        ddl = yaml.safe_load(f)
+    for table, script in ddl.items():
+        references = set(re.findall(r'REFERENCES (\w+)\(', script))
+        assert references <= set(async_load.LOAD_DEPENDENCIES.get(table, [])), table
+
+
+def test_only_dependencies_in_the_same_batch_are_awaited(pg_engine):
+    loader = async_load.AsyncLoader(pg_engine)
+    loader.call('dim_product', lambda: 0)
+    loader.call('fact_internet_sales', lambda: 0)
+    assert loader.dependencies('fact_internet_sales') == ['dim_product']
+    assert loader.dependencies('dim_product') == []
+    with pytest.raises(ValueError):
+        loader.call('dim_product', lambda: 0)
+
+
+def test_tables_wait_for_their_dependencies_and_independent_ones_overlap(pg_engine):
+    events = []
+    # Las dos dimensiones solo pasan la barrera si corren a la vez
+    barrier = threading.Barrier(2, timeout=5)
+
+    def load(table_name, rows):
+        events.append(('start', table_name))
+        if table_name.startswith('dim_'):
+            barrier.wait()
+        events.append(('end', table_name))
+        return rows
+
+    loader = async_load.AsyncLoader(pg_engine, pool_size=4)
+    # Encolados en orden inverso: el orden de ejecución lo dan las dependencias
+    loader.call('bridge_order_sales_reason', load, 'bridge_order_sales_reason', 3)
+    loader.call('fact_internet_sales', load, 'fact_internet_sales', 2)
+    loader.call('dim_product', load, 'dim_product', 1)
+    loader.call('dim_customer', load, 'dim_customer', 1)
+    results = loader.run()
+
+    assert {table: result['rows'] for table, result in results.items()} == {
+        'bridge_order_sales_reason': 3, 'fact_internet_sales': 2, 'dim_product': 1, 'dim_customer': 1}
+    position = {event: i for i, event in enumerate(events)}
+    assert position[('end', 'dim_product')] < position[('start', 'fact_internet_sales')]
+    assert position[('end', 'dim_customer')] < position[('start', 'fact_internet_sales')]
+    assert position[('end', 'fact_internet_sales')] < position[('start', 'bridge_order_sales_reason')]
+    assert loader.jobs == {}
+
+
+def test_rows_fall_back_to_the_dataframe_argument(pg_engine):
+    loader = async_load.AsyncLoader(pg_engine)
+    loader.call('dim_product', lambda df, conn: None, pd.DataFrame({'product_id': [1, 2, 3]}), pg_engine)
+    assert loader.run()['dim_product']['rows'] == 3
+
+
+def test_failed_table_skips_its_dependents(pg_engine, capsys):
+    loaded = []
+
+    def fail():
+        raise RuntimeError('llave duplicada')
+
+    loader = async_load.AsyncLoader(pg_engine)
+    loader.call('dim_product', fail)
+    loader.call('dim_customer', lambda: loaded.append('dim_customer'))
+    loader.call('fact_internet_sales', lambda: loaded.append('fact_internet_sales'))
+    loader.call('bridge_order_sales_reason', lambda: loaded.append('bridge_order_sales_reason'))
+
+    with pytest.raises(RuntimeError, match='dim_product, fact_internet_sales, bridge_order_sales_reason'):
+        loader.run()
+    # Las tablas independientes sí se cargan
+    assert loaded == ['dim_customer']
+    out = capsys.readouterr().out
+    assert '✗ Error cargando dim_product: llave duplicada' in out
+    assert '✗ Error cargando bridge_order_sales_reason: no se cargó porque falló fact_internet_sales' in out
+
+
+def test_call_only_batches_need_no_async_driver(pg_engine, monkeypatch):
+    def missing():
+        raise ImportError('sin driver')
+
+    monkeypatch.setattr(async_load, '_driver', missing)
+    loader = async_load.AsyncLoader(pg_engine)
+    loader.call('dim_product', lambda: 5)
+    assert loader.run()['dim_product']['rows'] == 5
+    assert async_load.AsyncLoader(pg_engine).run() == {}
+
+
+def test_connect_params_keep_the_search_path(pg_engine):
+    params = async_load.connect_params(pg_engine)
+    with pg_engine.connect() as conn:
+        schema = conn.execute(text('SELECT current_schema()')).scalar()
+    assert params['search_path'] == schema
+    assert params['database'] == pg_engine.url.database
+
+
+def test_after_watermark():
+    table = pd.DataFrame({'sales_order_id': [1, 2, 3, 4]})
+    assert async_load._after_watermark(table, 'sales_order_id', None) is table
+    assert async_load._after_watermark(table, 'sales_order_id', 2)['sales_order_id'].tolist() == [3, 4]
+    assert async_load._after_watermark(table, 'sales_order_id', 4).empty
+
+
+@pytest.mark.parametrize('rows, chunksize', [(0, 3), (5, 2), (6, 3), (2, 10)])
+def test_csv_chunks_rebuild_the_table(rows, chunksize):
+    table = pd.DataFrame({'id': range(rows), 'name': ['a,b'] * rows, 'value': [None] * rows})
+
+    async def collect():
+        return [chunk async for chunk in async_load._csv_chunks(table, chunksize)]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) == -(-rows // chunksize)
+    assert b''.join(chunks) == table.to_csv(index=False, header=False, na_rep='').encode('utf-8')
+
+
+@requires_driver
+def test_copy_with_replace_and_watermark(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_sales_reason (sales_reason_key INTEGER, sales_reason_name TEXT)'))
+        conn.execute(text('CREATE TABLE fact_internet_sales (sales_order_id INTEGER, line_total NUMERIC)'))
+        conn.execute(text("INSERT INTO dim_sales_reason VALUES (9, 'Anterior')"))
+        conn.execute(text('INSERT INTO fact_internet_sales VALUES (1, 10), (2, 20)'))
+
+    loader = async_load.AsyncLoader(pg_engine, chunksize=2)
+    loader.copy('dim_sales_reason', pd.DataFrame({'sales_reason_key': [1, 2, 3],
+                                                  'sales_reason_name': ['Price', 'Review', None]}), replace=True)
+    loader.copy('fact_internet_sales', pd.DataFrame({'sales_order_id': [1, 2, 3, 4], 'line_total': [10, 20, 30, 40]}),
+                watermark_column='sales_order_id')
+    results = loader.run()
+
+    assert results['dim_sales_reason']['rows'] == 3
+    assert results['fact_internet_sales']['rows'] == 2
+    with pg_engine.connect() as conn:
+        assert conn.execute(text('SELECT sales_reason_key FROM dim_sales_reason ORDER BY 1')).scalars().all() == [1, 2, 3]
+        assert conn.execute(text('SELECT sales_order_id FROM fact_internet_sales ORDER BY 1')).scalars().all() == [
+            1, 2, 3, 4]
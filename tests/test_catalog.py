@@ -0,0 +1,55 @@
+import inspect
+import pandas as pd
+from sqlalchemy import event, text
+from etl import catalog, cli, load, pipeline, reconcile, utils_etl, work_queue
+
+FACT = 'fact_internet_sales'
+
+
+def _plan(engine, query: str) -> str:
+    with engine.connect() as conn:
+        conn.execute(text('SET enable_seqscan = off'))
+        return '\n'.join(conn.execute(text(f'EXPLAIN {query}')).scalars())
+
+
+def test_fact_created_by_to_sql_gets_its_order_index(pg_engine):
+    pd.DataFrame({'sales_order_id': range(43659, 45659), 'sales_order_detail_id': range(2000)}).to_sql(
+        FACT, pg_engine, index=False)
+    assert 'Seq Scan' in _plan(pg_engine, f'SELECT MAX(sales_order_id) FROM {FACT}')
+
+    load.ensure_fact_order_indexes(pg_engine)
+    load.ensure_fact_order_indexes(pg_engine)
+    with pg_engine.connect() as conn:
+        indexes = conn.execute(text('SELECT indexname FROM pg_indexes WHERE tablename = :t'), {'t': FACT}).scalars()
+        assert list(indexes) == [f'{FACT}_order_idx']
+    # La marca de agua del estado ya no recorre el hecho
+    assert 'Index Only Scan Backward' in _plan(pg_engine, f'SELECT MAX(sales_order_id) FROM {FACT}')
+    assert catalog.get_status(pg_engine, refresh=True)[FACT]['watermark'] == 45658
+
+
+def test_status_command_reads_watermarks_once(pg_engine, monkeypatch, capsys):
+    with pg_engine.begin() as conn:
+        conn.execute(text(f'CREATE TABLE {FACT} (sales_order_id INTEGER)'))
+        conn.execute(text(f'INSERT INTO {FACT} VALUES (43659), (43700)'))
+        conn.execute(text('CREATE TABLE etl_log (process_name TEXT, status TEXT, run_timestamp TIMESTAMP)'))
+        conn.execute(text("INSERT INTO etl_log VALUES ('Hechos', 'Exitoso', '2024-05-01 10:00')"))
+    statements = []
+    event.listen(pg_engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    monkeypatch.setattr(cli, '_settings', lambda args: (None, None, None))
+    monkeypatch.setattr(utils_etl, 'create_target_connection', lambda config_target: pg_engine)
+
+    assert cli.main(['status']) == 0
+    assert sum('MAX(sales_order_id)' in statement for statement in statements) == 1
+    out = capsys.readouterr().out
+    assert '(última orden 43700)' in out
+    assert 'Hechos' in out and 'último éxito 2024-05-01 10:00:00' in out
+
+
+def test_every_fact_writer_invalidates_the_api_cache():
+    # Procesos que escriben los hechos: la API solo invalida su caché con los de FACT_PROCESSES
+    writers = {inspect.signature(utils_etl.push_all).parameters['process_name'].default, 'Hechos', 'Microlote',
+               'ETL_Completo'}
+    writers |= {spec['repair_process'] for spec in reconcile.RECONCILE_FACTS.values()}
+    writers |= {spec['process_name'] for spec in work_queue.QUEUE_FACTS.values()}
+    writers |= {process_name for *_, process_name in pipeline.FACT_TASKS.values()}
+    assert writers <= set(catalog.FACT_PROCESSES)
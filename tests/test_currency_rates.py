@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl import transform
+
+# Tasas desordenadas de varias monedas, con fechas que se intercalan entre monedas
+RATES = pd.DataFrame({
+    'currency_code': ['EUR', 'GBP', 'EUR', 'JPY', 'GBP', 'EUR', 'JPY'],
+    'rate_date': pd.to_datetime(['2012-03-10', '2012-03-01', '2012-03-01', '2012-03-05', '2012-03-20',
+                                 '2012-03-20', '2012-03-15']),
+    'average_rate': [0.76, 0.63, 0.75, 81.0, 0.64, 0.77, 83.0]
+})
+
+# (moneda, día, caso)
+CASES = [
+    ('EUR', '2012-03-01', 'tasa del mismo día'),
+    ('EUR', '2012-03-09', 'última tasa anterior'),
+    ('EUR', '2012-03-10', 'tasa del mismo día'),
+    ('EUR', '2012-04-30', 'después de la última tasa'),
+    ('EUR', '2012-02-01', 'antes de la primera tasa: primera tasa'),
+    ('GBP', '2012-03-15', 'última tasa anterior'),
+    ('GBP', '2012-02-28', 'antes de la primera tasa: primera tasa'),
+    # La tasa previa en la tabla ordenada es de EUR, no debe filtrarse a JPY
+    ('JPY', '2012-03-02', 'antes de la primera tasa: primera tasa'),
+    ('JPY', '2012-03-16', 'última tasa anterior'),
+    # GBP sigue a EUR en la tabla: su primera tasa no es la última de EUR
+    ('GBP', '2011-12-31', 'antes de la primera tasa: primera tasa'),
+]
+
+
+def _reference(queries: pd.DataFrame) -> np.ndarray:
+    """Misma búsqueda con pd.merge_asof: hacia atrás y, si no hay tasa previa, la primera"""
+    rates = RATES.sort_values('rate_date')
+    ordered = queries.reset_index().sort_values('day')
+    backward = pd.merge_asof(ordered, rates, left_on='day', right_on='rate_date', by='currency_code',
+                             direction='backward')
+    forward = pd.merge_asof(ordered, rates, left_on='day', right_on='rate_date', by='currency_code',
+                            direction='forward')
+    rate = backward['average_rate'].fillna(forward['average_rate'])
+    return rate.set_axis(backward['index']).sort_index().to_numpy()
+
+
+def _lookup(currency_codes, days) -> np.ndarray:
+    table = transform.prepare_currency_rates(RATES)
+    day_numbers = pd.to_datetime(pd.Series(days)).to_numpy(dtype='datetime64[D]').astype('int64')
+    return transform.lookup_rates(table, transform._rate_codes(table, currency_codes), day_numbers)
+
+
+@pytest.mark.parametrize('currency, day, case', CASES, ids=[f'{c}-{d}' for c, d, _ in CASES])
+def test_rate_matches_merge_asof(currency, day, case):
+    queries = pd.DataFrame({'currency_code': [currency], 'day': pd.to_datetime([day])})
+    assert _lookup([currency], [day]) == pytest.approx(_reference(queries)), case
+
+
+def test_all_cases_in_one_vectorized_call():
+    queries = pd.DataFrame({'currency_code': [c for c, _, _ in CASES], 'day': pd.to_datetime([d for _, d, _ in CASES])})
+    np.testing.assert_allclose(_lookup(queries['currency_code'], queries['day']), _reference(queries))
+
+
+def test_base_currency_and_unknown_currency():
+    rates = _lookup(['USD', 'CAD', None, 'EUR'], ['2012-03-05'] * 4)
+    # Moneda base (y sin moneda) = 1; moneda sin tasas = NaN
+    assert rates[0] == 1.0 and rates[2] == 1.0
+    assert np.isnan(rates[1])
+    assert rates[3] == 0.75
+
+
+def test_empty_rate_table():
+    table = transform.prepare_currency_rates(None)
+    codes = transform._rate_codes(table, ['USD', 'EUR'])
+    rates = transform.lookup_rates(table, codes, np.array([15400, 15400]))
+    assert rates[0] == 1.0 and np.isnan(rates[1])
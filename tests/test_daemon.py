@@ -0,0 +1,185 @@
+import re
+import pandas as pd
+import pytest
+import yaml
+from sqlalchemy import event, text
+from etl import daemon, source_probe, utils_etl
+
+ORDERS = list(range(43659, 43669))
+# La última orden es de un cliente que aún no está en dim_customer
+UNKNOWN_CUSTOMER_ORDER = ORDERS[-1]
+
+
+def _top_as_limit(conn, cursor, statement, parameters, context, executemany):
+    """SQLite no tiene TOP: el subquery de max_orders pasa a LIMIT con el mismo parámetro"""
+    marker = 'SELECT TOP (?) '
+    if marker not in statement:
+        return statement, parameters
+    params = list(parameters)
+    limit = params.pop(statement[:statement.index(marker)].count('?'))
+    statement = statement.replace(marker, 'SELECT ')
+    subquery_end = statement.index('ORDER BY b.SalesOrderID') + len('ORDER BY b.SalesOrderID')
+    params.insert(statement[:subquery_end].count('?'), limit)
+    return statement[:subquery_end] + ' LIMIT ?' + statement[subquery_end:], tuple(params)
+
+
+def _add_orders(engine, order_ids):
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT INTO Sales.SalesOrderHeader
+            VALUES (:id, '2012-03-01', '2012-03-13', '2012-03-08', :customer, NULL, 1, 20, 1.6, 0.5, 22.1, 1, NULL)
+        '''), [{'id': order_id, 'customer': 2 if order_id == UNKNOWN_CUSTOMER_ORDER else 1}
+               for order_id in order_ids])
+        conn.execute(text('INSERT INTO Sales.SalesOrderDetail VALUES (:id, :id, 1, 2, 10, 0, 20)'),
+                     [{'id': order_id} for order_id in order_ids])
+        conn.execute(text('INSERT INTO Sales.SalesOrderHeaderSalesReason VALUES (:id, 1)'),
+                     [{'id': order_id} for order_id in order_ids])
+
+
+@pytest.fixture
+def source():
+    engine = source_probe.standin_engine()
+    event.listen(engine, 'before_cursor_execute', _top_as_limit, retval=True)
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderHeader (SalesOrderID, OrderDate, DueDate, ShipDate, CustomerID,
+                SalesPersonID, TerritoryID, SubTotal, TaxAmt, Freight, TotalDue, OnlineOrderFlag, CurrencyRateID)
+        '''))
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderDetail (SalesOrderID, SalesOrderDetailID, ProductID, OrderQty, UnitPrice,
+                UnitPriceDiscount, LineTotal)
+        '''))
+        conn.execute(text('CREATE TABLE Sales.Customer (CustomerID, PersonID, StoreID)'))
+        conn.execute(text('CREATE TABLE Sales.Store (BusinessEntityID, Name)'))
+        conn.execute(text('CREATE TABLE Production.Product (ProductID, StandardCost)'))
+        conn.execute(text('CREATE TABLE Sales.CurrencyRate (CurrencyRateID, ToCurrencyCode)'))
+        conn.execute(text('CREATE TABLE Sales.SalesOrderHeaderSalesReason (SalesOrderID, SalesReasonID)'))
+        conn.execute(text('INSERT INTO Sales.Customer VALUES (1, 1, NULL), (2, 2, NULL)'))
+        conn.execute(text('INSERT INTO Production.Product VALUES (1, 5)'))
+    _add_orders(engine, ORDERS)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def warehouse(pg_engine):
+    """Dimensiones mínimas, los hechos y el puente con su DDL (sin llaves foráneas)"""
+    with open('sqlscripts.yml') as f:
+        ddl = yaml.safe_load(f)
+    with pg_engine.begin() as conn:
+        for table in ['fact_internet_sales', 'fact_reseller_sales', 'bridge_order_sales_reason']:
+            conn.execute(text(re.sub(r'REFERENCES \w+\(\w+\)', '', ddl[table])))
+    dims = {
+        'dim_customer': pd.DataFrame({'customer_key': [10], 'customer_id': [1]}),
+        'dim_product': pd.DataFrame({'product_key': [5], 'product_id': [1]}),
+        'dim_date': pd.DataFrame({'date_key': [1], 'date': [pd.Timestamp('2012-03-01')], 'year': [2012],
+                                  'month': [3]}),
+        'dim_territory': pd.DataFrame({'territory_key': pd.Series([], dtype='int64')}),
+        'dim_currency': pd.DataFrame({'currency_key': pd.Series([], dtype='int64')}),
+        'dim_employee': pd.DataFrame({'employee_key': pd.Series([], dtype='int64'),
+                                      'business_entity_id': pd.Series([], dtype='int64')}),
+        'dim_reseller': pd.DataFrame({'reseller_key': pd.Series([], dtype='int64'),
+                                      'store_id': pd.Series([], dtype='int64')})
+    }
+    for table, df in dims.items():
+        df.to_sql(table, pg_engine, index=False)
+    return pg_engine
+
+
+def _scalar(engine, query: str):
+    with engine.connect() as conn:
+        return conn.execute(text(query)).scalar()
+
+
+def _extractions(engine) -> list:
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement)
+                 if 'FROM Sales.SalesOrderHeader soh' in statement else None)
+    return statements
+
+
+def test_new_orders_load_in_micro_batches(source, warehouse):
+    worker = daemon.MicroBatchDaemon(source, warehouse, max_orders=4)
+    worker.warm()
+    assert worker.watermarks == {'fact_internet_sales': 0, 'fact_reseller_sales': 0, 'bridge_order_sales_reason': 0}
+
+    # 9 filas limpias; la del cliente desconocido va a cuarentena sin frenar el lote
+    assert worker.run_once() == 9
+    assert worker.stats['batches'] == 3
+    assert worker.watermarks == {fact: ORDERS[-1] for fact in worker.watermarks}
+    assert _scalar(warehouse, 'SELECT COUNT(*) FROM fact_internet_sales') == 9
+    assert _scalar(warehouse, 'SELECT sales_order_id FROM etl_quarantine') == UNKNOWN_CUSTOMER_ORDER
+    assert _scalar(warehouse, 'SELECT COUNT(*) FROM bridge_order_sales_reason') == len(ORDERS)
+    assert _scalar(warehouse, "SELECT records_processed FROM etl_log WHERE process_name = 'Microlote'") == 9
+
+
+def test_cycle_without_new_orders_only_probes(source, warehouse):
+    worker = daemon.MicroBatchDaemon(source, warehouse, max_orders=100)
+    worker.warm()
+    worker.run_once()
+    extractions = _extractions(source)
+
+    assert worker.run_once() == 0
+    assert extractions == []
+    _add_orders(source, [ORDERS[-1] + 1])
+    assert worker.run_once() == 1
+    assert len(extractions) == 2
+
+
+def test_warm_restarts_from_the_warehouse_watermarks(source, warehouse):
+    daemon.MicroBatchDaemon(source, warehouse, max_orders=100).run(max_cycles=1)
+    _add_orders(source, [ORDERS[-1] + 1, ORDERS[-1] + 2])
+
+    # Un proceso nuevo continúa desde la bodega y no duplica filas
+    restarted = daemon.MicroBatchDaemon(source, warehouse, max_orders=100, interval=0)
+    stats = restarted.run(max_cycles=1)
+    assert stats['rows'] == 2
+    assert _scalar(warehouse, 'SELECT COUNT(*) FROM fact_internet_sales') == 11
+
+
+def test_retried_batch_replaces_its_order_range(source, warehouse):
+    worker = daemon.MicroBatchDaemon(source, warehouse, max_orders=100)
+    worker.warm()
+    worker.run_once()
+    # Falla tras confirmar el lote y antes de avanzar la marca: el reintento borra y recarga el rango
+    worker.watermarks['fact_internet_sales'] = ORDERS[2]
+    worker.process_fact('fact_internet_sales', ORDERS[-1])
+    assert _scalar(warehouse, 'SELECT COUNT(*) FROM fact_internet_sales') == 9
+    assert _scalar(warehouse, 'SELECT COUNT(DISTINCT sales_order_detail_id) FROM fact_internet_sales') == 9
+
+
+def test_dimension_load_refreshes_the_cached_dimensions(source, warehouse):
+    worker = daemon.MicroBatchDaemon(source, warehouse, max_orders=100)
+    worker.warm()
+    assert not worker._dimensions_stale()
+
+    with warehouse.begin() as conn:
+        conn.execute(text('INSERT INTO dim_customer VALUES (20, 2)'))
+    utils_etl.log_etl_run(warehouse, 'Dimensiones', 'Exitoso')
+    assert worker._dimensions_stale()
+
+    # El ciclo relee dim_customer y el cliente 2 ya no es huérfano
+    assert worker.run_once() == len(ORDERS)
+    assert _scalar(warehouse, 'SELECT customer_key FROM fact_internet_sales WHERE sales_order_id = '
+                              f'{UNKNOWN_CUSTOMER_ORDER}') == 20
+
+
+def test_failed_cycle_is_logged_and_retried(source, warehouse, monkeypatch):
+    worker = daemon.MicroBatchDaemon(source, warehouse, max_orders=100, interval=0)
+    calls = []
+    original = worker.process_fact
+
+    def flaky(fact_name, until_order_id):
+        calls.append(fact_name)
+        if len(calls) == 1:
+            raise RuntimeError('conexión perdida')
+        return original(fact_name, until_order_id)
+
+    monkeypatch.setattr(worker, 'process_fact', flaky)
+    stats = worker.run(max_cycles=2)
+
+    assert stats['errors'] == 1 and stats['rows'] == 9
+    with warehouse.connect() as conn:
+        assert conn.execute(text("SELECT status FROM etl_log WHERE process_name = 'Microlote' ORDER BY log_id")
+                            ).scalars().all() == ['Fallido', 'Exitoso']
@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from etl import extract, source_probe, transform
+
+
+def _table(conn, name: str, rows: list):
+    columns = list(rows[0])
+    conn.execute(text(f"CREATE TABLE {name} ({', '.join(columns)})"))
+    conn.execute(text(f"INSERT INTO {name} VALUES ({', '.join(':' + col for col in columns)})"), rows)
+
+
+@pytest.fixture
+def source():
+    """
+    Persona 1 con dos emails, dos teléfonos y dos direcciones; persona 2 con
+    uno de cada uno; persona 3 sin contactos; la tienda 1001 con dos direcciones
+    """
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        _table(conn, 'Sales.Customer', [
+            {'CustomerID': 11, 'PersonID': 1, 'StoreID': None},
+            {'CustomerID': 12, 'PersonID': 2, 'StoreID': None},
+            {'CustomerID': 13, 'PersonID': 3, 'StoreID': None},
+            {'CustomerID': 14, 'PersonID': None, 'StoreID': 1001}
+        ])
+        _table(conn, 'Person.Person', [{'BusinessEntityID': i, 'FirstName': f'N{i}', 'LastName': f'L{i}',
+                                        'EmailPromotion': 0} for i in (1, 2, 3)])
+        _table(conn, 'Person.EmailAddress', [
+            {'BusinessEntityID': 1, 'EmailAddressID': 1, 'EmailAddress': 'old@aw.com', 'ModifiedDate': '2012-01-01'},
+            {'BusinessEntityID': 1, 'EmailAddressID': 2, 'EmailAddress': 'new@aw.com', 'ModifiedDate': '2014-01-01'},
+            {'BusinessEntityID': 2, 'EmailAddressID': 3, 'EmailAddress': 'two@aw.com', 'ModifiedDate': '2012-01-01'}
+        ])
+        _table(conn, 'Person.PhoneNumberType', [{'PhoneNumberTypeID': 1, 'Name': 'Cell'},
+                                                {'PhoneNumberTypeID': 3, 'Name': 'Work'}])
+        _table(conn, 'Person.PersonPhone', [
+            # El de trabajo es más reciente, pero Cell va primero en las preferencias
+            {'BusinessEntityID': 1, 'PhoneNumber': '555-0003', 'PhoneNumberTypeID': 3, 'ModifiedDate': '2014-01-01'},
+            {'BusinessEntityID': 1, 'PhoneNumber': '555-0001', 'PhoneNumberTypeID': 1, 'ModifiedDate': '2012-01-01'},
+            {'BusinessEntityID': 2, 'PhoneNumber': '555-0002', 'PhoneNumberTypeID': 3, 'ModifiedDate': '2012-01-01'}
+        ])
+        _table(conn, 'Person.AddressType', [{'AddressTypeID': 2, 'Name': 'Home'}, {'AddressTypeID': 3, 'Name': 'Main Office'},
+                                            {'AddressTypeID': 5, 'Name': 'Shipping'}])
+        _table(conn, 'Person.BusinessEntityAddress', [
+            {'BusinessEntityID': 1, 'AddressID': 1, 'AddressTypeID': 5, 'ModifiedDate': '2014-01-01'},
+            {'BusinessEntityID': 1, 'AddressID': 2, 'AddressTypeID': 2, 'ModifiedDate': '2012-01-01'},
+            {'BusinessEntityID': 2, 'AddressID': 3, 'AddressTypeID': 2, 'ModifiedDate': '2012-01-01'},
+            {'BusinessEntityID': 1001, 'AddressID': 4, 'AddressTypeID': 5, 'ModifiedDate': '2014-01-01'},
+            {'BusinessEntityID': 1001, 'AddressID': 5, 'AddressTypeID': 3, 'ModifiedDate': '2011-01-01'},
+            {'BusinessEntityID': 1001, 'AddressID': 6, 'AddressTypeID': 3, 'ModifiedDate': '2013-01-01'}
+        ])
+        _table(conn, 'Person.Address', [{'AddressID': i, 'AddressLine1': f'{i} Main St', 'City': 'Seattle',
+                                         'PostalCode': '98101', 'StateProvinceID': 1} for i in range(1, 7)])
+        _table(conn, 'Person.StateProvince', [{'StateProvinceID': 1, 'Name': 'Washington', 'CountryRegionCode': 'US'}])
+        _table(conn, 'Person.CountryRegion', [{'CountryRegionCode': 'US', 'Name': 'United States'}])
+        _table(conn, 'Sales.Store', [{'BusinessEntityID': 1001, 'Name': 'Store 1001', 'SalesPersonID': None}])
+    yield engine
+    engine.dispose()
+
+
+def test_one_row_per_customer_by_preference(source, capsys):
+    customers = extract.extract_customers(source).set_index('CustomerID')
+
+    assert list(customers.index) == [11, 12, 13, 14]
+    assert 'CollapsedRows' not in customers.columns
+    # Email más reciente, teléfono Cell antes que Work, dirección Home antes que Shipping
+    assert customers.loc[11, ['EmailAddress', 'PhoneNumber', 'AddressLine1']].tolist() == [
+        'new@aw.com', '555-0001', '2 Main St']
+    assert customers.loc[12, ['EmailAddress', 'PhoneNumber', 'AddressLine1']].tolist() == [
+        'two@aw.com', '555-0002', '3 Main St']
+    assert customers.loc[[13, 14], 'EmailAddress'].isna().all()
+    # El join anterior daba 2 x 2 x 2 filas para el cliente 11
+    assert 'Clientes: 4 filas extraídas, 7 filas duplicadas colapsadas en origen' in capsys.readouterr().out
+
+
+def test_customer_preferences_are_configurable(source):
+    customers = extract.extract_customers(source, preferences={'phone_types': ['Work', 'Cell'],
+                                                               'address_types': []})
+    customer = customers.set_index('CustomerID').loc[11]
+    # Sin preferencia de tipo de dirección decide la más reciente
+    assert customer[['PhoneNumber', 'AddressLine1']].tolist() == ['555-0003', '1 Main St']
+
+
+def test_one_row_per_store_with_recent_tie_break(source, capsys):
+    stores = extract.extract_stores(source)
+
+    # Main Office antes que Shipping; entre las dos Main Office, la más reciente
+    assert stores[['StoreID', 'AddressID']].values.tolist() == [[1001, 6]]
+    assert 'Tiendas: 1 filas extraídas, 2 filas duplicadas colapsadas en origen' in capsys.readouterr().out
+
+
+def test_transform_keeps_the_first_row_per_entity(capsys):
+    stores = pd.DataFrame({'StoreID': [1001, 1001, 1002], 'StoreName': ['A', 'B', 'C']})
+    deduplicated = transform.deduplicate_entities(stores, ['StoreID'], 'dim_reseller')
+    assert deduplicated['StoreName'].tolist() == ['A', 'C']
+    assert "1 filas duplicadas por ['StoreID'] colapsadas en dim_reseller" in capsys.readouterr().out
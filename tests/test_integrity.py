@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event, text
+from etl import extract, integrity, source_probe
+
+ORDERS = range(43659, 43659 + 3000)
+
+
+@pytest.fixture
+def source():
+    """Órdenes por internet con una línea cada una: solo las tablas que une extract_internet_sales"""
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderHeader (SalesOrderID, OrderDate, DueDate, ShipDate, CustomerID,
+                SalesPersonID, TerritoryID, SubTotal, TaxAmt, Freight, TotalDue, OnlineOrderFlag, CurrencyRateID)
+        '''))
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderDetail (SalesOrderID, SalesOrderDetailID, ProductID, OrderQty, UnitPrice,
+                UnitPriceDiscount, LineTotal)
+        '''))
+        conn.execute(text('CREATE TABLE Sales.Customer (CustomerID, PersonID)'))
+        conn.execute(text('CREATE TABLE Production.Product (ProductID, StandardCost)'))
+        conn.execute(text('CREATE TABLE Sales.CurrencyRate (CurrencyRateID, ToCurrencyCode)'))
+        conn.execute(text('''
+            INSERT INTO Sales.SalesOrderHeader
+            VALUES (:id, '2012-03-01', '2012-03-13', '2012-03-08', 1, NULL, 1, 20, 1.6, 0.5, 22.1, 1, NULL)
+        '''), [{'id': order_id} for order_id in ORDERS])
+        conn.execute(text('INSERT INTO Sales.SalesOrderDetail VALUES (:id, :id, 1, 1, 20, 0, 20)'),
+                     [{'id': order_id} for order_id in ORDERS])
+        conn.execute(text('INSERT INTO Sales.Customer VALUES (1, 1)'))
+        conn.execute(text('INSERT INTO Production.Product VALUES (1, 10)'))
+    yield engine
+    engine.dispose()
+
+
+def test_sparse_quarantine_is_extracted_in_bounded_batches(source):
+    # Órdenes dispersas: antes, una consulta por orden
+    quarantined = list(ORDERS)[::2] + [ORDERS[0]]
+    batches = integrity._order_batches(quarantined)
+    assert [len(batch) for batch in batches] == [1000, 500]
+
+    statements = []
+    event.listen(source, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    extracted = [extract.extract_internet_sales(source, start_date=None, order_ids=batch) for batch in batches]
+
+    assert len(statements) == len(batches)
+    assert [sorted(df['SalesOrderID']) for df in extracted] == batches
+
+
+def test_empty_order_list_extracts_nothing(source):
+    assert extract.extract_internet_sales(source, start_date=None, order_ids=[]).empty
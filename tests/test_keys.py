@@ -0,0 +1,91 @@
+import pandas as pd
+from sqlalchemy import event, text
+from etl import keys
+
+
+def _customers(ids) -> pd.DataFrame:
+    return pd.DataFrame({'customer_id': ids, 'first_name': [f'N{i}' for i in ids]})
+
+
+def _sequence_value(engine, sequence: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT last_value FROM {sequence}')).scalar()
+
+
+def _nextval_trips(engine) -> list:
+    trips = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: trips.append(statement) if 'nextval' in statement else None)
+    return trips
+
+
+def test_new_members_take_keys_from_reserved_blocks(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_customer (customer_key SERIAL PRIMARY KEY, customer_id INTEGER)'))
+        conn.execute(text('INSERT INTO dim_customer (customer_id) VALUES (100), (101), (102)'))
+    allocator = keys.KeyAllocator(pg_engine, block_size=5)
+    trips = _nextval_trips(pg_engine)
+
+    first = allocator.assign(_customers([100, 200, 201, 200]), 'dim_customer')
+    assert list(first.columns) == ['customer_key', 'customer_id', 'first_name']
+    # Conocidos conservan su llave; los nuevos (sin repetir) toman llaves del bloque 4..8
+    assert first['customer_key'].tolist() == [1, 4, 5, 4]
+    assert allocator.pools['dim_customer'].tolist() == [6, 7, 8]
+    assert _sequence_value(pg_engine, 'dim_customer_customer_key_seq') == 8
+
+    # Cruza el borde del bloque: usa las 3 llaves que quedaban y reserva un bloque más
+    second = allocator.assign(_customers([201, 202, 203, 204, 205]), 'dim_customer')
+    assert second['customer_key'].tolist() == [5, 6, 7, 8, 9]
+    assert allocator.pools['dim_customer'].tolist() == [10, 11, 12, 13]
+    assert _sequence_value(pg_engine, 'dim_customer_customer_key_seq') == 13
+    assert len(trips) == 2
+
+    # Cabe en lo que queda del bloque: sin viaje a PostgreSQL
+    allocator.assign(_customers([206]), 'dim_customer')
+    assert len(trips) == 2
+
+
+def test_only_new_returns_the_new_members(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_customer (customer_key SERIAL PRIMARY KEY, customer_id INTEGER)'))
+        conn.execute(text('INSERT INTO dim_customer (customer_id) VALUES (100)'))
+    allocator = keys.KeyAllocator(pg_engine, block_size=10)
+
+    new = allocator.assign(_customers([100, 300, 301]), 'dim_customer', only_new=True)
+    assert new[['customer_key', 'customer_id']].values.tolist() == [[2, 300], [3, 301]]
+    assert list(new.index) == [0, 1]
+    assert allocator.assign(_customers([100, 300]), 'dim_customer', only_new=True).empty
+
+
+def test_duplicated_members_keep_the_oldest_key(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_customer (customer_key SERIAL PRIMARY KEY, customer_id INTEGER)'))
+        # Una carga anterior duplicó al cliente 100
+        conn.execute(text('INSERT INTO dim_customer (customer_key, customer_id) VALUES (7, 100), (3, 100), (5, 101)'))
+        conn.execute(text("SELECT setval('dim_customer_customer_key_seq', 7)"))
+    allocator = keys.KeyAllocator(pg_engine)
+
+    assert allocator.assign(_customers([100, 101]), 'dim_customer')['customer_key'].tolist() == [3, 5]
+    assert allocator.key_frame('dim_customer').values.tolist() == [[3, 100], [5, 101]]
+
+
+def test_dimension_without_serial_gets_its_own_sequence(pg_engine):
+    with pg_engine.begin() as conn:
+        # Tabla creada por to_sql: la llave es un entero sin secuencia
+        conn.execute(text('CREATE TABLE dim_reseller (reseller_key BIGINT, store_id INTEGER)'))
+        conn.execute(text('INSERT INTO dim_reseller VALUES (10, 1001), (20, 1002)'))
+    allocator = keys.KeyAllocator(pg_engine, block_size=3)
+
+    stores = pd.DataFrame({'store_id': [1001, 1003]})
+    assert allocator.assign(stores, 'dim_reseller')['reseller_key'].tolist() == [10, 21]
+    assert allocator.sequences['dim_reseller'] == 'dim_reseller_reseller_key_seq'
+    assert _sequence_value(pg_engine, 'dim_reseller_reseller_key_seq') == 23
+
+    # Otro proceso sigue desde la secuencia, no desde la mayor llave de la tabla
+    other = keys.KeyAllocator(pg_engine, block_size=3)
+    assert other.assign(pd.DataFrame({'store_id': [1004]}), 'dim_reseller')['reseller_key'].tolist() == [24]
+
+
+def test_missing_dimension_starts_from_one(pg_engine):
+    allocator = keys.KeyAllocator(pg_engine, block_size=2)
+    assert allocator.assign(_customers([1, 2, 3]), 'dim_customer')['customer_key'].tolist() == [1, 2, 3]
@@ -0,0 +1,133 @@
+import uuid
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from etl import catalog, load
+
+FACT = 'fact_internet_sales'
+
+
+@pytest.fixture
+def reader(pg_engine):
+    """Rol de solo lectura; se quitan sus privilegios y se elimina al terminar"""
+    role = f'etl_reader_{uuid.uuid4().hex[:8]}'
+    with pg_engine.begin() as conn:
+        conn.execute(text(f'CREATE ROLE {role}'))
+    try:
+        yield role
+    finally:
+        with pg_engine.begin() as conn:
+            conn.execute(text(f'DROP OWNED BY {role}'))
+            conn.execute(text(f'DROP ROLE {role}'))
+
+
+@pytest.fixture
+def fact(pg_engine, reader):
+    with pg_engine.begin() as conn:
+        conn.execute(text(f'''
+            CREATE TABLE {FACT} (sales_order_detail_id INTEGER PRIMARY KEY, sales_order_id INTEGER,
+                                 line_total NUMERIC(12, 2))
+        '''))
+        conn.execute(text(f'INSERT INTO {FACT} VALUES (1, 10, 5.00), (2, 10, 7.50)'))
+        conn.execute(text(f'GRANT SELECT ON {FACT} TO {reader}'))
+        conn.execute(text(f'GRANT UPDATE (line_total) ON {FACT} TO {reader}'))
+        # Vista sobre vista para comprobar el orden de recreación
+        conn.execute(text(f'''
+            CREATE VIEW order_totals AS
+            SELECT sales_order_id, SUM(line_total) AS total FROM {FACT} GROUP BY sales_order_id
+        '''))
+        conn.execute(text('''
+            CREATE VIEW big_orders WITH (security_barrier) AS
+            SELECT * FROM order_totals WHERE total > 10 AND sales_order_id::text NOT LIKE '%9'
+        '''))
+        conn.execute(text(f'GRANT SELECT ON big_orders TO {reader}'))
+        conn.execute(text("COMMENT ON VIEW big_orders IS 'órdenes grandes'"))
+    catalog.invalidate_catalog()
+    return pg_engine
+
+
+def _privileges(conn, relation) -> set:
+    return set(conn.execute(text('''
+        SELECT grantee, privilege_type FROM information_schema.role_table_grants
+        WHERE table_name = :relation AND table_schema = current_schema()
+    '''), {'relation': relation}).all())
+
+
+def _column_privileges(conn, grantee) -> set:
+    return set(conn.execute(text('''
+        SELECT column_name, privilege_type FROM information_schema.column_privileges
+        WHERE table_name = :table_name AND table_schema = current_schema() AND grantee = :grantee
+    '''), {'table_name': FACT, 'grantee': grantee}).all())
+
+
+def test_swap_keeps_grants_and_recreates_dependent_views(fact, reader):
+    with fact.connect() as conn:
+        grants_before = _privileges(conn, FACT)
+        columns_before = _column_privileges(conn, reader)
+    load.load_swap(pd.DataFrame({'sales_order_detail_id': [1, 2, 3], 'sales_order_id': [10, 11, 11],
+                                 'line_total': [5.00, 8.00, 9.00]}), fact, FACT)
+
+    with fact.connect() as conn:
+        assert _privileges(conn, FACT) == grants_before
+        assert (reader, 'SELECT') in _privileges(conn, FACT)
+        assert _column_privileges(conn, reader) == columns_before
+        assert ('line_total', 'UPDATE') in columns_before
+        assert ('sales_order_id', 'UPDATE') not in columns_before
+        assert (reader, 'SELECT') in _privileges(conn, 'big_orders')
+        assert conn.execute(text("SELECT obj_description('big_orders'::regclass, 'pg_class')")).scalar() == \
+            'órdenes grandes'
+        assert conn.execute(text("SELECT reloptions FROM pg_class WHERE oid = 'big_orders'::regclass")).scalar() == \
+            ['security_barrier=true']
+        # Las vistas leen la tabla nueva
+        assert conn.execute(text('SELECT sales_order_id, total FROM big_orders')).all() == [(11, 17)]
+        assert conn.execute(text('SELECT COUNT(*) FROM order_totals')).scalar() == 2
+
+
+def test_materialized_view_falls_back_to_delete_and_append(fact):
+    with fact.begin() as conn:
+        conn.execute(text(f'CREATE MATERIALIZED VIEW order_count AS SELECT COUNT(*) AS n FROM {FACT}'))
+    load.load_swap(pd.DataFrame({'sales_order_detail_id': [7], 'sales_order_id': [12], 'line_total': [1.00]}),
+                   fact, FACT)
+    with fact.connect() as conn:
+        assert conn.execute(text(f'SELECT sales_order_detail_id FROM {FACT}')).scalars().all() == [7]
+        assert conn.execute(text("SELECT to_regclass('order_count') IS NOT NULL")).scalar()
+
+
+@pytest.fixture
+def dimension(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE dim_reseller (reseller_key SERIAL PRIMARY KEY, store_id INTEGER, store_name TEXT,
+                                       first_order DATE)
+        '''))
+        conn.execute(text("INSERT INTO dim_reseller (store_id, store_name) VALUES (1001, 'Old'), (1002, 'Same')"))
+    return pg_engine
+
+
+def _staging_tables(engine) -> list:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT relname FROM pg_class WHERE relname LIKE '\\_stage\\_%'")).scalars().all()
+
+
+def test_merge_dimension_updates_and_inserts_by_natural_key(dimension):
+    changes = pd.DataFrame({'reseller_key': [1, 3], 'store_id': [1001, 1003], 'store_name': ['New', 'Added'],
+                            'first_order': pd.to_datetime(['2012-03-01', None])})
+    assert load.merge_dimension(changes, dimension, 'dim_reseller', 'store_id') == (1, 1)
+
+    with dimension.connect() as conn:
+        rows = conn.execute(text('SELECT reseller_key, store_id, store_name, first_order::text FROM dim_reseller '
+                                 'ORDER BY reseller_key')).all()
+    assert rows == [(1, 1001, 'New', '2012-03-01'), (2, 1002, 'Same', None), (3, 1003, 'Added', None)]
+    # La tabla de paso temporal no queda en la bodega
+    assert _staging_tables(dimension) == []
+
+
+def test_failed_merge_drops_its_staging_table(dimension):
+    # La fecha inválida falla en el COPY, dentro de la transacción
+    bad = pd.DataFrame({'reseller_key': [1], 'store_id': [1001], 'first_order': ['no es fecha']})
+    with pytest.raises(Exception):
+        load.merge_dimension(bad, dimension, 'dim_reseller', 'store_id')
+    assert _staging_tables(dimension) == []
+    # Una nueva carga en el mismo pool no choca con la tabla de paso anterior
+    assert load.merge_dimension(bad.assign(first_order=['2012-01-01']), dimension, 'dim_reseller',
+                                'store_id') == (1, 0)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl import memory, utils_etl
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """RSS del proceso controlado por la prueba"""
+    current = {'bytes': 0}
+    monkeypatch.setattr(memory, 'current_rss', lambda: current['bytes'])
+    return current
+
+
+def _frame(rows: int, row_bytes: int = 8) -> pd.DataFrame:
+    return pd.DataFrame({f'c{i}': np.zeros(rows, dtype='int64') for i in range(row_bytes // 8)},
+                        index=pd.RangeIndex(rows))
+
+
+def _governor(**options) -> memory.MemoryGovernor:
+    defaults = {'min_rows': 10, 'max_rows': 1_000_000, 'initial_rows': 1000, 'safety': 1.0, 'smoothing': 0.5,
+                'verbose': False}
+    return memory.MemoryGovernor(100, **{**defaults, **options})
+
+
+def test_from_settings_needs_a_budget():
+    assert memory.MemoryGovernor.from_settings({}) is None
+    governor = memory.MemoryGovernor.from_settings({'memory_budget_mb': 256, 'memory_min_rows': 50,
+                                                    'memory_initial_rows': 500})
+    assert (governor.budget, governor.min_rows, governor.last_rows['extract']) == (256 * MB, 50, 500)
+
+
+def test_initial_size_until_a_stage_is_observed(rss):
+    governor = _governor()
+    assert governor.chunk_size('transform') == 1000
+
+
+def test_chunk_fits_the_remaining_budget(rss):
+    governor = _governor(initial_rows=10_000)
+    rss['bytes'] = 60 * MB
+    governor.observe('load', _frame(1000, row_bytes=64))
+    # 40 MB libres / (64 B por fila x factor 2.0 de la carga), sin pasar del doble del anterior
+    per_row = memory.frame_bytes(_frame(1000, row_bytes=64)) / 1000
+    assert governor.chunk_size('load') == 20_000
+    governor.last_rows['load'] = 10 ** 6
+    assert governor.chunk_size('load') == int(40 * MB / (per_row * memory.STAGE_FACTORS['load']))
+
+
+def test_growth_is_at_most_double(rss):
+    governor = _governor()
+    governor.observe('extract', _frame(1000))
+    assert [governor.chunk_size('extract') for _ in range(3)] == [2000, 4000, 8000]
+
+
+def test_over_budget_halves_down_to_the_minimum(rss):
+    governor = _governor(min_rows=300)
+    governor.observe('transform', _frame(1000))
+    rss['bytes'] = 120 * MB
+    assert [governor.chunk_size('transform') for _ in range(3)] == [500, 300, 300]
+
+
+def test_safety_margin_reserves_part_of_the_budget(rss):
+    rss['bytes'] = 80 * MB
+    assert _governor(safety=0.8).available_bytes() == 0
+    assert _governor(safety=1.0).available_bytes() == 20 * MB
+
+
+def test_observations_are_smoothed(rss):
+    governor = _governor(smoothing=0.5)
+    governor.observe('transform', _frame(100), extra_bytes=100 * 8)
+    first = governor.bytes_per_row['transform']
+    governor.observe('transform', _frame(100))
+    assert governor.bytes_per_row['transform'] == pytest.approx((first + first - 8) / 2)
+    # Un DataFrame vacío no cambia lo aprendido
+    governor.observe('transform', _frame(0))
+    assert governor.bytes_per_row['transform'] == pytest.approx((first + first - 8) / 2)
+
+
+def test_batch_orders_converts_rows_with_lines_per_order(rss):
+    governor = _governor(initial_rows=1200)
+    assert governor.batch_orders() == 1200
+    governor.observe('extract', _frame(400), orders=100)
+    rss['bytes'] = 100 * MB
+    # Sin memoria libre: la mitad de las filas, a 4 líneas por orden
+    assert governor.batch_orders() == 600 // 4
+    assert governor.batch == 2
+
+
+@pytest.mark.parametrize('order_ids, rows, expected', [
+    ([1, 1, 2, 2, 3, 3], 2, [(0, 2), (2, 4), (4, 6)]),
+    # El borde cae dentro de una orden: el tramo se extiende hasta su última línea
+    ([1, 1, 1, 2, 3, 3], 2, [(0, 3), (3, 6)]),
+    ([1, 1, 1, 1], 2, [(0, 4)]),
+    ([7], 100, [(0, 1)]),
+    ([], 10, [])
+])
+def test_slices_never_split_an_order(order_ids, rows, expected):
+    slices = utils_etl._order_aligned_slices(order_ids, rows)
+    assert slices == expected
+    for (_, end), (start, _) in zip(slices, slices[1:]):
+        assert order_ids[end - 1] != order_ids[start]
@@ -0,0 +1,27 @@
+import pandas as pd
+from datetime import date
+from etl import load, transform
+
+
+def _line(source_modified, status=5) -> pd.DataFrame:
+    return pd.DataFrame({
+        'sales_order_detail_id': [1], 'sales_order_id': [43659], 'channel': ['reseller'], 'status': [status],
+        'product_key': [7], 'order_date_key': [20110531], 'due_date_key': [20110612], 'ship_date_key': [20110607],
+        'order_to_ship_days': [7], 'order_to_due_days': [12], 'ship_delay_days': [-5],
+        'is_shipped': [True], 'is_late': [False],
+        'source_modified': [pd.Timestamp(source_modified)], 'saved_date': [date.today()]
+    })
+
+
+def test_watermark_advances_when_tracked_columns_are_unchanged(pg_engine):
+    load.ensure_order_lifecycle_table(pg_engine)
+    merge = lambda df: load.merge_order_lifecycle(df, pg_engine, transform.ORDER_LIFECYCLE_TRACKED)
+
+    assert merge(_line('2011-06-07')) == 1
+    # El origen tocó la línea sin cambiar nada del snapshot
+    assert merge(_line('2011-06-20')) == 1
+    assert load.order_lifecycle_watermark(pg_engine) == pd.Timestamp('2011-06-20')
+
+    # La línea de la marca de agua se re-extrae (inclusive) pero no se reescribe
+    assert merge(_line('2011-06-20')) == 0
+    assert merge(_line('2011-06-21', status=4)) == 1
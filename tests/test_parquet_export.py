@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from etl import catalog, parquet_export
+
+pytest.importorskip('pyarrow')
+
+FACT = 'fact_internet_sales'
+
+
+@pytest.fixture
+def warehouse(pg_engine):
+    """Hecho con órdenes en tres meses de 2012 y dim_date mínima"""
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_date (date_key INTEGER, date DATE, year INTEGER, month INTEGER)'))
+        conn.execute(text('''
+            INSERT INTO dim_date VALUES
+            (20120115, '2012-01-15', 2012, 1), (20120215, '2012-02-15', 2012, 2), (20120315, '2012-03-15', 2012, 3)
+        '''))
+        conn.execute(text(f'''
+            CREATE TABLE {FACT} (sales_order_id INTEGER, sales_order_detail_id INTEGER, date_key INTEGER,
+                                 order_quantity INTEGER, line_total NUMERIC(12, 2))
+        '''))
+        conn.execute(text(f'''
+            INSERT INTO {FACT} VALUES
+            (1, 1, 20120115, 1, 10.00), (2, 2, 20120115, 2, 20.00),
+            (3, 3, 20120215, 1, 15.00), (4, 4, 20120315, 3, 30.00)
+        '''))
+    catalog.invalidate_catalog()
+    return pg_engine
+
+
+def _partition(output_dir, month) -> pd.DataFrame:
+    return pd.read_parquet(output_dir / FACT / 'year=2012' / f'month={month:02d}' / 'part-0.parquet')
+
+
+def _repair_january_and_add_march(warehouse):
+    with warehouse.begin() as conn:
+        conn.execute(text(f'UPDATE {FACT} SET order_quantity = 5, line_total = 50.00 WHERE sales_order_id = 1'))
+        conn.execute(text(f"INSERT INTO {FACT} VALUES (5, 5, 20120315, 1, 12.00)"))
+
+
+def test_incremental_export_rewrites_only_the_partitions_passed(warehouse, tmp_path, monkeypatch):
+    first = parquet_export.export_fact(warehouse, FACT, str(tmp_path))
+    assert first == {'partitions': 3, 'rows': 4}
+
+    # Reparación de enero (orden vieja) y orden nueva en marzo, como las reporta el pipeline
+    _repair_january_and_add_march(warehouse)
+    monkeypatch.setattr(parquet_export, 'partition_fingerprints', None)
+    monkeypatch.setattr(parquet_export, 'fact_partitions', None)
+    second = parquet_export.export_fact(warehouse, FACT, str(tmp_path), partitions=[201201, 201203])
+    assert second == {'partitions': 2, 'rows': 4}
+    assert _partition(tmp_path, 1).set_index('sales_order_id').loc[1, 'order_quantity'] == 5
+    assert sorted(_partition(tmp_path, 3)['sales_order_id']) == [4, 5]
+
+
+def test_verify_finds_partitions_changed_below_watermark(warehouse, tmp_path):
+    parquet_export.export_fact(warehouse, FACT, str(tmp_path))
+    # La huella del manifiesto (calculada al escribir) coincide con la de la bodega
+    assert parquet_export.export_fact(warehouse, FACT, str(tmp_path), verify=True) == {'partitions': 0, 'rows': 0}
+
+    _repair_january_and_add_march(warehouse)
+    # Por órdenes nuevas solo se ve marzo
+    assert parquet_export.export_fact(warehouse, FACT, str(tmp_path), after_order_id=4) == {'partitions': 1, 'rows': 2}
+    assert parquet_export.export_fact(warehouse, FACT, str(tmp_path), verify=True) == {'partitions': 1, 'rows': 2}
+    assert _partition(tmp_path, 1).set_index('sales_order_id').loc[1, 'order_quantity'] == 5
+
+
+@pytest.mark.parametrize('options', [{'partitions': [201202]}, {'verify': True}])
+def test_incremental_export_removes_emptied_partitions(warehouse, tmp_path, options):
+    parquet_export.export_fact(warehouse, FACT, str(tmp_path))
+    with warehouse.begin() as conn:
+        conn.execute(text(f'DELETE FROM {FACT} WHERE date_key = 20120215'))
+
+    summary = parquet_export.export_fact(warehouse, FACT, str(tmp_path), **options)
+    assert summary['partitions'] == 0
+    assert not (tmp_path / FACT / 'year=2012' / 'month=02').exists()
+    assert set(parquet_export._read_manifest(str(tmp_path / FACT))['partitions']) == {'201201', '201203'}
+
+
+def test_date_partitions(warehouse):
+    assert parquet_export.date_partitions(warehouse, {20120115, 20120315}) == [201201, 201203]
+    # Sin fecha o sin fila en dim_date: partición 0
+    assert parquet_export.date_partitions(warehouse, {20120215, None}) == [0, 201202]
+    assert parquet_export.date_partitions(warehouse, {99991231}) == [0]
+    assert parquet_export.date_partitions(warehouse, set()) == []
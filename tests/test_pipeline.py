@@ -0,0 +1,135 @@
+import pytest
+from sqlalchemy import text
+from etl import pipeline, source_probe
+
+CALLS = []
+
+
+def _extract(pipeline_, inputs):
+    CALLS.append('extract')
+    return 'filas'
+
+
+def _dimension(pipeline_, inputs):
+    CALLS.append('dim')
+
+
+def _fact(pipeline_, inputs):
+    CALLS.append('fact')
+    return len(inputs['extract'])
+
+
+def _report(pipeline_, inputs):
+    CALLS.append('report')
+
+
+def _tasks() -> list:
+    """DAG mínimo: dimensión -> hecho (con su extracción en memoria) -> reporte"""
+    return [
+        pipeline.Task('dim', _dimension, sources=['Sales.Customer'], config=['replace_dimensions']),
+        pipeline.Task('extract', _extract, sources=['Sales.SalesOrderHeader'], materialized=False),
+        pipeline.Task('fact', _fact, deps=['dim', 'extract'], config=['start_date']),
+        pipeline.Task('report', _report, deps=['fact'], code=['reconcile.compare_fingerprints'])
+    ]
+
+
+@pytest.fixture
+def source():
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE Sales.Customer (CustomerID, ModifiedDate)'))
+        conn.execute(text("INSERT INTO Sales.Customer VALUES (1, '2014-01-01')"))
+        conn.execute(text('CREATE TABLE Sales.SalesOrderHeader (SalesOrderID, ModifiedDate)'))
+        conn.execute(text("INSERT INTO Sales.SalesOrderHeader VALUES (43659, '2014-01-01')"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def run(source, pg_engine):
+    settings = {'replace_dimensions': False, 'start_date': '2011-01-01'}
+
+    def run(**overrides):
+        CALLS.clear()
+        summary = pipeline.Pipeline(_tasks(), source, pg_engine, {**settings, **overrides}, workers=2).run()
+        assert not summary['failed']
+        return summary
+
+    return run
+
+
+def test_unchanged_fingerprints_skip_every_task(run):
+    assert run()['executed'] == ['dim', 'extract', 'fact', 'report']
+    summary = run()
+    assert summary['executed'] == [] and CALLS == []
+    assert summary['skipped'] == ['dim', 'extract', 'fact', 'report']
+
+
+def test_source_change_reruns_the_task_and_its_dependents_only(run, source):
+    run()
+    with source.begin() as conn:
+        conn.execute(text("INSERT INTO Sales.SalesOrderHeader VALUES (43660, '2014-01-02')"))
+
+    summary = run()
+    # La dimensión no lee la tabla de órdenes: se omite
+    assert summary['executed'] == ['extract', 'fact', 'report']
+    assert summary['skipped'] == ['dim']
+    assert summary['results']['fact'] == len('filas')
+
+
+def test_materialized_task_reruns_with_its_in_memory_dependency(run, source, pg_engine):
+    run()
+    with pg_engine.begin() as conn:
+        conn.execute(text("DELETE FROM etl_task_state WHERE task_name = 'fact'"))
+
+    # La extracción no cambió, pero el hecho necesita su salida en memoria; el reporte
+    # depende de la huella del hecho, que es la misma, y se omite
+    assert run()['executed'] == ['extract', 'fact']
+
+
+def test_config_change_reruns_tasks_that_use_it_and_their_dependents(run):
+    run()
+    assert run(start_date='2013-01-01')['executed'] == ['extract', 'fact', 'report']
+    # Una clave que ninguna tarea declara no cambia ninguna huella
+    assert run(start_date='2013-01-01', other_setting=1)['executed'] == []
+    assert run(start_date='2013-01-01', replace_dimensions=True)['executed'] == ['dim', 'extract', 'fact',
+                                                                                'report']
+
+
+def test_code_change_reruns_the_tasks_that_declare_it(run, monkeypatch):
+    run()
+    digest = pipeline._module_digest
+    monkeypatch.setattr(pipeline, '_module_digest',
+                        lambda name: digest(name) + '-editado' if name == 'etl.reconcile' else digest(name))
+    assert run()['executed'] == ['report']
+    assert run()['executed'] == []
+
+
+def test_code_version_forces_every_task(run, monkeypatch):
+    run()
+    monkeypatch.setattr(pipeline, 'CODE_VERSION', pipeline.CODE_VERSION + 1)
+    assert run()['executed'] == ['dim', 'extract', 'fact', 'report']
+
+
+@pytest.mark.parametrize('incremental, expected', [
+    (True, {'fact_internet_sales': [0, 201201], 'fact_reseller_sales': []}),
+    (False, None)
+])
+def test_parquet_export_gets_the_partitions_the_run_touched(source, pg_engine, monkeypatch, incremental, expected):
+    from etl import parquet_export
+
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE dim_date (date_key INTEGER, year INTEGER, month INTEGER)'))
+        conn.execute(text('INSERT INTO dim_date VALUES (20120115, 2012, 1), (20120120, 2012, 1)'))
+    exports = []
+    monkeypatch.setattr(parquet_export, 'export_datamart', lambda etl_conn, **options: exports.append(options))
+
+    runner = pipeline.Pipeline([], source, pg_engine, {'incremental_load': incremental})
+    # Carga nueva, liberación de cuarentena sin fecha y reparación del mismo mes
+    pipeline._touched_date_keys(runner, 'fact_internet_sales').update({20120115, None})
+    pipeline._touched_date_keys(runner, 'fact_internet_sales').update({20120120})
+    pipeline._touched_date_keys(runner, 'fact_reseller_sales')
+    pipeline._parquet_export(runner, {})
+
+    assert exports[0]['partitions'] == expected
+    assert not exports[0]['verify']
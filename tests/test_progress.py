@@ -0,0 +1,31 @@
+import io
+import pandas as pd
+from etl import load, progress
+
+ROWS = 25_000
+
+
+def test_load_rows_counted_per_insert_without_patching_to_sql(pg_engine):
+    original = pd.DataFrame.to_sql
+    tracker = progress.ProgressTracker(interval=0, stream=io.StringIO())
+    tracker.instrument(load_module=load)
+    tracker.attach(pg_engine)
+    try:
+        assert pd.DataFrame.to_sql is original
+        load.load(pd.DataFrame({'sales_order_id': range(ROWS)}), pg_engine, 'progress_target')
+    finally:
+        tracker.uninstrument()
+
+    # Una línea de avance por página de INSERT y sin doble conteo al terminar la carga
+    assert tracker.rows[('progress_target', 'load')] == ROWS
+    assert tracker.expected[('progress_target', 'load')] == ROWS
+    assert tracker.stream.getvalue().count('progress_target load') > 1
+    assert pd.DataFrame.to_sql is original
+
+
+def test_detached_engine_is_not_counted(pg_engine):
+    tracker = progress.ProgressTracker(interval=0, stream=io.StringIO())
+    tracker.attach(pg_engine)
+    tracker.uninstrument()
+    pd.DataFrame({'sales_order_id': range(10)}).to_sql('progress_target', pg_engine, index=False)
+    assert tracker.rows[('progress_target', 'load')] == 0
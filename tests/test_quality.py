@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from etl import quality
+
+RULES = {'unique': [['sales_order_detail_id']]}
+RULE = ('unique', 'sales_order_detail_id')
+
+
+def _chunk(ids) -> pd.DataFrame:
+    return pd.DataFrame({'sales_order_detail_id': np.asarray(ids, dtype='int64')})
+
+
+def test_sorted_keys_match_unique_over_random_chunks():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        chunks = [rng.integers(0, 500, rng.integers(0, 80)) for _ in range(rng.integers(1, 15))]
+        state = quality.QualityState('t', RULES)
+        for chunk in chunks:
+            state.update(_chunk(chunk))
+        everything = np.concatenate(chunks)
+        assert state.duplicates.get(RULE, 0) == len(everything) - len(np.unique(everything))
+        assert len(state.keys[RULE]) == len(np.unique(everything))
+        # Las corridas quedan disjuntas y ordenadas
+        runs = state.keys[RULE].runs
+        assert all((np.diff(run) > 0).all() for run in runs)
+        assert len(np.unique(np.concatenate(runs))) == sum(len(run) for run in runs)
+
+
+def test_duplicates_across_merged_chunks_fail_the_run():
+    run = quality.QualityState('fact_internet_sales', RULES)
+    first = quality.QualityState('fact_internet_sales', RULES).update(_chunk([1, 2, 3]))
+    second = quality.QualityState('fact_internet_sales', RULES).update(_chunk([3, 4]))
+    assert first.passed and second.passed
+
+    run.merge(first).merge(second)
+    assert not run.passed
+    assert run.duplicates[RULE] == 1
+    assert len(run.keys[RULE]) == 4
+
+
+def test_key_runs_stay_logarithmic():
+    state = quality.QualityState('t', RULES)
+    for start in range(0, 256_000, 1000):
+        state.update(_chunk(np.arange(start, start + 1000)))
+    assert state.passed
+    assert len(state.keys[RULE].runs) <= 10
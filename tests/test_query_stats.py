@@ -0,0 +1,33 @@
+import pandas as pd
+from sqlalchemy import text
+from etl import load, query_stats
+
+ROWS = 2500
+
+
+def test_copy_chunks_are_recorded(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text('CREATE TABLE copy_target (sales_order_id INTEGER, note TEXT)'))
+    recorder = query_stats.QueryRecorder()
+    recorder.attach(pg_engine, 'warehouse')
+    recorder.instrument(load)
+    try:
+        table = pd.DataFrame({'sales_order_id': range(ROWS), 'note': 'x'})
+        with pg_engine.begin() as conn:
+            load.copy_dataframe(table, conn.connection.cursor(), 'copy_target', chunksize=1000)
+    finally:
+        recorder.uninstrument()
+
+    copies = [record for record in recorder.records if record['statement'].startswith('COPY copy_target')]
+    assert [record['row_count'] for record in copies] == [1000, 1000, 500]
+    assert {record['function_name'] for record in copies} == {'load.copy_dataframe'}
+    assert len({record['statement_id'] for record in copies}) == 1
+    assert all(record['server_seconds'] > 0 and record['client_seconds'] > 0 for record in copies)
+    assert sum(record['bytes'] for record in copies) == len(table.to_csv(index=False, header=False))
+    assert load.COPY_OBSERVERS == []
+
+    # El COPY quedó registrado en la bodega como cualquier otra sentencia
+    recorder.flush(pg_engine)
+    with pg_engine.connect() as conn:
+        assert conn.execute(text("SELECT SUM(row_count) FROM etl_query_stats WHERE statement LIKE 'COPY%'")
+                            ).scalar() == ROWS
@@ -0,0 +1,136 @@
+import re
+import pandas as pd
+import pytest
+import yaml
+from sqlalchemy import text
+from etl import extract, integrity, reconcile, source_probe, transform
+
+FACT = 'fact_internet_sales'
+
+
+def _etl_log(engine) -> list:
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT process_name, status, records_processed, details FROM etl_log')).all()
+
+
+@pytest.fixture
+def warehouse(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text(f'CREATE TABLE {FACT} (sales_order_id INTEGER, sales_order_detail_id INTEGER, date_key INTEGER)'))
+        conn.execute(text(f'INSERT INTO {FACT} VALUES (43001, 1, 1), (43002, 2, NULL), (44001, 3, 2)'))
+    return pg_engine
+
+
+def test_repair_is_logged_with_its_partition(warehouse):
+    source = source_probe.standin_engine()
+    with source.begin() as conn:
+        # Las órdenes de la partición ya no están en el origen
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderHeader (SalesOrderID, OrderDate, DueDate, ShipDate, CustomerID,
+                SalesPersonID, TerritoryID, SubTotal, TaxAmt, Freight, TotalDue, OnlineOrderFlag, CurrencyRateID)
+        '''))
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderDetail (SalesOrderID, SalesOrderDetailID, ProductID, OrderQty, UnitPrice,
+                UnitPriceDiscount, LineTotal)
+        '''))
+        conn.execute(text('CREATE TABLE Sales.Customer (CustomerID, PersonID)'))
+        conn.execute(text('CREATE TABLE Production.Product (ProductID, StandardCost)'))
+        conn.execute(text('CREATE TABLE Sales.CurrencyRate (CurrencyRateID, ToCurrencyCode)'))
+
+    touched = set()
+    assert reconcile.repair_partition(source, warehouse, FACT, 43, {}, granularity='order', touched=touched) == 0
+    # Las fechas de las filas borradas quedan para la exportación incremental
+    assert touched == {1, None}
+    assert _etl_log(warehouse) == [('Reparacion_Internet_Sales', 'Exitoso', 0,
+                                    f'{FACT} partición 43 (order): 2 filas borradas')]
+    with warehouse.connect() as conn:
+        assert conn.execute(text(f'SELECT sales_order_id FROM {FACT}')).scalars().all() == [44001]
+
+
+def test_failed_repair_is_logged(warehouse):
+    source = source_probe.standin_engine()
+    with pytest.raises(Exception):
+        reconcile.repair_partition(source, warehouse, FACT, 44, {}, granularity='order')
+    assert _etl_log(warehouse) == [('Reparacion_Internet_Sales', 'Fallido', 0, f'{FACT} partición 44 (order)')]
+    with warehouse.connect() as conn:
+        assert conn.execute(text(f'SELECT COUNT(*) FROM {FACT}')).scalar() == 3
+
+
+@pytest.fixture
+def fact_warehouse(pg_engine):
+    """Hecho con su DDL (sin llaves foráneas), dim_date y la cuarentena"""
+    with open('sqlscripts.yml') as f:
+        ddl = re.sub(r'REFERENCES \w+\(\w+\)', '', yaml.safe_load(f)[FACT])
+    with pg_engine.begin() as conn:
+        conn.execute(text(ddl))
+        conn.execute(text('CREATE TABLE dim_date (date_key INTEGER PRIMARY KEY, date DATE, year INTEGER, month INTEGER)'))
+        conn.execute(text("INSERT INTO dim_date VALUES (1, '2012-03-01', 2012, 3)"))
+    integrity.ensure_quarantine_table(pg_engine)
+    return pg_engine
+
+
+@pytest.fixture
+def source():
+    """Dos órdenes de la partición 43: la 43001 de un cliente conocido y la 43002 de uno que no llegó"""
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderHeader (SalesOrderID, OrderDate, DueDate, ShipDate, CustomerID,
+                SalesPersonID, TerritoryID, SubTotal, TaxAmt, Freight, TotalDue, OnlineOrderFlag, CurrencyRateID)
+        '''))
+        conn.execute(text('''
+            CREATE TABLE Sales.SalesOrderDetail (SalesOrderID, SalesOrderDetailID, ProductID, OrderQty, UnitPrice,
+                UnitPriceDiscount, LineTotal)
+        '''))
+        conn.execute(text('CREATE TABLE Sales.Customer (CustomerID, PersonID)'))
+        conn.execute(text('CREATE TABLE Production.Product (ProductID, StandardCost)'))
+        conn.execute(text('CREATE TABLE Sales.CurrencyRate (CurrencyRateID, ToCurrencyCode)'))
+        conn.execute(text('''
+            INSERT INTO Sales.SalesOrderHeader
+            VALUES (:id, '2012-03-01', '2012-03-13', '2012-03-08', :customer, NULL, 1, 20, 1.6, 0.5, 22.1, 1, NULL)
+        '''), [{'id': 43001, 'customer': 1}, {'id': 43002, 'customer': 2}])
+        conn.execute(text('INSERT INTO Sales.SalesOrderDetail VALUES (:id, :detail, 1, 2, 10, 0, 20)'),
+                     [{'id': 43001, 'detail': 1}, {'id': 43002, 'detail': 2}])
+        conn.execute(text('INSERT INTO Sales.Customer VALUES (1, 1), (2, 2)'))
+        conn.execute(text('INSERT INTO Production.Product VALUES (1, 5)'))
+    yield engine
+    engine.dispose()
+
+
+def _dimensions() -> dict:
+    return {
+        'dim_customer': pd.DataFrame({'customer_key': [10], 'customer_id': [1]}),
+        'dim_product': pd.DataFrame({'product_key': [5], 'product_id': [1]}),
+        'dim_date': pd.DataFrame({'date_key': [1], 'date': [pd.Timestamp('2012-03-01')]})
+    }
+
+
+def _quarantined(engine) -> list:
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT sales_order_detail_id FROM etl_quarantine ORDER BY 1')).scalars().all()
+
+
+def test_repair_quarantines_orphans_and_releases_clean_rows(fact_warehouse, source):
+    # La 43001 quedó en cuarentena cuando su cliente aún no existía
+    early = {**_dimensions(), 'dim_customer': _dimensions()['dim_customer'][:0]}
+    rows = extract.extract_internet_sales(source, start_date=None, order_ids=[43001])
+    integrity.precheck(transform.transform_internet_sales(rows, early), FACT, early, fact_warehouse)
+    assert _quarantined(fact_warehouse) == [1]
+
+    touched = set()
+    assert reconcile.repair_partition(source, fact_warehouse, FACT, 43, _dimensions(), granularity='order',
+                                      touched=touched) == 1
+    assert touched == {1}
+    with fact_warehouse.connect() as conn:
+        assert conn.execute(text(f'SELECT sales_order_detail_id, customer_key FROM {FACT}')).all() == [(1, 10)]
+    # La fila reparada sale de la cuarentena; la huérfana nueva entra
+    assert _quarantined(fact_warehouse) == [2]
+
+    # Bodega + cuarentena coinciden con el origen: la partición ya no se repara
+    report = reconcile.reconcile_fact(source, fact_warehouse, FACT, granularity='order')
+    assert report['match'].all()
+    assert report[['partition_key', 'row_count_dw']].values.tolist() == [[43, 2]]
+    # Por mes, la huérfana cuenta en el mes de su date_key
+    net = reconcile.net_of_quarantine(reconcile.warehouse_fingerprints(fact_warehouse, FACT),
+                                      reconcile.quarantine_fingerprints(fact_warehouse, FACT))
+    assert net[['partition_key', 'row_count', 'order_quantity', 'line_total']].values.tolist() == [[201203, 2, 4, 40]]
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from etl import transform
+
+MEASURES = transform.SALES_METRIC_MEASURES
+GRAIN = transform.SALES_METRIC_GRAIN
+
+
+def _chunks(count: int, rows: int, groups: int) -> list:
+    rng = np.random.default_rng(0)
+    return [pd.DataFrame({'date_key': rng.integers(0, groups, rows), 'product_key': rng.integers(0, 50, rows),
+                          **{measure: rng.random(rows) for measure in MEASURES}}) for _ in range(count)]
+
+
+def test_compactions_stay_logarithmic_with_many_groups():
+    # Más grupos que compact_rows: antes se compactaba todo en cada chunk
+    chunks = _chunks(60, 5000, 2000)
+    aggregator = transform.SalesMetricsAggregator(compact_rows=1000)
+    compactions = []
+    compact = aggregator._compact
+    aggregator._compact = lambda: compactions.append(aggregator._pending) or compact()
+    for chunk in chunks:
+        aggregator.update(chunk)
+    metrics = aggregator.finalize()
+
+    assert len(compactions) <= 12
+    expected = pd.concat(chunks).groupby(GRAIN)[MEASURES].sum().sort_index()
+    assert len(metrics) == len(expected)
+    assert np.allclose(metrics.set_index(GRAIN)[MEASURES].sort_index().to_numpy(), expected.to_numpy())
+
+
+def test_merged_workers_match_single_pass():
+    chunks = _chunks(8, 2000, 300)
+    single = transform.SalesMetricsAggregator(compact_rows=500)
+    workers = [transform.SalesMetricsAggregator(compact_rows=500) for _ in range(2)]
+    for i, chunk in enumerate(chunks):
+        single.update(chunk)
+        workers[i % 2].update(chunk)
+    merged = workers[0].merge(workers[1])
+    assert merged.rows == single.rows
+    pd.testing.assert_frame_equal(merged.finalize(), single.finalize(), check_exact=False)
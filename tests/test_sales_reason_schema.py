@@ -0,0 +1,45 @@
+import pandas as pd
+from datetime import date
+from sqlalchemy import text
+from etl import catalog, load
+
+
+def _constraints(engine, table_name) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(text('''
+            SELECT contype FROM pg_constraint WHERE conrelid = to_regclass(:table_name)
+        '''), {'table_name': table_name}).scalars())
+
+
+def test_adds_primary_keys_to_tables_created_by_to_sql(pg_engine):
+    # Bodega vieja: to_sql creó las tablas sin llaves y con duplicados
+    pd.DataFrame({'sales_reason_id': [1, 2, 2], 'reason_name': ['Price', 'Promo', 'Promotion'],
+                  'reason_type': ['Other', 'Promotion', 'Promotion'], 'saved_date': date.today()}
+                 ).to_sql('dim_sales_reason', pg_engine, index=False)
+    pd.DataFrame({'sales_order_id': [10, 10, 11, None], 'sales_reason_id': [1, 1, 2, 1]}
+                 ).to_sql('bridge_order_sales_reason', pg_engine, index=False)
+    catalog.invalidate_catalog()
+
+    load.ensure_sales_reason_schema(pg_engine)
+    assert _constraints(pg_engine, 'dim_sales_reason') == {'p'}
+    assert _constraints(pg_engine, 'bridge_order_sales_reason') == {'p', 'f'}
+
+    # El UPSERT por llave y la carga incremental del puente ya funcionan
+    load.load_sales_reason(pd.DataFrame({'sales_reason_id': [2], 'reason_name': ['On Promotion'],
+                                         'reason_type': ['Promotion'], 'saved_date': [date.today()]}), pg_engine)
+    inserted = load.load_bridge_order_sales_reason(
+        pd.DataFrame({'sales_order_id': [10, 12], 'sales_reason_id': [1, 2]}), pg_engine)
+    assert inserted == 1
+    with pg_engine.connect() as conn:
+        assert conn.execute(text('SELECT reason_name FROM dim_sales_reason ORDER BY 1')).scalars().all() == [
+            'On Promotion', 'Price']
+        assert conn.execute(text('SELECT COUNT(*) FROM bridge_order_sales_reason')).scalar() == 3
+
+    # Idempotente
+    load.ensure_sales_reason_schema(pg_engine)
+
+
+def test_creates_missing_tables_from_scripts(pg_engine):
+    load.ensure_sales_reason_schema(pg_engine)
+    assert _constraints(pg_engine, 'dim_sales_reason') == {'p'}
+    assert _constraints(pg_engine, 'bridge_order_sales_reason') == {'p', 'f'}
@@ -0,0 +1,139 @@
+import random
+import pytest
+from sqlalchemy import text
+from etl import extract, source_probe
+
+ORDERS = 600
+PERSONS = 200
+STORES = 20
+EMPLOYEES = 15
+PRODUCTS = 60
+REASONS = 8
+
+
+def _table(conn, name: str, rows: list):
+    columns = list(rows[0])
+    conn.execute(text(f"CREATE TABLE {name} ({', '.join(columns)})"))
+    conn.execute(text(f"INSERT INTO {name} VALUES ({', '.join(':' + col for col in columns)})"), rows)
+
+
+def _seed(conn):
+    """AdventureWorks mínimo: las columnas que leen las extracciones, con datos al azar (semilla fija)"""
+    rng = random.Random(7)
+    stores = range(1001, 1001 + STORES)
+    employees = range(2001, 2001 + EMPLOYEES)
+    sales_people = list(employees)[:10]
+    people = list(range(1, PERSONS + 1)) + list(employees)
+
+    _table(conn, 'Person.Person', [{'BusinessEntityID': i, 'FirstName': f'N{i}', 'LastName': f'L{i}',
+                                    'EmailPromotion': i % 3} for i in people])
+    _table(conn, 'Person.EmailAddress', [{'BusinessEntityID': i, 'EmailAddressID': i, 'EmailAddress': f'{i}@aw.com',
+                                          'ModifiedDate': '2014-01-01'} for i in people])
+    _table(conn, 'Person.PhoneNumberType', [{'PhoneNumberTypeID': 1, 'Name': 'Cell'}])
+    _table(conn, 'Person.PersonPhone', [{'BusinessEntityID': i, 'PhoneNumber': f'555-{i:04d}',
+                                         'PhoneNumberTypeID': 1, 'ModifiedDate': '2014-01-01'} for i in people])
+    _table(conn, 'Person.CountryRegion', [{'CountryRegionCode': 'US', 'Name': 'United States'}])
+    _table(conn, 'Person.StateProvince', [{'StateProvinceID': 1, 'Name': 'Washington', 'CountryRegionCode': 'US'}])
+    _table(conn, 'Person.AddressType', [{'AddressTypeID': 1, 'Name': 'Main Office'}, {'AddressTypeID': 2, 'Name': 'Home'}])
+    entities = list(range(1, PERSONS + 1)) + list(stores)
+    _table(conn, 'Person.Address', [{'AddressID': i, 'AddressLine1': f'{i} Main St', 'City': 'Seattle',
+                                     'PostalCode': '98101', 'StateProvinceID': 1} for i in entities])
+    _table(conn, 'Person.BusinessEntityAddress', [{'BusinessEntityID': i, 'AddressID': i,
+                                                   'AddressTypeID': 1 if i in stores else 2,
+                                                   'ModifiedDate': '2014-01-01'} for i in entities])
+
+    _table(conn, 'HumanResources.Department', [{'DepartmentID': 3, 'Name': 'Sales'}])
+    _table(conn, 'HumanResources.Employee', [{'BusinessEntityID': i, 'JobTitle': 'Sales Representative',
+                                              'HireDate': '2011-05-31', 'BirthDate': '1980-01-01'} for i in employees])
+    _table(conn, 'HumanResources.EmployeeDepartmentHistory', [{'BusinessEntityID': i, 'DepartmentID': 3,
+                                                               'EndDate': None} for i in employees])
+
+    _table(conn, 'Sales.Store', [{'BusinessEntityID': i, 'Name': f'Store {i}', 'SalesPersonID': rng.choice(sales_people)}
+                                 for i in stores])
+    customers = [{'CustomerID': i, 'PersonID': i, 'StoreID': None, 'TerritoryID': 1} for i in range(1, PERSONS + 1)]
+    customers += [{'CustomerID': 500 + i, 'PersonID': None, 'StoreID': store, 'TerritoryID': 1}
+                  for i, store in enumerate(stores)]
+    _table(conn, 'Sales.Customer', customers)
+
+    _table(conn, 'Production.ProductCategory', [{'ProductCategoryID': 1, 'Name': 'Bikes'}])
+    _table(conn, 'Production.ProductSubcategory', [{'ProductSubcategoryID': 1, 'ProductCategoryID': 1,
+                                                    'Name': 'Road Bikes'}])
+    _table(conn, 'Production.ProductModel', [{'ProductModelID': 1, 'Name': 'Road-150'}])
+    _table(conn, 'Production.Product', [{'ProductID': i, 'Name': f'P{i}', 'ProductNumber': f'PN-{i}', 'Color': 'Red',
+                                         'StandardCost': 10.0, 'ListPrice': 20.0, 'Size': None, 'Weight': None,
+                                         'ProductLine': 'R', 'Class': 'H', 'Style': 'U', 'ProductSubcategoryID': 1,
+                                         'ProductModelID': 1} for i in range(1, PRODUCTS + 1)])
+
+    _table(conn, 'Sales.CurrencyRate', [{'CurrencyRateID': 1, 'ToCurrencyCode': 'EUR'}])
+    _table(conn, 'Sales.SalesReason', [{'SalesReasonID': i, 'Name': f'R{i}', 'ReasonType': 'Other'}
+                                       for i in range(1, REASONS + 1)])
+
+    headers, details, reasons = [], [], []
+    for order_id in range(43659, 43659 + ORDERS):
+        online = rng.random() < 0.5
+        customer = rng.randint(1, PERSONS) if online else 500 + rng.randrange(STORES)
+        headers.append({'SalesOrderID': order_id, 'OrderDate': '2012-03-01', 'DueDate': '2012-03-13',
+                        'ShipDate': '2012-03-08', 'CustomerID': customer,
+                        'SalesPersonID': None if online else rng.choice(sales_people), 'TerritoryID': 1,
+                        'SubTotal': 100.0, 'TaxAmt': 8.0, 'Freight': 2.5, 'TotalDue': 110.5,
+                        'OnlineOrderFlag': int(online), 'CurrencyRateID': rng.choice([None, 1]), 'Status': 5,
+                        'ModifiedDate': '2012-03-08'})
+        for _ in range(rng.randint(1, 3)):
+            details.append({'SalesOrderID': order_id, 'SalesOrderDetailID': len(details) + 1,
+                            # Los últimos 10 productos no se venden
+                            'ProductID': rng.randint(1, PRODUCTS - 10), 'OrderQty': 1, 'UnitPrice': 20.0,
+                            'UnitPriceDiscount': 0.0, 'LineTotal': 20.0, 'ModifiedDate': '2012-03-08'})
+        for reason in rng.sample(range(1, REASONS + 1), rng.randint(0, 2)):
+            reasons.append({'SalesOrderID': order_id, 'SalesReasonID': reason})
+    _table(conn, 'Sales.SalesOrderHeader', headers)
+    _table(conn, 'Sales.SalesOrderDetail', details)
+    _table(conn, 'Sales.SalesOrderHeaderSalesReason', reasons)
+
+
+@pytest.fixture
+def source():
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        _seed(conn)
+    extract.set_sample(10, seed=3)
+    yield engine
+    extract.set_sample()
+    engine.dispose()
+
+
+def test_sampled_extracts_are_referentially_closed(source):
+    internet = extract.extract_internet_sales(source, start_date=None)
+    reseller = extract.extract_reseller_sales(source, start_date=None)
+    customers = extract.extract_customers(source)
+    products = extract.extract_products(source)
+    employees = extract.extract_employees(source)
+    stores = extract.extract_stores(source)
+    reasons = extract.extract_sales_reason(source)
+    bridge = extract.extract_order_sales_reason(source)
+
+    # Muestra no trivial: una fracción de las órdenes
+    orders = set(internet['SalesOrderID']) | set(reseller['SalesOrderID'])
+    assert 0.05 * ORDERS < len(orders) < 0.2 * ORDERS
+
+    # Toda llave foránea de los hechos resuelve dentro de las dimensiones de la muestra
+    assert set(internet['CustomerID']) <= set(customers['CustomerID'])
+    assert set(reseller['CustomerID']) <= set(customers['CustomerID'])
+    assert set(internet['ProductID']) | set(reseller['ProductID']) <= set(products['ProductID'])
+    assert set(reseller['SalesPersonID'].dropna().astype(int)) <= set(employees['BusinessEntityID'])
+    assert set(reseller['StoreID']) <= set(stores['StoreID'])
+    assert set(bridge['SalesOrderID']) <= orders
+    assert set(bridge['SalesReasonID']) <= set(reasons['SalesReasonID'])
+
+    # Y las dimensiones no traen miembros que la muestra no referencia
+    assert set(customers['CustomerID']) == set(internet['CustomerID']) | set(reseller['CustomerID'])
+    assert set(products['ProductID']) == set(internet['ProductID']) | set(reseller['ProductID'])
+    assert set(employees['BusinessEntityID']) == set(reseller['SalesPersonID'].dropna().astype(int))
+    assert set(stores['StoreID']) == set(reseller['StoreID'])
+    assert set(reasons['SalesReasonID']) == set(bridge['SalesReasonID'])
+
+
+def test_same_seed_gives_the_same_sample(source):
+    first = set(extract.extract_internet_sales(source, start_date=None)['SalesOrderID'])
+    assert set(extract.extract_internet_sales(source, start_date=None)['SalesOrderID']) == first
+    extract.set_sample(10, seed=4)
+    assert set(extract.extract_internet_sales(source, start_date=None)['SalesOrderID']) != first
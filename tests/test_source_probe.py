@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import text
+from etl import source_probe
+
+DIMENSION = 'dim_customer'
+CUSTOMERS = 3000
+
+
+@pytest.fixture
+def source():
+    """Origen SQLite con Sales.Customer en 4 buckets y sus tablas relacionadas"""
+    engine = source_probe.standin_engine()
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE Sales.Customer (CustomerID INTEGER PRIMARY KEY, PersonID INTEGER, StoreID INTEGER,
+                                         TerritoryID INTEGER, ModifiedDate TEXT)
+        '''))
+        conn.execute(text('INSERT INTO Sales.Customer VALUES (:id, :id, NULL, :territory, :modified)'),
+                     [{'id': i, 'territory': i % 10, 'modified': '2014-06-30 00:00:00'}
+                      for i in range(1, CUSTOMERS + 1)])
+        for related in source_probe.DIMENSION_PROBES[DIMENSION]['related']:
+            conn.execute(text(f'CREATE TABLE {related} (ID INTEGER, ModifiedDate TEXT)'))
+            conn.execute(text(f"INSERT INTO {related} VALUES (1, '2014-06-30 00:00:00')"))
+    yield engine
+    engine.dispose()
+
+
+def _changes(source, previous) -> dict:
+    return source_probe.detect_changes(source_probe.probe_sources(source, [DIMENSION]), previous, DIMENSION)
+
+
+def test_first_probe_is_full(source):
+    previous = source_probe.probe_sources(source, [DIMENSION]).iloc[0:0]
+    assert _changes(source, previous)['mode'] == 'full'
+
+
+def test_unchanged_source(source):
+    previous = source_probe.probe_sources(source, [DIMENSION])
+    assert len(previous[previous['source_table'] == 'Sales.Customer']) == 4
+    assert _changes(source, previous) == {'mode': 'unchanged'}
+
+
+def test_changed_bucket_extracts_its_key_range(source):
+    previous = source_probe.probe_sources(source, [DIMENSION])
+    with source.begin() as conn:
+        # Mismo ModifiedDate y mismas filas: solo el checksum lo detecta
+        conn.execute(text('UPDATE Sales.Customer SET TerritoryID = 99 WHERE CustomerID = 2500'))
+    assert _changes(source, previous) == {'mode': 'ranges', 'ranges': [(2000, 2999)]}
+
+
+def test_changed_related_table_extracts_full(source):
+    previous = source_probe.probe_sources(source, [DIMENSION])
+    with source.begin() as conn:
+        conn.execute(text("UPDATE Person.EmailAddress SET ModifiedDate = '2014-07-01 00:00:00'"))
+    changes = _changes(source, previous)
+    assert changes['mode'] == 'full'
+    assert changes['reason'] == 'cambió una tabla relacionada'
+
+
+def test_too_many_changed_buckets_extract_full(source):
+    previous = source_probe.probe_sources(source, [DIMENSION])
+    with source.begin() as conn:
+        conn.execute(text('UPDATE Sales.Customer SET StoreID = 1 WHERE CustomerID IN (10, 1010, 2010)'))
+    assert _changes(source, previous)['mode'] == 'full'
+
+
+def test_saved_probe_round_trips(source, pg_engine):
+    current = source_probe.probe_sources(source, [DIMENSION])
+    source_probe.save_probe(pg_engine, current, DIMENSION)
+    assert _changes(source, source_probe.previous_probes(pg_engine)) == {'mode': 'unchanged'}
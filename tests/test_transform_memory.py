@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+from conftest import synthetic_transform_inputs, transform_peak
+from etl import memory, transform
+
+ROWS = 50_000
+
+# Pico de memoria permitido de cada transformación, en múltiplos del tamaño de su entrada
+TRANSFORM_PEAK_LIMITS = {
+    'transform_internet_sales': 1.0,
+    'transform_reseller_sales': 1.0,
+    'transform_customer': 0.75,
+    'transform_product': 0.75,
+    'transform_employee': 0.75,
+    'transform_reseller': 0.75
+}
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return synthetic_transform_inputs(ROWS)
+
+
+@pytest.mark.parametrize('name', sorted(TRANSFORM_PEAK_LIMITS))
+def test_peak_memory_under_limit(inputs, name):
+    args = inputs[name]
+    peak = transform_peak(getattr(transform, name), *args)
+    ratio = peak / memory.frame_bytes(args[0])
+    assert ratio <= TRANSFORM_PEAK_LIMITS[name], f'{name}: pico {ratio:.2f}x la entrada'
+
+
+@pytest.mark.parametrize('name', ['transform_internet_sales', 'transform_reseller_sales'])
+def test_sales_fact_on_slices_and_filters(inputs, name):
+    sales, dimensions = inputs[name]
+    fn = getattr(transform, name)
+    full = fn(sales, dimensions)
+
+    # Slice intermedio (como push_fact_batches) y filtro booleano (como release_quarantine)
+    pd.testing.assert_frame_equal(fn(sales.iloc[2:4], dimensions), full.iloc[2:4])
+    mask = (sales.index % 3 == 0)
+    pd.testing.assert_frame_equal(fn(sales[mask], dimensions), full[mask])
+
+
+@pytest.mark.parametrize('name', ['transform_internet_sales', 'transform_reseller_sales'])
+def test_sales_fact_on_non_range_index(inputs, name):
+    sales, dimensions = inputs[name]
+    fn = getattr(transform, name)
+    head = sales.iloc[:100]
+    shuffled = head.set_axis(pd.Index([f'r{i}' for i in range(len(head))])).iloc[::-1]
+
+    fact = fn(shuffled, dimensions)
+    assert fact.index.equals(shuffled.index)
+    expected = fn(head, dimensions).iloc[::-1].reset_index(drop=True)
+    pd.testing.assert_frame_equal(fact.reset_index(drop=True), expected)
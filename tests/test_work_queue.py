@@ -0,0 +1,101 @@
+import os
+import multiprocessing
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from etl import catalog, extract, integrity, transform, work_queue
+
+ORDERS = 1000
+ORDERS_PER_UNIT = 100
+# Orden cuya unidad falla mientras exista el archivo de falla
+POISON_ORDER = 250
+
+
+@pytest.fixture
+def queue_env(pg_engine, tmp_path, monkeypatch):
+    """Bodega con los dos hechos vacíos y extracción/transformación simuladas (se heredan con fork)"""
+    with pg_engine.begin() as conn:
+        for fact_name in work_queue.QUEUE_FACTS:
+            conn.execute(text(f'CREATE TABLE {fact_name} (sales_order_id INTEGER, sales_order_detail_id INTEGER)'))
+    catalog.invalidate_catalog()
+    poison = tmp_path / 'poison'
+    poison.touch()
+
+    def plan(source_conn, fact_name, after_order_id=0, start_date=None, orders_per_unit=2000):
+        if fact_name != 'fact_internet_sales':
+            return []
+        bounds = range(after_order_id + orders_per_unit, ORDERS + orders_per_unit, orders_per_unit)
+        lowers = [after_order_id] + list(bounds)[:-1]
+        return [{'fact_name': fact_name, 'after_order_id': lower, 'until_order_id': min(upper, ORDERS),
+                 'start_date': start_date} for lower, upper in zip(lowers, bounds) if lower < ORDERS]
+
+    def fake_extract(source_conn, start_date=None, after_order_id=0, until_order_id=None, **kwargs):
+        if after_order_id < POISON_ORDER <= until_order_id and poison.exists():
+            raise RuntimeError('fuente no disponible')
+        ids = list(range(after_order_id + 1, until_order_id + 1))
+        return pd.DataFrame({'SalesOrderID': ids, 'SalesOrderDetailID': ids})
+
+    def fake_transform(source_rows, dimensions):
+        return pd.DataFrame({'sales_order_id': source_rows['SalesOrderID'],
+                             'sales_order_detail_id': source_rows['SalesOrderDetailID']})
+
+    monkeypatch.setattr(work_queue, 'plan_work_units', plan)
+    monkeypatch.setattr(extract, 'extract_internet_sales', fake_extract)
+    monkeypatch.setattr(extract, 'extract_dimensions_from_dw', lambda etl_conn, currency=None: {})
+    monkeypatch.setattr(transform, 'transform_internet_sales', fake_transform)
+    monkeypatch.setattr(transform, 'validate_transformations', lambda df, name, etl_conn=None: True)
+    monkeypatch.setattr(integrity, 'precheck', lambda fact, fact_name, dimensions, etl_conn: fact)
+    return poison
+
+
+def _worker(url, index):
+    engine = create_engine(url)
+    work_queue.run_worker(None, engine, worker_id=f'test-{index}', poll_interval=0.05)
+    engine.dispose()
+
+
+def _run_workers(url, workers=4) -> list:
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_worker, args=(url, index)) for index in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+    return [process.exitcode for process in processes]
+
+
+def _loaded(engine) -> pd.Series:
+    return pd.read_sql_query(text('SELECT sales_order_id FROM fact_internet_sales'), engine)['sales_order_id']
+
+
+def _statuses(engine) -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(text('SELECT status, COUNT(*) FROM etl_work_queue GROUP BY status')).all())
+
+
+def test_local_workers_load_each_unit_once(pg_url, pg_engine, queue_env):
+    os.remove(queue_env)
+    work_queue.run_coordinator(None, pg_engine, orders_per_unit=ORDERS_PER_UNIT)
+    assert _run_workers(pg_url) == [0, 0, 0, 0]
+
+    loaded = _loaded(pg_engine)
+    assert _statuses(pg_engine) == {'done': ORDERS // ORDERS_PER_UNIT}
+    assert len(loaded) == ORDERS and loaded.is_unique
+
+
+def test_failed_unit_below_watermark_is_requeued(pg_url, pg_engine, queue_env):
+    work_queue.run_coordinator(None, pg_engine, orders_per_unit=ORDERS_PER_UNIT, max_attempts=2)
+    assert _run_workers(pg_url) == [0, 0, 0, 0]
+
+    # La unidad envenenada agotó sus intentos, pero la marca de agua ya quedó por encima
+    assert _statuses(pg_engine) == {'done': ORDERS // ORDERS_PER_UNIT - 1, 'failed': 1}
+    assert catalog.get_watermarks(pg_engine)['fact_internet_sales'] == ORDERS
+    assert not _loaded(pg_engine).between(201, 300).any()
+
+    os.remove(queue_env)
+    work_queue.run_coordinator(None, pg_engine, orders_per_unit=ORDERS_PER_UNIT, max_attempts=2)
+    assert _run_workers(pg_url) == [0, 0, 0, 0]
+
+    loaded = _loaded(pg_engine)
+    assert _statuses(pg_engine) == {'done': ORDERS // ORDERS_PER_UNIT}
+    assert len(loaded) == ORDERS and loaded.is_unique